@@ -10,14 +10,18 @@
 them into hashrings for distributors.
 """
 
+import array
 import bisect
 import logging
 import re
 import hashlib
+import itertools
 import socket
 import time
-import ipaddr
 import random
+import weakref
+
+from collections import OrderedDict
 
 import bridgedb.Storage
 
@@ -39,6 +43,12 @@ DIGEST_LEN = 20
 PORTSPEC_LEN = 16
 
 
+class FrozenHashringError(Exception):
+    """Raised when changing the bridges in a hashring which was frozen, i.e.
+    one which may already be serving requests.
+    """
+
+
 class BridgeRingParameters(object):
     """Store validated settings on minimum number of Bridges with certain
     attributes which should be included in any generated subring of a
@@ -48,11 +58,17 @@ class BridgeRingParameters(object):
         respective minimums.
     :ivar list needFlags: List of two-tuples of desired flags_ assigned to a
         Bridge by the Bridge DirAuth.
+    :ivar dict subnetPrefixes: A dictionary mapping IP versions (``4`` or
+        ``6``) to the prefix length of the subnets in which no two bridges in
+        an answer filtered by subnet may be.
+    :ivar bool memoizeAnswers: Whether hashrings should remember their
+        answers to :meth:`BridgeRing.getBridges`.
 
     .. _flags: https://gitweb.torproject.org/torspec.git/tree/dir-spec.txt?id=6b557594ef#n1695
     """
 
-    def __init__(self, needPorts=[], needFlags=[]):
+    def __init__(self, needPorts=[], needFlags=[], ipv4SubnetPrefix=16,
+                 ipv6SubnetPrefix=32, memoizeAnswers=False):
         """Control the creation of subrings by including a minimum number of
         bridges which possess certain attributes.
 
@@ -68,9 +84,17 @@ class BridgeRingParameters(object):
             an OR flag_, and ``minimum`` is an integer for the minimum number
             of Bridges which have acquired that ``flag`` to include in any new
             subring.
+        :param int ipv4SubnetPrefix: When filtering answers by subnet, no two
+            IPv4 bridges will be within the same subnet of this prefix length.
+        :param int ipv6SubnetPrefix: When filtering answers by subnet, no two
+            IPv6 bridges will be within the same subnet of this prefix length.
+        :param bool memoizeAnswers: If ``True``, each hashring remembers its
+            answer for every position and number of bridges requested, until
+            bridges are next inserted into it.
         :raises: An :exc:`TypeError` if an invalid port number, a minimum less
-            than one, or an "unsupported" flag is given. "Stable" appears to
-            be the only currently "supported" flag.
+            than one, an "unsupported" flag, or an invalid subnet prefix
+            length is given. "Stable" appears to be the only currently
+            "supported" flag.
         """
         for port, count in needPorts:
             if not (1 <= port <= 65535):
@@ -83,15 +107,351 @@ class BridgeRingParameters(object):
                 raise TypeError("Unsupported flag %s" % flag)
             if count <= 0:
                 raise TypeError("Count %s out of range." % count)
+        if not (0 <= ipv4SubnetPrefix <= 32):
+            raise TypeError("IPv4 subnet prefix %s out of range."
+                            % ipv4SubnetPrefix)
+        if not (0 <= ipv6SubnetPrefix <= 128):
+            raise TypeError("IPv6 subnet prefix %s out of range."
+                            % ipv6SubnetPrefix)
 
         self.needPorts = needPorts[:]
         self.needFlags = [(flag.lower(), count) for flag, count in needFlags[:]]
+        self.subnetPrefixes = {4: ipv4SubnetPrefix, 6: ipv6SubnetPrefix}
+        self.memoizeAnswers = memoizeAnswers
+
+
+class PlacementTable(object):
+    """Remembers where each bridge was placed in one generation of hashrings:
+    the pool (i.e. distributor) it was assigned to, its subring (i.e. client
+    cluster) within that pool, and its position in the pool's hashrings.
+    Each of these is only computed once per bridge, no matter how many
+    hashrings, subrings, and filters place the bridge.
+
+    A table is shared by a :class:`BridgeSplitter`, the hashrings of all of
+    its pools, and all of their subrings.
+
+    :ivar dict placements: A dictionary mapping bridge identity digests to
+        ``[pool, subring, position]`` lists, in which anything not yet known
+        is ``None``.  The ``pool`` is the name of the pool the bridge was
+        assigned to.  The ``subring`` is a 2-tuple of the ``(hmac, total)``
+        it was computed for (see :meth:`getSubringFunc`), and the subring's
+        number.  The ``position`` is a 2-tuple of the HMAC key it was
+        computed with, and the position.
+    :ivar dict filters: A dictionary mapping names to the filters which were
+        made with this table, by :func:`bridgedb.filters.bySubring`.
+    """
+
+    def __init__(self):
+        self.placements = {}
+        self.filters = {}
+        self._subringFuncs = {}
+
+    def __len__(self):
+        """Get the number of identities which have placements."""
+        return len(self.placements)
+
+    def _getPlacement(self, identity):
+        """Get the ``[pool, subring, position]`` of an **identity**, adding
+        an empty one if there isn't one yet.
+
+        :rtype: list
+        """
+        placement = self.placements.get(identity)
+        if placement is None:
+            placement = self.placements.setdefault(identity,
+                                                   [None, None, None])
+        return placement
+
+    def getPool(self, identity):
+        """Get the name of the pool which the bridge with some **identity**
+        was assigned to, or ``None`` if it wasn't assigned to one.
+        """
+        placement = self.placements.get(identity)
+        if placement is not None:
+            return placement[0]
+
+    def setPool(self, identity, pool):
+        """Record that the bridge with some **identity** was assigned to the
+        pool named **pool**.
+        """
+        self._getPlacement(identity)[0] = pool
+
+    def getPools(self):
+        """Get the pools which bridges were assigned to.
+
+        :rtype: dict
+        :returns: A dictionary mapping bridge identity digests to the names
+            of the pools they were assigned to.
+        """
+        return dict([(identity, placement[0]) for identity, placement
+                     in self.placements.items() if placement[0] is not None])
+
+    def getSubringFunc(self, hmac, total):
+        """Get a function which gets the subring, out of **total** subrings,
+        which a bridge is placed into by an **hmac** function, and remembers
+        the results in this table.
+
+        :param callable hmac: A hex-encoding HMAC function, as returned from
+            :func:`~bridgedb.crypto.getHMACFunc`.
+        :param int total: The number of subrings.
+        :rtype: callable
+        :returns: A function which takes a bridge's identity digest, and
+            returns the number of its subring, from ``0`` to ``total - 1``.
+        """
+        subring_fn = self._subringFuncs.get((hmac, total))
+        if subring_fn is not None:
+            return subring_fn
+
+        getPlacement = self._getPlacement
+        # Functions for the same key are different objects in different
+        # generations, so compare them by their results:
+        name = (hmac(""), total)
+
+        def subring_fn(identity):
+            placement = getPlacement(identity)
+            subring = placement[1]
+            if subring is None or subring[0] != name:
+                subring = placement[1] = (
+                    name, int(hmac(identity)[:8], 16) % total)
+            return subring[1]
+
+        self._subringFuncs[(hmac, total)] = subring_fn
+        return subring_fn
+
+    def getPositionFunc(self, key):
+        """Get a function which gets the position of a bridge in the hashrings
+        using some HMAC **key**, and remembers the results in this table.
+
+        It should only be called with bridge identity digests, since every
+        result is kept for as long as this table is.
+
+        :param bytes key: The HMAC key.
+        :rtype: callable
+        :returns: A function like those from
+            :func:`~bridgedb.crypto.getHMACFunc`, with ``hex=False``.
+        """
+        hmac = getHMACFunc(key, hex=False)
+        getPlacement = self._getPlacement
+
+        def position_fn(identity):
+            placement = getPlacement(identity)
+            position = placement[2]
+            if position is None or position[0] != key:
+                position = placement[2] = (key, hmac(identity))
+            return position[1]
+        return position_fn
+
+    def copyFrom(self, previous, excluded=()):
+        """Take over the placements in a **previous** table, e.g. that of the
+        previous generation of hashrings, so that they aren't computed again.
+
+        :type previous: :class:`PlacementTable`
+        :param excluded: The identity digests of bridges whose placements
+            shouldn't be taken over.
+        """
+        for identity, placement in previous.placements.items():
+            if identity not in excluded:
+                self.placements[identity] = list(placement)
+
+    def clear(self):
+        """Forget all placements."""
+        self.placements.clear()
+
+
+class PositionIndex(object):
+    """A sorted index of fixed-width hashring positions.
+
+    Rather than keeping one Python string object per bridge in a list (and a
+    dictionary mapping each of those strings to a :class:`Bridge`), all of
+    the positions are stored back-to-back, in sorted order, in a single
+    contiguous byte string.  A parallel :class:`array.array` holds an integer
+    "handle" for the bridge at each position, which the owner of the index
+    can use to find the actual bridge.
+
+    Lookups are a binary search over the fixed-width buffer, and new
+    positions are merged in, in one pass, with :meth:`merge`; the index never
+    needs to be re-sorted.
+
+    :ivar int width: The length, in bytes, of every position.
+    :ivar bytes positions: The sorted positions, concatenated.
+    :ivar handles: An :class:`array.array` of integers, such that
+        ``handles[i]`` is the handle for the position at index ``i``.
+    """
+
+    def __init__(self, width=DIGEST_LEN):
+        """Create a new, empty index.
+
+        :param int width: The length, in bytes, of every position which will
+            be stored in this index.
+        """
+        self.width = width
+        self.positions = b''
+        self.handles = array.array('l')
+
+    def __len__(self):
+        """Get the number of positions in this index."""
+        return len(self.handles)
+
+    @classmethod
+    def fromPairs(cls, pairs, width=DIGEST_LEN):
+        """Build an index from an iterable of ``(position, handle)`` pairs,
+        sorting them only once.
+
+        :rtype: :class:`PositionIndex`
+        """
+        index = cls(width)
+        index.merge(pairs)
+        return index
+
+    def positionAt(self, index):
+        """Get the position stored at **index**.
+
+        :param int index: An index into this :class:`PositionIndex`.
+        :rtype: bytes
+        """
+        start = index * self.width
+        return self.positions[start:start + self.width]
+
+    def bisect(self, position, lo=0, hi=None):
+        """Find the index at which **position** is, or would be inserted.
+
+        This behaves exactly like :func:`bisect.bisect_left` on a sorted list
+        of all of the positions.
+
+        :param bytes position: The position to search for.
+        :rtype: int
+        """
+        width = self.width
+        buf = self.positions
+        if hi is None:
+            hi = len(self.handles)
+
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start = mid * width
+            if buf[start:start + width] < position:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def find(self, position):
+        """Get the handle for the bridge at exactly **position**.
+
+        :param bytes position: The position to search for.
+        :rtype: int or ``None``
+        :returns: The handle, or ``None`` if nothing is at that position.
+        """
+        index = self.bisect(position)
+        if index < len(self.handles) and self.positionAt(index) == position:
+            return self.handles[index]
+        return None
+
+    def indicesAt(self, position, N=1):
+        """Get the indices of **N** consecutive positions, starting at the
+        first one which is greater than or equal to **position**, and wrapping
+        around the end of the index if necessary.
+
+        If **N** is greater than or equal to the size of this index, then
+        every index is returned.
+
+        :param bytes position: The position to start at.
+        :param int N: The number of indices to get.
+        :rtype: list
+        """
+        return self.indicesFrom(self.bisect(position), N)
+
+    def without(self, handles):
+        """Get a copy of this index without the positions of some
+        **handles**, copying the rest in contiguous runs between them.
+
+        :param set handles: The handles to leave out.
+        :rtype: :class:`PositionIndex`
+        """
+        width = self.width
+        index = self.__class__(width)
+        dropped = [i for i, handle in enumerate(self.handles)
+                   if handle in handles]
+
+        chunks = []
+        start = 0
+        for i in dropped + [len(self.handles)]:
+            if i > start:
+                chunks.append(self.positions[start * width:i * width])
+                index.handles.extend(self.handles[start:i])
+            start = i + 1
+
+        index.positions = b''.join(chunks)
+        return index
+
+    def indicesFrom(self, start, N=1):
+        """Get the indices of **N** consecutive positions, starting at the
+        index **start**, and wrapping around the end of the index if
+        necessary.  See :meth:`indicesAt`.
+
+        :param int start: The index to start at, e.g. from :meth:`bisect`.
+        :param int N: The number of indices to get.
+        :rtype: list
+        """
+        total = len(self.handles)
+        if N >= total:
+            return range(total)
+        return [(start + i) % total for i in xrange(N)]
+
+    def merge(self, pairs):
+        """Merge some new ``(position, handle)`` **pairs** into this index.
+
+        The new pairs are sorted, and then the existing buffer is copied over
+        in contiguous runs between them.  If a new position is already in the
+        index (or given more than once), the last handle given for it wins.
+
+        :param list pairs: A list of two-tuples of ``(position, handle)``.
+        :raises ValueError: if one of the positions is the wrong length.
+        """
+        if not pairs:
+            return
 
+        width = self.width
+        old = self.positions
+        oldHandles = self.handles
+        oldTotal = len(oldHandles)
+
+        chunks = []
+        handles = array.array(oldHandles.typecode)
+        previous = None
+        i = 0
+
+        for position, handle in sorted(pairs, key=lambda pair: pair[0]):
+            if len(position) != width:
+                raise ValueError("Hashring position %r is not %d bytes long."
+                                 % (position, width))
+            if position == previous:
+                handles[-1] = handle
+                continue
+
+            j = self.bisect(position, i, oldTotal)
+            if j > i:
+                chunks.append(old[i * width:j * width])
+                handles.extend(oldHandles[i:j])
+            i = j
+            if i < oldTotal and old[i * width:(i + 1) * width] == position:
+                i += 1
+
+            chunks.append(position)
+            handles.append(handle)
+            previous = position
+
+        if i < oldTotal:
+            chunks.append(old[i * width:])
+            handles.extend(oldHandles[i:])
+
+        self.positions = b''.join(chunks)
+        self.handles = handles
 
 class BridgeRing(object):
     """Arranges bridges into a hashring based on an hmac function."""
 
-    def __init__(self, key, answerParameters=None):
+    def __init__(self, key, answerParameters=None, placements=None):
         """Create a new BridgeRing, using key as its hmac key.
 
         :type key: bytes
@@ -99,16 +459,32 @@ class BridgeRing(object):
              :func:`~bridgedb.crypto.getKey`.
         :type answerParameters: :class:`BridgeRingParameters`
         :param answerParameters: DOCDOC
+        :type placements: :class:`PlacementTable` or None
+        :param placements: The table in which to remember the positions of
+            bridges.  If ``None``, this hashring and its subrings have a table
+            of their own.
         :ivar dict bridges: A dictionary which maps HMAC keys to
             :class:`~bridgedb.bridges.Bridge`s.
         :ivar dict bridgesByID: A dictionary which maps raw hash digests of
             bridge ID keys to :class:`~bridgedb.bridges.Bridge`s.
+        :ivar bytes key: The HMAC key.
         :type hmac: callable
         :ivar hmac: An HMAC function, which uses the **key** parameter to
              generate new HMACs for storing, inserting, and retrieving
              :class:`~bridgedb.bridges.Bridge`s within mappings.
+        :type placements: :class:`PlacementTable`
+        :ivar placements: The table which remembers the results of
+             :data:`hmac`.  It is shared with our subrings.
         :ivar bool isSorted: ``True`` if ``sortedKeys`` is currently sorted.
         :ivar list sortedKeys: A sorted list of all of the HMACs.
+        :ivar int lastSubnetWalk: The number of hashring positions which the
+            last call to :meth:`getBridges` with ``filterBySubnet=True`` had
+            to look at in order to find bridges in distinct subnets.
+        :ivar dict answers: If ``answerParameters.memoizeAnswers`` is set, a
+            dictionary mapping ``(index, N, filterBySubnet)`` to the answer
+            from :meth:`getBridges`, and the ``lastSubnetWalk`` for it, for
+            any position which bisects to ``index``.  It is emptied whenever
+            this hashring changes.
         :ivar str name: A string which identifies this hashring, used mostly
             for differentiating this hashring in log messages, but it is also
             used for naming subrings. If this hashring is a subring, the
@@ -140,25 +516,38 @@ class BridgeRing(object):
                 contains ``count`` number of
                 :class:`~bridgedb.bridges.Bridge`s of a certain ``type``.
         """
-        self.bridges = {}
-        self.bridgesByID = {}
-        self.hmac = getHMACFunc(key, hex=False)
-        self.isSorted = False
-        self.sortedKeys = []
+        self._ownsPlacements = placements is None
+        if placements is None:
+            placements = PlacementTable()
+        self.key = key
+        self.placements = placements
+        self.hmac = placements.getPositionFunc(key)
+        self._resetStorage()
         if answerParameters is None:
             answerParameters = BridgeRingParameters()
         self.answerParameters = answerParameters
+        self.lastSubnetWalk = 0
+        self.answers = {}
 
         self.subrings = []
         for port,count in self.answerParameters.needPorts:
             #note that we really need to use the same key here, so that
             # the mapping is in the same order for all subrings.
-            self.subrings.append( ('port',port,count,BridgeRing(key,None)) )
+            self.subrings.append( ('port',port,count,self._createSubring(key)) )
         for flag,count in self.answerParameters.needFlags:
-            self.subrings.append( ('flag',flag,count,BridgeRing(key,None)) )
+            self.subrings.append( ('flag',flag,count,self._createSubring(key)) )
 
         self.setName("Ring")
 
+    def _createSubring(self, key):
+        """Create one of the subrings for the ports and flags in our
+        :ivar:`answerParameters`.
+
+        :param bytes key: The HMAC key, which must be the same as ours.
+        :rtype: :class:`BridgeRing`
+        """
+        return self.__class__(key, None, self.placements)
+
     def setName(self, name):
         """Tag a unique name to this hashring for identification.
 
@@ -175,13 +564,20 @@ class BridgeRing(object):
         """Get the number of unique bridges this hashring contains."""
         return len(self.bridges)
 
-    def clear(self):
-        """Remove all bridges and mappings from this hashring and subrings."""
+    def _resetStorage(self):
+        """Create empty mappings for storing this hashring's bridges."""
         self.bridges = {}
         self.bridgesByID = {}
         self.isSorted = False
         self.sortedKeys = []
 
+    def clear(self):
+        """Remove all bridges and mappings from this hashring and subrings."""
+        self._resetStorage()
+        self.answers.clear()
+        if self._ownsPlacements:
+            self.placements.clear()
+
         for tp, val, count, subring in self.subrings:
             subring.clear()
 
@@ -199,6 +595,21 @@ class BridgeRing(object):
         :type bridge: :class:`~bridgedb.Bridges.Bridge`
         :param bridge: The bridge to insert into this hashring.
         """
+        self._insertIntoSubrings(bridge)
+        self.answers.clear()
+
+        pos = self.hmac(bridge.identity)
+        if not pos in self.bridges:
+            self.sortedKeys.append(pos)
+            self.isSorted = False
+        self.bridges[pos] = bridge
+        self.bridgesByID[bridge.identity] = bridge
+        logging.debug("Adding %s to %s" % (bridge.address, self.name))
+
+    def _insertIntoSubrings(self, bridge):
+        """Add a **bridge** to each of our subrings whose port or flag
+        requirements it satisfies.
+        """
         for tp, val, _, subring in self.subrings:
             if tp == 'port':
                 if val == bridge.orPort:
@@ -208,13 +619,15 @@ class BridgeRing(object):
                 if val == 'stable' and bridge.flags.stable:
                     subring.insert(bridge)
 
-        pos = self.hmac(bridge.identity)
-        if not pos in self.bridges:
-            self.sortedKeys.append(pos)
-            self.isSorted = False
-        self.bridges[pos] = bridge
-        self.bridgesByID[bridge.identity] = bridge
-        logging.debug("Adding %s to %s" % (bridge.address, self.name))
+    def _getBridgeByKey(self, key):
+        """Get the bridge at the hashring position **key**.
+
+        :param bytes key: A position, as returned from
+            :meth:`_getBridgeKeysAt`.
+        :raises KeyError: if there is no bridge at that position.
+        :rtype: :class:`~bridgedb.bridges.Bridge`
+        """
+        return self.bridges[key]
 
     def _sort(self):
         """Helper: put the keys in sorted order."""
@@ -222,6 +635,80 @@ class BridgeRing(object):
             self.sortedKeys.sort()
             self.isSorted = True
 
+    def _isSorted(self):
+        """Check whether this hashring is sorted, so that looking up bridges
+        in it won't change it.
+        """
+        return self.isSorted
+
+    def _sortAll(self):
+        """Sort this hashring and its subrings now, rather than on their
+        first lookups, e.g. before other threads may look bridges up in them.
+        """
+        self._sort()
+        for _, _, _, subring in self.subrings:
+            subring._sortAll()
+
+    def _canCopyFrom(self, previous):
+        """Check whether :meth:`copyFrom` can fill this hashring, and its
+        subrings, from a **previous** one.
+        """
+        if (type(previous) is not type(self) or previous.key != self.key
+                or len(self) or not previous._isSorted()):
+            return False
+        if ([(tp, val) for tp, val, _, _ in self.subrings] !=
+                [(tp, val) for tp, val, _, _ in previous.subrings]):
+            return False
+        for (_, _, _, subring), (_, _, _, other) in zip(self.subrings,
+                                                        previous.subrings):
+            if not subring._canCopyFrom(other):
+                return False
+        return True
+
+    def _copyFrom(self, previous, removed):
+        """Fill this hashring, and its subrings, from a **previous** one,
+        without any of the **removed** bridges.
+        """
+        gone = set([bridge.identity for bridge in removed])
+        self.bridges = dict([(pos, bridge) for pos, bridge
+                             in previous.bridges.items()
+                             if bridge.identity not in gone])
+        self.bridgesByID = dict([(identity, bridge) for identity, bridge
+                                 in previous.bridgesByID.items()
+                                 if identity not in gone])
+        self.sortedKeys = [pos for pos in previous.sortedKeys
+                           if pos in self.bridges]
+        self.isSorted = True
+
+        for (_, _, _, subring), (_, _, _, other) in zip(self.subrings,
+                                                        previous.subrings):
+            subring._copyFrom(other, removed)
+
+    def copyFrom(self, previous, removed=()):
+        """Fill this empty hashring with the bridges in a **previous** one,
+        e.g. the same subring in the previous generation of hashrings, except
+        for some **removed** bridges.
+
+        The positions of the bridges are copied, so none of them are HMACed
+        or inserted again.  The **previous** hashring must have the same
+        class, key and :ivar:`answerParameters`, and must have been sorted
+        (see :meth:`_sortAll`), so that it isn't changed while it's copied.
+
+        :type previous: :class:`BridgeRing`
+        :param previous: The hashring to copy.
+        :param list removed: The :class:`~bridgedb.bridges.Bridge`\\ s to
+            leave out.
+        :rtype: bool
+        :returns: ``True`` if this hashring was filled, or ``False`` if
+            **previous** can't be copied.
+        """
+        if not self._canCopyFrom(previous):
+            return False
+
+        self._copyFrom(previous, removed)
+        self.answers.clear()
+        return True
+
     def _getBridgeKeysAt(self, pos, N=1):
         """Bisect a list of bridges at a specified position, **pos**, and
         retrieve bridges from that point onwards, wrapping around the hashring
@@ -262,6 +749,21 @@ class BridgeRing(object):
         if not self.isSorted:
             self._sort()
         idx = bisect.bisect_left(self.sortedKeys, pos)
+        return self._getBridgeKeysFrom(idx, N)
+
+    def _getBridgeKeysFrom(self, idx, N=1):
+        """Get the positions of **N** bridges, starting at the index **idx**
+        into our sorted positions, and wrapping around the hashring if
+        necessary.  See :meth:`_getBridgeKeysAt`.
+
+        :param int idx: The index to start at, e.g. from
+            :meth:`_getIndicesAt`.
+        :param int N: The number of bridges to return.
+        :rtype: list
+        :returns: A list of positions.
+        """
+        if N >= len(self.sortedKeys):
+            return self.sortedKeys
         r = self.sortedKeys[idx:idx+N]
         if len(r) < N:
             # wrap around as needed.
@@ -269,42 +771,124 @@ class BridgeRing(object):
         assert len(r) == N
         return r
 
-    def filterDistinctSubnets(self, fingerprints):
+    def _getIndicesAt(self, positions):
+        """Get the index in our sorted positions at which each of many
+        **positions** is, or would be inserted, as :func:`bisect.bisect_left`
+        would find it.
+
+        The **positions** are visited in sorted order, so that each one is
+        only searched for after wherever the previous one was found, in a
+        single pass over our positions.
+
+        :param list positions: Some positions in this hashring.
+        :rtype: list
+        :returns: The index for each of the **positions**, in order.
+        """
+        if not self.isSorted:
+            self._sort()
+        indices = [0] * len(positions)
+        lo = 0
+        for i in sorted(xrange(len(positions)), key=positions.__getitem__):
+            lo = indices[i] = bisect.bisect_left(self.sortedKeys,
+                                                 positions[i], lo)
+        return indices
+
+    def _getIndexAt(self, pos):
+        """Get the index of the first position in this hashring which is
+        greater than or equal to **pos**, wrapping around the hashring.
+
+        Any two positions with the same index get the same answer from
+        :meth:`getBridges`.
+
+        :param bytes pos: A position in this hashring.
+        :rtype: int
+        """
+        if not self.isSorted:
+            self._sort()
+        return bisect.bisect_left(self.sortedKeys, pos) % len(self.sortedKeys)
+
+    def _iterBridgeKeysAt(self, pos):
+        """Iterate over every position in this hashring once, starting at
+        **pos** and wrapping around the hashring.
+
+        :param bytes pos: The position to start at.
+        :rtype: iterator
+        """
+        if not self.isSorted:
+            self._sort()
+        idx = bisect.bisect_left(self.sortedKeys, pos)
+        return itertools.chain(itertools.islice(self.sortedKeys, idx, None),
+                               itertools.islice(self.sortedKeys, 0, idx))
+
+    def _getSubnet(self, address):
+        """Get an integer key for the subnet containing **address**.
+
+        The subnet's prefix length is taken from our
+        :ivar:`answerParameters`.  Any two addresses in the same subnet get
+        the same key.
+
+        :type address: :class:`ipaddr.IPv4Address` or
+            :class:`ipaddr.IPv6Address`
+        :param address: A bridge's address.
+        :rtype: tuple
+        :returns: A 2-tuple of the IP version and the integer value of the
+            network prefix of **address**.
+        """
+        bits = address.max_prefixlen
+        prefix = self.answerParameters.subnetPrefixes[address.version]
+        return (address.version, int(address) >> (bits - prefix))
+
+    def _isInDistinctSubnet(self, key, bridge, subnets):
+        """Check whether a **bridge** is in a subnet which isn't yet in
+        **subnets**, and, if so, add it.
+
+        :param bytes key: The **bridge**'s hashring position.
+        :type bridge: :class:`~bridgedb.bridges.Bridge`
+        :param bridge: A bridge which we might distribute.
+        :param set subnets: The subnets, from :meth:`_getSubnet`, of the
+            bridges we're already distributing.
+        :rtype: bool
+        """
+        # HOTFIX for https://bugs.torproject.org/26150
+        if not bridge.address:
+            logging.error("Got strange bridge with no address field set: %s"
+                          % toHex(key))
+            return False
+
+        subnet = self._getSubnet(bridge.address)
+        if subnet in subnets:
+            logging.debug(
+                ("Skipping distribution of bridge %s in a subnet which "
+                 "contains another bridge we're already distributing")
+                % bridge)
+            return False
+
+        subnets.add(subnet)
+        return True
+
+    def filterDistinctSubnets(self, fingerprints, subnets=None):
         """Given a chosen set of ``fingerprints`` of bridges to distribute,
         filter the bridges such that they are in distinct subnets.
+
+        :param list fingerprints: The hashring positions of the bridges.
+        :type subnets: set or ``None``
+        :param subnets: If given, the subnets of bridges which were already
+            chosen.  The subnets of the bridges returned are added to it.
+        :rtype: list
+        :returns: The :class:`~bridgedb.bridges.Bridge`s, each of which is in
+            a distinct subnet.
         """
         logging.debug("Got %d possible bridges to filter" % len(fingerprints))
 
+        if subnets is None:
+            subnets = set()
+
         bridges = []
-        subnets = []
 
         for fingerprint in fingerprints:
-            bridge = self.bridges[fingerprint]
-            jump = False
-
-            # HOTFIX for https://bugs.torproject.org/26150
-            if not bridge.address:
-                logging.error("Got strange bridge with no address field set: %s"
-                              % toHex(fingerprint))
-                continue
-
-            for subnet in subnets:
-                if bridge.address in subnet:
-                    jump = True
-                    logging.debug(
-                        ("Skipping distribution of bridge %s in a subnet which "
-                         "contains another bridge we're already distributing")
-                        % bridge)
-                    break
-            if jump:
-                continue
-
-            bridges.append(bridge)
-            if bridge.address.version == 4:
-                cidr = str(bridge.address) + "/16"
-            else:
-                cidr = str(bridge.address) + "/32"
-            subnets.append(ipaddr.IPNetwork(cidr))
+            bridge = self._getBridgeByKey(fingerprint)
+            if self._isInDistinctSubnet(fingerprint, bridge, subnets):
+                bridges.append(bridge)
 
         return bridges
 
@@ -316,9 +900,75 @@ class BridgeRing(object):
             assigned to that position. Otherwise, indexing will start at the
             first position after this one which has a bridge assigned to it.
         :param int N: The number of bridges to return.
+        :param bool filterBySubnet: If ``True``, return no two bridges in the
+            same subnet (see :class:`BridgeRingParameters`).  If there aren't
+            **N** such bridges in the usual candidates, keep walking around
+            the hashring until there are, or until every bridge has been
+            looked at.
         :rtype: list
         :returns: A list of :class:`~bridgedb.bridges.Bridge`s.
         """
+        if not (self.answerParameters.memoizeAnswers and len(self)):
+            return self._getBridges(pos, N, filterBySubnet)
+
+        key = (self._getIndexAt(pos), N, filterBySubnet)
+        answer = self.answers.get(key)
+        if answer is None:
+            bridges = self._getBridges(pos, N, filterBySubnet)
+            answer = self.answers[key] = (bridges, self.lastSubnetWalk)
+
+        bridges, self.lastSubnetWalk = answer
+        return bridges[:]
+
+    def getBridgesMany(self, positions, N=1, filterBySubnet=False):
+        """Get the bridges which :meth:`getBridges` would return for each of
+        many **positions** at once.
+
+        Rather than bisecting our positions once for each of them, the
+        **positions** are sorted and merged against ours in a single pass.
+        If answers are memoized, then any of the **positions** which land on
+        the same bridge share an answer, just as with :meth:`getBridges`.
+
+        :param list positions: The positions to jump to.
+        :param int N: The number of bridges to return for each position.
+        :param bool filterBySubnet: See :meth:`getBridges`.
+        :rtype: list
+        :returns: A list of :class:`~bridgedb.bridges.Bridge`\\ s for each
+            of the **positions**, in order.
+        """
+        if not len(self):
+            return [[] for _ in positions]
+
+        memoize = self.answerParameters.memoizeAnswers
+        total = len(self)
+        answers = []
+
+        for pos, idx in zip(positions, self._getIndicesAt(positions)):
+            if not memoize:
+                answers.append(self._getBridges(pos, N, filterBySubnet, idx))
+                continue
+
+            key = (idx % total, N, filterBySubnet)
+            answer = self.answers.get(key)
+            if answer is None:
+                bridges = self._getBridges(pos, N, filterBySubnet, idx)
+                answer = self.answers[key] = (bridges, self.lastSubnetWalk)
+            bridges, self.lastSubnetWalk = answer
+            answers.append(bridges[:])
+
+        return answers
+
+    def _getBridges(self, pos, N=1, filterBySubnet=False, idx=None):
+        """Return **N** bridges appearing in this hashring after a position,
+        without using or updating :data:`answers`.
+
+        See :meth:`getBridges`.
+
+        :type idx: int or None
+        :param idx: If given, the index of **pos** in our sorted positions,
+            from :meth:`_getIndicesAt`, so that it needn't be searched for.
+        :rtype: list
+        """
         forced = []
         for _, _, count, subring in self.subrings:
             if len(subring) < count:
@@ -326,11 +976,17 @@ class BridgeRing(object):
             forced.extend(subring._getBridgeKeysAt(pos, count))
 
         keys = []
+        seen = set()
 
         # Oversample double the number we need, in case we need to
         # filter them and some are within the same subnet.
-        for k in forced + self._getBridgeKeysAt(pos, N + N):
-            if k not in keys:
+        if idx is None:
+            candidates = self._getBridgeKeysAt(pos, N + N)
+        else:
+            candidates = self._getBridgeKeysFrom(idx, N + N)
+        for k in forced + candidates:
+            if k not in seen:
+                seen.add(k)
                 keys.append(k)
             else:
                 logging.debug(
@@ -339,14 +995,112 @@ class BridgeRing(object):
         keys.sort()
 
         if filterBySubnet:
-            bridges = self.filterDistinctSubnets(keys)
+            subnets = set()
+            bridges = self.filterDistinctSubnets(keys, subnets)
+            walked = min(N + N, len(self))
+
+            # If too many of the candidates shared subnets, continue around
+            # the hashring from the requested position:
+            if len(bridges) < N and len(keys) < len(self):
+                walked = 0
+                for key in self._iterBridgeKeysAt(pos):
+                    if len(bridges) >= N:
+                        break
+                    walked += 1
+                    if key in seen:
+                        continue
+                    bridge = self._getBridgeByKey(key)
+                    if self._isInDistinctSubnet(key, bridge, subnets):
+                        bridges.append(bridge)
+
+            self.lastSubnetWalk = walked
+            logging.debug("Walked %d positions in %s to find %d bridges in "
+                          "distinct subnets." % (walked, self.name,
+                                                 min(len(bridges), N)))
         else:
-            bridges = [self.bridges[k] for k in keys]
+            bridges = [self._getBridgeByKey(k) for k in keys]
 
         bridges = bridges[:N]
 
         return bridges
 
+    def _getMatchingKeysAt(self, pos, N, filterFn):
+        """Get the positions of the first **N** bridges which match
+        **filterFn**, starting at **pos** and wrapping around the hashring.
+
+        :rtype: tuple
+        :returns: A 2-tuple of the list of positions, and the number of
+            positions which were walked to find them.
+        """
+        keys = []
+        walked = 0
+        if N < 1:
+            return keys, walked
+
+        for key in self._iterBridgeKeysAt(pos):
+            walked += 1
+            if filterFn(self._getBridgeByKey(key)):
+                keys.append(key)
+                if len(keys) >= N:
+                    break
+        return keys, walked
+
+    def getMatchingBridges(self, pos, N, filterFn, filterBySubnet=False):
+        """Return the bridges which :meth:`getBridges` would return, if this
+        hashring only had the bridges which match **filterFn**.
+
+        This is for answering clients from a hashring which also has bridges
+        that don't match their filters, e.g. while the subhashring for their
+        filters is being built.  Every bridge is at the same position in
+        that subhashring, and the same bridges are forced into its answers
+        by its subrings, so long as it has the same key and
+        :ivar:`answerParameters` as this one.  Thus clients get the same
+        bridges before and after their subhashring is built.
+
+        :param bytes pos: The position to start at.
+        :param int N: The number of bridges to return.
+        :param callable filterFn: A filter, e.g. from
+            :func:`bridgedb.filters.byFilters`, which the bridges must match.
+        :param bool filterBySubnet: If ``True``, return no two bridges in the
+            same subnet.
+        :rtype: list
+        :returns: A list of up to **N** :class:`~bridgedb.bridges.Bridge`\\ s.
+        """
+        # This follows _getBridges(), skipping the bridges which don't match:
+        forced = []
+        for _, _, count, subring in self.subrings:
+            forced.extend(subring._getMatchingKeysAt(pos, count, filterFn)[0])
+
+        candidates, walked = self._getMatchingKeysAt(pos, N + N, filterFn)
+        seen = set(forced + candidates)
+        keys = sorted(seen)
+
+        if filterBySubnet:
+            subnets = set()
+            bridges = self.filterDistinctSubnets(keys, subnets)
+
+            # If too many of the candidates shared subnets, continue around
+            # the hashring from the requested position:
+            if len(bridges) < N:
+                walked = 0
+                for key in self._iterBridgeKeysAt(pos):
+                    if len(bridges) >= N:
+                        break
+                    walked += 1
+                    if key in seen:
+                        continue
+                    bridge = self._getBridgeByKey(key)
+                    if (filterFn(bridge) and
+                            self._isInDistinctSubnet(key, bridge, subnets)):
+                        bridges.append(bridge)
+        else:
+            bridges = [self._getBridgeByKey(k) for k in keys]
+
+        self.lastSubnetWalk = walked
+        logging.debug("Walked %d positions in %s to find %d matching bridges."
+                      % (walked, self.name, min(len(bridges), N)))
+        return bridges[:N]
+
     def getBridgeByID(self, fp):
         """Return the bridge whose identity digest is fp, or None if no such
            bridge exists."""
@@ -367,6 +1121,415 @@ class BridgeRing(object):
             f.write("%s %s\n" % (b.fingerprint, " ".join(desc).strip()))
 
 
+class BridgeTable(object):
+    """A table of bridges, each of which is addressed by an integer handle.
+
+    A handle stays the same for as long as its bridge is in the table, and
+    isn't reused once its bridge is removed.
+
+    :ivar list bridges: The bridges, indexed by their handles.  The handles
+        of removed bridges are ``None``.
+    :ivar dict handles: A dictionary mapping bridge fingerprints to handles.
+    :type placements: :class:`PlacementTable`
+    :ivar placements: The table which remembers the placements of the
+        bridges for every hashring using this table.
+    """
+
+    def __init__(self):
+        self.bridges = []
+        self.handles = {}
+        self.placements = PlacementTable()
+        self._ownsPlacements = True
+
+    def usePlacements(self, placements):
+        """Remember the bridges' placements in some other **placements**
+        table, e.g. that of a :class:`BridgeSplitter`, which is never cleared
+        by this table.  No hashrings may have been created from this table
+        yet.
+
+        :type placements: :class:`PlacementTable`
+        """
+        self.placements = placements
+        self._ownsPlacements = False
+
+    def __len__(self):
+        """Get the number of bridges in this table."""
+        return len(self.handles)
+
+    def __getitem__(self, handle):
+        """Get the bridge with the given **handle**."""
+        return self.bridges[handle]
+
+    def getHandle(self, bridge):
+        """Get the handle of the bridge with the same fingerprint as
+        **bridge**, or ``None`` if there is no such bridge in this table.
+        """
+        return self.handles.get(bridge.fingerprint)
+
+    def add(self, bridge):
+        """Add a **bridge** to this table, replacing any bridge with the same
+        fingerprint.
+
+        :rtype: int
+        :returns: The bridge's handle.
+        """
+        handle = self.handles.get(bridge.fingerprint)
+        if handle is None:
+            handle = len(self.bridges)
+            self.bridges.append(bridge)
+            self.handles[bridge.fingerprint] = handle
+        else:
+            self.bridges[handle] = bridge
+        return handle
+
+    def copyFrom(self, previous, removed=()):
+        """Take over the bridges in a **previous** table, e.g. that of the
+        previous generation of a hashring, keeping their handles, except for
+        some **removed** bridges.
+
+        :type previous: :class:`BridgeTable`
+        :param list removed: The :class:`~bridgedb.bridges.Bridge`\\ s to
+            leave out.
+        :rtype: list
+        :returns: The handles which the **removed** bridges had.
+        """
+        self.bridges[:] = previous.bridges
+        self.handles.clear()
+        self.handles.update(previous.handles)
+
+        handles = []
+        for bridge in removed:
+            handle = self.handles.pop(bridge.fingerprint, None)
+            if handle is not None:
+                self.bridges[handle] = None
+                handles.append(handle)
+        return handles
+
+    def clear(self):
+        """Remove all bridges from this table."""
+        del self.bridges[:]
+        self.handles.clear()
+        if self._ownsPlacements:
+            self.placements.clear()
+
+
+class CompactBridgeRing(BridgeRing):
+    """A :class:`BridgeRing` which stores its positions in a
+    :class:`PositionIndex`, rather than in a dictionary and a list.
+
+    The bridges themselves are kept in a :class:`BridgeTable`, and are
+    referred to in the index by their handles.  The table may be shared with
+    other hashrings (for example, with all of a distributor's filtered
+    subhashrings), in which case each hashring is only a view of the bridges
+    in the table, storing nothing but its sorted positions and their handles.
+    The subrings for our :ivar:`answerParameters` always share our table.
+
+    Newly inserted bridges are buffered, and then merged into the index all
+    at once the next time that a lookup happens, so that building a ring only
+    ever sorts once.
+
+    This class is a drop-in replacement for :class:`BridgeRing`, except that
+    it has no ``sortedKeys`` or ``isSorted`` attributes, and its
+    ``bridges`` and ``bridgesByID`` attributes are (expensive) read-only
+    dictionaries which are created on demand.
+    """
+
+    def __init__(self, key, answerParameters=None, table=None):
+        """Create a new CompactBridgeRing, using key as its hmac key.
+
+        See :class:`BridgeRing`.
+
+        :type table: :class:`BridgeTable` or None
+        :param table: The table in which this hashring's bridges are kept.
+            If given, any bridge inserted into this hashring must already be
+            in the **table**, and this hashring never adds bridges to it.
+            Otherwise, this hashring has a table of its own.
+        """
+        self._ownsTable = table is None
+        self.table = BridgeTable() if table is None else table
+        self.key = key
+        super(CompactBridgeRing, self).__init__(key, answerParameters,
+                                                self.table.placements)
+
+    def _createSubring(self, key):
+        """Create a subring which shares our :data:`table`."""
+        return self.__class__(key, None, self.table)
+
+    def _resetStorage(self):
+        """Create an empty index for this hashring."""
+        self._index = PositionIndex(DIGEST_LEN)
+        self._pending = {}
+        self._count = 0
+
+    def clear(self):
+        """Remove all bridges and mappings from this hashring and subrings."""
+        if self._ownsTable:
+            self.table.clear()
+        super(CompactBridgeRing, self).clear()
+
+    @property
+    def bridges(self):
+        """A dictionary which maps hashring positions to bridges."""
+        self._sort()
+        return dict([(self._index.positionAt(i), self.table[handle])
+                     for i, handle in enumerate(self._index.handles)])
+
+    @property
+    def bridgesByID(self):
+        """A dictionary which maps bridge identity digests to bridges."""
+        self._sort()
+        bridges = [self.table[handle] for handle in self._index.handles]
+        return dict([(bridge.identity, bridge) for bridge in bridges])
+
+    def __len__(self):
+        """Get the number of unique bridges this hashring contains."""
+        return self._count
+
+    def _findHandle(self, pos):
+        """Get the handle of the bridge at the hashring position **pos**,
+        including any bridges which haven't yet been merged into the index.
+
+        :rtype: int or None
+        """
+        handle = self._pending.get(pos)
+        if handle is None:
+            handle = self._index.find(pos)
+        return handle
+
+    def insert(self, bridge):
+        """Add a **bridge** to this hashring.
+
+        If the bridge is already in this hashring, it is replaced.  Otherwise
+        its position will be merged into the index on the next lookup.
+
+        :type bridge: :class:`~bridgedb.Bridges.Bridge`
+        :param bridge: The bridge to insert into this hashring.
+        """
+        if self._ownsTable:
+            handle = self.table.add(bridge)
+        else:
+            handle = self.table.getHandle(bridge)
+            if handle is None:
+                logging.warn("Can't add %s to %s: it isn't in the bridge table."
+                             % (bridge, self.name))
+                return
+
+        self._insertIntoSubrings(bridge)
+        self.answers.clear()
+
+        pos = self.hmac(bridge.identity)
+        if pos not in self._pending and self._index.find(pos) is None:
+            self._pending[pos] = handle
+            self._count += 1
+        logging.debug("Adding %s to %s" % (bridge.address, self.name))
+
+    def getIndexJob(self, bridges):
+        """Describe how to fill this empty hashring, and its subrings, with
+        some **bridges**, so that the work can be done by
+        :func:`buildCompactIndexes` in another process.
+
+        :param list bridges: The :class:`~bridgedb.bridges.Bridge`\ s to
+            fill this hashring with.  They must be in our :data:`table`.
+        :rtype: tuple
+        :returns: A picklable job for :func:`buildCompactIndexes`.
+        """
+        members = []
+        for bridge in bridges:
+            handle = self.table.getHandle(bridge)
+            if handle is not None:
+                members.append((handle, bridge.identity, bridge.orPort,
+                                bool(bridge.flags.stable)))
+        subrings = [(tp, val) for tp, val, _, _ in self.subrings]
+        return (self.key, subrings, members)
+
+    def installIndexes(self, indexes):
+        """Fill this empty hashring, and its subrings, with the
+        :class:`PositionIndex`\ es built by :func:`buildCompactIndexes`.
+
+        :param list indexes: Our index, followed by one for each of our
+            :data:`subrings`, in order.
+        """
+        self._resetStorage()
+        self.answers.clear()
+        self._index = indexes[0]
+        self._count = len(indexes[0])
+        for (_, _, _, subring), index in zip(self.subrings, indexes[1:]):
+            subring.installIndexes([index])
+
+    def _sort(self):
+        """Helper: merge any newly inserted positions into the index."""
+        if self._pending:
+            self._index.merge(self._pending.items())
+            self._pending = {}
+
+    def _isSorted(self):
+        """Check whether every inserted position was merged into the index,
+        so that looking up bridges in this hashring won't change it.
+        """
+        return not self._pending
+
+    def _canCopyFrom(self, previous):
+        """Check whether :meth:`copyFrom` can fill this hashring from a
+        **previous** one.  Our :data:`table` must not be our own, but a
+        :meth:`copy <BridgeTable.copyFrom>` of **previous**'s, so that the
+        bridges in both have the same handles.
+        """
+        return (not self._ownsTable and
+                super(CompactBridgeRing, self)._canCopyFrom(previous))
+
+    def _copyFrom(self, previous, removed):
+        """Fill this hashring, and its subrings, from a **previous** one,
+        without any of the **removed** bridges.
+        """
+        handles = [previous.table.getHandle(bridge) for bridge in removed]
+        self._resetStorage()
+        self._index = previous._index.without(set(handles))
+        self._count = len(self._index)
+
+        for (_, _, _, subring), (_, _, _, other) in zip(self.subrings,
+                                                        previous.subrings):
+            subring._copyFrom(other, removed)
+
+    def _getBridgeByKey(self, key):
+        """Get the bridge at the hashring position **key**.
+
+        :param bytes key: A position, as returned from
+            :meth:`_getBridgeKeysAt`.
+        :raises KeyError: if there is no bridge at that position.
+        :rtype: :class:`~bridgedb.bridges.Bridge`
+        """
+        self._sort()
+        handle = self._index.find(key)
+        if handle is None:
+            raise KeyError(key)
+        return self.table[handle]
+
+    def _getBridgeKeysAt(self, pos, N=1):
+        """Get the positions of **N** bridges, starting at **pos** and
+        wrapping around the hashring if necessary.
+
+        See :meth:`BridgeRing._getBridgeKeysAt`.
+
+        :param bytes pos: The position to jump to.
+        :param int N: The number of bridges to return.
+        :rtype: list
+        :returns: A list of positions.
+        """
+        assert len(pos) == DIGEST_LEN
+        self._sort()
+        return [self._index.positionAt(i)
+                for i in self._index.indicesAt(pos, N)]
+
+    def _getBridgeKeysFrom(self, idx, N=1):
+        """Get the positions of **N** bridges, starting at the index **idx**
+        into our index, and wrapping around the hashring if necessary.
+
+        See :meth:`BridgeRing._getBridgeKeysFrom`.
+
+        :rtype: list
+        """
+        self._sort()
+        return [self._index.positionAt(i)
+                for i in self._index.indicesFrom(idx, N)]
+
+    def _getIndicesAt(self, positions):
+        """Get the index in our index at which each of many **positions**
+        is, or would be inserted, in a single pass.
+
+        See :meth:`BridgeRing._getIndicesAt`.
+
+        :rtype: list
+        """
+        self._sort()
+        indices = [0] * len(positions)
+        lo = 0
+        for i in sorted(xrange(len(positions)), key=positions.__getitem__):
+            lo = indices[i] = self._index.bisect(positions[i], lo)
+        return indices
+
+    def _getIndexAt(self, pos):
+        """Get the index of the first position in this hashring which is
+        greater than or equal to **pos**, wrapping around the hashring.
+
+        See :meth:`BridgeRing._getIndexAt`.
+
+        :param bytes pos: A position in this hashring.
+        :rtype: int
+        """
+        self._sort()
+        return self._index.bisect(pos) % len(self._index)
+
+    def _iterBridgeKeysAt(self, pos):
+        """Iterate over every position in this hashring once, starting at
+        **pos** and wrapping around the hashring.
+
+        :param bytes pos: The position to start at.
+        :rtype: iterator
+        """
+        self._sort()
+        index = self._index
+        total = len(index)
+        start = index.bisect(pos)
+        for i in xrange(total):
+            yield index.positionAt((start + i) % total)
+
+    def getBridgeByID(self, fp):
+        """Return the bridge whose identity digest is fp, or None if no such
+           bridge exists."""
+        for _,_,_,subring in self.subrings:
+            b = subring.getBridgeByID(fp)
+            if b is not None:
+                return b
+
+        handle = self._findHandle(self.hmac(fp))
+        if handle is not None:
+            return self.table[handle]
+
+    def dumpAssignments(self, f, description=""):
+        logging.info("Dumping bridge assignments for %s..." % self.name)
+        self._sort()
+        for handle in self._index.handles:
+            b = self.table[handle]
+            desc = [ description ]
+            for tp,val,_,subring in self.subrings:
+                if subring.getBridgeByID(b.identity):
+                    desc.append("%s=%s"%(tp,val))
+            f.write("%s %s\n" % (b.fingerprint, " ".join(desc).strip()))
+
+
+def buildCompactIndexes(job):
+    """Build the :class:`PositionIndex`\ es for a :class:`CompactBridgeRing`
+    and its subrings, i.e. HMAC every bridge's identity with the ring's key
+    and sort the results.
+
+    This only uses the picklable **job**, so it can run in a worker process
+    (see ``RING_BUILD_PROCESSES``), with the result handed back to
+    :meth:`CompactBridgeRing.installIndexes`.
+
+    :param tuple job: A job from :meth:`CompactBridgeRing.getIndexJob`.
+    :rtype: list
+    :returns: The ring's index, followed by one for each of its subrings.
+    """
+    key, subrings, members = job
+    hmac = getHMACFunc(key, hex=False)
+    placed = [(hmac(identity), handle, orPort, stable)
+              for handle, identity, orPort, stable in members]
+
+    indexes = [PositionIndex.fromPairs(
+        [(position, handle) for position, handle, _, _ in placed])]
+    for tp, val in subrings:
+        if tp == 'port':
+            pairs = [(position, handle)
+                     for position, handle, orPort, _ in placed
+                     if orPort == val]
+        else:
+            pairs = [(position, handle)
+                     for position, handle, _, stable in placed if stable]
+        indexes.append(PositionIndex.fromPairs(pairs))
+
+    return indexes
+
+
 class FixedBridgeSplitter(object):
     """Splits bridges up based on an HMAC and assigns them to one of several
     subhashrings with equal probability.
@@ -374,12 +1537,20 @@ class FixedBridgeSplitter(object):
     def __init__(self, key, rings):
         self.hmac = getHMACFunc(key, hex=True)
         self.rings = rings[:]
+        self.usePlacements(PlacementTable())
+
+    def usePlacements(self, placements):
+        """Remember which of our ``rings`` each bridge is in, in some
+        **placements** table, e.g. that of a :class:`BridgeSplitter`.
+
+        :type placements: :class:`PlacementTable`
+        """
+        self.placements = placements
+        self._getSubring = placements.getSubringFunc(self.hmac,
+                                                     len(self.rings))
 
     def insert(self, bridge):
-        # Grab the first 4 bytes
-        digest = self.hmac(bridge.identity)
-        pos = long( digest[:8], 16 )
-        which = pos % len(self.rings)
+        which = self._getSubring(bridge.identity)
         self.rings[which].insert(bridge)
 
     def clear(self):
@@ -425,6 +1596,15 @@ class UnallocatedHolder(object):
     def clear(self):
         self.fingerprints = []
 
+    def updateFrom(self, previous, removed):
+        """Leave the bridges which the **previous** holder left unallocated
+        unallocated, except for some **removed** ones.
+        """
+        gone = set([bridge.fingerprint for bridge in removed])
+        self.fingerprints = [fingerprint for fingerprint
+                             in previous.fingerprints
+                             if fingerprint not in gone]
+
     def dumpAssignments(self, f, description=""):
         with bridgedb.Storage.getDB() as db:
             allBridges = db.getAllBridges()
@@ -442,6 +1622,13 @@ class BridgeSplitter(object):
     """Splits incoming bridges up based on an HMAC, and assigns them to
     sub-bridgeholders with different probabilities.  Bridge ←→ BridgeSplitter
     associations are recorded in a store.
+
+    :type placements: :class:`PlacementTable`
+    :ivar placements: The placements of the bridges in this generation of
+        hashrings, which is shared with those of our subrings which can use
+        it.
+    :ivar bool frozen: Whether :meth:`freeze` was called, after which no
+        bridges may be inserted.
     """
     def __init__(self, key):
         self.hmac = getHMACFunc(key, hex=True)
@@ -450,6 +1637,8 @@ class BridgeSplitter(object):
         self.pValues = []
         self.rings = []
         self.statsHolders = []
+        self.placements = PlacementTable()
+        self.frozen = False
 
     def __len__(self):
         n = 0
@@ -457,8 +1646,18 @@ class BridgeSplitter(object):
             n += len(r)
         return n
 
+    @property
+    def assignments(self):
+        """A dictionary mapping the fingerprint of every bridge in our
+        subrings to the name of the subring it was assigned to, taken from
+        our :data:`placements`.
+        """
+        return dict([(toHex(identity).upper(), ringname) for identity, ringname
+                     in self.placements.getPools().items()])
+
     def addRing(self, ring, ringname, p=1):
-        """Add a new subring.
+        """Add a new subring.  If it can, it will share our
+        :data:`placements`.
 
         :param ring: The subring to add.
         :param str ringname: This is used to record which bridges have been
@@ -466,6 +1665,8 @@ class BridgeSplitter(object):
         :param int p: The relative proportion of bridges to assign to this
             bridgeholder.
         """
+        if hasattr(ring, 'usePlacements'):
+            ring.usePlacements(self.placements)
         self.ringsByName[ringname] = ring
         self.pValues.append(self.totalP)
         self.rings.append(ringname)
@@ -476,26 +1677,41 @@ class BridgeSplitter(object):
         """
         self.statsHolders.append(t)
 
-    def clear(self):
+    def freeze(self):
+        """Forbid any further changes to the bridges in this hashring and in
+        any of our subrings which can be frozen, once they are about to start
+        serving requests.
+        """
         for r in self.ringsByName.values():
-            r.clear()
+            if hasattr(r, 'freeze'):
+                r.freeze()
+        self.frozen = True
 
-    def insert(self, bridge):
-        assert self.rings
+    def _checkNotFrozen(self):
+        """Raise a :exc:`FrozenHashringError` if we were frozen."""
+        if self.frozen:
+            raise FrozenHashringError("Can't change the bridges in a frozen "
+                                      "hashring!")
 
-        for s in self.statsHolders:
-            s.insert(bridge)
+    def clear(self):
+        self._checkNotFrozen()
+        for r in self.ringsByName.values():
+            r.clear()
+        self.placements.clear()
 
-        # The bridge must be running to insert it:
-        if not bridge.flags.running:
-            return
+    def _choosePlacement(self, bridge, distribution_method=None):
+        """Decide which ring a running **bridge** should be placed into.
 
+        :type bridge: :class:`~bridgedb.bridges.Bridge`
+        :param bridge: The bridge to place.
+        :type distribution_method: str or None
+        :param distribution_method: The name of the ring the bridge was
+            already assigned to in the database, if any.
+        :rtype: str or None
+        :returns: The name of a ring, or ``None`` if the bridge requested not
+            to be distributed.
+        """
         validRings = self.rings
-        distribution_method = None
-
-        # If the bridge already has a distributor, use that.
-        with bridgedb.Storage.getDB() as db:
-            distribution_method = db.getBridgeDistributor(bridge, validRings)
 
         if distribution_method:
             logging.info("%s bridge %s was already in hashring %s" %
@@ -512,7 +1728,7 @@ class BridgeSplitter(object):
             if distribution_method == "none":
                 logging.info("%s bridge %s requested to not be distributed."
                              % (self.__class__.__name__, bridge))
-                return
+                return None
 
             # If we didn't know what they are talking about, or they requested
             # "any" distribution method, and we've never seen this bridge
@@ -529,23 +1745,366 @@ class BridgeSplitter(object):
                               " pos=%s).") % (self.__class__.__name__, bridge,
                                               distribution_method, n, pos))
 
+        return distribution_method
+
+    def insert(self, bridge):
+        assert self.rings
+        self._checkNotFrozen()
+
+        for s in self.statsHolders:
+            s.insert(bridge)
+
+        # The bridge must be running to insert it:
+        if not bridge.flags.running:
+            return
+
+        validRings = self.rings
+        distribution_method = None
+
+        # If the bridge already has a distributor, use that.
+        with bridgedb.Storage.getDB() as db:
+            distribution_method = db.getBridgeDistributor(bridge, validRings)
+
+        distribution_method = self._choosePlacement(bridge, distribution_method)
+        if distribution_method is None:
+            return
+
         with bridgedb.Storage.getDB() as db:
             ringname = db.insertBridgeAndGetRing(bridge, distribution_method,
                                                  time.time(), validRings)
             db.commit()
 
         ring = self.ringsByName.get(ringname)
-        ring.insert(bridge)
-
         if ring is None:
             logging.warn("Couldn't recognise ring named: '%s'" % ringname)
             logging.info("Current rings: %s" % " ".join(self.ringsByName))
+            return
+
+        ring.insert(bridge)
+        self.placements.setPool(bridge.identity, ringname)
+
+    def insertMany(self, bridges):
+        """Assign many bridges to rings in a single database transaction.
+
+        All of the existing assignments are fetched from the database in one
+        query, the placement of every bridge is decided in memory, and then
+        all of the new and updated assignments are written and committed at
+        once.  Finally, each ring is given all of its bridges at once (with
+        its ``insertMany()`` method, if it has one).
+
+        :param bridges: An iterable of :class:`~bridgedb.bridges.Bridge`s.
+        :rtype: int
+        :returns: The number of bridges which were placed into a ring.
+        """
+        assert self.rings
+        self._checkNotFrozen()
+
+        validRings = self.rings
+        placements = []
+        assigned = {}
+
+        with bridgedb.Storage.getDB() as db:
+            known = db.getBridgeDistributors()
+
+            for bridge in bridges:
+                for s in self.statsHolders:
+                    s.insert(bridge)
+
+                # The bridge must be running to insert it:
+                if not bridge.flags.running:
+                    continue
+
+                distribution_method = known.get(bridge.fingerprint)
+                if distribution_method not in validRings:
+                    distribution_method = None
+
+                distribution_method = self._choosePlacement(
+                    bridge, distribution_method)
+                if distribution_method is not None:
+                    placements.append((bridge, distribution_method))
+
+            ringnames = db.insertBridgesAndGetRings(placements, time.time(),
+                                                    validRings, known)
+            db.commit()
+
+        for (bridge, _), ringname in zip(placements, ringnames):
+            assigned.setdefault(ringname, []).append(bridge)
+
+        self._insertAssigned(assigned)
+
+        return len(placements)
+
+    def insertAssigned(self, bridges, assignments):
+        """Insert **bridges** into the subrings which they were already
+        assigned to, without consulting the database, e.g. when serving from
+        a :mod:`~bridgedb.snapshot` of another BridgeDB's hashrings.
+
+        :param bridges: An iterable of :class:`~bridgedb.bridges.Bridge`s.
+        :param dict assignments: A dictionary mapping the fingerprints of
+            the **bridges** to the names of the subrings they were assigned
+            to, i.e. another BridgeSplitter's :data:`assignments`.  Bridges
+            which weren't assigned to one of our subrings are skipped.
+        :rtype: int
+        :returns: The number of bridges which were placed into a ring.
+        """
+        self._checkNotFrozen()
+        assigned = {}
+        placed = 0
+
+        for bridge in bridges:
+            for s in self.statsHolders:
+                s.insert(bridge)
+
+            ringname = assignments.get(bridge.fingerprint)
+            if ringname in self.ringsByName:
+                assigned.setdefault(ringname, []).append(bridge)
+                placed += 1
+
+        self._insertAssigned(assigned)
+
+        return placed
+
+    def rebuildFrom(self, previous, bridges, ringnames):
+        """Take over the bridges of the **previous** generation of
+        hashrings, rebuilding only some of our subrings, e.g. after settings
+        which only some distributors' hashrings are built with changed.
+
+        Our subrings named in **ringnames** are filled with the **bridges**
+        which were assigned to them, without consulting the database.  All of
+        our other subrings are replaced by **previous**'s, which already hold
+        their bridges, and are shared by both generations.
+
+        :type previous: :class:`BridgeSplitter`
+        :param previous: The hashrings being served, which must have subrings
+            with the same names as ours.
+        :param bridges: An iterable of all the
+            :class:`~bridgedb.bridges.Bridge`\\ s in **previous**.
+        :param ringnames: The names of the subrings to rebuild.
+        :rtype: int
+        :returns: The number of bridges which were placed into a rebuilt
+            subring.
+        """
+        self._checkNotFrozen()
+        assignments = dict([(fingerprint, ringname) for fingerprint, ringname
+                            in previous.assignments.items()
+                            if ringname in ringnames])
+        placed = self.insertAssigned(bridges, assignments)
+
+        # The subrings we take over keep the placements of the generation
+        # they were built in, and we only take the pools from it:
+        for ringname, ring in previous.ringsByName.items():
+            if ringname not in ringnames:
+                self.ringsByName[ringname] = ring
+        for identity, ringname in previous.placements.getPools().items():
+            if ringname not in ringnames:
+                self.placements.setPool(identity, ringname)
+
+        return placed
+
+    def updateFrom(self, previous, removed, added):
+        """Build this generation of hashrings from the **previous** one, and
+        the bridges which were **removed** from and **added** to it since,
+        rather than inserting every bridge again.
+
+        The bridges which didn't change keep their pools and placements,
+        without the database being consulted for them, and each of our
+        subrings takes over those in **previous**'s subring of the same name
+        (see :meth:`FilteredBridgeSplitter.updateFrom`).  Only the **added**
+        bridges are then inserted, as by :meth:`insertMany`.
+
+        :type previous: :class:`BridgeSplitter`
+        :param previous: The hashrings being served, which must have been
+            created with the same settings as ours.
+        :param list removed: The :class:`~bridgedb.bridges.Bridge`\\ s in
+            **previous** which were removed or changed since, i.e. as
+            returned from :func:`bridgedb.main.getBridgeDelta`.
+        :param list added: The bridges which were added or changed since.
+        :rtype: int
+        :returns: The number of **added** bridges which were placed into a
+            ring.
+        """
+        self._checkNotFrozen()
+        gone = set([bridge.identity for bridge in removed])
+        self.placements.copyFrom(previous.placements, gone)
+        for ringname, ring in self.ringsByName.items():
+            ring.updateFrom(previous.ringsByName[ringname], removed)
+
+        with bridgedb.Storage.getDB() as db:
+            db.markBridgesSeen(self.assignments.keys(), time.time())
+            db.commit()
+
+        return self.insertMany(added)
+
+    def _insertAssigned(self, assigned):
+        """Give each of our subrings all of the bridges assigned to it at
+        once (with its ``insertMany()`` method, if it has one).
+
+        :param dict assigned: A dictionary mapping subring names to lists of
+            :class:`~bridgedb.bridges.Bridge`s.
+        """
+        for ringname, ringBridges in assigned.items():
+            ring = self.ringsByName.get(ringname)
+            if ring is None:
+                logging.warn("Couldn't recognise ring named: '%s'" % ringname)
+                logging.info("Current rings: %s" % " ".join(self.ringsByName))
+                continue
+            if hasattr(ring, 'insertMany'):
+                ring.insertMany(ringBridges)
+            else:
+                for bridge in ringBridges:
+                    ring.insert(bridge)
+            for bridge in ringBridges:
+                self.placements.setPool(bridge.identity, ringname)
 
     def dumpAssignments(self, f, description=""):
         for name,ring in self.ringsByName.iteritems():
             ring.dumpAssignments(f, "%s %s" % (description, name))
 
 
+class AttributeIndex(object):
+    """An index of which bridges, out of a list of bridges, pass each filter.
+
+    For every filter function from :mod:`bridgedb.filters` which has been
+    used with this index, i.e. for every bridge attribute such as "has an
+    IPv6 address", "supports obfs4 over IPv4", "isn't blocked in CN", or "is
+    in subring 2 of 4", a bitset is kept as a Python integer.  Its ``i``th
+    bit is set iff ``bridges[i]`` passes that filter.  The index ``i`` of a
+    bridge in :data:`bridges` is called its *handle*.
+
+    A filter made with :func:`bridgedb.filters.byFilters` is evaluated by
+    ANDing together the bitsets of the filters it is made from, so each
+    filter is only ever called once per bridge.
+
+    :ivar list bridges: The bridges being indexed.  This is shared with the
+        owner of the index, which must call :meth:`update` whenever a bridge
+        is added to, or replaced in, it.  Removed bridges are ``None``.
+    :ivar dict bitsets: A dictionary mapping filter names to bitsets.
+    """
+
+    def __init__(self, bridges):
+        self.bridges = bridges
+        self.bitsets = {}
+        self._filters = {}
+        # The handles of the bridges which each bitset taken over by
+        # copyFrom() hasn't been brought up to date for:
+        self._stale = {}
+
+    def __len__(self):
+        return len(self.bitsets)
+
+    @staticmethod
+    def bitsetFromHandles(handles):
+        """Create a bitset with the bits for some **handles** set."""
+        if not handles:
+            return 0
+        bits = bytearray('0' * (max(handles) + 1))
+        for handle in handles:
+            bits[handle] = '1'
+        return int(str(bits)[::-1], 2)
+
+    @staticmethod
+    def handlesFromBitset(bitset):
+        """Get the handles of all the bits set in a **bitset**, in order."""
+        bits = bin(bitset)[:1:-1]
+        handles = []
+        handle = bits.find('1')
+        while handle != -1:
+            handles.append(handle)
+            handle = bits.find('1', handle + 1)
+        return handles
+
+    def _computeBitset(self, filterFn):
+        bits = ''.join(['1' if bridge is not None and filterFn(bridge) else '0'
+                        for bridge in reversed(self.bridges)])
+        return int(bits, 2) if bits else 0
+
+    def copyFrom(self, previous, handles=()):
+        """Take over the bitsets of a **previous** index of the same
+        bridges, e.g. that of the previous generation of a hashring, without
+        the bits of some **handles**, whose bridges were removed.
+
+        The filters themselves aren't taken over, since they may belong to
+        the previous generation.  Instead, each bitset is brought up to date
+        for the bridges added since, the first time it's used with a filter
+        of the same name.
+
+        :type previous: :class:`AttributeIndex`
+        :param list handles: The handles of the removed bridges.
+        """
+        # Bitsets which aren't yet up to date in the previous index are
+        # computed again:
+        stale = dict(previous._stale)
+        mask = ~self.bitsetFromHandles(handles)
+        self.bitsets = dict([(name, bitset & mask) for name, bitset
+                             in previous.bitsets.items()
+                             if name not in stale])
+        self._filters = {}
+        self._stale = dict([(name, []) for name in self.bitsets])
+
+    def getBitset(self, filterFn):
+        """Get the bitset of the bridges which pass **filterFn**.
+
+        If **filterFn** has a ``name``, as all filters from
+        :mod:`bridgedb.filters` do, its bitset is computed once and then kept
+        up to date.
+        """
+        filtres = getattr(filterFn, 'filters', None)
+        if filtres is not None:
+            bitset = (1 << len(self.bridges)) - 1
+            for filtre in filtres:
+                bitset &= self.getBitset(filtre)
+            return bitset
+
+        name = getattr(filterFn, 'name', None)
+        if name is None:
+            return self._computeBitset(filterFn)
+
+        bitset = self.bitsets.get(name)
+        if bitset is None:
+            bitset = self.bitsets[name] = self._computeBitset(filterFn)
+            self._filters[name] = filterFn
+        elif name in self._stale:
+            for handle in self._stale[name]:
+                if filterFn(self.bridges[handle]):
+                    bitset |= 1 << handle
+                else:
+                    bitset &= ~(1 << handle)
+            self._filters[name] = filterFn
+            self.bitsets[name] = bitset
+            del self._stale[name]
+        return bitset
+
+    def getMatching(self, filterFn, mask=None):
+        """Get the bridges which pass **filterFn**, in handle order.
+
+        :param filterFn: A filter function.
+        :type mask: int or None
+        :param mask: If given, only bridges whose bits are set in this bitset
+            are considered.
+        :rtype: list
+        """
+        bitset = self.getBitset(filterFn)
+        if mask is not None:
+            bitset &= mask
+        return [self.bridges[handle]
+                for handle in self.handlesFromBitset(bitset)]
+
+    def update(self, handle):
+        """Recompute the bits for the bridge with the given **handle**, after
+        it was added or replaced.
+        """
+        bridge = self.bridges[handle]
+        bit = 1 << handle
+
+        for name, handles in self._stale.items():
+            handles.append(handle)
+        for name, filterFn in self._filters.items():
+            if filterFn(bridge):
+                self.bitsets[name] |= bit
+            else:
+                self.bitsets[name] &= ~bit
+
+
 class FilteredBridgeSplitter(object):
     """Places bridges into subrings based upon sets of filters.
 
@@ -553,15 +2112,20 @@ class FilteredBridgeSplitter(object):
     be passed to :meth:`~FilteredBridgeSplitter.addRing`.
     """
 
+    maxRemovedFraction = 0.5
+
     def __init__(self, key, max_cached_rings=3):
         """Create a hashring which filters bridges into sub hashrings.
 
         :type key: DOCDOC
         :param key: An HMAC key.
-        :param int max_cached_rings: XXX max_cached_rings appears to not be
-             used anywhere.
+        :param int max_cached_rings: The maximum number of subrings, not
+             counting pinned subrings, to keep in :data:`filterRings`.  When
+             adding a subring would exceed this, the least recently used
+             unpinned subring is dropped.
 
-        :ivar filterRings: A dictionary of subrings which has the form
+        :ivar filterRings: An ordered dictionary of subrings, from least to
+             most recently used, which has the form
              ``{ringname: (filterFn, subring)}``, where:
                  - ``ringname`` is a unique string identifying the subring.
                  - ``filterFn`` is a callable which filters Bridges in some
@@ -569,57 +2133,409 @@ class FilteredBridgeSplitter(object):
                  - ``subring`` is any of the horribly-implemented,
                    I-guess-it-passes-for-some-sort-of-hashring classes in this
                    module.
+        :ivar set pinnedRings: The names of the subrings in
+             :data:`filterRings` which are never evicted, i.e. those added by
+             a distributor's ``prepopulateRings()`` method.
         :ivar hmac: DOCDOC
-        :ivar bridges: DOCDOC
+        :type table: :class:`BridgeTable`
+        :ivar table: All of the bridges in this hashring.  Subrings created
+             with :meth:`newRing` are views of this table, and share its
+             :class:`PlacementTable`.
+        :ivar list bridges: All of the bridges in this hashring, indexed by
+             their handles in the :data:`table`.
+        :ivar dict bridgesByFingerprint: A dictionary mapping fingerprints to
+             handles.
+        :type index: :class:`AttributeIndex`
+        :ivar index: An index of which of the :data:`bridges` pass each
+             filter, used to populate subrings.
         :type distributorName: str
         :ivar distributorName: The name of this splitter's distributor. See
              :meth:`~bridgedb.distributors.https.distributor.HTTPSDistributor.setDistributorName`.
+        :ivar int cacheHits: The number of times :meth:`getRing` found the
+             requested subring.
+        :ivar int cacheMisses: The number of times :meth:`getRing` did not
+             find the requested subring.
+        :ivar int cacheEvictions: The number of subrings dropped in order to
+             stay within **max_cached_rings**.
+        :ivar int revision: Incremented whenever a bridge is added or
+             replaced, so that work based on an earlier set of
+             :data:`bridges` can tell that it is out of date.
+        :ivar bool frozen: Whether :meth:`freeze` was called, after which no
+             bridges may be added.  Subrings may still be added
+             and evicted, since they are only caches of the :data:`bridges`.
+        :ivar ringBuilder: If set, a :class:`multiprocessing.Pool` (or
+             anything else with a ``map()`` method) used to fill empty
+             :class:`CompactBridgeRing` subrings in parallel, in
+             :meth:`populateRings`.
+        :ivar int maxRemovedFraction: If more than this fraction of the
+             handles in our :data:`table` would belong to removed bridges,
+             :meth:`updateFrom` inserts the remaining bridges again, so that
+             their handles are contiguous.
         """
         self.key = key
-        self.filterRings = {}
+        self.filterRings = OrderedDict()
+        self.pinnedRings = set()
+        # The bySubring() filters use this to remember the bridges' subrings
+        # in our table's PlacementTable:
         self.hmac = getHMACFunc(key, hex=True)
-        self.bridges = []
+        self.table = BridgeTable()
+        self.bridges = self.table.bridges
+        self.bridgesByFingerprint = self.table.handles
+        self.index = AttributeIndex(self.bridges)
+        self.revision = 0
+        self.frozen = False
+        self.ringBuilder = None
         self.distributorName = ''
-
-        #XXX: unused
         self.max_cached_rings = max_cached_rings
+        self._resetPrevious()
+
+        self.cacheHits = 0
+        self.cacheMisses = 0
+        self.cacheEvictions = 0
 
     def __len__(self):
-        return len(self.bridges)
+        return len(self.table)
+
+    @property
+    def placements(self):
+        """The :class:`PlacementTable` of our :data:`table`."""
+        return self.table.placements
+
+    def usePlacements(self, placements):
+        """Remember the placements of our bridges in some other
+        **placements** table, e.g. that of the :class:`BridgeSplitter` which
+        we were added to.  No bridges may have been added to this hashring
+        yet.
+
+        :type placements: :class:`PlacementTable`
+        """
+        self._checkNotFrozen()
+        self.table.usePlacements(placements)
+
+    def freeze(self):
+        """Forbid any further changes to the bridges in this hashring, once it
+        is about to start serving requests.  After this, subrings may be
+        built from it in any thread, without being invalidated.
+        """
+        self.frozen = True
+
+    def _checkNotFrozen(self):
+        """Raise a :exc:`FrozenHashringError` if we were frozen."""
+        if self.frozen:
+            raise FrozenHashringError("Can't change the bridges in the frozen "
+                                      "%s hashring!" % self.distributorName)
 
     def clear(self):
-        self.bridges = []
-        self.filterRings = {}
+        self._checkNotFrozen()
+        self.table.clear()
+        self.index = AttributeIndex(self.bridges)
+        self.filterRings = OrderedDict()
+        self.pinnedRings = set()
+        self._resetPrevious()
+
+    def _resetPrevious(self):
+        """Forget the previous generation of this hashring, if
+        :meth:`updateFrom` was called.
+        """
+        # A weak reference, so that every generation doesn't keep all of
+        # the ones before it alive:
+        self._previous = lambda: None
+        self._removed = []
+        self._firstAdded = 0
+
+    def updateFrom(self, previous, removed):
+        """Take over the bridges in the **previous** generation of this
+        hashring, except for some **removed** ones, e.g. before inserting the
+        bridges which were added since.
+
+        Our :data:`table` and :data:`index` take over those of **previous**,
+        so that the bridges keep their handles, and their placements aren't
+        computed again.  Then, each subring which is populated from our
+        :data:`bridges` takes over the positions in **previous**'s subring
+        with the same filters (see :meth:`BridgeRing.copyFrom`), and only
+        the bridges added since are inserted into it.
+
+        :type previous: :class:`FilteredBridgeSplitter`
+        :param previous: The hashring being served, which must have been
+            created with the same key and settings as this one.  It isn't
+            changed.
+        :param list removed: The :class:`~bridgedb.bridges.Bridge`\\ s to
+            leave out.  Any which aren't in **previous** are ignored.
+        """
+        self._checkNotFrozen()
+        handles = self.table.copyFrom(previous.table, removed)
+
+        if len(self.table) < len(self.bridges) * (1 - self.maxRemovedFraction):
+            logging.info("Compacting the %s hashring's bridges."
+                         % self.distributorName)
+            bridges = [bridge for bridge in self.bridges if bridge is not None]
+            self.clear()
+            for bridge in bridges:
+                self._addBridge(bridge)
+            return
 
-    def insert(self, bridge):
-        """Insert a bridge into all appropriate sub-hashrings.
+        self.index.copyFrom(previous.index, handles)
+        self._previous = weakref.ref(previous)
+        self._removed = list(removed)
+        self._firstAdded = len(self.bridges)
+        self.revision += 1
 
-        For all sub-hashrings, the ``bridge`` will only be added iff it passes
-        the filter functions for that sub-hashring.
+    def _takeOverRing(self, ringname, filterFn, subring):
+        """Fill an empty **subring** by taking over the one with the same
+        filters in the previous generation of this hashring, if there is
+        one, and then inserting the bridges which were added since.
+
+        :param frozenset ringname: The filters of the **subring**.
+        :param filterFn: The filter function for the **subring**.
+        :rtype: bool
+        :returns: ``True`` if the **subring** was filled.
+        """
+        previous = self._previous()
+        if previous is None:
+            return False
+
+        # Filters from different generations have the same names:
+        names = frozenset([getattr(filtre, 'name', None)
+                           for filtre in ringname])
+        if None in names:
+            return False
+
+        # The previous generation may be serving requests meanwhile, which
+        # reorders its subrings, so don't iterate over them in order:
+        for othername, (_, other) in dict.items(previous.filterRings):
+            if (frozenset([getattr(filtre, 'name', None)
+                           for filtre in othername]) == names and
+                    subring.copyFrom(other, self._removed)):
+                break
+        else:
+            return False
+
+        added = (1 << len(self.bridges)) - (1 << self._firstAdded)
+        matching = self.index.getMatching(filterFn, added)
+        for bridge in matching:
+            subring.insert(bridge)
+        logging.info("Bridges taken over by %s subring: %d, inserted: %d"
+                     % (subring.name, len(subring) - len(matching),
+                        len(matching)))
+        return True
+
+    def populateRing(self, subring, ringname, filterFn):
+        """Fill an empty **subring** with our :data:`bridges` which pass
+        **filterFn**, without adding it to :data:`filterRings`, e.g. while
+        building it in a thread.
+
+        :param subring: The subring to fill, e.g. from :meth:`newRing`.
+        :param frozenset ringname: The filters of the **subring**.
+        :param filterFn: A filter function made from the filters in
+            **ringname**.
+        """
+        if not self._takeOverRing(ringname, filterFn, subring):
+            for bridge in self.index.getMatching(filterFn):
+                subring.insert(bridge)
+        subring._sortAll()
+
+    def _addBridge(self, bridge):
+        """Add a **bridge** to :data:`bridges`, replacing any bridge with the
+        same fingerprint, without inserting it into any subrings.
 
         :type bridge: :class:`~bridgedb.bridges.Bridge`
         :param bridge: The bridge to add.
+        :rtype: int or None
+        :returns: The bridge's handle in our :data:`table`, or ``None`` if
+            the bridge was skipped because it wasn't running.
         """
+        self._checkNotFrozen()
+
         # The bridge must be running to insert it:
         if not bridge.flags.running:
             logging.warn(("Skipping hashring insertion for non-running "
                           "bridge: %s") % bridge)
-            return
+            return None
 
-        index = 0
         logging.debug("Inserting %s into hashring..." % bridge)
-        for old_bridge in self.bridges[:]:
-            if bridge.fingerprint == old_bridge.fingerprint:
-                self.bridges[index] = bridge
-                break
-            index += 1
-        else:
-            self.bridges.append(bridge)
-        for ringname, (filterFn, subring) in self.filterRings.items():
-            if filterFn(bridge):
+        handle = self.table.add(bridge)
+        self.index.update(handle)
+        self.revision += 1
+        return handle
+
+    def newRing(self, ringClass, key, answerParameters=None):
+        """Create a subring of **ringClass**, which is a view of our
+        :data:`table` if the class supports it, and which otherwise shares
+        our table's :class:`PlacementTable`.
+
+        :param ringClass: Either :class:`BridgeRing` or
+            :class:`CompactBridgeRing`.
+        :param bytes key: The HMAC key for the subring.
+        :type answerParameters: :class:`BridgeRingParameters` or None
+        :param answerParameters: The subring's parameters.
+        :returns: The new, empty subring.
+        """
+        if issubclass(ringClass, CompactBridgeRing):
+            return ringClass(key, answerParameters, self.table)
+        return ringClass(key, answerParameters,
+                         placements=self.table.placements)
+
+    def _getMatchingRings(self, bridge, rings):
+        """Get the subrings, out of **rings**, whose filters **bridge** passes.
+
+        When a subring's filter function was created with
+        :func:`bridgedb.filters.byFilters`, each of the filters it is made of
+        is only called once for the **bridge**, no matter how many of the
+        **rings** share it.
+
+        :type bridge: :class:`~bridgedb.bridges.Bridge`
+        :param bridge: The bridge to filter.
+        :param list rings: A list of ``(ringname, (filterFn, subring))``
+            items from :data:`filterRings`.
+        :rtype: list
+        :returns: A list of ``(ringname, subring)`` two-tuples.
+        """
+        matching = []
+        results = {}
+
+        for ringname, (filterFn, subring) in rings:
+            filtres = getattr(filterFn, 'filters', None)
+            if filtres is None:
+                matched = filterFn(bridge)
+            else:
+                matched = True
+                for filtre in filtres:
+                    result = results.get(filtre)
+                    if result is None:
+                        result = results[filtre] = bool(filtre(bridge))
+                    if not result:
+                        matched = False
+                        break
+            if matched:
+                matching.append((ringname, subring))
+
+        return matching
+
+    def insert(self, bridge):
+        """Insert a bridge into all appropriate sub-hashrings.
+
+        For all sub-hashrings, the ``bridge`` will only be added iff it passes
+        the filter functions for that sub-hashring.
+
+        :type bridge: :class:`~bridgedb.bridges.Bridge`
+        :param bridge: The bridge to add.
+        """
+        if self._addBridge(bridge) is None:
+            return
+
+        for ringname, subring in self._getMatchingRings(
+                bridge, self.filterRings.items()):
+            subring.insert(bridge)
+            logging.debug("Inserted bridge %s into %s subhashring." %
+                          (bridge, ringname))
+
+    def insertMany(self, bridges):
+        """Insert many bridges, and then fill all of the sub-hashrings with
+        them.
+
+        :param bridges: An iterable of :class:`~bridgedb.bridges.Bridge`s.
+        :rtype: int
+        :returns: The number of bridges which were inserted.
+        """
+        handles = [self._addBridge(bridge) for bridge in bridges]
+        handles = [handle for handle in handles if handle is not None]
+        self._populateRingsFromIndex(self.filterRings.keys(),
+                                     AttributeIndex.bitsetFromHandles(handles))
+        return len(handles)
+
+    def _populateRingsFromIndex(self, ringnames, mask=None):
+        """Populate several sub-hashrings with the bridges in :data:`bridges`
+        which pass their filters, according to our :data:`index`.
+
+        :param list ringnames: The names of the subrings to populate.
+        :type mask: int or None
+        :param mask: If given, a bitset of the handles of the only bridges to
+            consider.  Otherwise, the subrings are sorted once populated,
+            and may take over those of the previous generation of this
+            hashring (see :meth:`updateFrom`).
+        """
+        remaining = ringnames
+        if mask is None:
+            remaining = [ringname for ringname in ringnames
+                         if not self._takeOverRing(
+                             ringname, *self.filterRings[ringname])]
+
+        if self.ringBuilder is not None and mask is None:
+            remaining = self._populateRingsWithBuilder(remaining)
+
+        for ringname in remaining:
+            filterFn, subring = self.filterRings[ringname]
+            matching = self.index.getMatching(filterFn, mask)
+            for bridge in matching:
                 subring.insert(bridge)
-                logging.debug("Inserted bridge %s into %s subhashring." %
-                              (bridge, ringname))
+            logging.info("Bridges inserted into %s subring: %d"
+                         % (subring.name, len(matching)))
+
+        if mask is None:
+            for ringname in ringnames:
+                self.filterRings[ringname][1]._sortAll()
+
+    def _populateRingsWithBuilder(self, ringnames):
+        """Fill those of the sub-hashrings named in **ringnames** which are
+        empty :class:`CompactBridgeRing` views of our :data:`table` using our
+        :data:`ringBuilder`, all at once.
+
+        :param list ringnames: The names of the subrings to populate.
+        :rtype: list
+        :returns: The names of the subrings which still need populating.
+        """
+        remaining = []
+        subrings = []
+        jobs = []
+
+        for ringname in ringnames:
+            filterFn, subring = self.filterRings[ringname]
+            if (isinstance(subring, CompactBridgeRing) and
+                    subring.table is self.table and not len(subring)):
+                subrings.append(subring)
+                jobs.append(subring.getIndexJob(
+                    self.index.getMatching(filterFn)))
+            else:
+                remaining.append(ringname)
+
+        for subring, indexes in zip(subrings,
+                                    self.ringBuilder.map(buildCompactIndexes,
+                                                         jobs)):
+            subring.installIndexes(indexes)
+            logging.info("Bridges inserted into %s subring: %d"
+                         % (subring.name, len(subring)))
+
+        return remaining
+
+    def populateRings(self, ringnames, populate_from):
+        """Populate several sub-hashrings in a single pass over some bridges.
+
+        :param list ringnames: The names of the subrings (previously added
+            with :meth:`addRing`) to populate.
+        :param populate_from: An iterable of :class:`Bridge`s.  Each one will
+            be inserted into every subring in **ringnames** whose filters it
+            passes.  If this is :data:`bridges`, the subrings are populated
+            using our :data:`index`.  Subrings which are views of our
+            :data:`table` will ignore any bridges not in it.
+        """
+        if populate_from is self.bridges:
+            self._populateRingsFromIndex(ringnames)
+            return
+
+        rings = [(ringname, self.filterRings[ringname])
+                 for ringname in ringnames]
+        counts = dict([(ringname, 0) for ringname in ringnames])
+
+        for bridge in populate_from:
+            if not isinstance(bridge, Bridge):
+                continue
+            for ringname, subring in self._getMatchingRings(bridge, rings):
+                subring.insert(bridge)
+                counts[ringname] += 1
+
+        for ringname, (_, subring) in rings:
+            logging.info("Bridges inserted into %s subring: %d"
+                         % (subring.name, counts[ringname]))
 
     def extractFilterNames(self, ringname):
         """Get the names of the filters applied to a particular sub hashring.
@@ -641,7 +2557,67 @@ class FilteredBridgeSplitter(object):
         filterNames.sort()
         return filterNames
 
-    def addRing(self, subring, ringname, filterFn, populate_from=None):
+    def getRing(self, ringname):
+        """Get a cached subring, and mark it as the most recently used.
+
+        :param str ringname: The name the subring was added with.
+        :returns: The subring, or ``None`` if there is no subring named
+            **ringname**.
+        """
+        try:
+            filterFn, subring = self.filterRings.pop(ringname)
+        except KeyError:
+            self.cacheMisses += 1
+            return None
+
+        self.filterRings[ringname] = (filterFn, subring)
+        self.cacheHits += 1
+        return subring
+
+    def getNearestRing(self, ringname):
+        """Find the cached subring which is closest to the subring for some
+        filters, i.e. the subring whose filters are the largest subset of
+        **ringname**.
+
+        Every bridge which would be in the subring named **ringname** is also
+        in the returned subring, but the returned subring may contain other
+        bridges as well.  This doesn't count as a cache hit or miss, nor mark
+        the subring as recently used.
+
+        :param frozenset ringname: The filters for the wanted subring.
+        :rtype: tuple
+        :returns: A 2-tuple of ``(ringname, subring)``, or ``(None, None)`` if
+            no cached subring's filters are a subset of **ringname**.
+        """
+        nearest = (None, None)
+
+        for name, (_, subring) in self.filterRings.items():
+            if not name <= ringname:
+                continue
+            if nearest[0] is None or len(name) > len(nearest[0]):
+                nearest = (name, subring)
+
+        return nearest
+
+    def _evictRings(self):
+        """Drop the least recently used unpinned subrings until there are no
+        more than :data:`max_cached_rings` of them.
+        """
+        unpinned = [name for name in self.filterRings
+                    if name not in self.pinnedRings]
+        excess = len(unpinned) - self.max_cached_rings
+
+        for ringname in unpinned[:max(excess, 0)]:
+            _, subring = self.filterRings.pop(ringname)
+            self.cacheEvictions += 1
+            logging.debug("Evicted %s subring %s (hits=%d misses=%d "
+                          "evictions=%d)" % (self.distributorName,
+                                             subring.name, self.cacheHits,
+                                             self.cacheMisses,
+                                             self.cacheEvictions))
+
+    def addRing(self, subring, ringname, filterFn, populate_from=None,
+                pinned=False):
         """Add a subring to this hashring.
 
         :param subring: The subring to add.
@@ -651,6 +2627,8 @@ class FilteredBridgeSplitter(object):
         :type populate_from: iterable or None
         :param populate_from: A group of :class:`Bridge`s. If given, the newly
             added subring will be populated with these bridges.
+        :param bool pinned: If ``True``, the subring is never evicted to make
+            room for other subrings.
         :rtype: bool
         :returns: False if there was a problem adding the subring, True
             otherwise.
@@ -693,10 +2671,17 @@ class FilteredBridgeSplitter(object):
                      (subring.name, subringNumber, self.distributorName))
         logging.info("  Subring filters: %s" % filterNames)
 
-        #TODO: drop LRU ring if len(self.filterRings) > self.max_cached_rings
         self.filterRings[ringname] = (filterFn, subring)
+        if pinned:
+            self.pinnedRings.add(ringname)
+        else:
+            self._evictRings()
 
-        if populate_from:
+        if populate_from is self.bridges:
+            self.populateRing(subring, ringname, filterFn)
+            logging.info("Bridges inserted into %s subring %s: %d"
+                         % (subring.name, subringNumber, len(subring)))
+        elif populate_from:
             inserted = 0
             for bridge in populate_from:
                 if isinstance(bridge, Bridge) and filterFn(bridge):
@@ -713,6 +2698,8 @@ class FilteredBridgeSplitter(object):
         # only one line should be dumped per bridge
 
         for b in self.bridges:
+            if b is None:
+                continue
             # gather all the filter descriptions
             desc = []
             for n,(g,r) in self.filterRings.items():
@@ -206,6 +206,87 @@ class Database(object):
                         (h, str(bridge.address), bridge.orPort, setRing, t, t))
             return setRing
 
+    def getBridgeDistributors(self):
+        """Get the distributors of every bridge in the database, in a single
+        query.
+
+        :rtype: dict
+        :returns: A dictionary mapping bridge fingerprints to the name of the
+            distributor each one is assigned to.
+        """
+        cur = self._cur
+        cur.execute("SELECT hex_key, distributor FROM Bridges")
+        return dict(cur.fetchall())
+
+    def insertBridgesAndGetRings(self, bridges, seenAt, validRings,
+                                 known=None, defaultPool="unallocated"):
+        """Update the info about many bridges at once, as
+        :meth:`insertBridgeAndGetRing` does for a single bridge.
+
+        All new bridges are inserted with one ``executemany()``, and all
+        existing bridges are updated with another.  Committing is left to the
+        caller.
+
+        :param list bridges: A list of two-tuples of ``(bridge, setRing)``.
+        :param seenAt: The time at which the bridges were seen.
+        :param validRings: The names of all currently valid rings.
+        :type known: dict or None
+        :param known: The result of :meth:`getBridgeDistributors`, if the
+            caller already has it.  It is updated with any new bridges.
+        :param str defaultPool: The ring to use for bridges whose ring isn't
+            valid anymore.
+        :rtype: list
+        :returns: The name of the distributor each of the **bridges** is
+            assigned to, in the same order as **bridges**.
+        """
+        cur = self._cur
+        t = timeToStr(seenAt)
+        inserts = []
+        updates = []
+        rings = []
+
+        if known is None:
+            known = self.getBridgeDistributors()
+
+        for bridge, setRing in bridges:
+            h = bridge.fingerprint
+            assert len(h) == HEX_ID_LEN
+
+            if h in known:
+                ring = known[h]
+                # Check if this is currently a valid ring name. If not, move
+                # back into default pool.
+                if ring not in validRings:
+                    ring = defaultPool
+                updates.append((str(bridge.address), bridge.orPort, ring, t, h))
+            else:
+                ring = setRing
+                if ring not in validRings:
+                    ring = defaultPool
+                inserts.append((h, str(bridge.address), bridge.orPort, ring, t, t))
+            known[h] = ring
+            rings.append(ring)
+
+        cur.executemany("INSERT INTO Bridges (hex_key, address, or_port, "
+                        "distributor, first_seen, last_seen) "
+                        "VALUES (?, ?, ?, ?, ?, ?)", inserts)
+        cur.executemany("UPDATE Bridges SET address = ?, or_port = ?, "
+                        "distributor = ?, last_seen = ? WHERE hex_key = ?",
+                        updates)
+        return rings
+
+    def markBridgesSeen(self, fingerprints, seenAt):
+        """Update the time at which many bridges, whose other info hasn't
+        changed, were last seen.  Committing is left to the caller.
+
+        :param list fingerprints: The fingerprints of the bridges.
+        :param seenAt: The time at which the bridges were seen.
+        """
+        t = timeToStr(seenAt)
+        self._cur.executemany("UPDATE Bridges SET last_seen = ? "
+                              "WHERE hex_key = ?",
+                              [(t, h) for h in fingerprints])
+
     def cleanEmailedBridges(self, expireBefore):
         cur = self._cur
         t = timeToStr(expireBefore)
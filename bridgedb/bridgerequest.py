@@ -28,6 +28,13 @@ from bridgedb.crypto import getHMACFunc
 from bridgedb.filters import byIPv
 from bridgedb.filters import byNotBlockedIn
 from bridgedb.filters import byTransport
+from bridgedb.filters import internFilters
+
+
+#: The maximum number of countries which a client may ask for bridges to not
+#: be blocked in.  Any further countries are ignored, so that clients can't
+#: make us build a hashring for every combination of countries.
+MAX_UNBLOCKED_COUNTRIES = 3
 
 
 class IRequestBridges(Interface):
@@ -35,6 +42,9 @@ class IRequestBridges(Interface):
 
     filters = Attribute(
         "A list of callables used to filter bridges from a hashring.")
+    filterKey = Attribute(
+        "The canonical frozenset of the ``filters``, as from "
+        ":func:`bridgedb.filters.internFilters`.")
     ipVersion = Attribute(
         "The IP version of bridge addresses to distribute to the client.")
     transports = Attribute(
@@ -94,6 +104,9 @@ class BridgeRequestBase(object):
 
     :vartype filters: list
     :ivar filters: A list of callables used to filter bridges from a hashring.
+    :vartype filterKey: frozenset
+    :ivar filterKey: The canonical set of the ``filters``.  Requests whose
+        filters are equivalent have the very same ``filterKey``.
     :vartype transports: list
     :ivar transports: A list of strings of Pluggable Transport types requested.
     :vartype notBlockedIn: list
@@ -112,6 +125,7 @@ class BridgeRequestBase(object):
     def __init__(self, ipVersion=None):
         self.ipVersion = ipVersion
         self.filters = list()
+        self.filterKey = internFilters(self.filters)
         self.transports = list()
         self.notBlockedIn = list()
         self.client = 'default'
@@ -210,10 +224,12 @@ class BridgeRequestBase(object):
             :mod:`bridgedb.filters`.
         """
         self.filters.append(filtre)
+        self.filterKey = internFilters(self.filters)
 
     def clearFilters(self):
         """Clear the list of ``filters``."""
         self.filters = []
+        self.filterKey = internFilters(self.filters)
 
     def justOnePTType(self):
         """Get just one bridge type (e.g. a
@@ -231,9 +247,25 @@ class BridgeRequestBase(object):
         """Build the list of callables, ``filters``, according to the current
         contents of the lists of ``transports``, ``notBlockedIn``, and the
         ``ipVersion``.
+
+        The ``notBlockedIn`` list is first normalised: country codes are
+        lowercased and deduplicated, any beyond the first
+        :data:`MAX_UNBLOCKED_COUNTRIES` are dropped, and the rest are sorted.
         """
         self.clearFilters()
 
+        countries = []
+        for country in self.notBlockedIn:
+            country = country.lower()
+            if country not in countries:
+                countries.append(country)
+        if len(countries) > MAX_UNBLOCKED_COUNTRIES:
+            logging.info("Ignoring request for bridges not blocked in %s "
+                         "(at most %d countries are allowed)."
+                         % (" ".join(countries[MAX_UNBLOCKED_COUNTRIES:]),
+                            MAX_UNBLOCKED_COUNTRIES))
+        self.notBlockedIn = sorted(countries[:MAX_UNBLOCKED_COUNTRIES])
+
         pt = self.justOnePTType()
         msg = ("Adding a filter to %s for %s for IPv%d"
                % (self.__class__.__name__, self.client, self.ipVersion))
@@ -1349,6 +1349,29 @@ class Bridge(BridgeBackwardsCompatibility):
                                                    bridgePrefix)
         return bridgeLine
 
+    def getDistributionState(self):
+        """Get everything about this bridge which affects whether and how it
+        is distributed, i.e. which hashrings it is placed into and the bridge
+        lines which are given out for it.
+
+        Two :class:`Bridge`s with the same fingerprint and an equal
+        distribution state are interchangeable within the hashrings.
+
+        :rtype: tuple
+        """
+        flags = self.flags
+        return (str(self.address), self.orPort,
+                tuple(sorted([(str(address), port, version)
+                              for address, port, version in self.orAddresses])),
+                tuple(sorted([(pt.methodname, str(pt.address), pt.port,
+                               tuple(sorted((pt.arguments or {}).items())))
+                              for pt in self.transports])),
+                (flags.fast, flags.guard, flags.running, flags.stable,
+                 flags.valid),
+                self.distribution_request,
+                tuple(sorted([(key, tuple(sorted(countries)))
+                              for key, countries in self._blockedIn.items()])))
+
     def _addBlockByKey(self, key, countryCode):
         """Create or append to the list of blocked countries for a **key**.
 
@@ -109,7 +109,8 @@ def loadConfig(configFile=None, configCls=None):
                     [os.path.abspath(os.path.expanduser(f)) for f in setting])
 
     for attr in ["DB_FILE", "DB_LOG_FILE", "MASTER_KEY_FILE", "PIDFILE",
-                 "ASSIGNMENTS_FILE", "HTTPS_CERT_FILE", "HTTPS_KEY_FILE",
+                 "ASSIGNMENTS_FILE", "SNAPSHOT_FILE", "HANDOVER_SOCKET",
+                 "HTTPS_CERT_FILE", "HTTPS_KEY_FILE",
                  "MOAT_CERT_FILE", "MOAT_KEY_FILE",
                  "LOG_FILE", "COUNTRY_BLOCK_FILE",
                  "GIMP_CAPTCHA_DIR", "GIMP_CAPTCHA_HMAC_KEYFILE",
@@ -137,6 +138,26 @@ def loadConfig(configFile=None, configCls=None):
         setting = getattr(config, attr, True) # Default to True
         setattr(config, attr, setting)
 
+    for attr in ["COMPACT_HASHRINGS", "BUILD_RINGS_IN_BACKGROUND",
+                 "SKIP_UNCHANGED_RELOADS", "MEMOIZE_RING_ANSWERS",
+                 "INCREMENTAL_INGEST", "WATCH_DESCRIPTORS",
+                 "HEALTH_DETAILS"]:
+        setting = getattr(config, attr, False) # Default to False
+        setattr(config, attr, setting)
+
+    for attr in ["PREBUILD_POPULAR_RINGS", "WEB_WORKERS",
+                 "RING_BUILD_PROCESSES", "PARSE_PROCESSES"]:
+        setting = getattr(config, attr, 0) # Default to 0
+        setattr(config, attr, setting)
+
+    for attr, default in [("IPV4_DISTINCT_SUBNET_PREFIX", 16),
+                          ("IPV6_DISTINCT_SUBNET_PREFIX", 32),
+                          ("FRONTEND_SNAPSHOT_INTERVAL", 60),
+                          ("HANDOVER_DRAIN_TIMEOUT", 10),
+                          ("WATCH_DESCRIPTORS_DELAY", 10)]:
+        setting = getattr(config, attr, default)
+        setattr(config, attr, setting)
+
     for attr in ["FORCE_PORTS", "FORCE_FLAGS", "NO_DISTRIBUTION_COUNTRIES"]:
         setting = getattr(config, attr, []) # Default to empty lists
         setattr(config, attr, setting)
@@ -167,6 +167,10 @@ class Distributor(Named):
     _hashringLevelMin = 20
     _hashringLevelMax = 100
 
+    #: The names of any attributes which :meth:`useGeneration` keeps, rather
+    #: than taking from the replacement distributor.
+    keptAcrossGenerations = ()
+
     def __init__(self, key=None):
         """Create a new bridge Distributor.
 
@@ -216,6 +220,29 @@ class Distributor(Named):
         if self.hashring:
             self.hashring.clear()
 
+    def useGeneration(self, replacement):
+        """Start serving from the hashrings of a **replacement** Distributor,
+        which a reload created, filled, and froze.
+
+        All of our state, including the settings which our hashrings were
+        built with, is swapped for the **replacement**'s in a single
+        assignment, so that a request never sees a mixture of the two
+        generations.  Only the attributes named in
+        :data:`keptAcrossGenerations` are carried over from the current
+        generation.  Our previous hashrings are freed as soon as nothing else
+        is using them.
+
+        This must be called from the reactor thread.
+
+        :type replacement: :class:`Distributor`
+        :param replacement: A Distributor of the same class as us.
+        """
+        state = dict(replacement.__dict__)
+        for attr in self.keptAcrossGenerations:
+            if attr in self.__dict__:
+                state[attr] = self.__dict__[attr]
+        self.__dict__ = state
+
     @property
     def name(self):
         """Get the name of this Distributor.
@@ -17,9 +17,12 @@ bridgedb.distributors.common.http
 Common utilities for HTTP-based distributors.
 """
 
+import json
 import logging
 import os
 
+from twisted.web import resource
+
 from bridgedb.parse.addr import isIPAddress
 from bridgedb.parse.addr import isLoopback
 
@@ -92,3 +95,75 @@ def getClientIP(request, useForwardedHeader=False, skipLoopback=False):
         ip = request.getClientIP()
 
     return ip
+
+
+class ReadyResource(resource.Resource):
+    """Tells load balancers whether we are serving bridges yet, i.e. whether
+    the first generation of hashrings was built.  Responds with a ``200`` if
+    so, and with a ``503`` otherwise.
+    """
+    isLeaf = True
+
+    def __init__(self, getStatus):
+        """Create a resource for checking whether we're ready.
+
+        :param getStatus: A callable which returns a dictionary with at
+            least a ``'ready'`` key, i.e.
+            :meth:`bridgedb.supervisor.ReloadSupervisor.getStatus`.
+        """
+        resource.Resource.__init__(self)
+        self.getStatus = getStatus
+
+    def render_GET(self, request):
+        request.setHeader(b"Content-Type", b"text/plain")
+        request.setHeader(b"Cache-Control", b"no-cache")
+
+        if self.getStatus().get('ready'):
+            return b"ready\n"
+
+        request.setResponseCode(503)
+        return b"not ready\n"
+
+
+class HealthResource(ReadyResource):
+    """Describes, as JSON, the generation of hashrings being served and the
+    most recent reload.  No templates are rendered, so this is cheap to poll.
+    """
+
+    def __init__(self, getStatus, detailed=False):
+        """Create a resource for checking our health.
+
+        :param getStatus: A callable which returns a dictionary describing
+            the hashrings being served, i.e.
+            :meth:`bridgedb.supervisor.ReloadSupervisor.getStatus`.
+        :param bool detailed: If ``True``, ask **getStatus** for the details
+            of the hashrings and reloads, too.
+        """
+        ReadyResource.__init__(self, getStatus)
+        self.detailed = detailed
+
+    def render_GET(self, request):
+        request.setHeader(b"Content-Type", b"application/json")
+        request.setHeader(b"Cache-Control", b"no-cache")
+        if self.detailed:
+            status = self.getStatus(detailed=True)
+        else:
+            status = self.getStatus()
+        return json.dumps(status, sort_keys=True)
+
+
+def addStatusResources(root, getStatus, detailed=False):
+    """Add ``/ready`` and ``/health`` resources to a web server.
+
+    :type root: :api:`twisted.web.resource.Resource`
+    :param root: The web server's root resource.
+    :param getStatus: A callable which returns a dictionary describing the
+        hashrings being served, or ``None`` to not add the resources.
+    :param bool detailed: Whether ``/health`` should show the details of the
+        hashrings and reloads, i.e. ``HEALTH_DETAILS``.
+    """
+    if getStatus is None:
+        return
+
+    root.putChild('ready', ReadyResource(getStatus))
+    root.putChild('health', HealthResource(getStatus, detailed))
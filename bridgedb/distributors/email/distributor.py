@@ -27,6 +27,8 @@ A :class:`~bridgedb.distribute.Distributor` which hands out :class:`bridges
 import logging
 import time
 
+from collections import OrderedDict
+
 import bridgedb.Storage
 
 from bridgedb.Bridges import BridgeRing
@@ -38,6 +40,7 @@ from bridgedb.filters import byFilters
 from bridgedb.filters import byIPv4
 from bridgedb.filters import byIPv6
 from bridgedb.filters import bySubring
+from bridgedb.filters import internFilters
 from bridgedb.parse import addr
 
 
@@ -77,7 +80,7 @@ class EmailDistributor(Distributor):
     emailRateMax = MAX_EMAIL_RATE
 
     def __init__(self, key, domainmap, domainrules,
-                 answerParameters=None, whitelist=None):
+                 answerParameters=None, whitelist=None, ringClass=BridgeRing):
         """Create a bridge distributor which uses email.
 
         :type emailHmac: callable
@@ -91,6 +94,9 @@ class EmailDistributor(Distributor):
         :type whitelist: dict or ``None``
         :param whitelist: A dictionary that maps whitelisted email addresses
             to GnuPG fingerprints.
+        :param ringClass: The class to use for this distributor's filtered
+            subhashrings, either :class:`~bridgedb.Bridges.BridgeRing` or
+            :class:`~bridgedb.Bridges.CompactBridgeRing`.
         """
         super(EmailDistributor, self).__init__(key)
 
@@ -98,6 +104,7 @@ class EmailDistributor(Distributor):
         self.domainrules = domainrules
         self.whitelist = whitelist or dict()
         self.answerParameters = answerParameters
+        self.ringClass = ringClass
 
         key1 = getHMAC(key, "Map-Addresses-To-Ring")
         key2 = getHMAC(key, "Order-Bridges-In-Ring")
@@ -138,10 +145,7 @@ class EmailDistributor(Distributor):
         :returns: A list of :class:`~bridgedb.bridges.Bridges` for the
             ``bridgeRequest.client``, if allowed.  Otherwise, returns ``None``.
         """
-        if (not bridgeRequest.client) or (bridgeRequest.client == 'default'):
-            raise addr.BadEmail(
-                ("%s distributor can't get bridges for invalid email address: "
-                 "%s") % (self.name, bridgeRequest.client), bridgeRequest.client)
+        self._checkAddress(bridgeRequest)
 
         logging.info("Attempting to get bridges for %s..." % bridgeRequest.client)
 
@@ -151,45 +155,15 @@ class EmailDistributor(Distributor):
             now = clock.seconds()
 
         with bridgedb.Storage.getDB() as db:
-            wasWarned = db.getWarnedEmail(bridgeRequest.client)
-            lastSaw = db.getEmailTime(bridgeRequest.client)
-            if lastSaw is not None:
-                if bridgeRequest.client in self.whitelist:
-                    logging.info(
-                        "Whitelisted address %s was last seen %d seconds ago."
-                        % (bridgeRequest.client, now - lastSaw))
-                elif (lastSaw + self.emailRateMax) >= now:
-                    wait = (lastSaw + self.emailRateMax) - now
-                    logging.info("Client %s must wait another %d seconds."
-                                 % (bridgeRequest.client, wait))
-                    if wasWarned:
-                        raise IgnoreEmail(
-                            "Client %s was warned." % bridgeRequest.client,
-                            bridgeRequest.client)
-                    else:
-                        logging.info("Sending duplicate request warning.")
-                        db.setWarnedEmail(bridgeRequest.client, True, now)
-                        db.commit()
-                        raise TooSoonEmail("Must wait %d seconds" % wait,
-                                           bridgeRequest.client)
-            # warning period is over
-            elif wasWarned:
-                db.setWarnedEmail(bridgeRequest.client, False)
+            try:
+                self._checkRateLimit(db, bridgeRequest.client, now)
+            except TooSoonEmail:
+                db.commit()
+                raise
 
             pos = self.emailHmac("<%s>%s" % (interval, bridgeRequest.client))
 
-            ring = None
-            filtres = frozenset(bridgeRequest.filters)
-            if filtres in self.hashring.filterRings:
-                logging.debug("Cache hit %s" % filtres)
-                _, ring = self.hashring.filterRings[filtres]
-            else:
-                logging.debug("Cache miss %s" % filtres)
-                key = getHMAC(self.key, "Order-Bridges-In-Ring")
-                ring = BridgeRing(key, self.answerParameters)
-                self.hashring.addRing(ring, filtres, byFilters(filtres),
-                                      populate_from=self.hashring.bridges)
-
+            ring = self._getRing(internFilters(bridgeRequest.filters))
             returnNum = self.bridgesPerResponse(ring)
             result = ring.getBridges(pos, returnNum, filterBySubnet=False)
 
@@ -198,6 +172,146 @@ class EmailDistributor(Distributor):
 
         return result
 
+    def getBridgesBatch(self, bridgeRequests, interval, clock=None):
+        """Return the lists of bridges to give to many users at once.
+
+        Each user gets the same bridges as from :meth:`getBridges`, but the
+        requests are grouped by the subhashring which answers them, so that
+        each subhashring is only looked up once, and all of its positions are
+        found together (see
+        :meth:`bridgedb.Bridges.BridgeRing.getBridgesMany`).  All of the
+        clients' email and warning times are recorded in a single database
+        transaction.
+
+        Rather than raising an exception for a client who shouldn't get any
+        bridges, as :meth:`getBridges` does, the exception is put in the list
+        of answers in place of that client's bridges, so that the other
+        clients are still answered.
+
+        :param list bridgeRequests: Some
+            :class:`~bridgedb.distributors.email.request.EmailBridgeRequest`\\ s,
+            as for :meth:`getBridges`.
+        :type interval: str
+        :param interval: The time period when we got these requests.
+        :type clock: :api:`twisted.internet.task.Clock`
+        :param clock: If given, use the clock to ask what time it is, rather
+            than :api:`time.time`.
+        :rtype: list
+        :returns: For each of the **bridgeRequests**, in order, either a list
+            of :class:`~bridgedb.bridges.Bridges`, or the
+            :exc:`~bridgedb.parse.addr.BadEmail`, :exc:`IgnoreEmail`, or
+            :exc:`TooSoonEmail` which :meth:`getBridges` would have raised.
+        """
+        logging.info("Attempting to get bridges for %d clients..."
+                     % len(bridgeRequests))
+
+        now = time.time()
+
+        if clock:
+            now = clock.seconds()
+
+        answers = [None] * len(bridgeRequests)
+        groups = OrderedDict()
+
+        with bridgedb.Storage.getDB() as db:
+            for i, bridgeRequest in enumerate(bridgeRequests):
+                try:
+                    self._checkAddress(bridgeRequest)
+                    self._checkRateLimit(db, bridgeRequest.client, now)
+                except addr.BadEmail as error:
+                    answers[i] = error
+                    continue
+
+                # This is recorded straight away, so that a client who asks
+                # twice within the batch is told to wait, as they would be
+                # by getBridges():
+                db.setEmailTime(bridgeRequest.client, now)
+
+                pos = self.emailHmac("<%s>%s" % (interval,
+                                                 bridgeRequest.client))
+                filtres = internFilters(bridgeRequest.filters)
+                if filtres not in groups:
+                    groups[filtres] = ([], [])
+                groups[filtres][0].append(i)
+                groups[filtres][1].append(pos)
+
+            for filtres, (indices, positions) in groups.items():
+                ring = self._getRing(filtres)
+                returnNum = self.bridgesPerResponse(ring)
+                found = ring.getBridgesMany(positions, returnNum,
+                                            filterBySubnet=False)
+                for i, answer in zip(indices, found):
+                    answers[i] = answer
+
+            db.commit()
+
+        return answers
+
+    def _checkAddress(self, bridgeRequest):
+        """Check that a **bridgeRequest** has a client email address.
+
+        :raises: :exc:`~bridgedb.parse.addr.BadEmail` if it doesn't.
+        """
+        if (not bridgeRequest.client) or (bridgeRequest.client == 'default'):
+            raise addr.BadEmail(
+                ("%s distributor can't get bridges for invalid email address: "
+                 "%s") % (self.name, bridgeRequest.client), bridgeRequest.client)
+
+    def _checkRateLimit(self, db, client, now):
+        """Check that a **client** hasn't been sent bridges too recently, and
+        update whether they were warned about it.
+
+        Any changes to the **db** are left for the caller to commit.
+
+        :type db: :class:`bridgedb.Storage.Database`
+        :param db: The database.
+        :param str client: The client's email address.
+        :param float now: The current time.
+        :raises: :exc:`TooSoonEmail` if the **client** must wait longer, and
+            should be warned, or :exc:`IgnoreEmail` if they were already
+            warned.
+        """
+        wasWarned = db.getWarnedEmail(client)
+        lastSaw = db.getEmailTime(client)
+        if lastSaw is not None:
+            if client in self.whitelist:
+                logging.info(
+                    "Whitelisted address %s was last seen %d seconds ago."
+                    % (client, now - lastSaw))
+            elif (lastSaw + self.emailRateMax) >= now:
+                wait = (lastSaw + self.emailRateMax) - now
+                logging.info("Client %s must wait another %d seconds."
+                             % (client, wait))
+                if wasWarned:
+                    raise IgnoreEmail("Client %s was warned." % client, client)
+                else:
+                    logging.info("Sending duplicate request warning.")
+                    db.setWarnedEmail(client, True, now)
+                    raise TooSoonEmail("Must wait %d seconds" % wait, client)
+        # warning period is over
+        elif wasWarned:
+            db.setWarnedEmail(client, False)
+
+    def _getRing(self, filtres):
+        """Get the subhashring for some **filtres**, building it if it isn't
+        cached.
+
+        :param frozenset filtres: The interned filters of a client's request.
+        :rtype: :class:`~bridgedb.Bridges.BridgeRing`
+        """
+        ring = self.hashring.getRing(filtres)
+        if ring is not None:
+            logging.debug("Cache hit %s" % filtres)
+        else:
+            logging.debug("Cache miss %s" % filtres)
+            key = getHMAC(self.key, "Order-Bridges-In-Ring")
+            ring = self.hashring.newRing(self.ringClass, key,
+                                         self.answerParameters)
+            self.hashring.addRing(ring, filtres, byFilters(filtres),
+                                  populate_from=self.hashring.bridges)
+
+        return ring
+
     def cleanDatabase(self):
         """Clear all emailed response and warning times from the database."""
         logging.info(("Cleaning all response and warning times for the %s "
@@ -218,12 +332,18 @@ class EmailDistributor(Distributor):
         """
         logging.info("Prepopulating %s distributor hashrings..." % self.name)
 
+        ringnames = []
         for filterFn in [byIPv4, byIPv6]:
-            ruleset = frozenset([filterFn])
+            ruleset = internFilters([filterFn])
             key = getHMAC(self.key, "Order-Bridges-In-Ring")
-            ring = BridgeRing(key, self.answerParameters)
-            self.hashring.addRing(ring, ruleset, byFilters([filterFn]),
-                                  populate_from=self.hashring.bridges)
+            ring = self.hashring.newRing(self.ringClass, key,
+                                         self.answerParameters)
+            if self.hashring.addRing(ring, ruleset, byFilters([filterFn]),
+                                     pinned=True):
+                ringnames.append(ruleset)
+
+        # Fill all of the new subrings in one pass over the bridges:
+        self.hashring.populateRings(ringnames, self.hashring.bridges)
 
         # Since prepopulateRings is called every half hour when the bridge
         # descriptors are re-parsed, we should clean the database then.
@@ -54,7 +54,6 @@ import io
 import socket
 
 from twisted.internet import defer
-from twisted.internet import reactor
 from twisted.internet.error import CannotListenError
 from twisted.internet.task import LoopingCall
 from twisted.mail import smtp
@@ -64,6 +63,7 @@ from twisted.python import failure
 from zope.interface import implements
 
 from bridgedb import __version__
+from bridgedb import prefork
 from bridgedb import safelog
 from bridgedb.crypto import initializeGnuPG
 from bridgedb.distributors.email import autoresponder
@@ -495,7 +495,7 @@ def addServer(config, distributor):
     port = config.EMAIL_PORT or 6725
 
     try:
-        reactor.listenTCP(port, factory, interface=addr)
+        prefork.listenTCP(port, factory, interface=addr)
     except CannotListenError as error:  # pragma: no cover
         logging.fatal(error)
         raise SystemExit(error.message)
@@ -23,6 +23,11 @@ A Distributor that hands out bridges through a web interface.
 import ipaddr
 import logging
 
+from collections import Counter
+from collections import OrderedDict
+
+from twisted.internet import threads
+
 import bridgedb.Storage
 
 from bridgedb import proxy
@@ -31,10 +36,12 @@ from bridgedb.Bridges import FilteredBridgeSplitter
 from bridgedb.crypto import getHMAC
 from bridgedb.crypto import getHMACFunc
 from bridgedb.distribute import Distributor
+from bridgedb.filters import byIPv
 from bridgedb.filters import byIPv4
 from bridgedb.filters import byIPv6
 from bridgedb.filters import byFilters
 from bridgedb.filters import bySubring
+from bridgedb.filters import internFilters
 
 
 class HTTPSDistributor(Distributor):
@@ -48,9 +55,25 @@ class HTTPSDistributor(Distributor):
     :ivar hashring: A hashring that assigns bridges to subrings with fixed
         proportions. Used to assign bridges into the subrings of this
         distributor.
+    :ivar bool buildRingsInBackground: If ``True``, subhashrings which
+        aren't cached are built in a thread, and clients are answered from
+        the nearest cached subhashring in the meantime.  Otherwise, they are
+        built while handling the client's request.
+    :type ringRequests: :class:`collections.Counter`
+    :ivar ringRequests: The number of times each ``(filters, subring)``
+        combination has been requested by a client.  At most
+        :data:`maxTrackedRingRequests` combinations are kept.
+    :ivar int placementCacheSize: The maximum number of client subnets whose
+        subhashring and hashring position are cached by
+        :meth:`getClientPlacement`.
     """
 
-    def __init__(self, totalSubrings, key, proxies=None, answerParameters=None):
+    #: Clients' requests are still counted after a reload, so that the most
+    #: popular subhashrings can be prebuilt again before the next one.
+    keptAcrossGenerations = ('ringRequests',)
+
+    def __init__(self, totalSubrings, key, proxies=None, answerParameters=None,
+                 ringClass=BridgeRing):
         """Create a Distributor that decides which bridges to distribute based
         upon the client's IP address and the current time.
 
@@ -73,10 +96,14 @@ class HTTPSDistributor(Distributor):
             bridges that this distributor answers a client with fit certain
             parameters, i.e. that an answer has "at least two obfsproxy
             bridges" or "at least one bridge on port 443", etc.
+        :param ringClass: The class to use for this distributor's filtered
+            subhashrings, either :class:`~bridgedb.Bridges.BridgeRing` or
+            :class:`~bridgedb.Bridges.CompactBridgeRing`.
         """
         super(HTTPSDistributor, self).__init__(key)
         self.totalSubrings = totalSubrings
         self.answerParameters = answerParameters
+        self.ringClass = ringClass
 
         if proxies:
             logging.info("Added known proxies to HTTPS distributor...")
@@ -89,6 +116,13 @@ class HTTPSDistributor(Distributor):
             self.proxySubring = 0
 
         self.ringCacheSize = self.totalSubrings * 3
+        self.maxTrackedRingRequests = self.ringCacheSize * 10
+        self.ringRequests = Counter()
+        self.buildRingsInBackground = False
+        self._ringsBuilding = set()
+        self.placementCacheSize = 4096
+        self._placements = OrderedDict()
+        self._placementsInterval = None
 
         key2 = getHMAC(key, "Assign-Bridges-To-Rings")
         key3 = getHMAC(key, "Order-Areas-In-Rings")
@@ -200,6 +234,42 @@ class HTTPSDistributor(Distributor):
         mapping = self._clientToPositionHMAC(position)
         return mapping
 
+    def getClientPlacement(self, interval, subnet, usingProxy=False):
+        """Get the subhashring and the hashring position for clients within
+        **subnet** during **interval**.
+
+        These are cached for the current **interval**, since most requests
+        come from a small number of subnets and proxy groups.  The cache is
+        flushed whenever the **interval** changes, and at most
+        :data:`placementCacheSize` subnets (the most recently seen ones) are
+        kept.
+
+        :param str interval: The interval which this client's request for
+            bridges took place within.
+        :param str subnet: The subnet which contains the client's IP.  See
+            :staticmethod:`getSubnet`.
+        :param bool usingProxy: Set to ``True`` if the client was using one of
+            the known :data:`proxies`.
+        :rtype: tuple
+        :returns: A 2-tuple of the subhashring, as from
+            :meth:`mapSubnetToSubring`, and the position, as from
+            :meth:`mapClientToHashringPosition`.
+        """
+        if interval != self._placementsInterval:
+            self._placements.clear()
+            self._placementsInterval = interval
+
+        key = (subnet, usingProxy)
+        placement = self._placements.pop(key, None)
+        if placement is None:
+            placement = (self.mapSubnetToSubring(subnet, usingProxy),
+                         self.mapClientToHashringPosition(interval, subnet))
+            while len(self._placements) >= self.placementCacheSize:
+                self._placements.popitem(last=False)
+        self._placements[key] = placement
+
+        return placement
+
     def prepopulateRings(self):
         """Prepopulate this distributor's hashrings and subhashrings with
         bridges.
@@ -249,18 +319,24 @@ class HTTPSDistributor(Distributor):
         """
         logging.info("Prepopulating %s distributor hashrings..." % self.name)
 
+        ringnames = []
         for filterFn in [byIPv4, byIPv6]:
             for subring in range(1, self.totalSubrings + 1):
                 filters = self._buildHashringFilters([filterFn,], subring)
                 key1 = getHMAC(self.key, "Order-Bridges-In-Ring-%d" % subring)
-                ring = BridgeRing(key1, self.answerParameters)
+                ring = self.hashring.newRing(self.ringClass, key1,
+                                             self.answerParameters)
                 # For consistency with previous implementation of this method,
                 # only set the "name" for "clusters" which are for this
                 # distributor's proxies:
                 if subring == self.proxySubring:
                     ring.setName('{0} Proxy Ring'.format(self.name))
-                self.hashring.addRing(ring, filters, byFilters(filters),
-                                      populate_from=self.hashring.bridges)
+                if self.hashring.addRing(ring, filters, byFilters(filters),
+                                         pinned=True):
+                    ringnames.append(filters)
+
+        # Fill all of the new subrings in one pass over the bridges:
+        self.hashring.populateRings(ringnames, self.hashring.bridges)
 
         logging.info("Bridges allotted for %s distribution: %d"
                      % (self.name, len(self.hashring)))
@@ -277,10 +353,110 @@ class HTTPSDistributor(Distributor):
         """Assign a bridge to this distributor."""
         self.hashring.insert(bridge)
 
+    def _buildRing(self, filters, subring, hashring):
+        """Create a subhashring for the bridges matching some **filters**.
+
+        The new subhashring is *not* added to the **hashring**, so this is
+        safe to call from a thread.
+
+        :param frozenset filters: The filters for the subhashring.
+        :param int subring: The client cluster the subhashring is for.
+        :type hashring: :class:`~bridgedb.Bridges.FilteredBridgeSplitter`
+        :param hashring: The hashring whose bridges should populate the new
+            subhashring.
+        :returns: The new, populated subhashring.
+        """
+        key1 = getHMAC(self.key, "Order-Bridges-In-Ring-%d" % subring)
+        ring = hashring.newRing(self.ringClass, key1, self.answerParameters)
+        hashring.populateRing(ring, filters, byFilters(filters))
+
+        return ring
+
+    def _addBuiltRing(self, ring, filters, hashring, revision):
+        """Add a subhashring built by :meth:`buildRingInBackground`, unless our
+        :data:`hashring` was replaced, or its bridges were changed, while it
+        was being built.
+        """
+        if hashring is not self.hashring or hashring.revision != revision:
+            logging.info("Discarding %s subhashring built from out of date "
+                         "bridges." % self.name)
+        elif filters not in hashring.filterRings:
+            hashring.addRing(ring, filters, byFilters(filters))
+
+    def buildRingInBackground(self, filters, subring):
+        """Build the subhashring for some **filters** in a thread, and add it
+        to our :data:`hashring` once it is finished.
+
+        :param frozenset filters: The filters for the subhashring.
+        :param int subring: The client cluster the subhashring is for.
+        :rtype: :api:`twisted.internet.defer.Deferred` or None
+        :returns: A deferred which fires once the subhashring has been added,
+            or ``None`` if it is already being built.
+        """
+        if filters in self._ringsBuilding:
+            return None
+
+        self._ringsBuilding.add(filters)
+        hashring = self.hashring
+
+        def finished(result):
+            self._ringsBuilding.discard(filters)
+            return result
+
+        d = threads.deferToThread(self._buildRing, filters, subring, hashring)
+        d.addCallback(self._addBuiltRing, filters, hashring, hashring.revision)
+        d.addErrback(lambda failure: logging.error(
+            "Error building %s subhashring: %s" % (self.name, failure)))
+        d.addBoth(finished)
+        return d
+
+    def recordRingRequest(self, filters, subring):
+        """Count a client request for the subhashring with some **filters**.
+
+        If more than :data:`maxTrackedRingRequests` combinations are being
+        counted, only the most popular half of them are kept.
+        """
+        self.ringRequests[(filters, subring)] += 1
+
+        if len(self.ringRequests) > self.maxTrackedRingRequests:
+            keep = self.ringRequests.most_common(self.maxTrackedRingRequests // 2)
+            self.ringRequests = Counter(dict(keep))
+
+    def popularRingRequests(self, count):
+        """Get the **count** most often requested subhashrings.
+
+        :rtype: list
+        :returns: A list of ``(filters, subring)`` two-tuples, most popular
+            first.
+        """
+        return [request for request, _ in self.ringRequests.most_common(count)]
+
+    def prebuildRings(self, requests):
+        """Build and add the subhashrings for some **requests**, i.e. as
+        returned by :meth:`popularRingRequests`, if they aren't already in our
+        :data:`hashring`.
+
+        At most :data:`ringCacheSize` subhashrings are built, so that none of
+        them are evicted by the others.
+
+        :param list requests: A list of ``(filters, subring)`` two-tuples.
+        """
+        built = 0
+
+        for filters, subring in requests[:self.ringCacheSize]:
+            if filters in self.hashring.filterRings:
+                continue
+            ring = self._buildRing(filters, subring, self.hashring)
+            if self.hashring.addRing(ring, filters, byFilters(filters)):
+                built += 1
+
+        logging.info("Prebuilt %d popular %s subhashrings." % (built, self.name))
+
     def _buildHashringFilters(self, previousFilters, subring):
-        f = bySubring(self.hashring.hmac, subring, self.totalSubrings)
+        f = bySubring(self.hashring.hmac, subring, self.totalSubrings,
+                      self.hashring.placements)
         previousFilters.append(f)
-        return frozenset(previousFilters)
+        return internFilters(previousFilters)
 
     def getBridges(self, bridgeRequest, interval):
         """Return a list of bridges to give to a user.
@@ -303,23 +479,10 @@ class HTTPSDistributor(Distributor):
             logging.warn("Bailing! Hashring has zero bridges!")
             return []
 
-        usingProxy = False
-
-        # First, check if the client's IP is one of the known :data:`proxies`:
-        if bridgeRequest.client in self.proxies:
-            # The tag is a tag applied to a proxy IP address when it is added
-            # to the bridgedb.proxy.ProxySet. For Tor Exit relays, the default
-            # is 'exit_relay'. For other proxies loaded from the
-            # PROXY_LIST_FILES config option, the default tag is the full
-            # filename that the IP address originally came from.
-            usingProxy = True
-            tag = self.proxies.getTag(bridgeRequest.client)
-            logging.info("Client was from known proxy (tag: %s): %s" %
-                         (tag, bridgeRequest.client))
-
+        usingProxy = self._isFromProxy(bridgeRequest)
         subnet = self.getSubnet(bridgeRequest.client, usingProxy)
-        subring = self.mapSubnetToSubring(subnet, usingProxy)
-        position = self.mapClientToHashringPosition(interval, subnet)
+        subring, position = self.getClientPlacement(interval, subnet,
+                                                    usingProxy)
         filters = self._buildHashringFilters(bridgeRequest.filters, subring)
 
         logging.debug("Client request within time interval: %s" % interval)
@@ -328,20 +491,175 @@ class HTTPSDistributor(Distributor):
         logging.debug("Total bridges: %d" % len(self.hashring))
         logging.debug("Bridge filters: %s" % ' '.join([x.func_name for x in filters]))
 
+        self.recordRingRequest(filters, subring)
+        ringFilters, ring = self._getRing(filters, subring,
+                                          bridgeRequest.ipVersion)
+
+        return self._getAnswers(ring, ringFilters, filters, subring,
+                                [position])[0]
+
+    def getBridgesBatch(self, bridgeRequests, interval):
+        """Return the lists of bridges to give to many users at once.
+
+        Each user gets the same bridges as from :meth:`getBridges`, but each
+        client subnet is only placed once, and the requests are grouped by
+        the subhashring which answers them, so that each subhashring is only
+        looked up once, and all of its positions are found together (see
+        :meth:`bridgedb.Bridges.BridgeRing.getBridgesMany`).
+
+        :param list bridgeRequests: Some
+            :class:`~bridgedb.distributors.https.request.HTTPSBridgeRequest`\\ s,
+            as for :meth:`getBridges`.
+        :param str interval: The time period when we got these requests.
+        :rtype: list
+        :returns: A list of :class:`~bridgedb.Bridges.Bridge`\\ s for each
+            of the **bridgeRequests**, in order.
+        """
+        logging.info("Attempting to get bridges for %d clients..."
+                     % len(bridgeRequests))
+
+        if not len(self.hashring):
+            logging.warn("Bailing! Hashring has zero bridges!")
+            return [[] for _ in bridgeRequests]
+
+        placements = {}
+        groups = OrderedDict()
+
+        for i, bridgeRequest in enumerate(bridgeRequests):
+            usingProxy = self._isFromProxy(bridgeRequest)
+            subnet = self.getSubnet(bridgeRequest.client, usingProxy)
+            if (subnet, usingProxy) not in placements:
+                placements[(subnet, usingProxy)] = self.getClientPlacement(
+                    interval, subnet, usingProxy)
+            subring, position = placements[(subnet, usingProxy)]
+            filters = self._buildHashringFilters(bridgeRequest.filters,
+                                                 subring)
+            self.recordRingRequest(filters, subring)
+
+            # The filters include the subring and the client's IP version:
+            if filters not in groups:
+                groups[filters] = (subring, bridgeRequest.ipVersion, [], [])
+            groups[filters][2].append(i)
+            groups[filters][3].append(position)
+
+        logging.debug("Answering %d clients from %d subnets with %d "
+                      "subhashrings." % (len(bridgeRequests),
+                                         len(placements), len(groups)))
+
+        answers = [None] * len(bridgeRequests)
+
+        for filters, group in groups.items():
+            subring, ipVersion, indices, positions = group
+            ringFilters, ring = self._getRing(filters, subring, ipVersion)
+            found = self._getAnswers(ring, ringFilters, filters, subring,
+                                     positions)
+            for i, answer in zip(indices, found):
+                answers[i] = answer
+
+        return answers
+
+    def _isFromProxy(self, bridgeRequest):
+        """Check whether the client's IP is one of the known :data:`proxies`.
+
+        :rtype: bool
+        """
+        if bridgeRequest.client not in self.proxies:
+            return False
+
+        # The tag is a tag applied to a proxy IP address when it is added
+        # to the bridgedb.proxy.ProxySet. For Tor Exit relays, the default
+        # is 'exit_relay'. For other proxies loaded from the
+        # PROXY_LIST_FILES config option, the default tag is the full
+        # filename that the IP address originally came from.
+        tag = self.proxies.getTag(bridgeRequest.client)
+        logging.info("Client was from known proxy (tag: %s): %s" %
+                     (tag, bridgeRequest.client))
+        return True
+
+    def _getRing(self, filters, subring, ipVersion):
+        """Get the subhashring to answer clients whose requests have some
+        **filters** from.
+
+        :param frozenset filters: The filters for the clients' requests.
+        :param int subring: The client cluster the clients are in.
+        :param int ipVersion: The IP version of the bridges requested.
+        :rtype: tuple
+        :returns: A 2-tuple of the filters of the subhashring, which may be
+            less specific than **filters** if it is being built in the
+            background, and the subhashring.
+        """
+        ringFilters = filters
+
         # Check wheth we have a cached copy of the hashring:
-        if filters in self.hashring.filterRings.keys():
+        ring = self.hashring.getRing(filters)
+        if ring is not None:
             logging.debug("Cache hit %s" % filters)
-            _, ring = self.hashring.filterRings[filters]
+        # Otherwise, build it off the reactor and meanwhile use the closest
+        # hashring we already have:
+        elif self.buildRingsInBackground:
+            logging.debug("Cache miss %s (building in background)" % filters)
+            self.buildRingInBackground(filters, subring)
+            # All of a client's filters select for bridges with addresses of
+            # the client's IP version, so adding byIPv() doesn't change which
+            # bridges match, but lets the prepopulated subhashrings be found:
+            ringFilters, ring = self.hashring.getNearestRing(
+                filters.union([byIPv(ipVersion)]))
+
         # Otherwise, construct a new hashring and populate it:
-        else:
+        if ring is None:
             logging.debug("Cache miss %s" % filters)
-            key1 = getHMAC(self.key, "Order-Bridges-In-Ring-%d" % subring)
-            ring = BridgeRing(key1, self.answerParameters)
-            self.hashring.addRing(ring, filters, byFilters(filters),
-                                  populate_from=self.hashring.bridges)
+            ringFilters = filters
+            ring = self._addRing(filters, subring)
+
+        return ringFilters, ring
+
+    def _addRing(self, filters, subring):
+        """Build the subhashring for some **filters** now, and add it to our
+        :data:`hashring`.
+
+        :rtype: :class:`~bridgedb.Bridges.BridgeRing`
+        """
+        ring = self._buildRing(filters, subring, self.hashring)
+        self.hashring.addRing(ring, filters, byFilters(filters))
+        return ring
+
+    def _getAnswers(self, ring, ringFilters, filters, subring, positions):
+        """Get the bridges to give to the clients at some **positions** in a
+        subhashring from :meth:`_getRing`.
+
+        If the subhashring is less specific than the clients' **filters**,
+        each client is given the bridges which the subhashring for their
+        **filters** would give them, by skipping over the bridges which don't
+        match.  If too few bridges match them for that to be quicker than
+        building it, the subhashring for their **filters** is built now, and
+        they are all answered from it instead.
+
+        :param ring: The subhashring.
+        :param frozenset ringFilters: The filters of the subhashring.
+        :param frozenset filters: The filters for the clients' requests.
+        :param int subring: The client cluster the clients are in.
+        :param list positions: The clients' positions in the subhashring.
+        :rtype: list
+        :returns: A list of :class:`~bridgedb.Bridges.Bridge`\\ s for each
+            of the **positions**, in order.
+        """
+        if ringFilters != filters:
+            filterFn = byFilters(filters)
+            # The subhashring for the clients' filters would have exactly
+            # these bridges, so the clients get as many bridges from it:
+            matching = self.hashring.index.getMatching(filterFn)
+            if len(matching) >= self.bridgesPerResponse(ring):
+                returnNum = self.bridgesPerResponse(matching)
+                return [ring.getMatchingBridges(position, returnNum, filterFn,
+                                                filterBySubnet=True)
+                        for position in positions]
+
+            logging.debug("Too few bridges match %s in the nearest "
+                          "subhashring; building it now." % filters)
+            ring = self.hashring.getRing(filters)
+            if ring is None:
+                ring = self._addRing(filters, subring)
 
         # Determine the appropriate number of bridges to give to the client:
         returnNum = self.bridgesPerResponse(ring)
-        answer = ring.getBridges(position, returnNum, filterBySubnet=True)
-
-        return answer
+        return ring.getBridgesMany(positions, returnNum, filterBySubnet=True)
@@ -49,12 +49,14 @@ from twisted.web.util import redirectTo
 
 from bridgedb import captcha
 from bridgedb import crypto
+from bridgedb import prefork
 from bridgedb import strings
 from bridgedb import translations
 from bridgedb import txrecaptcha
 from bridgedb.distributors.common.http import setFQDN
 from bridgedb.distributors.common.http import getFQDN
 from bridgedb.distributors.common.http import getClientIP
+from bridgedb.distributors.common.http import addStatusResources
 from bridgedb.distributors.https.request import HTTPSBridgeRequest
 from bridgedb.parse import headers
 from bridgedb.parse.addr import isIPAddress
@@ -983,7 +985,7 @@ class BridgesResource(CustomErrorHandlingResource, CSPResource):
         return rendered
 
 
-def addWebServer(config, distributor):
+def addWebServer(config, distributor, getStatus=None):
     """Set up a web server for HTTP(S)-based bridge distribution.
 
     :type config: :class:`bridgedb.persistent.Conf`
@@ -1014,6 +1016,10 @@ def addWebServer(config, distributor):
              CSP_INCLUDE_SELF
     :type distributor: :class:`bridgedb.distributors.https.distributor.HTTPSDistributor`
     :param distributor: A bridge distributor.
+    :param getStatus: If given, a callable returning a dictionary which
+        describes the hashrings being served, i.e.
+        :meth:`bridgedb.supervisor.ReloadSupervisor.getStatus`, for the
+        ``/ready`` and ``/health`` resources.
     :raises SystemExit: if the servers cannot be started.
     :rtype: :api:`twisted.web.server.Site`
     :returns: A webserver.
@@ -1048,6 +1054,7 @@ def addWebServer(config, distributor):
     root.putChild('maintenance', maintenance)
     root.putChild('error', resource500)
     root.putChild(CSPResource.reportURI, csp)
+    addStatusResources(root, getStatus, config.HEALTH_DETAILS)
 
     if config.RECAPTCHA_ENABLED:
         publicKey = config.RECAPTCHA_PUB_KEY
@@ -1091,7 +1098,7 @@ def addWebServer(config, distributor):
         ip = config.HTTP_UNENCRYPTED_BIND_IP or ""
         port = config.HTTP_UNENCRYPTED_PORT or 80
         try:
-            reactor.listenTCP(port, site, interface=ip)
+            prefork.listenTCP(port, site, interface=ip)
         except CannotListenError as error:
             raise SystemExit(error)
         logging.info("Started HTTP server on %s:%d" % (str(ip), int(port)))
@@ -1103,7 +1110,7 @@ def addWebServer(config, distributor):
             from twisted.internet.ssl import DefaultOpenSSLContextFactory
             factory = DefaultOpenSSLContextFactory(config.HTTPS_KEY_FILE,
                                                    config.HTTPS_CERT_FILE)
-            reactor.listenSSL(port, site, factory, interface=ip)
+            prefork.listenSSL(port, site, factory, interface=ip)
         except CannotListenError as error:
             raise SystemExit(error)
         logging.info("Started HTTPS server on %s:%d" % (str(ip), int(port)))
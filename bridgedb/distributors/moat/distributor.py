@@ -20,6 +20,7 @@ A Distributor that hands out bridges through a web interface.
     :parts: 1
 """
 
+from bridgedb.Bridges import BridgeRing
 from bridgedb.distributors.https.distributor import HTTPSDistributor
 
 class MoatDistributor(HTTPSDistributor):
@@ -36,7 +37,8 @@ class MoatDistributor(HTTPSDistributor):
         distributor.
     """
 
-    def __init__(self, totalSubrings, key, proxies=None, answerParameters=None):
+    def __init__(self, totalSubrings, key, proxies=None, answerParameters=None,
+                 ringClass=BridgeRing):
         """Create a Distributor that decides which bridges to distribute based
         upon the client's IP address and the current time.
 
@@ -59,6 +61,9 @@ class MoatDistributor(HTTPSDistributor):
             bridges that this distributor answers a client with fit certain
             parameters, i.e. that an answer has "at least two obfsproxy
             bridges" or "at least one bridge on port 443", etc.
+        :param ringClass: The class to use for this distributor's filtered
+            subhashrings, either :class:`~bridgedb.Bridges.BridgeRing` or
+            :class:`~bridgedb.Bridges.CompactBridgeRing`.
         """
         super(MoatDistributor, self).__init__(totalSubrings, key, proxies,
-                                              answerParameters)
+                                              answerParameters, ringClass)
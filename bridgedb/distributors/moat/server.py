@@ -33,16 +33,17 @@ from functools import partial
 
 from ipaddr import IPAddress
 
-from twisted.internet import reactor
 from twisted.internet.error import CannotListenError
 from twisted.web import resource
 from twisted.web.server import Site
 
 from bridgedb import captcha
 from bridgedb import crypto
+from bridgedb import prefork
 from bridgedb.distributors.common.http import setFQDN
 from bridgedb.distributors.common.http import getFQDN
 from bridgedb.distributors.common.http import getClientIP
+from bridgedb.distributors.common.http import addStatusResources
 from bridgedb.distributors.moat.request import MoatBridgeRequest
 from bridgedb.qrcodes import generateQR
 from bridgedb.schedule import Unscheduled
@@ -739,7 +740,7 @@ class CaptchaCheckResource(CaptchaResource):
             return self.failureResponse(4, request)
 
 
-def addMoatServer(config, distributor):
+def addMoatServer(config, distributor, getStatus=None):
     """Set up a web server for moat bridge distribution.
 
     :type config: :class:`bridgedb.persistent.Conf`
@@ -766,6 +767,10 @@ def addMoatServer(config, distributor):
              MOAT_GIMP_CAPTCHA_RSA_KEYFILE
     :type distributor: :class:`bridgedb.distributors.moat.distributor.MoatDistributor`
     :param distributor: A bridge distributor.
+    :param getStatus: If given, a callable returning a dictionary which
+        describes the hashrings being served, i.e.
+        :meth:`bridgedb.supervisor.ReloadSupervisor.getStatus`, for the
+        ``/ready`` and ``/health`` resources.
     :raises SystemExit: if the servers cannot be started.
     :rtype: :api:`twisted.web.server.Site`
     :returns: A webserver.
@@ -812,6 +817,7 @@ def addMoatServer(config, distributor):
     root = CustomErrorHandlingResource()
     root.putChild("meek", meek)
     root.putChild("moat", moat)
+    addStatusResources(root, getStatus, config.HEALTH_DETAILS)
 
     site = Site(root)
     site.displayTracebacks = False
@@ -820,7 +826,7 @@ def addMoatServer(config, distributor):
         ip = config.MOAT_HTTP_IP or ""
         port = config.MOAT_HTTP_PORT or 80
         try:
-            reactor.listenTCP(port, site, interface=ip)
+            prefork.listenTCP(port, site, interface=ip)
         except CannotListenError as error:
             raise SystemExit(error)
         logging.info("Started Moat HTTP server on %s:%d" % (str(ip), int(port)))
@@ -832,7 +838,7 @@ def addMoatServer(config, distributor):
             from twisted.internet.ssl import DefaultOpenSSLContextFactory
             factory = DefaultOpenSSLContextFactory(config.MOAT_TLS_KEY_FILE,
                                                    config.MOAT_TLS_CERT_FILE)
-            reactor.listenSSL(port, site, factory, interface=ip)
+            prefork.listenSSL(port, site, factory, interface=ip)
         except CannotListenError as error:
             raise SystemExit(error)
         logging.info("Started Moat TLS server on %s:%d" % (str(ip), int(port)))
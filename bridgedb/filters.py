@@ -14,6 +14,7 @@
 """Functions for filtering :class:`Bridges <bridgedb.bridges.Bridge>`."""
 
 import logging
+import weakref
 
 from ipaddr import IPv4Address
 from ipaddr import IPv6Address
@@ -22,13 +23,19 @@ from bridgedb.parse.addr import isIPv
 
 
 _cache = {}
+_keys = weakref.WeakValueDictionary()
+_combined = weakref.WeakKeyDictionary()
 
 
-def bySubring(hmac, assigned, total):
+def bySubring(hmac, assigned, total, placements=None):
     """Create a filter function which filters for only the bridges which fall
     into the same **assigned** subhashring (based on the results of an **hmac**
     function).
 
+    If some **placements** are given, the filter remembers the bridges'
+    subrings in them, and is cached in them, so that each generation of
+    hashrings has its own filters.  Otherwise, the filter is cached globally.
+
     :type hmac: callable
     :param hmac: An HMAC function, i.e. as returned from
         :func:`bridgedb.crypto.getHMACFunc`.
@@ -37,6 +44,9 @@ def bySubring(hmac, assigned, total):
         address, then this function should only return bridges which would
         also be assigned to subring 2of3.
     :param int total: The total number of subrings.
+    :type placements: :class:`~bridgedb.Bridges.PlacementTable` or None
+    :param placements: The placements of the generation of hashrings which
+        will use the filter.
     :rtype: callable
     :returns: A filter function for :class:`Bridges <bridgedb.bridges.Bridge>`.
     """
@@ -45,37 +55,61 @@ def bySubring(hmac, assigned, total):
 
     name = "-".join([str(hmac("")[:8]).encode('hex'),
                      str(assigned), "of", str(total)])
+    cache = _cache if placements is None else placements.filters
     try:
-        return _cache[name]
+        return cache[name]
     except KeyError:
+        if placements is None:
+            getSubring = lambda identity: int(hmac(identity)[:8], 16) % total
+        else:
+            getSubring = placements.getSubringFunc(hmac, total)
+
         def _bySubring(bridge):
-            position = int(hmac(bridge.identity)[:8], 16)
-            which = (position % total) + 1
+            which = getSubring(bridge.identity) + 1
             return True if which == assigned else False
         # The `description` attribute must contain an `=`, or else
         # dumpAssignments() will not work correctly.
         setattr(_bySubring, "description", "ring=%d" % assigned)
         _bySubring.__name__ = ("bySubring%sof%s" % (assigned, total))
         _bySubring.name = name
-        _cache[name] = _bySubring
+        cache[name] = _bySubring
         return _bySubring
 
+def internFilters(filtres):
+    """Get the canonical set of some **filtres**.
+
+    Any two calls with the same filters, in any order and with any number of
+    duplicates, return the very same :class:`frozenset` object for as long
+    as it is in use, so that it can be used as a key for hashrings of
+    bridges matching those filters.
+
+    :param list filtres: A list (or other iterable) of filter functions.
+    :rtype: frozenset
+    """
+    key = frozenset(filtres)
+    return _keys.setdefault(key, key)
+
 def byFilters(filtres):
     """Returns a filter which filters by multiple **filtres**.
 
+    The order of the **filtres**, and any duplicates among them, don't
+    matter: the same filter function is returned for all of them, for as
+    long as their :func:`interned <internFilters>` set is in use.  (Filters
+    with the same names, but from different generations of hashrings, get
+    different filter functions.)
+
     :param list filtres: A list (or other iterable) of callables which some
         :class:`Bridges <bridgedb.bridges.Bridge>` should be filtered
         according to.
     :rtype: callable
     :returns: A filter function for :class:`Bridges <bridgedb.bridges.Bridge>`.
     """
-    name = []
-    for filtre in filtres:
-        name.extend(filtre.name.split(" "))
-    name = " ".join(set(name))
+    key = internFilters(filtres)
+    filtres = sorted(key, key=lambda filtre: filtre.name)
+    name = ", ".join([filtre.name for filtre in filtres])
 
     try:
-        return _cache[name]
+        return _combined[key]
     except KeyError:
         def _byFilters(bridge):
             results = [f(bridge) for f in filtres]
@@ -84,8 +118,9 @@ def byFilters(filtres):
             return True
         setattr(_byFilters, "description",
                 " ".join([getattr(f, "description", "") for f in filtres]))
+        _byFilters.filters = list(filtres)
         _byFilters.name = name
-        _cache[name] = _byFilters
+        _combined[key] = _byFilters
         return _byFilters
 
 def byIPv(ipVersion=None):
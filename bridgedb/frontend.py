@@ -0,0 +1,193 @@
+# -*- coding: utf-8 ; test-case-name: bridgedb.test.test_frontend -*-
+#
+# This file is part of BridgeDB, a Tor bridge distribution system.
+#
+# :authors: please see the AUTHORS file for attributions
+# :copyright: (c) 2007-2017, The Tor Project, Inc.
+#             (c) 2007-2017, all entities within the AUTHORS file
+# :license: see LICENSE for licensing information
+
+"""Read-only distribution frontends, which serve bridges over HTTPS and moat
+from a :mod:`~bridgedb.snapshot` of the hashrings.
+
+A frontend never parses descriptors nor opens the database: the bridges, and
+the distributors they were assigned to, all come from the snapshot, which is
+written by ``bridgedb export-rings`` or by a BridgeDB with ``SNAPSHOT_FILE``
+set.  Since frontends are stateless, as many of them as are needed can be
+run, on as many hosts, so long as they all have the same config file and
+master key as the BridgeDB which writes the snapshots.
+"""
+
+import logging
+import os
+import signal
+
+from twisted.internet import reactor
+from twisted.internet import task
+
+from bridgedb import crypto
+from bridgedb import main
+from bridgedb import prefork
+from bridgedb import proxy
+from bridgedb import snapshot
+from bridgedb.supervisor import ReloadSupervisor
+
+
+def getSnapshotID(filename):
+    """Get something which changes whenever the snapshot at **filename** is
+    replaced.
+
+    :rtype: tuple
+    :raises: :exc:`OSError` if the snapshot doesn't exist.
+    """
+    info = os.stat(filename)
+    return (info.st_ino, info.st_mtime, info.st_size)
+
+def loadRings(cfg, key, filename):
+    """Create the HTTPS and moat distributors, and fill their hashrings with
+    the bridges in a snapshot.
+
+    The distributors use the open proxies which the snapshot was written
+    with, rather than any of our own, so that they create the same hashrings
+    as the BridgeDB which wrote it.
+
+    :type cfg: :class:`~bridgedb.configure.Conf`
+    :param cfg: The current configuration.
+    :param bytes key: The hashring master key.
+    :param str filename: The snapshot file.
+    :raises: :exc:`~bridgedb.snapshot.SnapshotError` if the snapshot can't be
+        used.
+    :rtype: tuple
+    :returns: A 2-tuple of an
+        :class:`~bridgedb.distributors.https.distributor.HTTPSDistributor` or
+        None, and a
+        :class:`~bridgedb.distributors.moat.distributor.MoatDistributor` or
+        None.
+    """
+    proxies = proxy.ProxySet()
+    bridges, assignments = snapshot.load(filename, main.getRingSettings(cfg),
+                                         key, proxies)
+
+    (hashring, _, ipDistributor, moatDistributor) = main.createBridgeRings(
+        cfg, proxies, key)
+    placed = hashring.insertAssigned(bridges, assignments)
+    hashring.freeze()
+    logging.info("Placed %d bridges from snapshot into hashrings." % placed)
+
+    for distributor in (ipDistributor, moatDistributor):
+        if distributor is not None:
+            distributor.prepopulateRings()
+
+    return ipDistributor, moatDistributor
+
+def getBridgeCounts(ipDistributor, moatDistributor):
+    """Count the bridges which the HTTPS and moat distributors are serving.
+
+    :rtype: dict
+    :returns: A dictionary mapping ``'https'`` and ``'moat'`` to the number
+        of bridges in those distributors' hashrings, for those which exist.
+    """
+    counts = {}
+    if ipDistributor is not None:
+        counts['https'] = len(ipDistributor.hashring)
+    if moatDistributor is not None:
+        counts['moat'] = len(moatDistributor.hashring)
+    return counts
+
+def run(cfg, filename=None, sockets=None, reactor=reactor):
+    """Serve bridges over HTTPS and moat from a snapshot, swapping in new
+    snapshots as they are written, until we're stopped.
+
+    :type cfg: :class:`~bridgedb.configure.Conf`
+    :param cfg: The current configuration.
+    :param str filename: The snapshot file.  (default:
+        ``cfg.SNAPSHOT_FILE``)
+    :param str sockets: If given, a description of the listening sockets
+        which we inherited from a master process, from
+        :func:`bridgedb.prefork.formatSockets`, to serve on.
+    :rtype: int
+    :returns: The exit status.
+    """
+    from bridgedb.distributors.https.server import addWebServer
+    from bridgedb.distributors.moat.server import addMoatServer
+
+    filename = filename or cfg.SNAPSHOT_FILE
+    if not filename:
+        logging.error("No snapshot to serve from! Set SNAPSHOT_FILE or use "
+                      "--snapshot.")
+        return 1
+
+    # Don't let crypto.getKey() create a new master key, since it couldn't
+    # verify any snapshot:
+    if not os.path.isfile(cfg.MASTER_KEY_FILE):
+        logging.error("Missing master key file: '%s'" % cfg.MASTER_KEY_FILE)
+        return 1
+
+    key = crypto.getKey(cfg.MASTER_KEY_FILE)
+
+    try:
+        loaded = getSnapshotID(filename)
+        ipDistributor, moatDistributor = loadRings(cfg, key, filename)
+    except (OSError, snapshot.SnapshotError) as error:
+        logging.error("Couldn't load snapshot '%s': %s" % (filename, error))
+        return 1
+
+    # The snapshot which the distributors are currently serving from, and
+    # the number of snapshots which were loaded:
+    live = {'snapshot': loaded, 'generation': 1}
+
+    def refresh():
+        """Load the snapshot, if it was replaced since it was last loaded,
+        and swap it into the distributors.  This runs in a thread.
+        """
+        supervisor.stage("loading snapshot")
+        try:
+            current = getSnapshotID(filename)
+            if current == live['snapshot']:
+                return
+            ipDistributorTmp, moatDistributorTmp = loadRings(
+                cfg, key, filename)
+        except (OSError, snapshot.SnapshotError) as error:
+            logging.warn("Couldn't load new snapshot '%s': %s" %
+                         (filename, error))
+            return
+
+        live['snapshot'] = current
+        live['generation'] += 1
+        reactor.callFromThread(main.replaceAllBridgeRings, [
+            (ipDistributor, ipDistributorTmp),
+            (moatDistributor, moatDistributorTmp)])
+        reactor.callFromThread(supervisor.published, live['generation'],
+                               getBridgeCounts(ipDistributorTmp,
+                                               moatDistributorTmp))
+
+    # Load snapshots one at a time, however often we're asked to:
+    supervisor = ReloadSupervisor(refresh, reactor)
+    supervisor.published(live['generation'],
+                         getBridgeCounts(ipDistributor, moatDistributor))
+
+    if sockets:
+        prefork.inheritSockets(sockets)
+    if cfg.MOAT_DIST and cfg.MOAT_SHARE:
+        addMoatServer(cfg, moatDistributor, supervisor.getStatus)
+    if cfg.HTTPS_DIST and cfg.HTTPS_SHARE:
+        addWebServer(cfg, ipDistributor, supervisor.getStatus)
+
+    tasks = {}
+    tasks['REFRESH_SNAPSHOT'] = task.LoopingCall(supervisor.request)
+    tasks['REFRESH_SNAPSHOT'].start(cfg.FRONTEND_SNAPSHOT_INTERVAL,
+                                    now=False)
+
+    # Check for a new snapshot immediately upon SIGHUP:
+    signal.signal(signal.SIGHUP,
+                  lambda *args: reactor.callFromThread(supervisor.request))
+    # Stop accepting connections upon SIGUSR2, because our master handed its
+    # listening sockets over to a new BridgeDB.  It sends us a SIGTERM once
+    # we've had time to answer the connections we already accepted:
+    signal.signal(signal.SIGUSR2,
+                  lambda *args: reactor.callFromThread(prefork.stopListening))
+
+    logging.info("Starting frontend reactor.")
+    reactor.run()
+
+    return 0
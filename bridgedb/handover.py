@@ -0,0 +1,294 @@
+# -*- coding: utf-8 ; test-case-name: bridgedb.test.test_handover -*-
+#
+# This file is part of BridgeDB, a Tor bridge distribution system.
+#
+# :authors: please see the AUTHORS file for attributions
+# :copyright: (c) 2007-2017, The Tor Project, Inc.
+#             (c) 2007-2017, all entities within the AUTHORS file
+# :license: see LICENSE for licensing information
+
+"""Restarting BridgeDB without refusing any connections.
+
+When ``HANDOVER_SOCKET`` is set, a running BridgeDB listens on that UNIX
+socket for a newly started BridgeDB to take over from it.  The new BridgeDB
+first builds its hashrings, while the old one is still serving, and then:
+
+  1. connects to the ``HANDOVER_SOCKET`` and sends ``HANDOVER``,
+  2. receives the old BridgeDB's listening sockets for the HTTPS, moat, and
+     email servers, passed as file descriptors, followed by a line with the
+     address of each of them,
+  3. starts its own servers on those sockets, and sends ``STARTED``, upon
+     which
+  4. the old BridgeDB stops accepting connections, tells its
+     ``WEB_WORKERS``, if any, to stop accepting them too, stops listening on
+     the ``HANDOVER_SOCKET``, replies ``DRAINING``, and exits after
+     ``HANDOVER_DRAIN_TIMEOUT`` seconds, once it has answered the requests
+     which it had already accepted.
+
+The new BridgeDB then listens on the ``HANDOVER_SOCKET`` itself.  Since the
+listening sockets are never closed, any connections which arrive meanwhile
+wait in their backlog, rather than being refused.
+
+.. py:module:: bridgedb.handover
+   :synopsis: Restarting BridgeDB without refusing any connections.
+
+::
+
+  bridgedb.handover
+   |_ formatAddresses - Describe the addresses of the handed over sockets.
+   |_ parseAddresses - Parse the addresses of the handed over sockets.
+   |_ requestSockets - Take the listening sockets of a running BridgeDB.
+   |_ finishHandover - Tell the old BridgeDB that we've started.
+   |_ listen - Listen for a new BridgeDB to hand our sockets over to.
+   |
+   |_ HandoverError - Raised if the sockets couldn't be handed over.
+   |_ HandoverProtocol - Hands our listening sockets over to a new BridgeDB.
+   \_ HandoverFactory - Stops accepting connections once the new BridgeDB
+                        has started.
+..
+"""
+
+import logging
+import os
+import select
+import socket
+import struct
+
+from twisted.internet import defer
+from twisted.internet import protocol
+from twisted.internet import reactor
+from twisted.protocols import basic
+from twisted.python import sendmsg
+
+from bridgedb import prefork
+
+
+class HandoverError(Exception):
+    """Raised if a running BridgeDB couldn't hand its sockets over to us."""
+
+
+def formatAddresses(addresses):
+    """Describe the addresses of the sockets being handed over.
+
+    :param list addresses: A list of ``(interface, port)`` 2-tuples.
+    :rtype: str
+    :returns: A comma-separated list of ``INTERFACE:PORT`` items.
+    """
+    return ",".join(["%s:%d" % (interface, port)
+                     for interface, port in addresses])
+
+def parseAddresses(description):
+    """Parse a description of addresses from :func:`formatAddresses`.
+
+    :param str description: A comma-separated list of ``INTERFACE:PORT``
+        items.
+    :raises: :exc:`ValueError` if the **description** is malformed.
+    :rtype: list
+    :returns: A list of ``(interface, port)`` 2-tuples.
+    """
+    addresses = []
+
+    for item in description.split(","):
+        if not item:
+            continue
+        interface, port = item.rsplit(":", 1)
+        addresses.append((interface, int(port)))
+
+    return addresses
+
+def _receiveLine(conn):
+    """Receive a line, along with any file descriptors which were passed
+    with it, from a running BridgeDB.
+
+    :type conn: :class:`socket.socket`
+    :param conn: Our connection to the ``HANDOVER_SOCKET``.
+    :raises HandoverError: if the connection was closed, or timed out,
+        first.
+    :rtype: tuple
+    :returns: A 2-tuple of the line, without its newline, and a list of the
+        file descriptors, in the order in which they were passed.
+    """
+    data = ''
+    fds = []
+
+    while not data.endswith('\n'):
+        # recvmsg() doesn't respect the socket's timeout by itself:
+        readable, _, _ = select.select([conn], [], [], conn.gettimeout())
+        if not readable:
+            raise HandoverError("Timed out waiting for running BridgeDB.")
+        message = sendmsg.recvmsg(conn, 1024)
+        for level, kind, payload in message.ancillary:
+            if level == socket.SOL_SOCKET and kind == sendmsg.SCM_RIGHTS:
+                count = len(payload) // 4
+                fds.extend(struct.unpack("%di" % count, payload[:count * 4]))
+        if not message.data:
+            raise HandoverError("Connection closed by running BridgeDB.")
+        data += message.data
+
+    return data.rstrip('\n'), fds
+
+def requestSockets(path, timeout=30):
+    """Take the listening sockets of the BridgeDB which is listening for
+    handovers on the UNIX socket at **path**, if there is one.
+
+    This blocks, and should only be called while we're starting up, before
+    any servers are started.  Afterwards, the sockets are used by
+    :func:`bridgedb.prefork.listenTCP`, :func:`bridgedb.prefork.listenSSL`,
+    and :func:`bridgedb.prefork.startWorkers`.
+
+    :param str path: The ``HANDOVER_SOCKET``.
+    :param int timeout: How long (in seconds) to wait for the running
+        BridgeDB to answer.
+    :raises HandoverError: if the sockets couldn't be handed over.
+    :rtype: :class:`socket.socket` or None
+    :returns: Our connection to the running BridgeDB, to pass to
+        :func:`finishHandover`, or ``None`` if there was no BridgeDB to take
+        over from.
+    """
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    conn.settimeout(timeout)
+
+    try:
+        conn.connect(path)
+    except socket.error as error:
+        logging.info("No running BridgeDB to take over from at '%s': %s"
+                     % (path, error))
+        conn.close()
+        return None
+
+    try:
+        conn.sendall("HANDOVER\n")
+        line, fds = _receiveLine(conn)
+        addresses = parseAddresses(line)
+    except (socket.error, ValueError, HandoverError) as error:
+        conn.close()
+        raise HandoverError("Couldn't take over listening sockets: %s"
+                            % error)
+
+    if len(addresses) != len(fds):
+        for fd in fds:
+            os.close(fd)
+        conn.close()
+        raise HandoverError("Received %d sockets for %d addresses."
+                            % (len(fds), len(addresses)))
+
+    for (interface, port), fd in zip(addresses, fds):
+        logging.info("Took over listening socket for %s:%d." %
+                     (interface, port))
+    prefork.inheritDescriptors(dict(zip(addresses, fds)))
+
+    return conn
+
+def finishHandover(conn):
+    """Tell the BridgeDB which we took the listening sockets of that our
+    servers are started, and wait for it to stop accepting connections and
+    to stop listening for handovers.
+
+    :type conn: :class:`socket.socket`
+    :param conn: Our connection to the running BridgeDB, from
+        :func:`requestSockets`.
+    """
+    try:
+        conn.sendall("STARTED\n")
+        line, _ = _receiveLine(conn)
+    except (socket.error, HandoverError) as error:
+        logging.warn("The BridgeDB we took over from didn't say whether it "
+                     "is draining: %s" % error)
+    else:
+        logging.info("The BridgeDB we took over from is %s." % line.lower())
+    finally:
+        conn.close()
+
+    # The sockets which we were handed were duplicated when our servers
+    # started on them; close any which are still open:
+    prefork.closeInherited()
+
+def listen(path, drainTimeout, reactor=reactor, workers=None):
+    """Listen on the UNIX socket at **path** for a new BridgeDB to hand our
+    listening sockets over to.
+
+    Only our own user may connect to the socket, since whoever does is given
+    our listening sockets, and can tell us to stop accepting on them.
+
+    :param str path: The ``HANDOVER_SOCKET``.
+    :param int drainTimeout: How long (in seconds) to keep running, after
+        the handover, to finish answering requests.
+    :type workers: :class:`~bridgedb.prefork.WorkerPool` or None
+    :param workers: Our worker processes, if any, which accept connections
+        on some of our listening sockets.
+    :rtype: :class:`HandoverFactory`
+    """
+    factory = HandoverFactory(drainTimeout, reactor, workers)
+    factory.port = reactor.listenUNIX(path, factory, mode=0o600,
+                                      wantPID=True)
+    logging.info("Listening for handovers on '%s'." % path)
+    return factory
+
+
+class HandoverProtocol(basic.LineOnlyReceiver):
+    """Hands our listening sockets over to a new BridgeDB."""
+
+    delimiter = '\n'
+
+    def lineReceived(self, line):
+        if line == "HANDOVER":
+            self.factory.sendSockets(self)
+        elif line == "STARTED":
+            self.factory.drain(self)
+        else:
+            logging.warn("Unexpected handover request: %r" % line)
+            self.transport.loseConnection()
+
+
+class HandoverFactory(protocol.ServerFactory):
+    """Stops accepting connections once a new BridgeDB has started on our
+    listening sockets, and then stops the reactor.
+
+    :ivar int drainTimeout: How long (in seconds) to keep running, after the
+        handover, to finish answering requests.
+    :ivar port: The :api:`twisted.internet.interfaces.IListeningPort` for
+        the ``HANDOVER_SOCKET``, or ``None``.
+    :ivar workers: Our :class:`~bridgedb.prefork.WorkerPool`, or ``None``.
+    :ivar bool draining: Whether we've handed our sockets over.
+    """
+    protocol = HandoverProtocol
+
+    def __init__(self, drainTimeout, reactor=reactor, workers=None):
+        self.drainTimeout = drainTimeout
+        self.reactor = reactor
+        self.workers = workers
+        self.port = None
+        self.draining = False
+
+    def sendSockets(self, proto):
+        """Pass all of our listening sockets over a **proto**\\ col's
+        connection, followed by a line with their addresses.
+        """
+        listening = sorted(prefork.getListening().items())
+        logging.info("Handing over %d listening sockets." % len(listening))
+
+        for _, listener in listening:
+            proto.transport.sendFileDescriptor(listener.fileno())
+        proto.sendLine(formatAddresses([address for address, _ in listening]))
+
+    def drain(self, proto):
+        """Stop accepting connections, tell our workers to stop accepting
+        them too, and stop listening for handovers.  Once we have, tell the
+        new BridgeDB, over its **proto**\\ col's connection, and stop the
+        reactor (and so terminate our workers) after :data:`drainTimeout`
+        seconds.
+        """
+        if self.draining:
+            return
+        self.draining = True
+
+        logging.info("Handed over our listening sockets. Exiting in %d "
+                     "seconds." % self.drainTimeout)
+        prefork.stopAccepting()
+        if self.workers is not None:
+            self.workers.drain()
+
+        d = defer.maybeDeferred(self.port.stopListening)
+        d.addCallback(lambda _: proto.sendLine("DRAINING"))
+        d.addBoth(lambda _: proto.transport.loseConnection())
+        self.reactor.callLater(self.drainTimeout, self.reactor.stop)
@@ -0,0 +1,386 @@
+# -*- coding: utf-8 ; test-case-name: bridgedb.test.test_ingest -*-
+#
+# This file is part of BridgeDB, a Tor bridge distribution system.
+#
+# :authors: please see the AUTHORS file for attributions
+# :copyright: (c) 2007-2017, The Tor Project, Inc.
+#             (c) 2007-2017, all entities within the AUTHORS file
+# :license: see LICENSE for licensing information
+
+"""Parsing only the parts of the descriptor files which changed.
+
+The BridgeAuthority mostly appends new extrainfo descriptors to
+``cached-extrainfo.new``, and replaces ``networkstatus-bridges`` and
+``bridge-descriptors`` on a schedule.  With ``INCREMENTAL_INGEST``, a
+:class:`DescriptorCache` keeps the
+:class:`~bridgedb.parse.descriptors.DescriptorRecord`\\ s parsed from each
+descriptor file, along with a :class:`FileCursor` recording the file's inode,
+size, modification time, how far into it was parsed, and digests of its
+contents.  On each reload:
+
+  * A file whose inode, size, and modification time are unchanged isn't read
+    at all, and neither is one which was rewritten with the same contents.
+  * If an extrainfo file was appended to, only the new descriptors at its
+    end are parsed, and merged with the ones already parsed from it.  Any
+    descriptor at the end of the file which is still being written is left
+    for the next reload.
+  * Any other file which changed is parsed again from its beginning.
+
+With ``WATCH_DESCRIPTORS``, a :class:`DescriptorWatcher` uses inotify to
+request a reload shortly after the BridgeAuthority has finished writing to
+any of the descriptor files, rather than waiting for a SIGHUP.
+
+.. py:module:: bridgedb.ingest
+   :synopsis: Parsing only the parts of the descriptor files which changed.
+
+::
+
+  bridgedb.ingest
+   |_ FileCursor - How far a descriptor file has been parsed.
+   |_ DescriptorCache - The records parsed from each descriptor file, which
+   |                    are only parsed again where the files changed.
+   \_ DescriptorWatcher - Requests a reload once the descriptor files are
+                          written to.
+..
+"""
+
+import hashlib
+import io
+import logging
+import os
+
+from twisted.internet import reactor
+
+from bridgedb.parse import descriptors
+
+
+#: How many bytes at the end of the part of a file which was already read
+#: are compared, to check that the file was only appended to since.
+TAIL_SIZE = 4096
+
+#: How many bytes to read from a file at a time.
+CHUNK_SIZE = 1 << 16
+
+#: The line which ends each extrainfo descriptor.
+END_OF_DESCRIPTOR = "-----END SIGNATURE-----\n"
+
+#: The kinds of descriptor file which are appended to, rather than replaced.
+APPENDED_KINDS = ('extrainfo',)
+
+
+def _findEnd(data):
+    """Find the end of the last complete extrainfo descriptor in **data**.
+
+    :param bytes data: Some extrainfo descriptors.
+    :rtype: int
+    :returns: The offset just after the last complete descriptor, or ``0``
+        if there isn't one.
+    """
+    index = data.rfind(END_OF_DESCRIPTOR)
+    if index == -1:
+        return 0
+    return index + len(END_OF_DESCRIPTOR)
+
+
+class FileCursor(object):
+    """How far a descriptor file has been parsed.
+
+    :ivar int inode: The file's inode number.
+    :ivar int size: The file's size, i.e. how much of it has been digested.
+    :ivar float mtime: The file's modification time.
+    :ivar int offset: How much of the file has been parsed.  For an
+        extrainfo file, this is the end of the last complete descriptor in
+        it.
+    :ivar str digest: The hex-encoded SHA-1 digest of the file's contents.
+    :ivar str tail: The hex-encoded SHA-1 digest of the last
+        :data:`TAIL_SIZE` bytes of the file's contents.
+    """
+
+    def __init__(self):
+        self.inode = None
+        self.size = 0
+        self.mtime = None
+        self.offset = 0
+        self.digest = None
+        self.tail = None
+        self._hash = hashlib.sha1()
+
+    @classmethod
+    def fromFile(cls, fh, info):
+        """Digest all of an open file.
+
+        :param file fh: The open file.
+        :param info: The file's :func:`os.fstat`.
+        :rtype: :class:`FileCursor`
+        """
+        cursor = cls()
+        fh.seek(0)
+        for chunk in iter(lambda: fh.read(CHUNK_SIZE), b''):
+            cursor._hash.update(chunk)
+        cursor._update(fh, info)
+        cursor.offset = cursor.size
+        return cursor
+
+    def _update(self, fh, info):
+        """Record the file's current size and modification time, and the
+        digests of its contents up to its current size.
+        """
+        self.inode = info.st_ino
+        self.mtime = info.st_mtime
+        self.size = info.st_size
+        self.digest = self._hash.hexdigest()
+        self.tail = self._getTail(fh)
+
+    def _getTail(self, fh):
+        """Digest the last :data:`TAIL_SIZE` bytes of the file which we've
+        digested so far.
+
+        :rtype: str
+        """
+        start = max(0, self.size - TAIL_SIZE)
+        fh.seek(start)
+        return hashlib.sha1(fh.read(self.size - start)).hexdigest()
+
+    def isUnchanged(self, info):
+        """Check whether a file hasn't been modified since we digested it.
+
+        :param info: The file's :func:`os.stat`.
+        :rtype: bool
+        """
+        return ((info.st_ino, info.st_size, info.st_mtime) ==
+                (self.inode, self.size, self.mtime))
+
+    def isAppendedTo(self, fh, info):
+        """Check whether a file has only been appended to since we digested
+        it, i.e. that it's the same file, it's larger, and the end of what we
+        digested is still the same.
+
+        :param file fh: The open file.
+        :param info: The file's :func:`os.fstat`.
+        :rtype: bool
+        """
+        return (info.st_ino == self.inode and info.st_size > self.size and
+                self._getTail(fh) == self.tail)
+
+    def readAppended(self, fh, info):
+        """Read everything in an appended file after what has been parsed,
+        and digest whatever is new.
+
+        :param file fh: The open file.
+        :param info: The file's :func:`os.fstat`.
+        :rtype: bytes
+        :returns: The file's contents from :data:`offset` onwards.
+        """
+        fh.seek(self.offset)
+        data = fh.read(info.st_size - self.offset)
+        self._hash.update(data[self.size - self.offset:])
+        self._update(fh, info)
+        return data
+
+
+class DescriptorCache(object):
+    """The :class:`~bridgedb.parse.descriptors.DescriptorRecord`\\ s parsed
+    from each descriptor file, which are only parsed again where the files
+    changed.
+
+    :ivar dict cursors: A dictionary mapping filenames to their
+        :class:`FileCursor`\\ s.
+    :ivar dict records: A dictionary mapping filenames to a list of the
+        records parsed from them, or, for extrainfo files, a dictionary
+        mapping fingerprints to the newest record for each.
+    """
+
+    def __init__(self):
+        self.cursors = {}
+        self.records = {}
+
+    def getNetworkStatuses(self, filename):
+        """Get the records for the entries in a networkstatus file.
+
+        :rtype: list
+        """
+        return self._ingest('networkstatus', filename)
+
+    def getServerDescriptors(self, filename):
+        """Get the records for the descriptors in a bridge-descriptors file.
+
+        :rtype: list
+        """
+        return self._ingest('server', filename)
+
+    def getExtraInfos(self, filenames):
+        """Get the records for the newest extrainfo descriptor for each
+        bridge in some extrainfo files.
+
+        :param list filenames: The extrainfo files.
+        :rtype: dict
+        :returns: A dictionary mapping fingerprints to records.
+        """
+        return descriptors.deduplicate(
+            record for filename in filenames
+            for record in self._ingest('extrainfo', filename).values())
+
+    def forget(self, filenames):
+        """Forget the records and cursors for any files which aren't in
+        **filenames**, e.g. because they are no longer configured.
+
+        :param list filenames: The descriptor files to remember.
+        """
+        for filename in set(self.cursors) - set(filenames):
+            self.cursors.pop(filename, None)
+            self.records.pop(filename, None)
+
+    def _ingest(self, kind, filename):
+        """Parse whatever changed in a descriptor file since it was last
+        parsed.
+
+        :param str kind: The kind of the descriptors, one of
+            ``'networkstatus'``, ``'server'``, or ``'extrainfo'``.
+        :param str filename: The descriptor file.
+        :raises IOError: if the file can't be read.
+        :raises: Anything which
+            :func:`~bridgedb.parse.descriptors.iterDescriptorRecords` does.
+        :rtype: list or dict
+        """
+        cursor = self.cursors.get(filename)
+
+        with open(filename, 'rb') as fh:
+            info = os.fstat(fh.fileno())
+
+            if cursor is not None and cursor.isUnchanged(info):
+                logging.debug("Descriptor file unchanged: %s" % filename)
+                return self.records[filename]
+
+            if (cursor is not None and kind in APPENDED_KINDS and
+                    cursor.isAppendedTo(fh, info)):
+                data = cursor.readAppended(fh, info)
+                end = _findEnd(data)
+                logging.info("Parsing %d appended bytes of %s..."
+                             % (end, filename))
+                try:
+                    appended = list(descriptors.iterDescriptorRecords(
+                        kind, io.BytesIO(data[:end])))
+                except Exception as error:
+                    # Parse all of it again, so that any unparseable file is
+                    # handled as usual:
+                    logging.warn("Couldn't parse the descriptors appended to "
+                                 "%s: %s" % (filename, error))
+                    cursor = None
+                else:
+                    records = self.records[filename]
+                    records.update(descriptors.deduplicate(
+                        records.values() + appended))
+                    cursor.offset += end
+                    return records
+
+            replacement = FileCursor.fromFile(fh, info)
+
+        if cursor is not None and replacement.digest == cursor.digest:
+            logging.debug("Descriptor file rewritten with the same contents: "
+                          "%s" % filename)
+            replacement.offset = cursor.offset
+            self.cursors[filename] = replacement
+            return self.records[filename]
+
+        logging.info("Parsing all of %s..." % filename)
+        records = descriptors.iterDescriptorRecords(kind, filename)
+        if kind in APPENDED_KINDS:
+            start = max(0, replacement.size - CHUNK_SIZE)
+            with open(filename, 'rb') as fh:
+                fh.seek(start)
+                tail = fh.read(replacement.size - start)
+            # Any incomplete descriptor at the end is parsed again once it
+            # has been finished:
+            replacement.offset = start + _findEnd(tail)
+            records = descriptors.deduplicate(records)
+        else:
+            records = list(records)
+
+        self.cursors[filename] = replacement
+        self.records[filename] = records
+        return records
+
+
+class DescriptorWatcher(object):
+    """Requests a reload once the BridgeAuthority has finished writing to any
+    of the descriptor files, using inotify.
+
+    Many files are usually written at once, so the reload is only requested
+    once none of them has been written to for :data:`delay` seconds.
+
+    :ivar set filenames: The absolute paths of the descriptor files.
+    :ivar callback: The function which requests a reload, i.e.
+        :meth:`bridgedb.supervisor.ReloadSupervisor.request`.
+    :ivar int delay: How long (in seconds) to wait after the last write
+        before requesting a reload.
+    :ivar notifier: The :api:`twisted.internet.inotify.INotify`, if we're
+        watching.
+    :ivar pending: The :api:`twisted.internet.base.DelayedCall` which will
+        request the next reload, or ``None``.
+    """
+
+    def __init__(self, filenames, callback, delay=10, reactor=reactor):
+        self.filenames = set([os.path.abspath(f) for f in filenames])
+        self.callback = callback
+        self.delay = delay
+        self.reactor = reactor
+        self.notifier = None
+        self.pending = None
+
+    def start(self):
+        """Start watching the directories which contain the descriptor files.
+
+        :rtype: bool
+        :returns: ``True`` if we're watching them, or ``False`` if inotify
+            isn't available.
+        """
+        try:
+            from twisted.internet import inotify
+            from twisted.python import filepath
+            notifier = inotify.INotify(self.reactor)
+        except Exception as error:
+            logging.warn("Can't watch the descriptor files: %s" % error)
+            return False
+
+        notifier.startReading()
+        mask = inotify.IN_CLOSE_WRITE | inotify.IN_MOVED_TO
+        for directory in sorted(set([os.path.dirname(f)
+                                     for f in self.filenames])):
+            logging.info("Watching for descriptor changes in %s" % directory)
+            notifier.watch(filepath.FilePath(directory), mask,
+                           callbacks=[self.changed])
+
+        self.notifier = notifier
+        return True
+
+    def stop(self):
+        """Stop watching, and forget about any pending reload."""
+        if self.pending is not None and self.pending.active():
+            self.pending.cancel()
+        self.pending = None
+        if self.notifier is not None:
+            self.notifier.connectionLost(None)
+            self.notifier = None
+
+    def changed(self, ignored, path, mask):
+        """Called by inotify when a file in a watched directory is written
+        to or moved into it.  If it's one of the descriptor files, request
+        a reload after :data:`delay` seconds, or postpone a pending one.
+
+        :type path: :api:`twisted.python.filepath.FilePath`
+        :param path: The file which changed.
+        :param int mask: The inotify event.
+        """
+        if path.path not in self.filenames:
+            return
+
+        if self.pending is not None and self.pending.active():
+            self.pending.reset(self.delay)
+        else:
+            logging.info("Descriptor file %s changed; reloading in %d "
+                         "seconds." % (path.path, self.delay))
+            self.pending = self.reactor.callLater(self.delay, self._fire)
+
+    def _fire(self):
+        self.pending = None
+        self.callback()
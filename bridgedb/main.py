@@ -12,6 +12,7 @@
 """This module sets up BridgeDB and starts the servers running."""
 
 import logging
+import multiprocessing
 import os
 import signal
 import sys
@@ -19,11 +20,18 @@ import time
 
 from twisted.internet import reactor
 from twisted.internet import task
+from twisted.internet import threads
+from twisted.internet.error import CannotListenError
 
 from bridgedb import crypto
+from bridgedb import handover
+from bridgedb import ingest
 from bridgedb import persistent
+from bridgedb import planner
+from bridgedb import prefork
 from bridgedb import proxy
 from bridgedb import runner
+from bridgedb import snapshot
 from bridgedb import util
 from bridgedb.bridges import MalformedBridgeInfo
 from bridgedb.bridges import MissingServerDescriptorDigest
@@ -36,6 +44,7 @@ from bridgedb.distributors.https.distributor import HTTPSDistributor
 from bridgedb.distributors.moat.distributor import MoatDistributor
 from bridgedb.parse import descriptors
 from bridgedb.parse.blacklist import parseBridgeBlacklistFile
+from bridgedb.supervisor import ReloadSupervisor
 
 import bridgedb.Storage
 
@@ -54,6 +63,25 @@ def expandBridgeAuthDir(authdir, filename):
 
     return path
 
+def getDescriptorFiles(cfg):
+    """Get all of the files which :func:`loadBridges` reads.
+
+    :type cfg: :class:`Conf`
+    :param cfg: The current configuration.
+    :rtype: list
+    """
+    filenames = []
+
+    for auth in cfg.BRIDGE_AUTHORITY_DIRECTORIES:
+        filenames.append(expandBridgeAuthDir(auth, cfg.STATUS_FILE))
+        for filename in list(cfg.BRIDGE_FILES) + list(cfg.EXTRA_INFO_FILES):
+            filenames.append(expandBridgeAuthDir(auth, filename))
+
+    if cfg.NO_DISTRIBUTION_FILE:
+        filenames.append(cfg.NO_DISTRIBUTION_FILE)
+
+    return filenames
+
 def writeAssignments(hashring, filename):
     """Dump bridge distributor assignments to disk.
 
@@ -72,7 +100,214 @@ def writeAssignments(hashring, filename):
     except IOError:
         logging.info("I/O error while writing assignments to: '%s'" % filename)
 
-def load(state, hashring, clear=False):
+def getPublished(bridge):
+    """Get when a **bridge**'s newest descriptor was published.
+
+    :rtype: :class:`datetime.datetime` or None
+    """
+    return (bridge.getDescriptorLastPublished() or
+            bridge.getNetworkstatusLastPublished())
+
+def joinDescriptors(state, networkstatuses, serverdescriptors, extrainfos):
+    """Join the descriptors from one of the BRIDGE_AUTHORITY_DIRECTORIES
+    into :class:`~bridgedb.bridges.Bridge`\\ s.
+
+    Each of the descriptors is only iterated over once, so they may be
+    streamed in from generators.
+
+    :param networkstatuses: An iterable of the networkstatus entries, parsed
+        with Stem or as
+        :class:`~bridgedb.parse.descriptors.DescriptorRecord`\\ s.
+    :param list serverdescriptors: An iterable of the server descriptors
+        from each of the BRIDGE_FILES.
+    :param dict extrainfos: The newest extrainfo descriptor for each
+        fingerprint.
+    :rtype: tuple
+    :returns: A 2-tuple of a dictionary mapping fingerprints to the
+        :class:`~bridgedb.bridges.Bridge`\\ s, and a dictionary mapping
+        fingerprints to the times their server descriptors were published,
+        if ``COLLECT_TIMESTAMPS`` is enabled.
+    """
+    bridges = {}
+    timestamps = {}
+
+    ignoreNetworkstatus = state.IGNORE_NETWORKSTATUS
+
+    logging.info("Processing networkstatus descriptors...")
+    for router in networkstatuses:
+        bridge = Bridge()
+        bridge.updateFromNetworkStatus(router, ignoreNetworkstatus)
+        try:
+            bridge.assertOK()
+        except MalformedBridgeInfo as error:
+            logging.warn(str(error))
+        else:
+            bridges[bridge.fingerprint] = bridge
+
+    for routers in serverdescriptors:
+        for router in routers:
+            try:
+                bridge = bridges[router.fingerprint]
+            except KeyError:
+                logging.warn(
+                    ("Received server descriptor for bridge '%s' which wasn't "
+                     "in the networkstatus!") % router.fingerprint)
+                if ignoreNetworkstatus:
+                    bridge = Bridge()
+                else:
+                    continue
+
+            try:
+                bridge.updateFromServerDescriptor(router, ignoreNetworkstatus)
+            except (ServerDescriptorWithoutNetworkstatus,
+                    MissingServerDescriptorDigest,
+                    ServerDescriptorDigestMismatch) as error:
+                logging.warn(str(error))
+                # Reject any routers whose server descriptors didn't pass
+                # :meth:`~bridges.Bridge._checkServerDescriptor`, i.e. those
+                # bridges who don't have corresponding networkstatus
+                # documents, or whose server descriptor digests don't check
+                # out:
+                bridges.pop(router.fingerprint)
+                continue
+
+            if state.COLLECT_TIMESTAMPS:
+                # Update timestamps from server descriptors, not from network
+                # status descriptors (because networkstatus documents and
+                # descriptors aren't authenticated in any way):
+                if bridge.fingerprint in timestamps.keys():
+                    timestamps[bridge.fingerprint].append(router.published)
+                else:
+                    timestamps[bridge.fingerprint] = [router.published]
+
+    for fingerprint, router in extrainfos.items():
+        try:
+            bridges[fingerprint].updateFromExtraInfoDescriptor(router)
+        except MalformedBridgeInfo as error:
+            logging.warn(str(error))
+        except KeyError as error:
+            logging.warn(("Received extrainfo descriptor for bridge '%s', "
+                          "but could not find bridge with that fingerprint.")
+                         % router.fingerprint)
+
+    return bridges, timestamps
+
+def loadBridges(state, parser=None, cache=None):
+    """Read and parse all descriptors, and get the bridges to distribute.
+
+    Read all the appropriate bridge files from the saved
+    :class:`~bridgedb.persistent.State`, parse and validate them, and drop
+    any bridges which shouldn't be distributed.  If a bridge is in more than
+    one of the BRIDGE_AUTHORITY_DIRECTORIES, only its most recently published
+    descriptors are used.  The ``state`` will be saved again at the end of
+    this function.
+
+    :type parser: :class:`multiprocessing.Pool` or None
+    :param parser: If given, the pool of processes which parse all of the
+        descriptor files at once.  See ``PARSE_PROCESSES``.
+    :type cache: :class:`~bridgedb.ingest.DescriptorCache` or None
+    :param cache: If given, only the parts of the descriptor files which
+        changed since they were last parsed into the **cache** are parsed,
+        rather than using the **parser**.  See ``INCREMENTAL_INGEST``.
+    :rtype: list
+    :returns: The :class:`~bridgedb.bridges.Bridge`s which should be
+        inserted into the hashrings.
+    """
+    logging.info("Loading bridges...")
+
+    distributable = []
+    joined = {}
+
+    if state.IGNORE_NETWORKSTATUS:
+        logging.info("Ignoring BridgeAuthority networkstatus documents.")
+
+    if cache is not None:
+        cache.forget(getDescriptorFiles(state))
+    elif parser is not None:
+        jobs = []
+        for auth in state.BRIDGE_AUTHORITY_DIRECTORIES:
+            jobs.append(('networkstatus',
+                         expandBridgeAuthDir(auth, state.STATUS_FILE)))
+            jobs.extend([('server', expandBridgeAuthDir(auth, fn))
+                         for fn in state.BRIDGE_FILES])
+            jobs.extend([('extrainfo', expandBridgeAuthDir(auth, fn))
+                         for fn in state.EXTRA_INFO_FILES])
+        logging.info("Parsing %d descriptor files in parallel..."
+                     % len(jobs))
+        # Each file is parsed separately, and the results come back in the
+        # same order as the files are read from below:
+        results = iter(parser.map(descriptors.parseDescriptorFile, jobs, 1))
+
+    for auth in state.BRIDGE_AUTHORITY_DIRECTORIES:
+        logging.info("Processing descriptors in %s directory..." % auth)
+
+        if cache is not None:
+            networkstatuses = cache.getNetworkStatuses(
+                expandBridgeAuthDir(auth, state.STATUS_FILE))
+            serverdescriptors = [
+                cache.getServerDescriptors(expandBridgeAuthDir(auth, fn))
+                for fn in state.BRIDGE_FILES]
+            extrainfos = cache.getExtraInfos(
+                [expandBridgeAuthDir(auth, fn)
+                 for fn in state.EXTRA_INFO_FILES])
+        elif parser is not None:
+            networkstatuses = next(results)
+            serverdescriptors = [next(results) for _ in state.BRIDGE_FILES]
+            extrainfos = descriptors.deduplicate(
+                router for _ in state.EXTRA_INFO_FILES
+                for router in next(results))
+        else:
+            # Stream each file's descriptors into the join, copying each
+            # into a record as it is parsed, so that no more than one of
+            # Stem's descriptors is alive at a time.  Only the newest
+            # extrainfo descriptor for each bridge is kept:
+            networkstatuses = descriptors.iterDescriptorRecords(
+                'networkstatus', expandBridgeAuthDir(auth, state.STATUS_FILE))
+            serverdescriptors = [
+                descriptors.iterDescriptorRecords(
+                    'server', expandBridgeAuthDir(auth, fn))
+                for fn in state.BRIDGE_FILES]
+            extrainfos = descriptors.deduplicate(
+                record for fn in state.EXTRA_INFO_FILES
+                for record in descriptors.iterDescriptorRecords(
+                    'extrainfo', expandBridgeAuthDir(auth, fn)))
+
+        bridges, timestamps = joinDescriptors(state, networkstatuses,
+                                              serverdescriptors, extrainfos)
+
+        # If another bridge authority also has this bridge, keep whichever
+        # of their descriptors for it is newest:
+        for fingerprint, bridge in bridges.items():
+            other = joined.get(fingerprint)
+            if other is None or getPublished(bridge) > getPublished(other):
+                joined[fingerprint] = bridge
+
+        if state.COLLECT_TIMESTAMPS:
+            reactor.callInThread(updateBridgeHistory, bridges, timestamps)
+
+    blacklist = parseBridgeBlacklistFile(state.NO_DISTRIBUTION_FILE)
+
+    for fingerprint, bridge in joined.items():
+        # Skip insertion of bridges which are geolocated to be in one of the
+        # NO_DISTRIBUTION_COUNTRIES, a.k.a. the countries we don't distribute
+        # bridges from:
+        if bridge.country in state.NO_DISTRIBUTION_COUNTRIES:
+            logging.warn("Not distributing Bridge %s %s:%s in country %s!" %
+                         (bridge, bridge.address, bridge.orPort, bridge.country))
+        # Skip insertion of blacklisted bridges.
+        elif bridge in blacklist.keys():
+            logging.warn("Not distributing blacklisted Bridge %s %s:%s: %s" %
+                         (bridge, bridge.address, bridge.orPort, blacklist[bridge]))
+        else:
+            # If the bridge is not running, then it is skipped during the
+            # insertion process.
+            distributable.append(bridge)
+
+    state.save()
+
+    return distributable
+
+def load(state, hashring, clear=False, bridges=None):
     """Read and parse all descriptors, and load into a bridge hashring.
 
     Read all the appropriate bridge files from the saved
@@ -85,6 +320,10 @@ def load(state, hashring, clear=False):
         Bridges in order to assign them to hashrings.
     :param boolean clear: If True, clear all previous bridges from the
         hashring before parsing for new ones.
+    :param list bridges: If given, insert these bridges (e.g. from a
+        :mod:`~bridgedb.snapshot`) rather than parsing the descriptors.
+    :rtype: list
+    :returns: The :class:`~bridgedb.bridges.Bridge`s which were inserted.
     """
     if not state:
         logging.fatal("bridgedb.main.load() could not retrieve state!")
@@ -94,113 +333,176 @@ def load(state, hashring, clear=False):
         logging.info("Clearing old bridges...")
         hashring.clear()
 
-    logging.info("Loading bridges...")
+    if bridges is None:
+        bridges = loadBridges(state)
+
+    logging.info("Inserting %d bridges into hashring..." % len(bridges))
+    # Assign all of the bridges to their pools within a single database
+    # transaction, if the hashring supports it:
+    if hasattr(hashring, 'insertMany'):
+        hashring.insertMany(bridges)
+    else:
+        for bridge in bridges:
+            hashring.insert(bridge)
+    logging.info("Done inserting %d bridges into hashring." % len(bridges))
+
+    return bridges
+
+def getBridgeDelta(live, bridges):
+    """Find which bridges were added, removed, or changed since the bridges
+    in the **live** hashrings were loaded.
+
+    :param dict live: A dictionary mapping the fingerprints of the bridges
+        in the live hashrings to 2-tuples of ``(state, bridge)``, where
+        ``state`` is the result of
+        :meth:`~bridgedb.bridges.Bridge.getDistributionState` for ``bridge``.
+    :param list bridges: The newly loaded bridges, as returned by
+        :func:`loadBridges`.
+    :rtype: tuple
+    :returns: A 2-tuple of ``(removed, added)``, both of which are lists of
+        :class:`~bridgedb.bridges.Bridge`s.  Changed bridges are in both:
+        their old object is in ``removed``, and their new one is in
+        ``added``.
+    """
+    current = dict([(bridge.fingerprint, bridge) for bridge in bridges])
+    removed = []
+    added = []
+
+    for fingerprint, (state, bridge) in live.items():
+        new = current.get(fingerprint)
+        if new is None or new.getDistributionState() != state:
+            removed.append(bridge)
+
+    for fingerprint, bridge in current.items():
+        if fingerprint not in live:
+            added.append(bridge)
+        elif live[fingerprint][0] != bridge.getDistributionState():
+            added.append(bridge)
+
+    return removed, added
+
+def restoreSnapshot(filename, settings, key):
+    """Read the bridges to insert into the hashrings from a snapshot.
+
+    :param str filename: The snapshot file, or None if snapshots are
+        disabled.
+    :param tuple settings: The settings from :func:`getRingSettings`.
+    :param bytes key: The hashring master key.
+    :rtype: list or None
+    :returns: The :class:`~bridgedb.bridges.Bridge`s from the snapshot, or
+        None if there isn't a usable one.
+    """
+    if not filename:
+        return None
 
-    ignoreNetworkstatus = state.IGNORE_NETWORKSTATUS
-    if ignoreNetworkstatus:
-        logging.info("Ignoring BridgeAuthority networkstatus documents.")
+    try:
+        bridges, _ = snapshot.load(filename, settings, key)
+    except snapshot.SnapshotError as error:
+        logging.info("Not using snapshot: %s" % error)
+    else:
+        return bridges
+
+def saveSnapshot(filename, settings, key, bridges, assignments=None,
+                 proxies=None):
+    """Dump a snapshot of the **bridges** in the hashrings, for
+    :func:`restoreSnapshot` and for :mod:`~bridgedb.frontend`s.
+
+    :param str filename: The snapshot file, or None if snapshots are
+        disabled.
+    :param tuple settings: The settings from :func:`getRingSettings`.
+    :param bytes key: The hashring master key.
+    :param list bridges: The :class:`~bridgedb.bridges.Bridge`s which were
+        inserted into the hashrings.
+    :param dict assignments: The hashring's
+        :data:`~bridgedb.Bridges.BridgeSplitter.assignments`.
+    :type proxies: :class:`~bridgedb.proxy.ProxySet`
+    :param proxies: The open proxies which the hashrings were created with.
+    """
+    if not filename:
+        return
 
-    for auth in state.BRIDGE_AUTHORITY_DIRECTORIES:
-        logging.info("Processing descriptors in %s directory..." % auth)
+    try:
+        snapshot.dump(filename, settings, key, bridges, assignments, proxies)
+    except (IOError, OSError) as error:
+        logging.warn("Couldn't write snapshot to '%s': %s" % (filename, error))
 
-        bridges = {}
-        timestamps = {}
+def loadProxies(cfg, proxies):
+    """Load the open proxies in all of the **cfg**'s ``PROXY_LIST_FILES``.
 
-        fn = expandBridgeAuthDir(auth, state.STATUS_FILE)
-        logging.info("Opening networkstatus file: %s" % fn)
-        networkstatuses = descriptors.parseNetworkStatusFile(fn)
-        logging.debug("Closing networkstatus file: %s" % fn)
+    :type proxies: :class:`~bridgedb.proxy.ProxySet`
+    :param proxies: The proxies to update.
+    """
+    for proxyfile in cfg.PROXY_LIST_FILES:
+        logging.info("Loading proxies from: %s" % proxyfile)
+        proxy.loadProxiesFromFile(proxyfile, proxies, removeStale=True)
+
+def exportRings(cfg, filename=None):
+    """Parse all descriptors, assign the bridges to distributors, and write
+    the result to a snapshot for :mod:`~bridgedb.frontend`\ s to serve from.
+
+    :type cfg: :class:`Conf`
+    :param cfg: The current configuration.
+    :param str filename: The file to write the snapshot to.  (default:
+        ``cfg.SNAPSHOT_FILE``)
+    :rtype: int
+    :returns: The exit status.
+    """
+    filename = filename or cfg.SNAPSHOT_FILE
+    if not filename:
+        logging.error("No file to export the hashrings to! Set SNAPSHOT_FILE "
+                      "or use --output.")
+        return 1
+
+    state = persistent.State(config=cfg)
+    key = crypto.getKey(cfg.MASTER_KEY_FILE)
+    proxies = proxy.ProxySet()
+    loadProxies(cfg, proxies)
 
-        logging.info("Processing networkstatus descriptors...")
-        for router in networkstatuses:
-            bridge = Bridge()
-            bridge.updateFromNetworkStatus(router, ignoreNetworkstatus)
-            try:
-                bridge.assertOK()
-            except MalformedBridgeInfo as error:
-                logging.warn(str(error))
-            else:
-                bridges[bridge.fingerprint] = bridge
+    bridgedb.Storage.initializeDBLock()
+    bridgedb.Storage.setDBFilename(cfg.DB_FILE + ".sqlite")
 
-        for filename in state.BRIDGE_FILES:
-            fn = expandBridgeAuthDir(auth, filename)
-            logging.info("Opening bridge-server-descriptor file: '%s'" % fn)
-            serverdescriptors = descriptors.parseServerDescriptorsFile(fn)
-            logging.debug("Closing bridge-server-descriptor file: '%s'" % fn)
+    hashring = createBridgeRings(cfg, proxies, key)[0]
+    bridges = load(state, hashring)
 
-            for router in serverdescriptors:
-                try:
-                    bridge = bridges[router.fingerprint]
-                except KeyError:
-                    logging.warn(
-                        ("Received server descriptor for bridge '%s' which wasn't "
-                         "in the networkstatus!") % router.fingerprint)
-                    if ignoreNetworkstatus:
-                        bridge = Bridge()
-                    else:
-                        continue
+    try:
+        snapshot.dump(filename, getRingSettings(cfg), key, bridges,
+                      hashring.assignments, proxies)
+    except (IOError, OSError) as error:
+        logging.error("Couldn't write snapshot to '%s': %s" %
+                      (filename, error))
+        return 1
 
-                try:
-                    bridge.updateFromServerDescriptor(router, ignoreNetworkstatus)
-                except (ServerDescriptorWithoutNetworkstatus,
-                        MissingServerDescriptorDigest,
-                        ServerDescriptorDigestMismatch) as error:
-                    logging.warn(str(error))
-                    # Reject any routers whose server descriptors didn't pass
-                    # :meth:`~bridges.Bridge._checkServerDescriptor`, i.e. those
-                    # bridges who don't have corresponding networkstatus
-                    # documents, or whose server descriptor digests don't check
-                    # out:
-                    bridges.pop(router.fingerprint)
-                    continue
+    return 0
 
-                if state.COLLECT_TIMESTAMPS:
-                    # Update timestamps from server descriptors, not from network
-                    # status descriptors (because networkstatus documents and
-                    # descriptors aren't authenticated in any way):
-                    if bridge.fingerprint in timestamps.keys():
-                        timestamps[bridge.fingerprint].append(router.published)
-                    else:
-                        timestamps[bridge.fingerprint] = [router.published]
-
-        eifiles = [expandBridgeAuthDir(auth, fn) for fn in state.EXTRA_INFO_FILES]
-        extrainfos = descriptors.parseExtraInfoFiles(*eifiles)
-        for fingerprint, router in extrainfos.items():
-            try:
-                bridges[fingerprint].updateFromExtraInfoDescriptor(router)
-            except MalformedBridgeInfo as error:
-                logging.warn(str(error))
-            except KeyError as error:
-                logging.warn(("Received extrainfo descriptor for bridge '%s', "
-                              "but could not find bridge with that fingerprint.")
-                             % router.fingerprint)
+def getLiveBridges(bridges):
+    """Record the distribution state of some **bridges**, for
+    :func:`getBridgeDelta`.
 
-        blacklist = parseBridgeBlacklistFile(state.NO_DISTRIBUTION_FILE)
+    :rtype: dict
+    """
+    return dict([(bridge.fingerprint, (bridge.getDistributionState(), bridge))
+                 for bridge in bridges])
 
-        inserted = 0
-        logging.info("Inserting %d bridges into hashring..." % len(bridges))
-        for fingerprint, bridge in bridges.items():
-            # Skip insertion of bridges which are geolocated to be in one of the
-            # NO_DISTRIBUTION_COUNTRIES, a.k.a. the countries we don't distribute
-            # bridges from:
-            if bridge.country in state.NO_DISTRIBUTION_COUNTRIES:
-                logging.warn("Not distributing Bridge %s %s:%s in country %s!" %
-                             (bridge, bridge.address, bridge.orPort, bridge.country))
-            # Skip insertion of blacklisted bridges.
-            elif bridge in blacklist.keys():
-                logging.warn("Not distributing blacklisted Bridge %s %s:%s: %s" %
-                             (bridge, bridge.address, bridge.orPort, blacklist[bridge]))
-            else:
-                # If the bridge is not running, then it is skipped during the
-                # insertion process.
-                hashring.insert(bridge)
-                inserted += 1
-        logging.info("Done inserting %d bridges into hashring." % inserted)
+def getRingSettings(cfg):
+    """Get all of the settings which :func:`createBridgeRings` uses to create
+    the hashrings.  If these change, the hashrings must be rebuilt from
+    scratch.
 
-        if state.COLLECT_TIMESTAMPS:
-            reactor.callInThread(updateBridgeHistory, bridges, timestamps)
+    Whether there are any open proxies also changes how the hashrings are
+    created, but the proxies aren't settings: they are kept in snapshots,
+    so that :mod:`~bridgedb.frontend`\ s create their hashrings with the
+    same ones.
 
-        state.save()
+    :rtype: tuple
+    """
+    return (cfg.N_IP_CLUSTERS, cfg.MOAT_N_IP_CLUSTERS,
+            cfg.HTTPS_DIST, cfg.HTTPS_SHARE, cfg.MOAT_DIST, cfg.MOAT_SHARE,
+            cfg.EMAIL_DIST, cfg.EMAIL_SHARE, cfg.RESERVED_SHARE,
+            cfg.FORCE_PORTS, cfg.FORCE_FLAGS, cfg.IPV4_DISTINCT_SUBNET_PREFIX,
+            cfg.IPV6_DISTINCT_SUBNET_PREFIX, cfg.MEMOIZE_RING_ANSWERS,
+            cfg.COMPACT_HASHRINGS, cfg.BUILD_RINGS_IN_BACKGROUND,
+            cfg.EMAIL_DOMAIN_MAP,
+            cfg.EMAIL_DOMAIN_RULES, cfg.EMAIL_WHITELIST, cfg.DB_FILE)
 
 def _reloadFn(*args):
     """Placeholder callback function for :func:`_handleSIGHUP`."""
@@ -208,13 +510,57 @@ def _reloadFn(*args):
 
 def _handleSIGHUP(*args):
     """Called when we receive a SIGHUP; invokes _reloadFn."""
-    reactor.callInThread(_reloadFn)
+    reactor.callFromThread(_reloadFn)
 
 def replaceBridgeRings(current, replacement):
-    """Replace the current thing with the new one"""
-    current.hashring = replacement.hashring
+    """Make the **current** distributor serve from the frozen hashrings of
+    its **replacement**, built by a reload.
+
+    This must be called from the reactor thread.
+
+    :type current: :class:`~bridgedb.distribute.Distributor`
+    :param current: The distributor which is currently serving requests.
+    :type replacement: :class:`~bridgedb.distribute.Distributor`
+    :param replacement: The new generation of the **current** distributor.
+    """
+    current.useGeneration(replacement)
 
-def createBridgeRings(cfg, proxyList, key):
+def replaceAllBridgeRings(distributors):
+    """Switch several distributors to their replacements at once, so that
+    they all start serving from the new generation of hashrings together.
+
+    This must be called from the reactor thread.
+
+    :param list distributors: A list of ``(current, replacement)``
+        2-tuples, as for :func:`replaceBridgeRings`.  Pairs where either
+        distributor is ``None`` are skipped.
+    """
+    for current, replacement in distributors:
+        if current is not None and replacement is not None:
+            replaceBridgeRings(current, replacement)
+
+def prebuildPopularRings(current, replacement, count):
+    """Prebuild, in the **replacement** distributor's hashring, the **count**
+    subhashrings which clients most often requested from the **current**
+    distributor.
+
+    This must be called from a thread other than the reactor's.
+
+    :type current: :class:`~bridgedb.distributors.https.distributor.HTTPSDistributor`
+    :param current: The distributor which is currently serving requests.
+    :type replacement: :class:`~bridgedb.distributors.https.distributor.HTTPSDistributor`
+    :param replacement: The distributor whose hashring will replace the
+        **current** one's.
+    :param int count: The number of subhashrings to prebuild.
+    """
+    if not (current and count):
+        return
+
+    requests = threads.blockingCallFromThread(
+        reactor, current.popularRingRequests, count)
+    replacement.prebuildRings(requests)
+
+def createBridgeRings(cfg, proxyList, key, ringBuilder=None):
     """Create the bridge distributors defined by the config file
 
     :type cfg:  :class:`Conf`
@@ -225,6 +571,9 @@ def createBridgeRings(cfg, proxyList, key):
     :param proxyList: The container for the IP addresses of any currently
         known open proxies.
     :param bytes key: Hashring master key
+    :type ringBuilder: :class:`multiprocessing.Pool` or None
+    :param ringBuilder: If given, the pool of processes which fill the
+        distributors' subhashrings.  See ``RING_BUILD_PROCESSES``.
     :rtype: tuple
     :returns: A :class:`~bridgedb.Bridges.BridgeSplitter` hashring, an
         :class:`~bridgedb.distributors.https.distributor.HTTPSDistributor` or None, and an
@@ -237,8 +586,18 @@ def createBridgeRings(cfg, proxyList, key):
     logging.debug("Created hashring: %r" % hashring)
 
     # Create ring parameters.
-    ringParams = Bridges.BridgeRingParameters(needPorts=cfg.FORCE_PORTS,
-                                              needFlags=cfg.FORCE_FLAGS)
+    ringParams = Bridges.BridgeRingParameters(
+        needPorts=cfg.FORCE_PORTS,
+        needFlags=cfg.FORCE_FLAGS,
+        ipv4SubnetPrefix=cfg.IPV4_DISTINCT_SUBNET_PREFIX,
+        ipv6SubnetPrefix=cfg.IPV6_DISTINCT_SUBNET_PREFIX,
+        memoizeAnswers=cfg.MEMOIZE_RING_ANSWERS)
+
+    # Choose the storage used for the distributors' filtered hashrings.
+    if cfg.COMPACT_HASHRINGS:
+        ringClass = Bridges.CompactBridgeRing
+    else:
+        ringClass = Bridges.BridgeRing
 
     emailDistributor = ipDistributor = moatDistributor = None
 
@@ -249,7 +608,10 @@ def createBridgeRings(cfg, proxyList, key):
             cfg.MOAT_N_IP_CLUSTERS,
             crypto.getHMAC(key, "Moat-Dist-Key"),
             proxyList,
-            answerParameters=ringParams)
+            answerParameters=ringParams,
+            ringClass=ringClass)
+        moatDistributor.buildRingsInBackground = cfg.BUILD_RINGS_IN_BACKGROUND
+        moatDistributor.hashring.ringBuilder = ringBuilder
         hashring.addRing(moatDistributor.hashring, "moat", cfg.MOAT_SHARE)
 
     # As appropriate, create an IP-based distributor.
@@ -259,7 +621,10 @@ def createBridgeRings(cfg, proxyList, key):
             cfg.N_IP_CLUSTERS,
             crypto.getHMAC(key, "HTTPS-IP-Dist-Key"),
             proxyList,
-            answerParameters=ringParams)
+            answerParameters=ringParams,
+            ringClass=ringClass)
+        ipDistributor.buildRingsInBackground = cfg.BUILD_RINGS_IN_BACKGROUND
+        ipDistributor.hashring.ringBuilder = ringBuilder
         hashring.addRing(ipDistributor.hashring, "https", cfg.HTTPS_SHARE)
 
     # As appropriate, create an email-based distributor.
@@ -270,7 +635,9 @@ def createBridgeRings(cfg, proxyList, key):
             cfg.EMAIL_DOMAIN_MAP.copy(),
             cfg.EMAIL_DOMAIN_RULES.copy(),
             answerParameters=ringParams,
-            whitelist=cfg.EMAIL_WHITELIST.copy())
+            whitelist=cfg.EMAIL_WHITELIST.copy(),
+            ringClass=ringClass)
+        emailDistributor.hashring.ringBuilder = ringBuilder
         hashring.addRing(emailDistributor.hashring, "email", cfg.EMAIL_SHARE)
 
     # As appropriate, tell the hashring to leave some bridges unallocated.
@@ -346,11 +713,45 @@ def run(options, reactor=reactor):
     ipDistributor = None
     moatDistributor = None
 
+    # Start the processes which fill the hashrings, and which parse the
+    # descriptors, now, so that they are forked before we have any threads:
+    ringBuilder = None
+    if config.RING_BUILD_PROCESSES:
+        ringBuilder = multiprocessing.Pool(config.RING_BUILD_PROCESSES)
+        if reactor:
+            reactor.addSystemEventTrigger('before', 'shutdown',
+                                          ringBuilder.terminate)
+    descriptorParser = None
+    if config.PARSE_PROCESSES:
+        descriptorParser = multiprocessing.Pool(config.PARSE_PROCESSES)
+        if reactor:
+            reactor.addSystemEventTrigger('before', 'shutdown',
+                                          descriptorParser.terminate)
+    # The records parsed from each descriptor file, so that only what
+    # changed in them is parsed again on each reload:
+    descriptorCache = None
+    if config.INCREMENTAL_INGEST:
+        descriptorCache = ingest.DescriptorCache()
+
     # Save our state
     state.proxies = proxies
     state.key = key
     state.save()
 
+    # The generation of hashrings which the distributors are currently
+    # serving from: its number, hashring, the bridges in it, the settings it
+    # was created with, whether there were any open proxies then, and the
+    # planner's inputs it was built from, plus the pool of worker processes
+    # serving HTTPS and moat, if any:
+    live = {'generation': 0, 'hashring': None, 'bridges': {},
+            'settings': None, 'proxied': False, 'inputs': None,
+            'workers': None}
+
+    def signalWorkers():
+        """Tell the workers, if there are any, to load the new snapshot."""
+        if live['workers'] is not None:
+            reactor.callFromThread(live['workers'].signal, 'HUP')
+
     def reload(inThread=True): # pragma: no cover
         """Reload settings, proxy lists, and bridges.
 
@@ -385,86 +786,272 @@ def run(options, reactor=reactor):
         logging.debug("Caught SIGHUP")
         logging.info("Reloading...")
 
+        supervisor.stage("loading settings")
         logging.info("Loading saved state...")
         state = persistent.load()
         cfg = loadConfig(state.CONFIG_FILE, state.config)
         logging.info("Updating any changed settings...")
         state.useChangedSettings(cfg)
+        # Every generation of hashrings uses the same set of open proxies,
+        # which is also the one that the GET_TOR_EXIT_LIST task updates:
+        state.proxies = proxies
+
+        # Only redo whatever depends on the settings and files which changed
+        # since the hashrings being served were built:
+        inputs = planner.getInputs(cfg, getDescriptorFiles(cfg),
+                                   live['inputs'])
+        plan = planner.planReload(live['inputs'] if inThread else None,
+                                  inputs)
+        supervisor.planned(str(plan))
+
+        if plan.logLevel:
+            level = getattr(state, 'LOGLEVEL', 'WARNING')
+            logging.info("Updating log level to: '%s'" % level)
+            level = getattr(logging, level)
+            logging.getLogger().setLevel(level)
+
+        if plan.proxies:
+            logging.info("Reloading the list of open proxies...")
+            if inThread:
+                # The live distributors are using them:
+                threads.blockingCallFromThread(reactor, loadProxies, cfg,
+                                               proxies)
+            else:
+                loadProxies(cfg, proxies)
+            # The HTTPS and moat distributors have an extra cluster for
+            # clients coming from open proxies, if there are any:
+            if not plan.full and bool(proxies) != live['proxied']:
+                for ringname in ('https', 'moat'):
+                    plan.rebuildDistributor(ringname, "the open proxies were "
+                                            "all added or removed")
+
+        if not plan.needsNewGeneration():
+            logging.info("Still serving generation %d of the hashrings." %
+                         live['generation'])
+            live['inputs'] = inputs
+            state.save()
+            return
 
-        level = getattr(state, 'LOGLEVEL', 'WARNING')
-        logging.info("Updating log level to: '%s'" % level)
-        level = getattr(logging, level)
-        logging.getLogger().setLevel(level)
-
-        logging.info("Reloading the list of open proxies...")
-        for proxyfile in cfg.PROXY_LIST_FILES:
-            logging.info("Loading proxies from: %s" % proxyfile)
-            proxy.loadProxiesFromFile(proxyfile, state.proxies, removeStale=True)
+        # Initialize our DB.
+        bridgedb.Storage.initializeDBLock()
+        bridgedb.Storage.setDBFilename(cfg.DB_FILE + ".sqlite")
 
-        logging.info("Reparsing bridge descriptors...")
+        # If the hashrings would be created in the same way as the live ones
+        # were, then the new generation of hashrings is built from the live
+        # one, and only the bridges which changed are inserted into it (or,
+        # with SKIP_UNCHANGED_RELOADS, if none did, the live one keeps being
+        # served).  Otherwise, it is built from scratch.  Either way,
+        # requests are still answered from the live one meanwhile:
+        settings = getRingSettings(cfg)
+        parsed = None
+        delta = None
+        if (plan.descriptors and inThread
+                and live['hashring'] is not None
+                and live['settings'] == settings
+                and live['proxied'] == bool(proxies)):
+            supervisor.stage("parsing descriptors")
+            logging.info("Reparsing bridge descriptors...")
+            parsed = loadBridges(state, descriptorParser, descriptorCache)
+            delta = getBridgeDelta(live['bridges'], parsed)
+            logging.info("Bridges removed or changed: %d; added or "
+                         "changed: %d" % tuple(map(len, delta)))
+            if cfg.SKIP_UNCHANGED_RELOADS and not any(delta):
+                logging.info("No bridges changed. Still serving generation "
+                             "%d of the hashrings." % live['generation'])
+                if emailDistributor is not None:
+                    emailDistributor.cleanDatabase()
+                live['inputs'] = inputs
+                state.save()
+                return
+
+        # When starting up, build the hashrings from the last snapshot, if
+        # there is a usable one, and reparse the descriptors once we're
+        # serving:
+        restored = None
+        if not inThread:
+            restored = restoreSnapshot(cfg.SNAPSHOT_FILE, settings, key)
+
+        # If only some distributors' settings changed, then only their
+        # hashrings are rebuilt, from the bridges which were assigned to
+        # them, and the others keep serving from the ones they have:
+        rebuilt = None
+        if not (plan.full or plan.descriptors):
+            rebuilt = plan.distributors
+
+        if rebuilt is None and restored is None and parsed is None:
+            supervisor.stage("parsing descriptors")
+            logging.info("Reparsing bridge descriptors...")
+            parsed = loadBridges(state, descriptorParser, descriptorCache)
+
+        supervisor.stage("building hashrings")
         (hashring,
          emailDistributorTmp,
          ipDistributorTmp,
-         moatDistributorTmp) = createBridgeRings(cfg, state.proxies, key)
+         moatDistributorTmp) = createBridgeRings(cfg, state.proxies, key,
+                                                 ringBuilder)
+
+        if delta is not None:
+            logging.info("Building generation %d of the hashrings from "
+                         "generation %d..." % (live['generation'] + 1,
+                                               live['generation']))
+            try:
+                hashring.updateFrom(live['hashring'], *delta)
+            except Exception as error:
+                logging.exception(error)
+                logging.error("Couldn't build the hashrings from the live "
+                              "ones! Building them from scratch...")
+                (hashring,
+                 emailDistributorTmp,
+                 ipDistributorTmp,
+                 moatDistributorTmp) = createBridgeRings(cfg, state.proxies,
+                                                         key, ringBuilder)
+                delta = None
         logging.info("Bridges loaded: %d" % len(hashring))
 
-        # Initialize our DB.
-        bridgedb.Storage.initializeDBLock()
-        bridgedb.Storage.setDBFilename(cfg.DB_FILE + ".sqlite")
-        load(state, hashring, clear=False)
+        if delta is not None:
+            bridges = parsed
+        elif rebuilt is not None:
+            bridges = [bridge for _, bridge in live['bridges'].values()]
+            hashring.rebuildFrom(live['hashring'], bridges, rebuilt)
+            if 'email' not in rebuilt:
+                emailDistributorTmp = None
+            if 'https' not in rebuilt:
+                ipDistributorTmp = None
+            if 'moat' not in rebuilt:
+                moatDistributorTmp = None
+        elif parsed is not None:
+            bridges = load(state, hashring, clear=False, bridges=parsed)
+        else:
+            bridges = load(state, hashring, clear=False, bridges=restored)
+        counts = dict([(name, len(ring))
+                       for name, ring in hashring.ringsByName.items()])
+        # Nothing may change the bridges in this generation from now on, so
+        # that its subhashrings can be built in any thread while it serves:
+        hashring.freeze()
 
         if emailDistributorTmp is not None:
             emailDistributorTmp.prepopulateRings() # create default rings
-        else:
+        elif rebuilt is None:
             logging.warn("No email distributor created!")
 
         if ipDistributorTmp is not None:
             ipDistributorTmp.prepopulateRings() # create default rings
-        else:
+            if inThread:
+                prebuildPopularRings(ipDistributor, ipDistributorTmp,
+                                     cfg.PREBUILD_POPULAR_RINGS)
+        elif rebuilt is None:
             logging.warn("No HTTP(S) distributor created!")
 
         if moatDistributorTmp is not None:
             moatDistributorTmp.prepopulateRings()
-        else:
+            if inThread:
+                prebuildPopularRings(moatDistributor, moatDistributorTmp,
+                                     cfg.PREBUILD_POPULAR_RINGS)
+        elif rebuilt is None:
             logging.warn("No Moat distributor created!")
 
-        # Dump bridge pool assignments to disk.
-        writeAssignments(hashring, state.ASSIGNMENTS_FILE)
+        # Dump bridge pool assignments to disk, unless none of them changed.
+        supervisor.stage("writing assignments")
+        if rebuilt is None:
+            writeAssignments(hashring, state.ASSIGNMENTS_FILE)
+        if restored is None:
+            saveSnapshot(cfg.SNAPSHOT_FILE, settings, key, bridges,
+                         hashring.assignments, state.proxies)
+            signalWorkers()
+        else:
+            logging.info("Reparsing bridge descriptors once started...")
+            reactor.callWhenRunning(supervisor.request)
         state.save()
 
+        live['generation'] += 1
+        live['hashring'] = hashring
+        live['bridges'] = getLiveBridges(bridges)
+        live['settings'] = settings
+        live['proxied'] = bool(proxies)
+        # If we restored a snapshot, the descriptors haven't been parsed yet:
+        live['inputs'] = inputs if restored is None else None
+        logging.info("Built generation %d of the hashrings." %
+                     live['generation'])
+
         if inThread:
+            # The bridges' assignments were all written to the database by
+            # load(), in this thread, so the reactor only has to swap the
+            # in-memory generations.
+            #
             # XXX shutdown the distributors if they were previously running
             # and should now be disabled
-            if moatDistributorTmp:
-                reactor.callFromThread(replaceBridgeRings,
-                                       moatDistributor, moatDistributorTmp)
-            if ipDistributorTmp:
-                reactor.callFromThread(replaceBridgeRings,
-                                       ipDistributor, ipDistributorTmp)
-            if emailDistributorTmp:
-                reactor.callFromThread(replaceBridgeRings,
-                                       emailDistributor, emailDistributorTmp)
+            reactor.callFromThread(replaceAllBridgeRings, [
+                (moatDistributor, moatDistributorTmp),
+                (ipDistributor, ipDistributorTmp),
+                (emailDistributor, emailDistributorTmp)])
+            reactor.callFromThread(supervisor.published, live['generation'],
+                                   counts)
         else:
+            supervisor.published(live['generation'], counts)
             # We're still starting up. Return these distributors so
             # they are configured in the outer-namespace
             return emailDistributorTmp, ipDistributorTmp, moatDistributorTmp
 
+    # Run reloads one at a time, merging any requested meanwhile:
+    supervisor = ReloadSupervisor(reload, reactor)
+
     global _reloadFn
-    _reloadFn = reload
+    _reloadFn = supervisor.request
     signal.signal(signal.SIGHUP, _handleSIGHUP)
 
     if reactor:  # pragma: no cover
         # And actually load it to start parsing. Get back our distributors.
-        emailDistributor, ipDistributor, moatDistributor = reload(False)
-
-        # Configure all servers:
-        if config.MOAT_DIST and config.MOAT_SHARE:
-            addMoatServer(config, moatDistributor)
-        if config.HTTPS_DIST and config.HTTPS_SHARE:
-            addWebServer(config, ipDistributor)
+        (emailDistributor,
+         ipDistributor,
+         moatDistributor) = supervisor.runNow(False)
+
+        # Now that our hashrings are built, take over the listening sockets
+        # of the BridgeDB which we're replacing, if there is one:
+        predecessor = None
+        if config.HANDOVER_SOCKET:
+            try:
+                predecessor = handover.requestSockets(config.HANDOVER_SOCKET)
+            except handover.HandoverError as error:
+                logging.error(error)
+
+        # Configure all servers.  If there are to be worker processes, then
+        # they serve HTTPS and moat from our snapshots, rather than us:
+        if config.WEB_WORKERS and not config.SNAPSHOT_FILE:
+            logging.warn("WEB_WORKERS requires SNAPSHOT_FILE to be set! "
+                         "Serving HTTPS and moat from a single process.")
+        if config.WEB_WORKERS and config.SNAPSHOT_FILE:
+            live['workers'] = prefork.startWorkers(config, options)
+        else:
+            if config.MOAT_DIST and config.MOAT_SHARE:
+                addMoatServer(config, moatDistributor, supervisor.getStatus)
+            if config.HTTPS_DIST and config.HTTPS_SHARE:
+                addWebServer(config, ipDistributor, supervisor.getStatus)
         if config.EMAIL_DIST and config.EMAIL_SHARE:
             addSMTPServer(config, emailDistributor)
 
+        # Tell the BridgeDB we replaced to stop accepting connections, and
+        # then wait for the next one to replace us:
+        if predecessor is not None:
+            handover.finishHandover(predecessor)
+        if config.HANDOVER_SOCKET:
+            try:
+                handover.listen(config.HANDOVER_SOCKET,
+                                config.HANDOVER_DRAIN_TIMEOUT, reactor,
+                                live['workers'])
+            except CannotListenError as error:
+                logging.warn("Can't listen for handovers: %s" % error)
+
+        # Reload soon after the BridgeAuthority writes new descriptors,
+        # rather than waiting for a SIGHUP:
+        if config.WATCH_DESCRIPTORS:
+            watcher = ingest.DescriptorWatcher(getDescriptorFiles(config),
+                                               supervisor.request,
+                                               config.WATCH_DESCRIPTORS_DELAY,
+                                               reactor)
+            if watcher.start():
+                reactor.addSystemEventTrigger('before', 'shutdown',
+                                              watcher.stop)
+
         tasks = {}
 
         # Setup all our repeating tasks:
@@ -507,11 +1094,23 @@ def run(options, reactor=reactor):
     except KeyboardInterrupt: # pragma: no cover
         logging.fatal("Received keyboard interrupt. Shutting down...")
     finally:
-        if config.PIDFILE:
+        # If we handed over to another BridgeDB, the PIDFILE is now its:
+        if config.PIDFILE and isOwnPIDFile(config.PIDFILE):
             os.unlink(config.PIDFILE)
         logging.info("Exiting...")
         sys.exit()
 
+def isOwnPIDFile(filename):
+    """Check whether the PIDFILE at **filename** holds our PID.
+
+    :rtype: bool
+    """
+    try:
+        with open(filename) as pidfile:
+            return pidfile.read().strip() == str(os.getpid())
+    except (IOError, OSError):
+        return False
+
 def runSubcommand(options, config):
     """Run a subcommand from the 'Commands' section of the bridgedb help menu.
 
@@ -536,6 +1135,12 @@ def runSubcommand(options, config):
         if 'descriptors' in options.subOptions:
             statuscode = runner.generateDescriptors(
                 options.subOptions['descriptors'], config.RUN_IN_DIR)
+        elif options.subCommand == 'export-rings':
+            statuscode = exportRings(config, options.subOptions['output'])
+        elif options.subCommand == 'frontend':
+            from bridgedb import frontend
+            statuscode = frontend.run(config, options.subOptions['snapshot'],
+                                      options.subOptions['sockets'])
 
         logging.info("Subcommand '%s' finished with status %s."
                      % (options.subCommand, statuscode))
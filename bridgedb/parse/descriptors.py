@@ -22,14 +22,23 @@ bridgedb.parse.descriptors
 ::
 
  DescriptorWarning - Raised when we parse a very odd descriptor.
+ DescriptorRecord - A compact copy of the parts of a descriptor which we use.
  deduplicate - Deduplicate a container of descriptors, keeping only the newest
                descriptor for each router.
+ iterNetworkStatusFile - Parse the entries of a bridge-networkstatus document
+                         one at a time.
  parseNetworkStatusFile - Parse a bridge-networkstatus document generated and
                           given to us by the BridgeAuthority.
+ iterServerDescriptorsFile - Parse bridge-server-descriptors one at a time.
  parseServerDescriptorsFile - Parse a file containing
                               bridge-server-descriptors.
+ iterExtraInfoFiles - Parse bridge-extrainfo descriptors one at a time.
  parseExtraInfoFiles - Parse (multiple) file(s) containing bridge-extrainfo
                        descriptors.
+ iterDescriptorRecords - Parse any one descriptor file into DescriptorRecords,
+                         one at a time.
+ parseDescriptorFile - Parse any one descriptor file into DescriptorRecords,
+                       i.e. in a worker process.
 ..
 """
 
@@ -88,6 +97,38 @@ def _copyUnparseableDescriptorFile(filename):
                        "descriptor file."))
         return True
 
+def iterNetworkStatusFile(filename, validate=True, skipAnnotations=True,
+                          descriptorClass=RouterStatusEntryV3):
+    """Parse the entries in an ``@type bridge-networkstatus`` document one at
+    a time, so that each can be dropped once it has been used.
+
+    The file is kept open until the last entry has been parsed.  See
+    :func:`parseNetworkStatusFile`, which takes the same parameters, and
+    raises the same exceptions (but only as each entry is parsed).
+
+    :rtype: generator
+    """
+    logging.info("Parsing networkstatus file: %s" % filename)
+    with open(filename) as fh:
+        position = fh.tell()
+        if skipAnnotations:
+            while not fh.readline().startswith('r '):
+                position = fh.tell()
+        logging.debug("Skipping %d bytes of networkstatus file." % position)
+        fh.seek(position)
+        document = _parseNSFile(fh, validate, entry_class=descriptorClass)
+
+        try:
+            for router in document:
+                yield router
+        except ValueError as error:
+            if "nickname isn't valid" in str(error):
+                raise InvalidRouterNickname(str(error))
+            else:
+                raise ValueError(str(error))
+
+    logging.info("Closed networkstatus file: %s" % filename)
+
 def parseNetworkStatusFile(filename, validate=True, skipAnnotations=True,
                            descriptorClass=RouterStatusEntryV3):
     """Parse a file which contains an ``@type bridge-networkstatus`` document.
@@ -119,29 +160,33 @@ def parseNetworkStatusFile(filename, validate=True, skipAnnotations=True,
     :returns: A list of
         :class:`stem.descriptor.router_status_entry.RouterStatusEntry`.
     """
-    routers = []
+    return list(iterNetworkStatusFile(filename, validate, skipAnnotations,
+                                      descriptorClass))
 
-    logging.info("Parsing networkstatus file: %s" % filename)
-    with open(filename) as fh:
-        position = fh.tell()
-        if skipAnnotations:
-            while not fh.readline().startswith('r '):
-                position = fh.tell()
-        logging.debug("Skipping %d bytes of networkstatus file." % position)
-        fh.seek(position)
-        document = _parseNSFile(fh, validate, entry_class=descriptorClass)
+def iterServerDescriptorsFile(filename, validate=True):
+    """Parse the ``@type bridge-server-descriptor``\\ s in **filename** one at
+    a time, so that each can be dropped once it has been used.
 
-        try:
-            routers.extend(list(document))
-        except ValueError as error:
-            if "nickname isn't valid" in str(error):
-                raise InvalidRouterNickname(str(error))
-            else:
-                raise ValueError(str(error))
+    See :func:`parseServerDescriptorsFile`.
 
-    logging.info("Closed networkstatus file: %s" % filename)
+    :rtype: generator
+    """
+    logging.info("Parsing server descriptors with Stem: %s" % filename)
+    descriptorType = 'server-descriptor 1.0'
+    document = parse_file(filename, descriptorType, validate=validate)
 
-    return routers
+    # Work around https://bugs.torproject.org/26023 by parsing each descriptor
+    # at a time and catching any errors not handled in stem:
+    while True:
+        try:
+            router = document.next()
+        except StopIteration:
+            break
+        except Exception as error:
+            logging.debug("Error while parsing a bridge server descriptor: %s"
+                          % error)
+        else:
+            yield router
 
 def parseServerDescriptorsFile(filename, validate=True):
     """Open and parse **filename**, which should contain
@@ -158,23 +203,7 @@ def parseServerDescriptorsFile(filename, validate=True):
     :returns: A list of
         :class:`stem.descriptor.server_descriptor.RelayDescriptor`s.
     """
-    logging.info("Parsing server descriptors with Stem: %s" % filename)
-    descriptorType = 'server-descriptor 1.0'
-    document = parse_file(filename, descriptorType, validate=validate)
-    routers = list()
-
-    # Work around https://bugs.torproject.org/26023 by parsing each descriptor
-    # at a time and catching any errors not handled in stem:
-    while True:
-        try:
-            routers.append(document.next())
-        except StopIteration:
-            break
-        except Exception as error:
-            logging.debug("Error while parsing a bridge server descriptor: %s"
-                          % error)
-
-    return routers
+    return list(iterServerDescriptorsFile(filename, validate))
 
 def __cmp_published__(x, y):
     """A custom ``cmp()`` which sorts descriptors by published date.
@@ -206,10 +235,16 @@ def deduplicate(descriptors, statistics=False):
         fingerprint WILL BE LOGGED ON PURPOSE, because we assume that router
         to be broken or malicious.
 
-    :param list descriptors: A list of
+    The **descriptors** are merged in a single pass, so that only the newest
+    descriptor seen so far for each router is kept, and any older ones can
+    be dropped as soon as a newer one is found.  If two are equally new, the
+    later one is kept.
+
+    :param descriptors: An iterable of
         :class:`stem.descriptor.server_descriptor.RelayDescriptor`,
         :class:`stem.descriptor.extrainfo_descriptor.BridgeExtraInfoDescriptor`,
-        or :class:`stem.descriptor.router_status_entry.RouterStatusEntry`.
+        :class:`stem.descriptor.router_status_entry.RouterStatusEntry`, or
+        :class:`DescriptorRecord`, e.g. from :func:`iterExtraInfoFiles`.
     :param bool statistics: If ``True``, log some extra statistics about the
         number of duplicates.
     :rtype: dict
@@ -221,21 +256,17 @@ def deduplicate(descriptors, statistics=False):
 
     for descriptor in descriptors:
         fingerprint = descriptor.fingerprint
-        if fingerprint in duplicates:
-            duplicates[fingerprint].append(descriptor)
+        current = newest.get(fingerprint)
+        if current is None:
+            duplicates[fingerprint] = 0
+            newest[fingerprint] = descriptor
         else:
-            duplicates[fingerprint] = [descriptor,]
-
-    for fingerprint, dupes in duplicates.items():
-        dupes.sort(cmp=__cmp_published__)
-        first = dupes.pop()
-        newest[fingerprint] = first
-        duplicates[fingerprint] = dupes
+            duplicates[fingerprint] += 1
+            if __cmp_published__(descriptor, current) >= 0:
+                newest[fingerprint] = descriptor
 
     if statistics:
-        # sorted() won't sort by values (or anything that isn't the first item
-        # in its container), period, no matter what the cmp function is.
-        totals  = sorted([(len(v), k,) for k, v in duplicates.viewitems()])
+        totals  = sorted([(v, k,) for k, v in duplicates.viewitems()])
         total   = sum([k for (k, v) in totals])
         bridges = len(duplicates)
         top     = 10 if bridges >= 10 else bridges
@@ -249,34 +280,14 @@ def deduplicate(descriptors, statistics=False):
 
     return newest
 
-def parseExtraInfoFiles(*filenames, **kwargs):
-    """Open **filenames** and parse any ``@type bridge-extrainfo-descriptor``
-    contained within.
+def iterExtraInfoFiles(*filenames, **kwargs):
+    """Parse the ``@type bridge-extrainfo-descriptor``\\ s in **filenames**
+    one at a time, without deduplicating them.
 
-    .. warning:: This function will *not* check that the ``router-signature``
-        at the end of the extrainfo descriptor is valid. See
-        ``bridgedb.bridges.Bridge._verifyExtraInfoSignature`` for a method for
-        checking the signature.  The signature cannot be checked here, because
-        to do so, we would need the latest, valid, corresponding
-        ``signing-key`` for the Bridge.
+    See :func:`parseExtraInfoFiles`, which takes the same arguments.
 
-    .. note:: This function will call :func:`deduplicate` to deduplicate the
-        extrainfo descriptors parsed from all **filenames**.
-
-    :kwargs validate: If there is a ``'validate'`` keyword argument, its value
-        will be passed along as the ``'validate'`` argument to
-        :class:`stem.descriptor.extrainfo_descriptor.BridgeExtraInfoDescriptor`.
-        The ``'validate'`` keyword argument defaults to ``True``, meaning that
-        the hash digest stored in the ``router-digest`` line will be checked
-        against the actual contents of the descriptor and the extrainfo
-        document's signature will be verified.
-    :rtype: dict
-    :returns: A dictionary mapping bridge fingerprints to their corresponding,
-        deduplicated
-        :class:`stem.descriptor.extrainfo_descriptor.RelayExtraInfoDescriptor`.
+    :rtype: generator
     """
-    descriptors = []
-
     # The ``stem.descriptor.extrainfo_descriptor.BridgeExtraInfoDescriptor``
     # class (with ``descriptorType = 'bridge-extra-info 1.1``) is unsuitable
     # for our purposes for the following reasons:
@@ -300,12 +311,149 @@ def parseExtraInfoFiles(*filenames, **kwargs):
 
         try:
             for router in document:
-                descriptors.append(router)
+                yield router
         except (ValueError, ProtocolError) as error:
             logging.error(
                 ("Stem exception while parsing extrainfo descriptor from "
                  "file '%s':\n%s") % (filename, str(error)))
             _copyUnparseableDescriptorFile(filename)
 
-    routers = deduplicate(descriptors)
-    return routers
+def parseExtraInfoFiles(*filenames, **kwargs):
+    """Open **filenames** and parse any ``@type bridge-extrainfo-descriptor``
+    contained within.
+
+    .. warning:: This function will *not* check that the ``router-signature``
+        at the end of the extrainfo descriptor is valid. See
+        ``bridgedb.bridges.Bridge._verifyExtraInfoSignature`` for a method for
+        checking the signature.  The signature cannot be checked here, because
+        to do so, we would need the latest, valid, corresponding
+        ``signing-key`` for the Bridge.
+
+    .. note:: This function will call :func:`deduplicate` to deduplicate the
+        extrainfo descriptors parsed from all **filenames**.
+
+    :kwargs validate: If there is a ``'validate'`` keyword argument, its value
+        will be passed along as the ``'validate'`` argument to
+        :class:`stem.descriptor.extrainfo_descriptor.BridgeExtraInfoDescriptor`.
+        The ``'validate'`` keyword argument defaults to ``True``, meaning that
+        the hash digest stored in the ``router-digest`` line will be checked
+        against the actual contents of the descriptor and the extrainfo
+        document's signature will be verified.
+    :rtype: dict
+    :returns: A dictionary mapping bridge fingerprints to their corresponding,
+        deduplicated
+        :class:`stem.descriptor.extrainfo_descriptor.RelayExtraInfoDescriptor`.
+    """
+    return deduplicate(iterExtraInfoFiles(*filenames, **kwargs))
+
+
+#: The attributes of each type of descriptor which BridgeDB uses, and which
+#: a :class:`DescriptorRecord` copies from it.
+RECORD_FIELDS = {
+    'networkstatus': ('fingerprint', 'nickname', 'address', 'or_port',
+                      'or_addresses', 'flags', 'digest', 'bandwidth',
+                      'published'),
+    'server': ('fingerprint', 'nickname', 'address', 'or_port',
+               'or_addresses', 'hibernating', 'bridge_distribution',
+               'onion_key', 'ntor_onion_key', 'signing_key',
+               'average_bandwidth', 'burst_bandwidth', 'observed_bandwidth',
+               'contact', 'family', 'platform', 'tor_version',
+               'operating_system', 'uptime', 'extra_info_digest',
+               'published'),
+    'extrainfo': ('fingerprint', 'nickname', 'published', 'bridge_ips',
+                  'transport'),
+}
+
+
+class DescriptorRecord(object):
+    """A compact copy of the parts of a parsed descriptor which BridgeDB
+    uses, which can be pickled cheaply, e.g. to send it back from a worker
+    process.
+
+    A :class:`~bridgedb.bridges.Bridge` can be updated from a
+    :class:`DescriptorRecord` just as from the Stem descriptor which it was
+    copied from.
+
+    :ivar str kind: The type of the descriptor, one of the keys of
+        :data:`RECORD_FIELDS`.
+    """
+
+    def __init__(self, kind, descriptor):
+        """Copy the attributes in :data:`RECORD_FIELDS` for **kind** from a
+        **descriptor**.
+
+        :param str kind: One of ``'networkstatus'``, ``'server'``, or
+            ``'extrainfo'``.
+        :param descriptor: The descriptor, parsed with Stem.
+        """
+        self.kind = kind
+        for name in RECORD_FIELDS[kind]:
+            setattr(self, name, getattr(descriptor, name, None))
+
+        # A server descriptor's digest is computed by a method, and an
+        # extrainfo descriptor's signature is checked against its contents:
+        self._digest = descriptor.digest() if kind == 'server' else None
+        self._bytes = descriptor.get_bytes() if kind == 'extrainfo' else None
+
+    def digest(self):
+        """Get the digest of a server descriptor.  (A networkstatus entry's
+        ``digest`` attribute replaces this method.)
+
+        :rtype: str
+        """
+        return self._digest
+
+    def get_bytes(self):
+        """Get the contents of an extrainfo descriptor.
+
+        :rtype: str
+        """
+        return self._bytes
+
+
+def iterDescriptorRecords(kind, filename):
+    """Parse the descriptors in a file one at a time, copying each into a
+    :class:`DescriptorRecord`, so that the Stem descriptors can be dropped
+    straight away.
+
+    :param str kind: The kind of the descriptors, one of
+        ``'networkstatus'``, ``'server'``, or ``'extrainfo'``.
+    :param str filename: The file to parse them from.
+    :raises: Anything which :func:`iterNetworkStatusFile`,
+        :func:`iterServerDescriptorsFile`, or :func:`iterExtraInfoFiles`
+        does, or :exc:`ValueError` if the **kind** is unknown.
+    :rtype: generator
+    """
+    if kind == 'networkstatus':
+        found = iterNetworkStatusFile(filename)
+    elif kind == 'server':
+        found = iterServerDescriptorsFile(filename)
+    elif kind == 'extrainfo':
+        found = iterExtraInfoFiles(filename)
+    else:
+        raise ValueError("Unknown kind of descriptor file: %r" % kind)
+
+    for descriptor in found:
+        yield DescriptorRecord(kind, descriptor)
+
+def parseDescriptorFile(job):
+    """Parse one descriptor file into :class:`DescriptorRecord`\\ s.
+
+    This may be called in a worker process, i.e. with
+    :meth:`multiprocessing.Pool.map`, so that many files are parsed at once.
+    Only the records are sent back, rather than the Stem descriptors.
+
+    :param tuple job: A 2-tuple of the kind of the descriptors, one of
+        ``'networkstatus'``, ``'server'``, or ``'extrainfo'``, and the file
+        to parse them from.
+    :raises: Anything which :func:`iterDescriptorRecords` does.
+    :rtype: list
+    :returns: A :class:`DescriptorRecord` for each descriptor in the file.
+        Any extrainfo descriptors are already deduplicated.
+    """
+    kind, filename = job
+    records = iterDescriptorRecords(kind, filename)
+
+    if kind == 'extrainfo':
+        return deduplicate(records).values()
+    return list(records)
@@ -36,6 +36,10 @@ bridgedb.parse.options
        |
        |__ MockOptions - Suboptions for creating fake bridge descriptors for
        |                 testing purposes.
+       |__ ExportRingsOptions - Suboptions for writing a snapshot of the
+       |                        hashrings for frontends.
+       |__ FrontendOptions - Suboptions for serving bridges from a snapshot
+       |                     of the hashrings.
        \__ MainOptions - Main commandline options parser for BridgeDB.
 ..
 """
@@ -265,6 +269,38 @@ class MockOptions(BaseOptions):
           (types: netstatus, extrainfo, server)''']]
 
 
+class ExportRingsOptions(BaseOptions):
+    """Suboptions for writing a snapshot of the hashrings for frontends."""
+
+    longdesc = (
+        "Parse all bridge descriptors, assign the bridges to distributors, "
+        "write a snapshot of the result, and exit.  Frontends started with "
+        "`bridgedb frontend` serve bridges from the snapshot.")
+
+    optParameters = [
+        ['output', 'o', None,
+         'Write the snapshot to this file [default: SNAPSHOT_FILE]']]
+
+
+class FrontendOptions(BaseOptions):
+    """Suboptions for serving bridges from a snapshot of the hashrings."""
+
+    longdesc = (
+        "Serve bridges over HTTPS and moat from a snapshot written by "
+        "`bridgedb export-rings` (or by a running BridgeDB, if SNAPSHOT_FILE "
+        "is set), without parsing any descriptors or using the database.  "
+        "The snapshot is checked for changes every FRONTEND_SNAPSHOT_INTERVAL "
+        "seconds, and new snapshots are swapped in once they are loaded.")
+
+    optParameters = [
+        ['snapshot', 's', None,
+         'Serve from this snapshot file [default: SNAPSHOT_FILE]'],
+        ['sockets', None, None,
+         """Serve on these listening sockets, inherited from a BridgeDB
+         with WEB_WORKERS set, as a comma-separated list of
+         FD=INTERFACE:PORT"""]]
+
+
 class SIGHUPOptions(BaseOptions):
     """Options menu to explain usage and handling of SIGHUP signals."""
 
@@ -294,5 +330,9 @@ class MainOptions(BaseOptions):
         ['reload', 'R', 'Reload bridge descriptors into running servers']]
     subCommands = [
         ['mock', None, MockOptions, "Generate a testing environment"],
+        ['export-rings', None, ExportRingsOptions,
+         "Write a snapshot of the hashrings for frontends"],
+        ['frontend', None, FrontendOptions,
+         "Serve bridges from a snapshot of the hashrings"],
         ['SIGHUP', None, SIGHUPOptions,
          "Reload bridge descriptors into running servers"]]
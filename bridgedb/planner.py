@@ -0,0 +1,303 @@
+# -*- coding: utf-8 ; test-case-name: bridgedb.test.test_planner -*-
+#
+# This file is part of BridgeDB, a Tor bridge distribution system.
+#
+# :authors: please see the AUTHORS file for attributions
+# :copyright: (c) 2007-2017, The Tor Project, Inc.
+#             (c) 2007-2017, all entities within the AUTHORS file
+# :license: see LICENSE for licensing information
+
+"""Deciding how much of BridgeDB a reload needs to redo.
+
+Before each reload, the settings in the config file, and the descriptor and
+proxy list files, are compared with those which the hashrings being served
+were built from.  Only the stages which depend on whatever changed are run:
+
+  * If only the ``LOGLEVEL`` changed, only the log level is updated.
+  * If only the proxy lists changed, only the open proxies are reloaded.
+  * If only settings which a single distributor's hashrings are built with
+    changed (e.g. ``N_IP_CLUSTERS``), only that distributor is rebuilt, from
+    the bridges which are already assigned to it.
+  * If the descriptors changed, they are reparsed, and the hashrings are
+    built from the live ones, inserting only the bridges which changed,
+    unless (with ``SKIP_UNCHANGED_RELOADS``) none of them did.
+  * If any other setting changed, including any which isn't classified in
+    this module, the hashrings are all rebuilt from scratch.
+
+Settings which only change how later reloads are done, such as
+``SKIP_UNCHANGED_RELOADS``, don't cause anything to be redone.
+
+Files are compared by their modification times and sizes, and, if those
+changed, by their digests, so that a file which was rewritten with the same
+contents doesn't cause a rebuild.
+
+.. py:module:: bridgedb.planner
+   :synopsis: Deciding how much of BridgeDB a reload needs to redo.
+
+::
+
+  bridgedb.planner
+   |_ getFileState - Get the modification time, size, and digest of a file.
+   |_ getInputs - Get everything which a reload depends on.
+   |_ planReload - Decide what a reload needs to redo.
+   \_ ReloadPlan - What a reload needs to redo, and why.
+..
+"""
+
+import hashlib
+import os
+
+
+#: Settings which only the logging depends on.
+LOGGING_SETTINGS = ('LOGLEVEL',)
+
+#: Settings which only the open proxies depend on.
+PROXY_SETTINGS = ('PROXY_LIST_FILES',)
+
+#: Settings which parsing the descriptors depends on.
+DESCRIPTOR_SETTINGS = ('BRIDGE_AUTHORITY_DIRECTORIES', 'STATUS_FILE',
+                       'BRIDGE_FILES', 'EXTRA_INFO_FILES',
+                       'IGNORE_NETWORKSTATUS', 'NO_DISTRIBUTION_COUNTRIES',
+                       'NO_DISTRIBUTION_FILE', 'COLLECT_TIMESTAMPS')
+
+#: A dictionary mapping the names of the distributors' hashrings to the
+#: settings which only that distributor is built with.
+DISTRIBUTOR_SETTINGS = {
+    'https': ('N_IP_CLUSTERS',),
+    'moat': ('MOAT_N_IP_CLUSTERS',),
+    'email': ('EMAIL_DOMAIN_MAP', 'EMAIL_DOMAIN_RULES', 'EMAIL_WHITELIST'),
+}
+
+#: Settings which all of the hashrings are built with, which decide which
+#: bridges are assigned to which distributor, or which name the files that
+#: each generation of hashrings is written to.  See
+#: :func:`bridgedb.main.getRingSettings`.
+HASHRING_SETTINGS = ('HTTPS_DIST', 'HTTPS_SHARE', 'MOAT_DIST', 'MOAT_SHARE',
+                     'EMAIL_DIST', 'EMAIL_SHARE', 'RESERVED_SHARE',
+                     'FORCE_PORTS', 'FORCE_FLAGS',
+                     'IPV4_DISTINCT_SUBNET_PREFIX',
+                     'IPV6_DISTINCT_SUBNET_PREFIX', 'MEMOIZE_RING_ANSWERS',
+                     'COMPACT_HASHRINGS', 'BUILD_RINGS_IN_BACKGROUND',
+                     'DB_FILE', 'ASSIGNMENTS_FILE', 'SNAPSHOT_FILE')
+
+#: Settings which only change how later reloads build their generation of
+#: hashrings, so that changing them doesn't need anything to be redone.
+RELOAD_SETTINGS = ('SKIP_UNCHANGED_RELOADS', 'PREBUILD_POPULAR_RINGS')
+
+
+def getFileState(filename, previous=None):
+    """Get the modification time, size, and digest of a file.
+
+    :param str filename: The file.
+    :type previous: tuple or None
+    :param previous: The state of the file when it was last looked at, if
+        known.  If its modification time and size haven't changed since, its
+        digest is reused, rather than being computed again.
+    :rtype: tuple or None
+    :returns: A 3-tuple of ``(mtime, size, digest)``, or ``None`` if the
+        file doesn't exist.
+    """
+    try:
+        info = os.stat(filename)
+    except OSError:
+        return None
+
+    if previous is not None and previous[:2] == (info.st_mtime, info.st_size):
+        return previous
+
+    digest = hashlib.sha1()
+    try:
+        with open(filename, 'rb') as fh:
+            for chunk in iter(lambda: fh.read(1 << 16), b''):
+                digest.update(chunk)
+    except IOError:
+        return None
+
+    return (info.st_mtime, info.st_size, digest.hexdigest())
+
+def _getFileStates(filenames, previous=None):
+    """Get the state of each of some files, as :func:`getFileState` does.
+
+    :rtype: dict
+    """
+    previous = previous or {}
+    return dict([(filename, getFileState(filename, previous.get(filename)))
+                 for filename in filenames])
+
+def getInputs(cfg, descriptorFiles, previous=None):
+    """Get everything which a reload depends on.
+
+    :type cfg: :class:`~bridgedb.configure.Conf`
+    :param cfg: The configuration.
+    :param list descriptorFiles: The descriptor files, and any other files
+        which parsing the descriptors depends on.
+    :type previous: dict or None
+    :param previous: The inputs of the previous reload, if known, so that
+        the digests of any files which weren't modified since are reused.
+    :rtype: dict
+    :returns: A dictionary with the values of all of the ``settings``, and
+        the states of the ``descriptors`` and ``proxies`` files, for
+        :func:`planReload`.
+    """
+    previous = previous or {}
+    return {
+        'settings': dict(vars(cfg)),
+        'descriptors': _getFileStates(descriptorFiles,
+                                      previous.get('descriptors')),
+        'proxies': _getFileStates(getattr(cfg, 'PROXY_LIST_FILES', []),
+                                  previous.get('proxies')),
+    }
+
+def _getChangedFiles(previous, current):
+    """Get the files whose contents changed, or which appeared or vanished.
+
+    :rtype: list
+    """
+    changed = []
+
+    for filename in sorted(set(previous) | set(current)):
+        old = previous.get(filename)
+        new = current.get(filename)
+        if (old is None) != (new is None) or (old and old[2] != new[2]):
+            changed.append(filename)
+
+    return changed
+
+def planReload(previous, current):
+    """Decide what a reload needs to redo.
+
+    :type previous: dict or None
+    :param previous: The :func:`getInputs` which the hashrings being served
+        were built from, or ``None`` if they're unknown, in which case
+        everything is redone.
+    :param dict current: The :func:`getInputs` for this reload.
+    :rtype: :class:`ReloadPlan`
+    """
+    plan = ReloadPlan()
+
+    if previous is None:
+        plan.rebuildAll("nothing is known about the hashrings being served")
+        return plan
+
+    names = set(previous['settings']) | set(current['settings'])
+    for name in sorted(names):
+        if (previous['settings'].get(name) ==
+                current['settings'].get(name)):
+            continue
+
+        reason = "%s changed" % name
+        owners = [ringname for ringname, settings
+                  in DISTRIBUTOR_SETTINGS.items() if name in settings]
+
+        if name in RELOAD_SETTINGS:
+            continue
+        elif name in LOGGING_SETTINGS:
+            plan.updateLogLevel(reason)
+        elif name in PROXY_SETTINGS:
+            plan.reloadProxies(reason)
+        elif name in DESCRIPTOR_SETTINGS:
+            plan.reparseDescriptors(reason)
+        elif owners:
+            for ringname in owners:
+                plan.rebuildDistributor(ringname, reason)
+        # Any other setting, including any which isn't classified above,
+        # might change how the hashrings are built:
+        else:
+            plan.rebuildAll(reason)
+
+    changed = _getChangedFiles(previous['proxies'], current['proxies'])
+    if changed:
+        plan.reloadProxies("%d proxy lists changed" % len(changed))
+
+    changed = _getChangedFiles(previous['descriptors'],
+                               current['descriptors'])
+    if changed:
+        plan.reparseDescriptors("%d descriptor files changed" % len(changed))
+
+    return plan
+
+
+class ReloadPlan(object):
+    """What a reload needs to redo, and why.
+
+    :ivar bool full: Whether all of the hashrings must be rebuilt from
+        scratch.
+    :ivar bool logLevel: Whether the log level must be updated.
+    :ivar bool proxies: Whether the open proxies must be reloaded.
+    :ivar bool descriptors: Whether the descriptors must be reparsed.
+    :ivar set distributors: The names of the distributors whose hashrings
+        must be rebuilt, from the bridges already assigned to them.
+    :ivar list reasons: Why each of the above must be redone.
+    """
+
+    def __init__(self):
+        self.full = False
+        self.logLevel = False
+        self.proxies = False
+        self.descriptors = False
+        self.distributors = set()
+        self.reasons = []
+
+    def __str__(self):
+        """Describe what will be redone, and why, for the logs."""
+        if self.full:
+            steps = ["rebuild all hashrings"]
+        else:
+            steps = []
+            if self.logLevel:
+                steps.append("update the log level")
+            if self.proxies:
+                steps.append("reload open proxies")
+            if self.descriptors and self.distributors:
+                steps.append("reparse descriptors and rebuild all hashrings")
+            elif self.descriptors:
+                steps.append("reparse descriptors")
+            elif self.distributors:
+                steps.append("rebuild the %s hashrings" %
+                             ", ".join(sorted(self.distributors)))
+
+        if not steps:
+            return "nothing to do (nothing changed)"
+        return "%s (%s)" % (", ".join(steps), "; ".join(self.reasons))
+
+    def isEmpty(self):
+        """Check whether nothing needs to be redone.
+
+        :rtype: bool
+        """
+        return not (self.full or self.logLevel or self.proxies or
+                    self.descriptors or self.distributors)
+
+    def needsNewGeneration(self):
+        """Check whether a new generation of hashrings must be built.
+
+        :rtype: bool
+        """
+        return bool(self.full or self.descriptors or self.distributors)
+
+    def rebuildAll(self, reason):
+        """Redo everything, because of some **reason**."""
+        self.full = self.logLevel = self.proxies = self.descriptors = True
+        self.reasons.append(reason)
+
+    def updateLogLevel(self, reason):
+        """Update the log level, because of some **reason**."""
+        self.logLevel = True
+        self.reasons.append(reason)
+
+    def reloadProxies(self, reason):
+        """Reload the open proxies, because of some **reason**."""
+        self.proxies = True
+        self.reasons.append(reason)
+
+    def reparseDescriptors(self, reason):
+        """Reparse the descriptors, because of some **reason**."""
+        self.descriptors = True
+        self.reasons.append(reason)
+
+    def rebuildDistributor(self, name, reason):
+        """Rebuild the hashrings of the distributor whose hashring is called
+        **name**, because of some **reason**.
+        """
+        self.distributors.add(name)
+        self.reasons.append(reason)
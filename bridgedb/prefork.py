@@ -0,0 +1,435 @@
+# -*- coding: utf-8 ; test-case-name: bridgedb.test.test_prefork -*-
+#
+# This file is part of BridgeDB, a Tor bridge distribution system.
+#
+# :authors: please see the AUTHORS file for attributions
+# :copyright: (c) 2007-2017, The Tor Project, Inc.
+#             (c) 2007-2017, all entities within the AUTHORS file
+# :license: see LICENSE for licensing information
+
+"""Serving HTTPS and moat from several worker processes at once.
+
+When ``WEB_WORKERS`` is set, the main BridgeDB process (the *master*) still
+parses the descriptors, builds the hashrings, runs the email distributor,
+and writes a :mod:`~bridgedb.snapshot` after every reload, but it doesn't
+serve HTTPS or moat itself.  Instead, it opens their listening sockets, and
+spawns ``WEB_WORKERS`` :mod:`~bridgedb.frontend` processes which inherit the
+sockets and serve from the snapshot.  The kernel spreads the incoming
+connections between the workers, so that the web distributors can use as
+many cores as there are workers.
+
+After each reload, the master sends its workers a SIGHUP, so that they load
+the new snapshot.  Workers which exit are respawned.  When the master's
+listening sockets are handed over to a new BridgeDB, it sends its workers a
+SIGUSR2, so that they stop accepting connections straight away, and only
+terminates them once they've had time to answer the ones they accepted.
+
+.. py:module:: bridgedb.prefork
+   :synopsis: Serving HTTPS and moat from several worker processes at once.
+
+::
+
+  bridgedb.prefork
+   |_ getWebAddresses - Get the addresses which the HTTPS and moat servers
+   |                    listen on.
+   |_ bindSocket - Open a listening socket for workers to inherit.
+   |_ formatSockets - Describe listening sockets, for a worker's commandline.
+   |_ parseSockets - Parse a worker's description of its inherited sockets.
+   |_ inheritSockets - Make listenTCP() and listenSSL() use inherited sockets.
+   |_ inheritDescriptors - Make listenTCP() and listenSSL() use inherited
+   |                       file descriptors.
+   |_ closeInherited - Close any inherited sockets which we haven't used.
+   |_ listenTCP - Listen for TCP connections, on an inherited socket if
+   |              there is one for the address.
+   |_ listenSSL - Listen for TLS connections, on an inherited socket if
+   |              there is one for the address.
+   |_ getListening - Get all of our listening sockets.
+   |_ stopAccepting - Stop accepting connections on our listening sockets.
+   |_ stopListening - Stop listening on our listening sockets.
+   |_ startWorkers - Open the listening sockets and spawn the workers.
+   |
+   |_ WorkerProcessProtocol - Tells a WorkerPool when a worker exits.
+   \_ WorkerPool - Spawns, signals, and respawns worker processes.
+..
+"""
+
+import logging
+import os
+import socket
+import sys
+
+from twisted.internet import defer
+from twisted.internet import protocol
+from twisted.internet import reactor
+from twisted.internet.error import CannotListenError
+from twisted.internet.error import ProcessExitedAlready
+from twisted.protocols.tls import TLSMemoryBIOFactory
+
+
+#: A dictionary mapping the ``(interface, port)`` addresses of any listening
+#: sockets which we inherited from a master process, or which were handed
+#: over to us by a :mod:`~bridgedb.handover`, to their file descriptors.  See
+#: :func:`inheritSockets`.
+_inherited = {}
+
+#: A dictionary mapping the ``(interface, port)`` addresses of all of the
+#: sockets which we listen on to the
+#: :api:`twisted.internet.interfaces.IListeningPort`\\ s, or, for the
+#: sockets which our workers accept connections on, the
+#: :class:`socket.socket`\\ s.  See :func:`getListening`.
+_listening = {}
+
+
+def getWebAddresses(cfg):
+    """Get the addresses which the HTTPS and moat servers listen on.
+
+    :type cfg: :class:`~bridgedb.configure.Conf`
+    :param cfg: The current configuration.
+    :rtype: list
+    :returns: A list of ``(interface, port)`` 2-tuples.
+    """
+    addresses = []
+
+    if cfg.HTTPS_DIST and cfg.HTTPS_SHARE:
+        if cfg.HTTP_UNENCRYPTED_PORT:
+            addresses.append((cfg.HTTP_UNENCRYPTED_BIND_IP or "",
+                              cfg.HTTP_UNENCRYPTED_PORT))
+        if cfg.HTTPS_PORT:
+            addresses.append((cfg.HTTPS_BIND_IP or "", cfg.HTTPS_PORT))
+
+    if cfg.MOAT_DIST and cfg.MOAT_SHARE:
+        if cfg.MOAT_HTTP_PORT:
+            addresses.append((cfg.MOAT_HTTP_IP or "", cfg.MOAT_HTTP_PORT))
+        if cfg.MOAT_HTTPS_PORT:
+            addresses.append((cfg.MOAT_HTTPS_IP or "", cfg.MOAT_HTTPS_PORT))
+
+    return addresses
+
+def _getAddressFamily(interface):
+    """Get the address family of an **interface** to listen on."""
+    if ':' in interface:
+        return socket.AF_INET6
+    return socket.AF_INET
+
+def bindSocket(interface, port, backlog=50):
+    """Open a listening socket, in the same way that
+    :api:`twisted.internet.interfaces.IReactorTCP.listenTCP` would, for
+    worker processes to inherit.
+
+    :param str interface: The IP address to listen on, or ``""`` for all
+        IPv4 addresses.
+    :param int port: The port to listen on.
+    :param int backlog: The size of the listen queue.
+    :raises: :exc:`socket.error` if we couldn't listen.
+    :rtype: :class:`socket.socket`
+    """
+    sock = socket.socket(_getAddressFamily(interface), socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((interface, port))
+    sock.listen(backlog)
+    sock.setblocking(False)
+    return sock
+
+def formatSockets(sockets):
+    """Describe some listening **sockets**, for a worker's commandline.
+
+    :param dict sockets: A dictionary mapping ``(interface, port)``
+        addresses to :class:`socket.socket`\\ s.
+    :rtype: str
+    :returns: A comma-separated list of ``FD=INTERFACE:PORT`` items.
+    """
+    return ",".join(["%d=%s:%d" % (sock.fileno(), interface, port)
+                     for (interface, port), sock in sorted(sockets.items())])
+
+def parseSockets(description):
+    """Parse a description of inherited sockets from :func:`formatSockets`.
+
+    :param str description: A comma-separated list of ``FD=INTERFACE:PORT``
+        items.
+    :raises: :exc:`ValueError` if the **description** is malformed.
+    :rtype: dict
+    :returns: A dictionary mapping ``(interface, port)`` addresses to file
+        descriptors.
+    """
+    sockets = {}
+
+    for item in description.split(","):
+        if not item:
+            continue
+        fd, address = item.split("=", 1)
+        interface, port = address.rsplit(":", 1)
+        sockets[(interface, int(port))] = int(fd)
+
+    return sockets
+
+def inheritSockets(description):
+    """Make :func:`listenTCP` and :func:`listenSSL` use the listening sockets
+    which we inherited from a master process.
+
+    :param str description: A description of the sockets, from
+        :func:`formatSockets`.
+    """
+    inheritDescriptors(parseSockets(description))
+
+def inheritDescriptors(descriptors):
+    """Make :func:`listenTCP`, :func:`listenSSL`, and :func:`startWorkers`
+    use listening sockets which were passed to us as file descriptors.
+
+    :param dict descriptors: A dictionary mapping ``(interface, port)``
+        addresses to file descriptors.
+    """
+    _inherited.clear()
+    _inherited.update(descriptors)
+
+def closeInherited():
+    """Close the file descriptors of all of our inherited sockets.
+
+    This should be called once all of our servers are started, since any
+    inherited sockets which they use were duplicated, and any others aren't
+    needed anymore.
+    """
+    for fd in _inherited.values():
+        try:
+            os.close(fd)
+        except OSError:  # pragma: no cover
+            pass
+    _inherited.clear()
+
+def getListening():
+    """Get all of the sockets which we listen on, or which our workers
+    accept connections on.
+
+    :rtype: dict
+    :returns: A dictionary mapping ``(interface, port)`` addresses to
+        objects with a ``fileno()`` method.
+    """
+    return dict(_listening)
+
+def stopAccepting():
+    """Stop accepting connections on all of our listening sockets, without
+    closing them, e.g. because another process now accepts them.
+    """
+    for listener in _listening.values():
+        stopReading = getattr(listener, 'stopReading', None)
+        if stopReading is not None:
+            stopReading()
+
+def stopListening():
+    """Stop listening on, and close, all of our listening sockets, e.g.
+    because we are a worker, and our master handed them over to a new
+    BridgeDB.  Any connections which we already accepted are kept open.
+
+    :rtype: :api:`twisted.internet.defer.Deferred`
+    :returns: A deferred which fires once all of the sockets are closed.
+    """
+    stopped = []
+
+    for address, listener in list(_listening.items()):
+        stopListening = getattr(listener, 'stopListening', None)
+        if stopListening is not None:
+            logging.info("Stopped listening on %s:%d." % address)
+            stopped.append(defer.maybeDeferred(stopListening))
+            del _listening[address]
+
+    return defer.gatherResults(stopped)
+
+def listenTCP(port, factory, interface=''):
+    """Listen for TCP connections on an inherited socket, if there is one
+    for the address, otherwise with
+    :api:`twisted.internet.interfaces.IReactorTCP.listenTCP`.
+
+    :rtype: :api:`twisted.internet.interfaces.IListeningPort`
+    """
+    fd = _inherited.get((interface, port))
+    if fd is None:
+        listener = reactor.listenTCP(port, factory, interface=interface)
+    else:
+        listener = reactor.adoptStreamPort(fd, _getAddressFamily(interface),
+                                           factory)
+    _listening[(interface, port)] = listener
+    return listener
+
+def listenSSL(port, factory, contextFactory, interface=''):
+    """Listen for TLS connections on an inherited socket, if there is one
+    for the address, otherwise with
+    :api:`twisted.internet.interfaces.IReactorSSL.listenSSL`.
+
+    :rtype: :api:`twisted.internet.interfaces.IListeningPort`
+    """
+    fd = _inherited.get((interface, port))
+    if fd is None:
+        listener = reactor.listenSSL(port, factory, contextFactory,
+                                     interface=interface)
+    else:
+        listener = reactor.adoptStreamPort(
+            fd, _getAddressFamily(interface),
+            TLSMemoryBIOFactory(contextFactory, False, factory))
+    _listening[(interface, port)] = listener
+    return listener
+
+def startWorkers(cfg, options, reactor=reactor):
+    """Open the HTTPS and moat servers' listening sockets, or use the ones
+    which were handed over to us, and spawn ``cfg.WEB_WORKERS`` worker
+    processes to serve on them.
+
+    :type cfg: :class:`~bridgedb.configure.Conf`
+    :param cfg: The current configuration.
+    :type options: :class:`~bridgedb.parse.options.MainOptions`
+    :param options: The options which we were started with.
+    :raises SystemExit: if the sockets couldn't be opened.
+    :rtype: :class:`WorkerPool`
+    """
+    sockets = {}
+
+    for interface, port in getWebAddresses(cfg):
+        fd = _inherited.get((interface, port))
+        try:
+            if fd is None:
+                sock = bindSocket(interface, port)
+            else:
+                sock = socket.fromfd(fd, _getAddressFamily(interface),
+                                     socket.SOCK_STREAM)
+        except socket.error as error:
+            raise SystemExit(CannotListenError(interface, port, error))
+        sockets[(interface, port)] = _listening[(interface, port)] = sock
+        logging.info("Listening on %s:%d for workers." % (interface, port))
+
+    args = [sys.executable, os.path.abspath(sys.argv[0]),
+            '--rundir', options['rundir'], '--config', options['config'],
+            'frontend', '--snapshot', cfg.SNAPSHOT_FILE,
+            '--sockets', formatSockets(sockets)]
+
+    pool = WorkerPool(args, sockets, cfg.WEB_WORKERS, reactor)
+    pool.start()
+    reactor.addSystemEventTrigger('before', 'shutdown', pool.stop)
+
+    return pool
+
+
+class WorkerProcessProtocol(protocol.ProcessProtocol):
+    """Tells a :class:`WorkerPool` when one of its workers exits."""
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.started = pool.reactor.seconds()
+
+    def processEnded(self, reason):
+        self.pool.workerEnded(self, reason)
+
+
+class WorkerPool(object):
+    """Spawns, signals, and respawns worker processes.
+
+    :ivar list args: The worker's executable, followed by its arguments.
+    :ivar dict sockets: The listening sockets which the workers inherit, as
+        a dictionary mapping ``(interface, port)`` addresses to
+        :class:`socket.socket`\\ s.
+    :ivar int count: The number of workers to keep running.
+    :ivar set workers: The :class:`WorkerProcessProtocol`\\ s of the running
+        workers.
+    :ivar bool stopping: Whether we are stopping, in which case workers
+        aren't respawned.
+    :ivar int failures: The number of workers in a row which exited within
+        :data:`minUptime` seconds of being spawned.
+    """
+
+    #: How long (in seconds) to wait before respawning a worker which exited.
+    #: This is doubled for each worker in a row which exited too quickly.
+    respawnDelay = 1
+    #: The longest (in seconds) to ever wait before respawning a worker.
+    maxRespawnDelay = 300
+    #: How long (in seconds) a worker must run for, for its exit to not be
+    #: counted as a failure to start.
+    minUptime = 10
+    #: How many failures to start in a row to log as errors.
+    maxFailures = 5
+
+    def __init__(self, args, sockets, count, reactor=reactor):
+        self.args = args
+        self.sockets = sockets
+        self.count = count
+        self.reactor = reactor
+        self.workers = set()
+        self.stopping = False
+        self.failures = 0
+
+        self.childFDs = {0: 0, 1: 1, 2: 2}
+        for sock in sockets.values():
+            self.childFDs[sock.fileno()] = sock.fileno()
+
+    def start(self):
+        """Spawn :data:`count` workers."""
+        for _ in range(self.count):
+            self.spawn()
+
+    def spawn(self):
+        """Spawn a worker, unless we are stopping."""
+        if self.stopping:
+            return
+
+        worker = WorkerProcessProtocol(self)
+        self.reactor.spawnProcess(worker, self.args[0], self.args,
+                                  env=os.environ, childFDs=self.childFDs)
+        self.workers.add(worker)
+        logging.info("Spawned worker process %s." % worker.transport.pid)
+
+    def signal(self, signalName):
+        """Send all of the running workers a signal.
+
+        :param str signalName: The signal's name without the ``SIG``, e.g.
+            ``'HUP'``.
+        """
+        for worker in list(self.workers):
+            try:
+                worker.transport.signalProcess(signalName)
+            except ProcessExitedAlready:
+                pass
+
+    def drain(self):
+        """Tell all of the workers to stop accepting connections, but to keep
+        answering the ones they accepted, and don't respawn them.
+        """
+        self.stopping = True
+        self.signal('USR2')
+
+    def stop(self):
+        """Stop all of the workers, and don't respawn them."""
+        self.stopping = True
+        self.signal('TERM')
+
+    def getRespawnDelay(self):
+        """Get how long to wait before respawning a worker, backing off
+        exponentially while workers keep failing to start.
+
+        :rtype: int
+        """
+        if not self.failures:
+            return self.respawnDelay
+        return min(self.respawnDelay * 2 ** (self.failures - 1),
+                   self.maxRespawnDelay)
+
+    def workerEnded(self, worker, reason):
+        """Called when a **worker** exits, to respawn it (after
+        :meth:`getRespawnDelay` seconds) unless we are stopping.
+
+        :type reason: :api:`twisted.python.failure.Failure`
+        """
+        self.workers.discard(worker)
+        if self.stopping:
+            return
+
+        if self.reactor.seconds() - worker.started < self.minUptime:
+            self.failures += 1
+        else:
+            self.failures = 0
+        delay = self.getRespawnDelay()
+
+        if self.failures >= self.maxFailures:
+            logging.error(("%d worker processes in a row exited within %ds of "
+                           "starting (last: %s)! Respawning in %ds.")
+                          % (self.failures, self.minUptime,
+                             reason.getErrorMessage(), delay))
+        else:
+            logging.warn("Worker process exited: %s" %
+                         reason.getErrorMessage())
+        self.reactor.callLater(delay, self.spawn)
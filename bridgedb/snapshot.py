@@ -0,0 +1,164 @@
+# -*- coding: utf-8 ; test-case-name: bridgedb.test.test_snapshot -*-
+#
+# This file is part of BridgeDB, a Tor bridge distribution system.
+#
+# :authors: please see the AUTHORS file for attributions
+# :copyright: (c) 2007-2017, The Tor Project, Inc.
+#             (c) 2007-2017, all entities within the AUTHORS file
+# :license: see LICENSE for licensing information
+
+"""Snapshots of the bridges in the hashrings, for warm restarts and for
+read-only distribution frontends.
+
+After each successful reload, the bridges which were inserted into the
+hashrings, and the distributors they were assigned to, are dumped to a
+snapshot file.  When BridgeDB is next started, if the hashrings would be
+created in the same way, they can be built from the snapshot, so that
+BridgeDB begins serving without first reparsing all of the bridge
+descriptors.  A snapshot is also all that a :mod:`~bridgedb.frontend` needs
+to serve bridges.
+
+A snapshot file is a header line, containing :data:`SNAPSHOT_MAGIC`,
+:data:`SNAPSHOT_VERSION`, and a hex-encoded HMAC of the rest of the file,
+followed by a pickle.  The HMAC is keyed by the hashring master key, so a
+snapshot is only ever unpickled if it was written by a BridgeDB with the
+same key, and wasn't changed since.
+"""
+
+import copy
+import logging
+import os
+import time
+
+try:
+    import cPickle as pickle
+except (ImportError, NameError):  # pragma: no cover
+    import pickle
+
+from bridgedb import crypto
+
+
+#: The version of the snapshot format.  Snapshots with any other version are
+#: ignored.
+SNAPSHOT_VERSION = 3
+
+#: The start of the first line of every snapshot file.
+SNAPSHOT_MAGIC = b"bridgedb-snapshot"
+
+
+class SnapshotError(Exception):
+    """Raised when a snapshot can't be used."""
+
+
+def getDigest(key, payload):
+    """Get the HMAC of a snapshot's **payload**, with a key derived from the
+    hashring master **key**.
+
+    :param bytes key: The hashring master key.
+    :param bytes payload: The pickled snapshot.
+    :rtype: str
+    :returns: The hex-encoded HMAC.
+    """
+    return crypto.getHMACFunc(crypto.getHMAC(key, "Snapshot-Key"))(payload)
+
+def _stripBridge(bridge):
+    """Get a copy of a **bridge** without its parsed descriptors, which
+    aren't used by the hashrings and would take up most of the snapshot.
+
+    :type bridge: :class:`~bridgedb.bridges.Bridge`
+    :rtype: :class:`~bridgedb.bridges.Bridge`
+    """
+    stripped = copy.copy(bridge)
+    stripped.descriptors = dict.fromkeys(bridge.descriptors)
+    return stripped
+
+def dump(filename, settings, key, bridges, assignments=None, proxies=None):
+    """Write a snapshot of some **bridges** to **filename**.
+
+    The snapshot is written to a temporary file first, and then moved into
+    place, so that a partially-written snapshot is never loaded, and so that
+    anything reading the previous snapshot keeps reading it.
+
+    :param str filename: The file to write the snapshot to.
+    :param tuple settings: The settings which the hashrings were created
+        with, i.e. as returned by :func:`bridgedb.main.getRingSettings`.
+    :param bytes key: The hashring master key.
+    :param list bridges: The :class:`~bridgedb.bridges.Bridge`s which were
+        inserted into the hashrings.
+    :param dict assignments: A dictionary mapping the fingerprints of the
+        **bridges** to the names of the rings they were assigned to, i.e. as
+        kept in :data:`bridgedb.Bridges.BridgeSplitter.assignments`.
+    :type proxies: :class:`~bridgedb.proxy.ProxySet` or None
+    :param proxies: The open proxies which the hashrings were created with.
+    :raises: :exc:`IOError` or :exc:`OSError` if the file couldn't be
+        written.
+    """
+    snapshot = {
+        'created': time.time(),
+        'settings': settings,
+        'bridges': [_stripBridge(bridge) for bridge in bridges],
+        'assignments': assignments or {},
+        'proxies': dict([(ip, proxies.getTag(ip)) for ip in proxies or []]),
+    }
+    payload = pickle.dumps(snapshot, pickle.HIGHEST_PROTOCOL)
+    temporary = filename + ".new"
+
+    # The snapshot contains all of the bridges' addresses, so it should only
+    # be readable by us:
+    fd = os.open(temporary, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'wb') as fh:
+        fh.write(b"%s %d %s\n" % (SNAPSHOT_MAGIC, SNAPSHOT_VERSION,
+                                  getDigest(key, payload)))
+        fh.write(payload)
+    os.rename(temporary, filename)
+
+    logging.info("Wrote snapshot of %d bridges to '%s'." %
+                 (len(bridges), filename))
+
+def load(filename, settings, key, proxies=None):
+    """Read the bridges from a snapshot written by :func:`dump`.
+
+    :param str filename: The file to read the snapshot from.
+    :param tuple settings: The settings which the hashrings are going to be
+        created with.  The snapshot is only used if they are the same as the
+        ones it was written with.
+    :param bytes key: The hashring master key.
+    :type proxies: :class:`~bridgedb.proxy.ProxySet` or None
+    :param proxies: If given, the open proxies which the hashrings were
+        created with are added to these.
+    :raises SnapshotError: If the snapshot is missing, unreadable, from a
+        different version, was changed since it was written, or was written
+        with different settings or a different master key.
+    :rtype: tuple
+    :returns: A 2-tuple of the :class:`~bridgedb.bridges.Bridge`s in the
+        snapshot, and a dictionary mapping their fingerprints to the names of
+        the rings they were assigned to.
+    """
+    try:
+        with open(filename, 'rb') as fh:
+            header = fh.readline().split()
+            payload = fh.read()
+    except (IOError, OSError) as error:
+        raise SnapshotError("Couldn't read snapshot '%s': %s" %
+                            (filename, error))
+
+    if (len(header) != 3 or
+            header[:2] != [SNAPSHOT_MAGIC, str(SNAPSHOT_VERSION)]):
+        raise SnapshotError("Snapshot '%s' has an unknown format." % filename)
+    if header[2] != getDigest(key, payload):
+        raise SnapshotError("Snapshot '%s' is corrupt, or was written with a "
+                            "different master key." % filename)
+
+    snapshot = pickle.loads(payload)
+
+    if snapshot['settings'] != settings:
+        raise SnapshotError("Snapshot '%s' was written with different "
+                            "hashring settings." % filename)
+    if proxies is not None:
+        proxies.addProxies(snapshot['proxies'])
+
+    logging.info("Read snapshot of %d bridges from '%s', written %s." %
+                 (len(snapshot['bridges']), filename,
+                  time.strftime("%Y-%m-%d %H:%M:%S",
+                                time.localtime(snapshot['created']))))
+    return snapshot['bridges'], snapshot['assignments']
@@ -0,0 +1,225 @@
+# -*- coding: utf-8 ; test-case-name: bridgedb.test.test_supervisor -*-
+#
+# This file is part of BridgeDB, a Tor bridge distribution system.
+#
+# :authors: please see the AUTHORS file for attributions
+# :copyright: (c) 2007-2017, The Tor Project, Inc.
+#             (c) 2007-2017, all entities within the AUTHORS file
+# :license: see LICENSE for licensing information
+
+"""Running reloads one at a time, and reporting on their progress.
+
+Reloads are requested whenever BridgeDB receives a SIGHUP, which might
+happen several times in quick succession, e.g. when the descriptors are
+updated while an operator is also reloading BridgeDB.  A
+:class:`ReloadSupervisor` runs at most one reload at a time, in a thread,
+and coalesces all of the requests which arrive while it is running into a
+single reload afterwards.
+
+Each reload reports the stages it goes through to its supervisor.  If any
+stage fails, the reload is abandoned, and the distributors keep serving from
+the previous generation of hashrings.  The supervisor's
+:meth:`~ReloadSupervisor.getStatus` is served by the ``/ready`` and
+``/health`` resources of the web servers.  Since those are public, only
+whether we're ready, the generation, and whether a reload is running are
+shown, unless ``HEALTH_DETAILS`` is enabled.
+"""
+
+import logging
+import time
+
+from twisted.internet import reactor
+from twisted.internet import threads
+
+
+class ReloadSupervisor(object):
+    """Runs reloads in a thread, one at a time, and keeps track of the
+    generation of hashrings which is being served.
+
+    :ivar reloadFn: The function which reloads BridgeDB.  It is called in a
+        thread, with no arguments, and should call :meth:`stage` as it goes,
+        and :meth:`published` once a new generation is being served.
+    :ivar bool running: Whether a reload is running.
+    :ivar bool pending: Whether another reload was requested while one was
+        running, in which case it will be run once the current one finishes.
+    :ivar int generation: The number of the generation of hashrings which is
+        being served, or ``0`` if none are yet.
+    :ivar dict bridges: A dictionary mapping the names of the hashrings in
+        the current generation to the number of bridges in each.
+    :ivar lastReload: The time at which the current generation started
+        being served, or ``None``.
+    :ivar plan: A description of what the current, or most recent, reload
+        decided to redo, or ``None``.  See :mod:`bridgedb.planner`.
+    :ivar list stages: A list of ``(name, seconds)`` 2-tuples, for each
+        finished stage of the current, or most recent, reload.
+    :ivar currentStage: A ``(name, startTime)`` 2-tuple for the stage which
+        the running reload is in, or ``None``.
+    :ivar lastError: The name of the stage in which the most recent reload
+        failed, or ``None`` if it succeeded.  The error itself is only
+        logged.
+    :ivar int reloads: The number of reloads which were run.
+    :ivar int failures: The number of reloads which failed.
+    :ivar int coalesced: The number of requested reloads which were merged
+        into another.
+    """
+
+    def __init__(self, reloadFn, reactor=reactor):
+        self.reloadFn = reloadFn
+        self.reactor = reactor
+        self.running = False
+        self.pending = False
+        self.generation = 0
+        self.bridges = {}
+        self.lastReload = None
+        self.plan = None
+        self.stages = []
+        self.currentStage = None
+        self.lastError = None
+        self.reloads = 0
+        self.failures = 0
+        self.coalesced = 0
+
+    def request(self):
+        """Ask for a reload.  If one is already running, another is run once
+        it has finished, no matter how many times this is called meanwhile.
+
+        This must be called from the reactor thread.
+
+        :rtype: :api:`twisted.internet.defer.Deferred` or None
+        :returns: A deferred which fires once the reload has finished, or
+            ``None`` if the reload was coalesced with a pending one.
+        """
+        if self.running:
+            if self.pending:
+                self.coalesced += 1
+            self.pending = True
+            logging.info("A reload is already running; reloading again once "
+                         "it has finished.")
+            return None
+
+        self.running = True
+        self.pending = False
+        self.reloads += 1
+        self.plan = None
+        self.stages = []
+        self.currentStage = None
+
+        d = threads.deferToThreadPool(self.reactor,
+                                      self.reactor.getThreadPool(),
+                                      self.reloadFn)
+        d.addCallbacks(self._reloadSucceeded, self._reloadFailed)
+        d.addBoth(self._reloadFinished)
+        return d
+
+    def runNow(self, *args, **kwargs):
+        """Run a reload in the current thread, e.g. while starting up, with
+        any arguments given.  Unlike with :meth:`request`, any error is
+        raised.
+
+        :returns: Whatever :data:`reloadFn` returned.
+        """
+        self.running = True
+        self.reloads += 1
+        self.plan = None
+        self.stages = []
+
+        try:
+            return self.reloadFn(*args, **kwargs)
+        finally:
+            self._finishStage()
+            self.running = False
+
+    def stage(self, name):
+        """Record that the running reload has started a new stage, finishing
+        the previous one.
+
+        :param str name: The stage's name.
+        """
+        self._finishStage()
+        self.currentStage = (name, time.time())
+        logging.info("Reloading: %s..." % name)
+
+    def planned(self, plan):
+        """Record what the running reload decided to redo.
+
+        :param str plan: A description of the reload's plan.
+        """
+        self.plan = plan
+        logging.info("Reload plan: %s" % plan)
+
+    def _finishStage(self):
+        """Record how long the current stage took, if there is one."""
+        if self.currentStage is not None:
+            name, started = self.currentStage
+            self.stages.append((name, time.time() - started))
+            self.currentStage = None
+
+    def published(self, generation, bridges):
+        """Record that a new **generation** of hashrings is being served.
+
+        :param int generation: The generation's number.
+        :param dict bridges: A dictionary mapping the names of the
+            generation's hashrings to the number of bridges in each.
+        """
+        self.generation = generation
+        self.bridges = bridges
+        self.lastReload = time.time()
+        logging.info("Now serving generation %d of the hashrings." %
+                     generation)
+
+    def _reloadSucceeded(self, result):
+        self._finishStage()
+        self.lastError = None
+        logging.info("Reload finished in %.2f seconds." %
+                     sum([seconds for _, seconds in self.stages]))
+
+    def _reloadFailed(self, failure):
+        current = self.currentStage
+        stage = current[0] if current else None
+        self._finishStage()
+        self.failures += 1
+        self.lastError = stage
+        logging.error("Reload failed while %s: %s" %
+                      (stage, failure.getTraceback()))
+        logging.warn("Still serving generation %d of the hashrings." %
+                     self.generation)
+
+    def _reloadFinished(self, result):
+        self.running = False
+        if self.pending:
+            self.request()
+
+    def getStatus(self, detailed=False):
+        """Get a summary of the generation being served and of the most
+        recent reload, which is cheap enough to be polled frequently.
+
+        :param bool detailed: If ``True``, also include the number of bridges
+            in each hashring, and the plan, stages, and outcome of the most
+            recent reload.  These describe how BridgeDB is run, so they
+            shouldn't be shown to just anyone.
+        :rtype: dict
+        """
+        status = {
+            'ready': self.generation > 0,
+            'generation': self.generation,
+            'reloading': self.running,
+        }
+        if not detailed:
+            return status
+
+        # The reload thread may finish the current stage at any time:
+        current = self.currentStage
+
+        status.update({
+            'bridges': self.bridges,
+            'lastReload': self.lastReload,
+            'pending': self.pending,
+            'plan': self.plan,
+            'stage': current[0] if current else None,
+            'stages': self.stages,
+            'lastError': self.lastError,
+            'reloads': self.reloads,
+            'failures': self.failures,
+            'coalesced': self.coalesced,
+        })
+        return status
@@ -49,6 +49,7 @@ GIMP_CAPTCHA_RSA_KEYFILE = 'captcha_rsa_key'
 CSP_ENABLED = True
 CSP_REPORT_ONLY = True
 CSP_INCLUDE_SELF = True
+HEALTH_DETAILS = False
 
 TEST_CONFIG_FILE = io.StringIO(unicode("""\
 SERVER_PUBLIC_FQDN = %r
@@ -76,6 +77,7 @@ GIMP_CAPTCHA_RSA_KEYFILE = %r
 CSP_ENABLED = %r
 CSP_REPORT_ONLY = %r
 CSP_INCLUDE_SELF = %r
+HEALTH_DETAILS = %r
 """ % (SERVER_PUBLIC_FQDN,
        SERVER_PUBLIC_EXTERNAL_IP,
        HTTPS_DIST,
@@ -100,7 +102,8 @@ CSP_INCLUDE_SELF = %r
        GIMP_CAPTCHA_RSA_KEYFILE,
        CSP_ENABLED,
        CSP_REPORT_ONLY,
-       CSP_INCLUDE_SELF)))
+       CSP_INCLUDE_SELF,
+       HEALTH_DETAILS)))
 
 
 def _createConfig(configFile=TEST_CONFIG_FILE):
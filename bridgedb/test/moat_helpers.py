@@ -47,6 +47,7 @@ MOAT_N_IP_CLUSTERS = 4
 MOAT_ROTATION_PERIOD = "3 hours"
 MOAT_GIMP_CAPTCHA_HMAC_KEYFILE = 'moat_captcha_hmac_key'
 MOAT_GIMP_CAPTCHA_RSA_KEYFILE = 'moat_captcha_rsa_key'
+HEALTH_DETAILS = False
 
 TEST_CONFIG_FILE = io.StringIO(unicode("""\
 GIMP_CAPTCHA_DIR = %r
@@ -69,6 +70,7 @@ MOAT_N_IP_CLUSTERS = %r
 MOAT_ROTATION_PERIOD = %r
 MOAT_GIMP_CAPTCHA_HMAC_KEYFILE = %r
 MOAT_GIMP_CAPTCHA_RSA_KEYFILE = %r
+HEALTH_DETAILS = %r
 """ % (GIMP_CAPTCHA_DIR,
        SERVER_PUBLIC_FQDN,
        SUPPORTED_TRANSPORTS,
@@ -88,7 +90,8 @@ MOAT_GIMP_CAPTCHA_RSA_KEYFILE = %r
        MOAT_N_IP_CLUSTERS,
        MOAT_ROTATION_PERIOD,
        MOAT_GIMP_CAPTCHA_HMAC_KEYFILE,
-       MOAT_GIMP_CAPTCHA_RSA_KEYFILE)))
+       MOAT_GIMP_CAPTCHA_RSA_KEYFILE,
+       HEALTH_DETAILS)))
 
 def _createConfig(configFile=TEST_CONFIG_FILE):
     configuration = {}
@@ -13,14 +13,21 @@
 
 from __future__ import print_function
 
+import bisect
 import copy
 import io
 import ipaddr
 import logging
+import multiprocessing
+import os
+import time
 
 from twisted.trial import unittest
 
 from bridgedb import Bridges
+from bridgedb import Storage
+from bridgedb import crypto
+from bridgedb import filters
 from bridgedb.test import util
 
 # For additional logger output for debugging, comment out the following:
@@ -29,6 +36,79 @@ logging.disable(50)
 #Bridges.logging.getLogger().setLevel(10)
 
 
+class PlacementTableTests(unittest.TestCase):
+    """Unittests for :class:`bridgedb.Bridges.PlacementTable`."""
+
+    def setUp(self):
+        self.table = Bridges.PlacementTable()
+        self.identities = [b.identity for b in util.generateFakeBridges()[:5]]
+
+    def test_getPositionFunc(self):
+        """The position functions from a PlacementTable should give the same
+        results as the HMAC functions from crypto.getHMACFunc().
+        """
+        position = self.table.getPositionFunc('fake-key')
+        hmac = crypto.getHMACFunc('fake-key', False)
+        for identity in self.identities:
+            self.assertEqual(position(identity), hmac(identity))
+            self.assertEqual(position(identity), hmac(identity))
+
+    def test_getPositionFunc_shared(self):
+        """Each identity should be HMACed once, and its position should be
+        shared by every function for the same key.
+        """
+        first = self.table.getPositionFunc('fake-key')
+        second = self.table.getPositionFunc('fake-key')
+        identity = self.identities[0]
+
+        position = first(identity)
+        self.assertIs(second(identity), position)
+        self.assertEqual(len(self.table), 1)
+        self.assertEqual(self.table.placements[identity][2],
+                         ('fake-key', position))
+
+        other = self.table.getPositionFunc('other-key')
+        self.assertEqual(other(identity),
+                         crypto.getHMACFunc('other-key', False)(identity))
+
+    def test_getSubringFunc(self):
+        """The subring functions from a PlacementTable should place bridges
+        in the same subrings as the HMAC of their identity does, and remember
+        them.
+        """
+        hmac = crypto.getHMACFunc('fake-key', True)
+        subring = self.table.getSubringFunc(hmac, 3)
+        self.assertIs(self.table.getSubringFunc(hmac, 3), subring)
+
+        for identity in self.identities:
+            self.assertEqual(subring(identity),
+                             int(hmac(identity)[:8], 16) % 3)
+            self.assertEqual(self.table.placements[identity][1][1],
+                             subring(identity))
+
+        other = self.table.getSubringFunc(
+            crypto.getHMACFunc('fake-key', True), 4)
+        for identity in self.identities:
+            self.assertEqual(other(identity),
+                             int(hmac(identity)[:8], 16) % 4)
+
+    def test_setPool(self):
+        """The pool a bridge was assigned to should be kept along with the
+        rest of its placement.
+        """
+        position = self.table.getPositionFunc('fake-key')
+        position(self.identities[0])
+        self.table.setPool(self.identities[0], 'https')
+        self.table.setPool(self.identities[1], 'email')
+
+        self.assertEqual(self.table.getPool(self.identities[0]), 'https')
+        self.assertIsNone(self.table.getPool(self.identities[2]))
+        self.assertEqual(self.table.getPools(),
+                         {self.identities[0]: 'https',
+                          self.identities[1]: 'email'})
+        self.assertIsNotNone(self.table.placements[self.identities[0]][2])
+
+
 class BridgeRingTests(unittest.TestCase):
     """Unittests for :class:`bridgedb.Bridges.BridgeRing`."""
 
@@ -95,6 +175,222 @@ class BridgeRingTests(unittest.TestCase):
         bridges = self.ring.getBridges('a' * Bridges.DIGEST_LEN, N=3, filterBySubnet=True)
         self.assertEqual(len(bridges), 3)
 
+    def test_getBridges_filterBySubnet_clustered(self):
+        """When almost all of the bridges are in the same subnet, getBridges()
+        should keep walking the hashring until it finds enough bridges in
+        distinct subnets.
+        """
+        self.addBridgesFromSameSubnet()
+        bridges = copy.deepcopy(util.generateFakeBridges()[:2])
+        bridges[0].address = ipaddr.IPAddress("6.6.6.6")
+        bridges[1].address = ipaddr.IPAddress("7.7.7.7")
+        [self.ring.insert(bridge) for bridge in bridges]
+
+        answer = self.ring.getBridges('a' * Bridges.DIGEST_LEN, N=3,
+                                      filterBySubnet=True)
+
+        self.assertEqual(len(answer), 3)
+        self.assertEqual(len(set([str(b.address).split('.')[0]
+                                  for b in answer])), 3)
+        self.assertGreater(self.ring.lastSubnetWalk, 6)
+
+    def test_getBridges_filterBySubnet_exhausted(self):
+        """If there aren't enough bridges in distinct subnets in the whole
+        hashring, getBridges() should return as many as there are, after
+        walking the whole hashring.
+        """
+        self.addBridgesFromSameSubnet()
+        answer = self.ring.getBridges('a' * Bridges.DIGEST_LEN, N=3,
+                                      filterBySubnet=True)
+
+        self.assertEqual(len(answer), 1)
+        self.assertEqual(self.ring.lastSubnetWalk, len(self.ring))
+
+    def test_filterDistinctSubnets_prefix(self):
+        """Bridges should only be filtered out if they are within the same
+        subnet of the configured prefix length.
+        """
+        params = Bridges.BridgeRingParameters(ipv4SubnetPrefix=24)
+        self.ring = Bridges.BridgeRing('fake-hmac-key', params)
+        self.addBridgesFromSameSubnet()
+
+        chosen = self.ring.bridges.keys()
+        bridges = self.ring.filterDistinctSubnets(chosen)
+
+        # The bridges are spread across 5.5.1.0/24 to 5.5.N.0/24:
+        subnets = set([str(b.address).rsplit('.', 1)[0]
+                       for b in self.ring.bridges.values()])
+        self.assertEqual(len(bridges), len(subnets))
+        self.assertGreater(len(bridges), 1)
+
+    def test_getBridges_memoizeAnswers(self):
+        """A hashring which memoizes its answers should give the same answers
+        as one which doesn't, and should only remember one answer for all of
+        the positions which bisect to the same index.
+        """
+        params = Bridges.BridgeRingParameters(needPorts=[(443, 1)],
+                                              memoizeAnswers=True)
+        self.ring = Bridges.BridgeRing('fake-hmac-key', params)
+        other = Bridges.BridgeRing('fake-hmac-key',
+                                   Bridges.BridgeRingParameters(needPorts=[(443, 1)]))
+        self.addRandomBridges()
+        [other.insert(bridge) for bridge in self.ring.bridges.values()]
+
+        self.ring._sort()
+        # Pick a key whose last byte can be decremented:
+        key = [k for k in self.ring.sortedKeys[5:] if k[-1] != chr(0)][0]
+        before = key[:-1] + chr(ord(key[-1]) - 1)
+
+        for pos in (key, before, 'a' * Bridges.DIGEST_LEN):
+            for filterBySubnet in (True, False):
+                self.assertEqual(
+                    self.ring.getBridges(pos, N=3, filterBySubnet=filterBySubnet),
+                    other.getBridges(pos, N=3, filterBySubnet=filterBySubnet))
+
+        # ``key`` and ``before`` bisect to the same index:
+        self.assertEqual(len(self.ring.answers), 4)
+
+    def test_getBridgesMany(self):
+        """getBridgesMany() should give the same answers, in order, as
+        getBridges() would for each position, whether or not answers are
+        memoized.
+        """
+        self.addRandomBridges()
+        self.ring._sort()
+        key = self.ring.sortedKeys[5]
+        positions = ['j' * Bridges.DIGEST_LEN, key, 'a' * Bridges.DIGEST_LEN,
+                     key, self.ring.sortedKeys[-1],
+                     '\xff' * Bridges.DIGEST_LEN]
+        expected = [self.ring.getBridges(pos, N=3, filterBySubnet=True)
+                    for pos in positions]
+
+        self.assertEqual(self.ring.getBridgesMany(positions, N=3,
+                                                  filterBySubnet=True),
+                         expected)
+
+        self.ring.answerParameters = Bridges.BridgeRingParameters(
+            memoizeAnswers=True)
+        self.assertEqual(self.ring.getBridgesMany(positions, N=3,
+                                                  filterBySubnet=True),
+                         expected)
+        self.assertEqual(len(self.ring.answers), 5)
+
+    def test_getMatchingBridges(self):
+        """getMatchingBridges() should walk the hashring from the position
+        until it has found N bridges which match the filter.
+        """
+        self.addRandomBridges()
+        filterFn = lambda bridge: bridge.fingerprint[0] in '0123'
+
+        bridges = self.ring.getMatchingBridges('a' * Bridges.DIGEST_LEN, 3,
+                                               filterFn)
+
+        self.assertEqual(len(bridges), 3)
+        self.assertTrue(all([filterFn(bridge) for bridge in bridges]))
+        self.assertGreaterEqual(self.ring.lastSubnetWalk, 3)
+
+    def test_getMatchingBridges_same_as_filtered_ring(self):
+        """getMatchingBridges() should give the same bridges, including the
+        ones forced into answers by the subrings for needed ports and flags,
+        as a hashring with the same key of only the matching bridges.
+        """
+        bridges = copy.deepcopy(util.generateFakeBridges())
+        filterFn = lambda bridge: bridge.fingerprint[0] in '0123'
+        matching = [bridge for bridge in bridges if filterFn(bridge)]
+        params = Bridges.BridgeRingParameters(
+            needPorts=[(matching[-1].orPort, 1)], needFlags=[('stable', 2)])
+        self.ring = Bridges.BridgeRing('fake-hmac-key', params)
+        filtered = Bridges.BridgeRing('fake-hmac-key', params)
+        [self.ring.insert(bridge) for bridge in bridges]
+        [filtered.insert(bridge) for bridge in matching]
+
+        for pos in [chr(i) * Bridges.DIGEST_LEN for i in range(0, 256, 15)]:
+            for filterBySubnet in (True, False):
+                self.assertEqual(
+                    self.ring.getMatchingBridges(pos, 3, filterFn,
+                                                 filterBySubnet),
+                    filtered.getBridges(pos, 3, filterBySubnet))
+
+    def test_copyFrom(self):
+        """copyFrom() should fill a hashring with the bridges of a sorted one
+        with the same key, except for the removed ones, giving the same
+        answers as inserting them would.
+        """
+        params = Bridges.BridgeRingParameters(needPorts=[(443, 1)],
+                                              needFlags=[('stable', 1)])
+        bridges = copy.deepcopy(util.generateFakeBridges())
+        previous = Bridges.BridgeRing('fake-hmac-key', params)
+        [previous.insert(bridge) for bridge in bridges]
+        ring = Bridges.BridgeRing('fake-hmac-key', params)
+        self.assertFalse(ring.copyFrom(previous))
+
+        previous._sortAll()
+        self.assertFalse(Bridges.BridgeRing('other-key', params).copyFrom(
+            previous))
+        self.assertTrue(ring.copyFrom(previous, bridges[:10]))
+        expected = Bridges.BridgeRing('fake-hmac-key', params)
+        [expected.insert(bridge) for bridge in bridges[10:]]
+
+        self.assertEqual(len(ring), len(expected))
+        self.assertEqual(len(previous), len(bridges))
+        for pos in [chr(i) * Bridges.DIGEST_LEN for i in range(0, 256, 15)]:
+            self.assertEqual(ring.getBridges(pos, 3, filterBySubnet=True),
+                             expected.getBridges(pos, 3, filterBySubnet=True))
+
+    def test_getMatchingBridges_exhausted(self):
+        """getMatchingBridges() should give fewer than N bridges if not
+        enough of the hashring's bridges match the filter.
+        """
+        self.addRandomBridges()
+        filterFn = lambda bridge: False
+
+        self.assertEqual(
+            self.ring.getMatchingBridges('a' * Bridges.DIGEST_LEN, 3,
+                                         filterFn), [])
+        self.assertEqual(self.ring.lastSubnetWalk, len(self.ring))
+
+    def test_getBridgesMany_empty(self):
+        """getBridgesMany() should give no bridges from an empty hashring."""
+        self.assertEqual(
+            self.ring.getBridgesMany(['a' * Bridges.DIGEST_LEN] * 2, N=3),
+            [[], []])
+
+    def test_getBridges_memoizeAnswers_invalidated(self):
+        """Inserting bridges should forget any memoized answers."""
+        params = Bridges.BridgeRingParameters(memoizeAnswers=True)
+        self.ring = Bridges.BridgeRing('fake-hmac-key', params)
+        bridges = copy.deepcopy(util.generateFakeBridges())
+        [self.ring.insert(bridge) for bridge in bridges[:50]]
+
+        pos = 'a' * Bridges.DIGEST_LEN
+        self.ring.getBridges(pos, N=3)
+        self.assertEqual(len(self.ring.answers), 1)
+
+        [self.ring.insert(bridge) for bridge in bridges[50:]]
+        self.assertEqual(len(self.ring.answers), 0)
+
+    def test_placements_shared_with_subrings(self):
+        """The subrings should share the ring's PlacementTable, so that each
+        bridge's identity is only HMACed once for all of them.
+        """
+        params = Bridges.BridgeRingParameters(needPorts=[(443, 1)],
+                                              needFlags=[('Stable', 1)])
+        self.ring = Bridges.BridgeRing('fake-hmac-key', params)
+        self.addRandomBridges()
+
+        for _, _, _, subring in self.ring.subrings:
+            self.assertIs(subring.placements, self.ring.placements)
+        self.assertEqual(len(self.ring.placements), len(self.ring))
+        for placement in self.ring.placements.placements.values():
+            self.assertEqual(placement[2][0], 'fake-hmac-key')
+
+    def test_BridgeRingParameters_bad_subnet_prefix(self):
+        """BridgeRingParameters should reject impossible prefix lengths."""
+        self.assertRaises(TypeError, Bridges.BridgeRingParameters,
+                          ipv4SubnetPrefix=33)
+        self.assertRaises(TypeError, Bridges.BridgeRingParameters,
+                          ipv6SubnetPrefix=129)
+
     def test_dumpAssignments(self):
         """This should dump the bridges to the file."""
         self.addRandomBridges()
@@ -113,6 +409,213 @@ class BridgeRingTests(unittest.TestCase):
         self.assertIn(first, data)
 
 
+class PositionIndexTests(unittest.TestCase):
+    """Unittests for :class:`bridgedb.Bridges.PositionIndex`."""
+
+    def setUp(self):
+        self.positions = ['%02d' % i * 10 for i in range(0, 100, 7)]
+        self.index = Bridges.PositionIndex.fromPairs(
+            [(pos, i) for i, pos in enumerate(self.positions)])
+
+    def test_fromPairs_sorted(self):
+        """Building an index should sort the positions."""
+        index = Bridges.PositionIndex.fromPairs([('b' * 20, 1), ('a' * 20, 2)])
+        self.assertEqual(index.positions, 'a' * 20 + 'b' * 20)
+        self.assertEqual(list(index.handles), [2, 1])
+
+    def test_merge_wrong_width(self):
+        """Merging a position of the wrong length should raise ValueError."""
+        self.assertRaises(ValueError, self.index.merge, [('a' * 19, 1)])
+
+    def test_merge_duplicate_replaces(self):
+        """Merging an existing position should replace its handle."""
+        self.index.merge([(self.positions[3], 42)])
+        self.assertEqual(len(self.index), len(self.positions))
+        self.assertEqual(self.index.find(self.positions[3]), 42)
+
+    def test_merge_interleaved(self):
+        """Merging new positions should keep the index sorted."""
+        new = ['%02d' % i * 10 for i in range(1, 100, 11)]
+        self.index.merge([(pos, 100 + i) for i, pos in enumerate(new)])
+        expected = sorted(set(self.positions + new))
+        self.assertEqual(len(self.index), len(expected))
+        self.assertEqual(self.index.positions, ''.join(expected))
+
+    def test_bisect(self):
+        """PositionIndex.bisect() should act like bisect.bisect_left()."""
+        for pos in ['00' * 10, '50' * 10, '55' * 10, '99' * 10, 'zz' * 10]:
+            self.assertEqual(self.index.bisect(pos),
+                             bisect.bisect_left(self.positions, pos))
+
+    def test_find_missing(self):
+        """Finding a position which isn't in the index should return None."""
+        self.assertIsNone(self.index.find('55' * 10))
+
+    def test_indicesAt_wraps(self):
+        """Getting indices near the end of the index should wrap around."""
+        total = len(self.positions)
+        indices = self.index.indicesAt(self.positions[-1], 3)
+        self.assertEqual(indices, [total - 1, 0, 1])
+
+    def test_indicesAt_all(self):
+        """Asking for more indices than there are should return all of them."""
+        total = len(self.positions)
+        self.assertEqual(self.index.indicesAt('00' * 10, total + 5),
+                         range(total))
+
+    def test_without(self):
+        """without() should leave out the positions of the given handles, and
+        keep the others in order, without changing the index.
+        """
+        dropped = set([0, 4, len(self.positions) - 1])
+        index = self.index.without(dropped)
+        kept = [i for i in range(len(self.positions)) if i not in dropped]
+
+        self.assertEqual(index.positions,
+                         ''.join([self.positions[i] for i in kept]))
+        self.assertEqual(list(index.handles), kept)
+        self.assertEqual(len(self.index), len(self.positions))
+
+
+class CompactBridgeRingTests(unittest.TestCase):
+    """Unittests for :class:`bridgedb.Bridges.CompactBridgeRing`."""
+
+    def setUp(self):
+        self.params = Bridges.BridgeRingParameters(needPorts=[(443, 1)],
+                                                   needFlags=[('Stable', 1)])
+        self.ring = Bridges.CompactBridgeRing('fake-hmac-key', self.params)
+        self.bridges = copy.deepcopy(util.generateFakeBridges())
+
+    def addRandomBridges(self):
+        [self.ring.insert(bridge) for bridge in self.bridges]
+
+    def test_len(self):
+        """The ring should contain all the unique bridges inserted."""
+        self.addRandomBridges()
+        self.addRandomBridges()
+        self.assertEqual(len(self.ring), len(self.bridges))
+
+    def test_clear(self):
+        """Clear should get rid of all the inserted bridges."""
+        self.addRandomBridges()
+        self.ring.clear()
+        self.assertEqual(len(self.ring), 0)
+        self.assertEqual(len(self.ring._index), 0)
+
+    def test_getBridges_same_as_BridgeRing(self):
+        """A CompactBridgeRing should give the same answers as a BridgeRing
+        with the same key.
+        """
+        ring = Bridges.BridgeRing('fake-hmac-key', self.params)
+        [ring.insert(bridge) for bridge in self.bridges]
+        self.addRandomBridges()
+
+        for char in 'abcdefghij':
+            pos = char * Bridges.DIGEST_LEN
+            self.assertEqual(
+                self.ring.getBridges(pos, N=3, filterBySubnet=True),
+                ring.getBridges(pos, N=3, filterBySubnet=True))
+
+    def test_getBridgesMany_same_as_BridgeRing(self):
+        """A CompactBridgeRing should give the same answers from
+        getBridgesMany() as a BridgeRing with the same key.
+        """
+        ring = Bridges.BridgeRing('fake-hmac-key', self.params)
+        [ring.insert(bridge) for bridge in self.bridges]
+        self.addRandomBridges()
+        positions = [char * Bridges.DIGEST_LEN for char in 'jdabgcihfea']
+
+        self.assertEqual(
+            self.ring.getBridgesMany(positions, N=3, filterBySubnet=True),
+            [ring.getBridges(pos, N=3, filterBySubnet=True)
+             for pos in positions])
+
+    def test_getBridges_filterBySubnet_walk_same_as_BridgeRing(self):
+        """When a CompactBridgeRing has to walk further around the hashring
+        to find bridges in distinct subnets, it should give the same answers
+        as a BridgeRing.
+        """
+        for i, bridge in enumerate(self.bridges):
+            bridge.address = ipaddr.IPAddress("5.%d.%d.1" % (i % 3, i % 256))
+        ring = Bridges.BridgeRing('fake-hmac-key', self.params)
+        [ring.insert(bridge) for bridge in self.bridges]
+        self.addRandomBridges()
+
+        for char in 'abcdefghij':
+            pos = char * Bridges.DIGEST_LEN
+            self.assertEqual(
+                self.ring.getBridges(pos, N=3, filterBySubnet=True),
+                ring.getBridges(pos, N=3, filterBySubnet=True))
+            self.assertEqual(self.ring.lastSubnetWalk, ring.lastSubnetWalk)
+
+    def test_shared_table(self):
+        """CompactBridgeRings sharing a BridgeTable should only ever look up
+        their bridges in it, and shouldn't add bridges which aren't in it.
+        """
+        table = Bridges.BridgeTable()
+        [table.add(bridge) for bridge in self.bridges[1:]]
+        ring = Bridges.CompactBridgeRing('fake-hmac-key', self.params, table)
+        [ring.insert(bridge) for bridge in self.bridges]
+
+        self.assertEqual(len(ring), len(self.bridges) - 1)
+        self.assertEqual(len(table), len(self.bridges) - 1)
+        self.assertIsNone(ring.getBridgeByID(self.bridges[0].identity))
+
+        replacement = copy.deepcopy(self.bridges[5])
+        table.add(replacement)
+        self.assertIs(ring.getBridgeByID(replacement.identity), replacement)
+
+    def test_getBridges_memoizeAnswers_same_as_BridgeRing(self):
+        """A CompactBridgeRing which memoizes its answers should give the same
+        answers as a BridgeRing.
+        """
+        params = Bridges.BridgeRingParameters(needPorts=[(443, 1)],
+                                              needFlags=[('Stable', 1)],
+                                              memoizeAnswers=True)
+        self.ring = Bridges.CompactBridgeRing('fake-hmac-key', params)
+        ring = Bridges.BridgeRing('fake-hmac-key', self.params)
+        [ring.insert(bridge) for bridge in self.bridges]
+        self.addRandomBridges()
+
+        for char in 'abcdefghij':
+            pos = char * Bridges.DIGEST_LEN
+            self.assertEqual(
+                self.ring.getBridges(pos, N=3, filterBySubnet=True),
+                ring.getBridges(pos, N=3, filterBySubnet=True))
+
+    def test_getBridges_interleaved_inserts(self):
+        """Inserting more bridges between lookups should still give the same
+        answers as a ring which was built all at once.
+        """
+        half = len(self.bridges) // 2
+        [self.ring.insert(bridge) for bridge in self.bridges[:half]]
+        self.ring.getBridges('a' * Bridges.DIGEST_LEN, N=3)
+        [self.ring.insert(bridge) for bridge in self.bridges[half:]]
+
+        ring = Bridges.CompactBridgeRing('fake-hmac-key', self.params)
+        [ring.insert(bridge) for bridge in self.bridges]
+
+        pos = 'b' * Bridges.DIGEST_LEN
+        self.assertEqual(self.ring.getBridges(pos, N=3),
+                         ring.getBridges(pos, N=3))
+
+    def test_getBridgeByID(self):
+        """getBridgeByID() should find an inserted bridge."""
+        self.addRandomBridges()
+        bridge = self.bridges[7]
+        self.assertEqual(self.ring.getBridgeByID(bridge.identity), bridge)
+
+    def test_dumpAssignments(self):
+        """This should dump the bridges to the file."""
+        self.addRandomBridges()
+
+        f = io.StringIO()
+        self.ring.dumpAssignments(f)
+        f.seek(0)
+
+        self.assertIn(self.bridges[0].fingerprint, f.read())
+
+
 class FixedBridgeSplitterTests(unittest.TestCase):
     """Unittests for :class:`bridgedb.Bridges.FixedBridgeSplitter`."""
 
@@ -130,6 +633,21 @@ class FixedBridgeSplitterTests(unittest.TestCase):
         self.addRandomBridges()
         self.assertGreater(len(self.splitter), 0)
 
+    def test_insert_placements(self):
+        """Each bridge should be inserted into the ring for the subring
+        which is remembered in the splitter's placements.
+        """
+        bridges = copy.deepcopy(util.generateFakeBridges())
+        placements = Bridges.PlacementTable()
+        self.splitter.usePlacements(placements)
+        [self.splitter.insert(bridge) for bridge in bridges]
+
+        self.assertEqual(len(placements), len(bridges))
+        for bridge in bridges:
+            _, (_, which), _ = placements.placements[bridge.identity]
+            ring = self.rings[which]
+            self.assertIsNotNone(ring.getBridgeByID(bridge.identity))
+
     def test_clear(self):
         """Clear should get rid of all the inserted bridges."""
         self.addRandomBridges()
@@ -153,3 +671,659 @@ class FixedBridgeSplitterTests(unittest.TestCase):
 
         # The first bridge's fingerprint should be within the data somewhere
         self.assertIn(first, data)
+
+
+class AttributeIndexTests(unittest.TestCase):
+    """Unittests for :class:`bridgedb.Bridges.AttributeIndex`."""
+
+    def setUp(self):
+        self.bridges = copy.deepcopy(util.generateFakeBridges())
+        self.index = Bridges.AttributeIndex(self.bridges)
+        self.hmac = Bridges.getHMACFunc('fake-hmac-key', hex=True)
+
+    def test_bitsetFromHandles(self):
+        self.assertEqual(Bridges.AttributeIndex.bitsetFromHandles([]), 0)
+        self.assertEqual(Bridges.AttributeIndex.bitsetFromHandles([0, 3, 4]),
+                         0b11001)
+
+    def test_handlesFromBitset(self):
+        self.assertEqual(Bridges.AttributeIndex.handlesFromBitset(0), [])
+        self.assertEqual(Bridges.AttributeIndex.handlesFromBitset(0b11001),
+                         [0, 3, 4])
+
+    def test_getMatching(self):
+        """getMatching() should return the same bridges, in the same order,
+        as calling the filter on every bridge.
+        """
+        for filtre in [filters.byIPv4, filters.byIPv6,
+                       filters.bySubring(self.hmac, 2, 3),
+                       filters.byFilters([filters.byIPv4,
+                                          filters.bySubring(self.hmac, 1, 3)])]:
+            self.assertEqual(self.index.getMatching(filtre),
+                             [b for b in self.bridges if filtre(b)])
+
+    def test_getMatching_mask(self):
+        """Only bridges whose bits are set in the mask should be returned."""
+        mask = Bridges.AttributeIndex.bitsetFromHandles([1, 2, 5])
+        self.assertEqual(
+            self.index.getMatching(filters.byIPv4, mask),
+            [self.bridges[i] for i in (1, 2, 5)
+             if filters.byIPv4(self.bridges[i])])
+
+    def test_getBitset_caches_component_filters(self):
+        """Each component filter of a byFilters() filter should be indexed, and
+        not the combined filter itself.
+        """
+        combined = filters.byFilters([filters.byIPv4,
+                                      filters.bySubring(self.hmac, 1, 2)])
+        self.index.getBitset(combined)
+        self.assertEqual(len(self.index), 2)
+        self.assertNotIn(combined.name, self.index.bitsets)
+
+    def test_update(self):
+        """update() should recompute the bits for a replaced bridge."""
+        filtre = filters.bySubring(self.hmac, 1, 2)
+        self.index.getBitset(filtre)
+        matching = [i for i, b in enumerate(self.bridges) if filtre(b)]
+        others = [i for i, b in enumerate(self.bridges) if not filtre(b)]
+
+        self.bridges[matching[0]] = self.bridges[others[0]]
+        self.index.update(matching[0])
+
+        self.assertEqual(self.index.getMatching(filtre),
+                         [b for b in self.bridges if filtre(b)])
+
+    def test_copyFrom(self):
+        """An index which took over the bitsets of another should match the
+        same bridges as a new one, calling each filter only for the bridges
+        added since.
+        """
+        calls = []
+        def byAnything(bridge):
+            calls.append(bridge)
+            return True
+        byAnything.name = 'by-anything'
+        filtres = [byAnything, filters.byIPv4,
+                   filters.bySubring(self.hmac, 1, 2)]
+        [self.index.getBitset(filtre) for filtre in filtres]
+
+        bridges = self.bridges[:3] + [None] + self.bridges[4:]
+        index = Bridges.AttributeIndex(bridges)
+        index.copyFrom(self.index, [3])
+        bridges.append(copy.deepcopy(self.bridges[3]))
+        index.update(len(bridges) - 1)
+        filtres.append(filters.byIPv6)
+        expected = [[b for b in bridges if b is not None and filtre(b)]
+                    for filtre in filtres]
+        del calls[:]
+
+        self.assertEqual([index.getMatching(f) for f in filtres], expected)
+        self.assertEqual(calls, bridges[-1:])
+
+
+class BridgeTableTests(unittest.TestCase):
+    """Unittests for :class:`bridgedb.Bridges.BridgeTable`."""
+
+    def setUp(self):
+        self.table = Bridges.BridgeTable()
+        self.bridges = copy.deepcopy(util.generateFakeBridges()[:5])
+
+    def test_add(self):
+        """Bridges should get consecutive handles, and adding a bridge with
+        the same fingerprint should replace it and keep its handle.
+        """
+        handles = [self.table.add(bridge) for bridge in self.bridges]
+        self.assertEqual(handles, range(5))
+
+        replacement = copy.deepcopy(self.bridges[3])
+        self.assertEqual(self.table.add(replacement), 3)
+        self.assertIs(self.table[3], replacement)
+        self.assertEqual(len(self.table), 5)
+
+    def test_copyFrom(self):
+        """copyFrom() should keep the handles of the bridges taken over, and
+        shouldn't reuse those of the removed bridges.
+        """
+        [self.table.add(bridge) for bridge in self.bridges]
+        table = Bridges.BridgeTable()
+
+        self.assertEqual(table.copyFrom(self.table, self.bridges[1:2]), [1])
+        self.assertEqual(len(table), 4)
+        self.assertIsNone(table[1])
+        self.assertEqual(table.getHandle(self.bridges[3]), 3)
+        self.assertEqual(table.add(copy.deepcopy(self.bridges[1])), 5)
+        self.assertEqual(len(self.table), 5)
+
+
+class FilteredBridgeSplitterTests(unittest.TestCase):
+    """Unittests for :class:`bridgedb.Bridges.FilteredBridgeSplitter`."""
+
+    def setUp(self):
+        self.splitter = Bridges.FilteredBridgeSplitter('fake-hmac-key',
+                                                       max_cached_rings=4)
+        self.bridges = copy.deepcopy(util.generateFakeBridges())
+
+    def addRings(self, populate_from=None):
+        ringnames = []
+        for filtre in [filters.byIPv4, filters.byIPv6]:
+            for assigned in (1, 2):
+                ringname = frozenset([
+                    filtre, filters.bySubring(self.splitter.hmac, assigned, 2)])
+                ring = Bridges.BridgeRing('fake-ring-key')
+                self.splitter.addRing(ring, ringname,
+                                      filters.byFilters(ringname),
+                                      populate_from=populate_from)
+                ringnames.append(ringname)
+        return ringnames
+
+    def test_insert_replaces_same_fingerprint(self):
+        """Inserting a bridge with the same fingerprint as a bridge already
+        in the hashring should replace the old one.
+        """
+        [self.splitter.insert(bridge) for bridge in self.bridges]
+        replacement = copy.deepcopy(self.bridges[3])
+        self.splitter.insert(replacement)
+
+        self.assertEqual(len(self.splitter), len(self.bridges))
+        self.assertIs(self.splitter.bridges[3], replacement)
+
+    def test_insert_not_running(self):
+        """A bridge which isn't running shouldn't be inserted."""
+        bridge = self.bridges[0]
+        bridge.flags.running = False
+        self.splitter.insert(bridge)
+        self.assertEqual(len(self.splitter), 0)
+
+    def test_insertMany(self):
+        """insertMany() should populate all of the subrings, exactly as
+        inserting the bridges one at a time would.
+        """
+        self.addRings()
+        self.assertEqual(self.splitter.insertMany(self.bridges),
+                         len(self.bridges))
+
+        other = Bridges.FilteredBridgeSplitter('fake-hmac-key',
+                                               max_cached_rings=4)
+        for ringname, (filterFn, _) in self.splitter.filterRings.items():
+            other.addRing(Bridges.BridgeRing('fake-ring-key'), ringname,
+                          filterFn)
+        [other.insert(bridge) for bridge in self.bridges]
+
+        for ringname, (_, subring) in self.splitter.filterRings.items():
+            _, otherSubring = other.filterRings[ringname]
+            self.assertGreater(len(subring), 0)
+            self.assertItemsEqual(subring.bridges.keys(),
+                                  otherSubring.bridges.keys())
+
+    def test_populateRings(self):
+        """populateRings() should populate the subrings with the same bridges
+        as addRing(populate_from=...) does.
+        """
+        [self.splitter.insert(bridge) for bridge in self.bridges]
+        ringnames = self.addRings(populate_from=self.splitter.bridges)
+
+        other = Bridges.FilteredBridgeSplitter('fake-hmac-key',
+                                               max_cached_rings=4)
+        for ringname in ringnames:
+            filterFn, _ = self.splitter.filterRings[ringname]
+            other.addRing(Bridges.BridgeRing('fake-ring-key'), ringname,
+                          filterFn)
+        other.populateRings(ringnames, self.bridges)
+
+        for ringname in ringnames:
+            _, subring = self.splitter.filterRings[ringname]
+            _, otherSubring = other.filterRings[ringname]
+            self.assertItemsEqual(subring.bridges.keys(),
+                                  otherSubring.bridges.keys())
+
+    def populateCompactRings(self, splitter, ringBuilder=None, bridges=None):
+        params = Bridges.BridgeRingParameters(needPorts=[(443, 1)],
+                                              needFlags=[('Stable', 1)])
+        splitter.ringBuilder = ringBuilder
+        splitter.insertMany(self.bridges if bridges is None else bridges)
+        ringnames = []
+        for filtre in [filters.byIPv4, filters.byIPv6]:
+            for assigned in (1, 2):
+                ringname = frozenset([
+                    filtre, filters.bySubring(splitter.hmac, assigned, 2)])
+                ring = splitter.newRing(Bridges.CompactBridgeRing,
+                                        'fake-ring-key-%d' % assigned, params)
+                splitter.addRing(ring, ringname, filters.byFilters(ringname),
+                                 pinned=True)
+                ringnames.append(ringname)
+        splitter.populateRings(ringnames, splitter.bridges)
+        return ringnames
+
+    def assertSameRings(self, splitter, other, ringnames):
+        for ringname in ringnames:
+            _, ring = splitter.filterRings[ringname]
+            _, otherRing = other.filterRings[ringname]
+            self.assertGreater(len(ring), 0)
+            self.assertEqual(len(ring), len(otherRing))
+            for (_, _, _, sub), (_, _, _, otherSub) in zip(ring.subrings,
+                                                           otherRing.subrings):
+                self.assertEqual(len(sub), len(otherSub))
+            for pos in ['a' * 20, '\x00' * 20, '\xff' * 20, 'M' * 20]:
+                self.assertEqual(
+                    ring.getBridges(pos, N=3, filterBySubnet=True),
+                    otherRing.getBridges(pos, N=3, filterBySubnet=True))
+
+    def test_populateRings_ringBuilder(self):
+        """Subrings filled by a ringBuilder should be the same as ones
+        filled by inserting every bridge.
+        """
+        class Builder(object):
+            calls = 0
+            def map(self, func, jobs):
+                self.calls += 1
+                return [func(job) for job in jobs]
+
+        builder = Builder()
+        ringnames = self.populateCompactRings(self.splitter, builder)
+        other = Bridges.FilteredBridgeSplitter('fake-hmac-key')
+        self.populateCompactRings(other)
+
+        self.assertEqual(builder.calls, 1)
+        self.assertSameRings(self.splitter, other, ringnames)
+
+    def test_populateRings_ringBuilder_processes(self):
+        """Subrings should be filled the same way by a pool of processes."""
+        pool = multiprocessing.Pool(2)
+        # Let the workers exit by themselves (cleanups run in reverse
+        # order), as terminating them can hang when the reactor has a
+        # SIGTERM handler:
+        self.addCleanup(pool.join)
+        self.addCleanup(pool.close)
+        ringnames = self.populateCompactRings(self.splitter, pool)
+        other = Bridges.FilteredBridgeSplitter('fake-hmac-key')
+        self.populateCompactRings(other)
+
+        self.assertSameRings(self.splitter, other, ringnames)
+
+    def test_updateFrom(self):
+        """A hashring updated from the previous one should take over its
+        subrings, only inserting the bridges which were added since, and
+        should have the same subrings as one built from scratch.
+        """
+        self.populateCompactRings(self.splitter)
+        self.splitter.freeze()
+        changed = copy.deepcopy(self.bridges[1])
+        changed.orPort = 443
+        removed = self.bridges[:2]
+        self.bridges = self.bridges[2:] + [changed]
+
+        inserted = []
+        insert = Bridges.CompactBridgeRing.insert
+        def recordInsert(ring, bridge):
+            inserted.append(bridge)
+            return insert(ring, bridge)
+        self.patch(Bridges.CompactBridgeRing, 'insert', recordInsert)
+
+        splitter = Bridges.FilteredBridgeSplitter('fake-hmac-key')
+        splitter.updateFrom(self.splitter, removed)
+        ringnames = self.populateCompactRings(splitter, bridges=[changed])
+        self.assertEqual(set(inserted), set([changed]))
+
+        other = Bridges.FilteredBridgeSplitter('fake-hmac-key')
+        self.populateCompactRings(other)
+        self.assertEqual(len(splitter), len(other))
+        self.assertSameRings(splitter, other, ringnames)
+        self.assertEqual(len(self.splitter), len(self.bridges) + 1)
+
+    def test_updateFrom_compacts(self):
+        """If too many of the handles taken over would belong to removed
+        bridges, the others should be inserted again, with new handles.
+        """
+        self.splitter.insertMany(self.bridges)
+        self.splitter.freeze()
+        removed = self.bridges[:len(self.bridges) // 5]
+
+        splitter = Bridges.FilteredBridgeSplitter('fake-hmac-key')
+        splitter.maxRemovedFraction = 0.1
+        splitter.updateFrom(self.splitter, removed)
+
+        self.assertEqual(splitter.bridges, self.bridges[len(removed):])
+
+    def test_populateRings_calls_shared_filters_once(self):
+        """A filter which is shared by several subrings should only be called
+        once per bridge.
+        """
+        calls = []
+        def byAnything(bridge):
+            calls.append(bridge)
+            return True
+        byAnything.name = 'by-anything'
+
+        for assigned in (1, 2, 3):
+            ringname = frozenset([byAnything, filters.byIPv(assigned)])
+            self.splitter.addRing(Bridges.BridgeRing('fake-ring-key'),
+                                  ringname, filters.byFilters(ringname))
+
+        self.splitter.populateRings(self.splitter.filterRings.keys(),
+                                    self.bridges)
+        self.assertEqual(len(calls), len(self.bridges))
+
+    def test_addRing_evicts_least_recently_used(self):
+        """Adding more than max_cached_rings subrings should drop the least
+        recently used one.
+        """
+        self.splitter.max_cached_rings = 3
+        ringnames = self.addRings()
+
+        self.assertEqual(len(self.splitter.filterRings), 3)
+        self.assertNotIn(ringnames[0], self.splitter.filterRings)
+        self.assertEqual(self.splitter.cacheEvictions, 1)
+
+    def test_getRing_marks_recently_used(self):
+        """A subring returned by getRing() should be the last to be evicted."""
+        self.splitter.max_cached_rings = 4
+        ringnames = self.addRings()
+        self.assertIsNotNone(self.splitter.getRing(ringnames[0]))
+
+        ring = Bridges.BridgeRing('fake-ring-key')
+        ringname = frozenset([filters.byIPv4])
+        self.splitter.addRing(ring, ringname, filters.byFilters(ringname))
+
+        self.assertIn(ringnames[0], self.splitter.filterRings)
+        self.assertNotIn(ringnames[1], self.splitter.filterRings)
+
+    def test_addRing_never_evicts_pinned_rings(self):
+        """Pinned subrings should neither be evicted nor count towards
+        max_cached_rings.
+        """
+        self.splitter.max_cached_rings = 1
+        pinned = frozenset([filters.byIPv4])
+        self.splitter.addRing(Bridges.BridgeRing('fake-ring-key'), pinned,
+                              filters.byFilters(pinned), pinned=True)
+        ringnames = self.addRings()
+
+        self.assertEqual(self.splitter.filterRings.keys(),
+                         [pinned, ringnames[-1]])
+        self.assertEqual(self.splitter.cacheEvictions, 3)
+
+    def test_getRing_counters(self):
+        """getRing() should count cache hits and misses."""
+        ringnames = self.addRings()[-2:]
+        self.splitter.getRing(ringnames[0])
+        self.splitter.getRing(ringnames[1])
+        self.splitter.getRing(frozenset([filters.byIPv4]))
+
+        self.assertEqual(self.splitter.cacheHits, 2)
+        self.assertEqual(self.splitter.cacheMisses, 1)
+
+    def test_getNearestRing(self):
+        """getNearestRing() should return the cached subring with the most
+        filters which are a subset of the requested filters.
+        """
+        ringnames = self.addRings()
+        general = frozenset([filters.byIPv4])
+        self.splitter.addRing(Bridges.BridgeRing('fake-ring-key'), general,
+                              filters.byFilters(general), pinned=True)
+        wanted = ringnames[0].union([filters.byNotBlockedIn('cn')])
+
+        name, subring = self.splitter.getNearestRing(wanted)
+        self.assertEqual(name, ringnames[0])
+        self.assertIs(subring, self.splitter.filterRings[name][1])
+
+        name, subring = self.splitter.getNearestRing(
+            frozenset([filters.byIPv4, filters.byNotBlockedIn('cn')]))
+        self.assertEqual(name, general)
+
+    def test_getNearestRing_none(self):
+        """getNearestRing() should return (None, None) if no cached subring's
+        filters are a subset of the requested filters.
+        """
+        self.addRings()
+        self.assertEqual(
+            self.splitter.getNearestRing(frozenset([filters.byIPv6])),
+            (None, None))
+
+    def test_newRing_shares_table(self):
+        """A CompactBridgeRing from newRing() should be a view of the
+        splitter's table, and should give the same answers as a BridgeRing
+        with the same bridges.
+        """
+        [self.splitter.insert(bridge) for bridge in self.bridges]
+        params = Bridges.BridgeRingParameters(needPorts=[(443, 1)],
+                                              needFlags=[('Stable', 1)])
+        ringname = frozenset([filters.byIPv4])
+        ring = self.splitter.newRing(Bridges.CompactBridgeRing,
+                                     'fake-ring-key', params)
+        self.splitter.addRing(ring, ringname, filters.byFilters(ringname),
+                              populate_from=self.splitter.bridges)
+        other = self.splitter.newRing(Bridges.BridgeRing,
+                                      'fake-ring-key', params)
+        [other.insert(bridge) for bridge in self.bridges]
+
+        self.assertIs(ring.table, self.splitter.table)
+        self.assertIs(ring.placements, self.splitter.table.placements)
+        self.assertIs(other.placements, self.splitter.table.placements)
+        for _, _, _, subring in ring.subrings:
+            self.assertIs(subring.table, self.splitter.table)
+
+        self.assertEqual(len(ring), len(other))
+        for char in 'abcdefghij':
+            pos = char * Bridges.DIGEST_LEN
+            self.assertEqual(ring.getBridges(pos, N=3, filterBySubnet=True),
+                             other.getBridges(pos, N=3, filterBySubnet=True))
+
+    def test_freeze(self):
+        """Once frozen, the hashring shouldn't let any bridges be inserted,
+        but subrings should still be added to its cache.
+        """
+        self.splitter.insertMany(self.bridges[:10])
+        self.splitter.freeze()
+
+        self.assertRaises(Bridges.FrozenHashringError,
+                          self.splitter.insert, self.bridges[10])
+        self.assertRaises(Bridges.FrozenHashringError, self.splitter.clear)
+        self.assertEqual(len(self.splitter), len(
+            [b for b in self.bridges[:10] if b.flags.running]))
+
+        ringnames = self.addRings(populate_from=self.splitter.bridges)
+        self.assertEqual(len(self.splitter.filterRings), len(ringnames))
+
+
+class BridgeSplitterTests(unittest.TestCase):
+    """Unittests for :class:`bridgedb.Bridges.BridgeSplitter`."""
+
+    def setUp(self):
+        self.dbfname = 'test-bridgesplitter.sqlite'
+        Storage.setDBFilename(self.dbfname)
+        Storage.initializeDBLock()
+        self.bridges = copy.deepcopy(util.generateFakeBridges())
+        self.splitter = self.makeSplitter()
+
+    def tearDown(self):
+        if os.path.isfile(self.dbfname):
+            os.unlink(self.dbfname)
+        Storage.clearGlobalDB()
+
+    def makeSplitter(self):
+        splitter = Bridges.BridgeSplitter('fake-hmac-key')
+        splitter.addRing(Bridges.UnallocatedHolder(), 'unallocated', 1)
+        splitter.addRing(Bridges.FilteredBridgeSplitter('fake-hmac-key-1'),
+                         'https', 5)
+        splitter.addRing(Bridges.FilteredBridgeSplitter('fake-hmac-key-2'),
+                         'email', 3)
+        return splitter
+
+    def getAssignments(self, splitter):
+        assignments = {}
+        for name, ring in splitter.ringsByName.items():
+            for fingerprint in getattr(ring, 'fingerprints', []):
+                assignments[fingerprint] = name
+            for fingerprint in getattr(ring, 'bridgesByFingerprint', []):
+                assignments[fingerprint] = name
+        return assignments
+
+    def test_insertMany(self):
+        """insertMany() should place every running bridge into a ring."""
+        running = [b for b in self.bridges if b.flags.running]
+        inserted = self.splitter.insertMany(self.bridges)
+
+        self.assertEqual(inserted, len(running))
+        self.assertEqual(len(self.getAssignments(self.splitter)), len(running))
+
+    def test_insertMany_same_as_insert(self):
+        """insertMany() should assign bridges to the same rings as insert()."""
+        for bridge in self.bridges:
+            self.splitter.insert(bridge)
+        expected = self.getAssignments(self.splitter)
+
+        Storage.clearGlobalDB()
+        os.unlink(self.dbfname)
+        Storage.setDBFilename(self.dbfname)
+        Storage.initializeDBLock()
+
+        splitter = self.makeSplitter()
+        splitter.insertMany(self.bridges)
+
+        self.assertEqual(self.getAssignments(splitter), expected)
+
+    def test_insert_unknown_ring(self):
+        """insert() shouldn't place a bridge whose ring in the database is
+        no longer valid, if there is no ``unallocated`` ring to fall back to.
+        """
+        bridge = [b for b in self.bridges if b.flags.running][0]
+        with Storage.getDB() as db:
+            db.insertBridgeAndGetRing(bridge, 'moat', time.time(), ['moat'])
+            db.commit()
+
+        splitter = Bridges.BridgeSplitter('fake-hmac-key')
+        splitter.addRing(Bridges.FilteredBridgeSplitter('fake-hmac-key-1'),
+                         'https', 5)
+        splitter.insert(bridge)
+
+        self.assertEqual(len(splitter), 0)
+        self.assertIsNone(splitter.placements.getPool(bridge.identity))
+
+    def test_insertMany_keeps_existing_assignments(self):
+        """insertMany() should keep bridges in the rings they were already
+        assigned to in the database.
+        """
+        bridge = self.bridges[0]
+        bridge.flags.running = True
+        with Storage.getDB() as db:
+            db.insertBridgeAndGetRing(bridge, 'email', 0, ['email'])
+            db.commit()
+
+        self.splitter.insertMany([bridge])
+
+        self.assertEqual(self.getAssignments(self.splitter),
+                         {bridge.fingerprint: 'email'})
+
+    def test_insertMany_distribution_request_none(self):
+        """Bridges which requested not to be distributed shouldn't be placed
+        into any ring.
+        """
+        bridge = self.bridges[0]
+        bridge.flags.running = True
+        bridge.distribution_request = 'none'
+
+        self.assertEqual(self.splitter.insertMany([bridge]), 0)
+        self.assertEqual(self.getAssignments(self.splitter), {})
+
+    def test_placements_shared(self):
+        """The splitter should share its placements with its subrings, and
+        remember which pool each bridge was assigned to in them.
+        """
+        self.splitter.insertMany(self.bridges)
+        https = self.splitter.ringsByName['https']
+
+        assignments = self.splitter.assignments
+        self.assertIs(https.placements, self.splitter.placements)
+        self.assertGreater(len(assignments), 0)
+        for bridge in self.bridges:
+            self.assertEqual(
+                self.splitter.placements.getPool(bridge.identity),
+                assignments.get(bridge.fingerprint))
+
+    def test_assignments(self):
+        """The splitter's assignments should record which ring each bridge
+        was placed into.
+        """
+        self.splitter.insertMany(self.bridges)
+        self.assertEqual(self.splitter.assignments,
+                         self.getAssignments(self.splitter))
+
+        self.splitter.clear()
+        self.assertEqual(self.splitter.assignments, {})
+
+    def test_insertAssigned(self):
+        """insertAssigned() should place bridges into the same rings as the
+        splitter whose assignments it is given, without the database.
+        """
+        self.splitter.insertMany(self.bridges)
+        Storage.clearGlobalDB()
+
+        splitter = self.makeSplitter()
+        placed = splitter.insertAssigned(self.bridges,
+                                         self.splitter.assignments)
+
+        self.assertEqual(placed, len(self.splitter.assignments))
+        self.assertEqual(self.getAssignments(splitter),
+                         self.getAssignments(self.splitter))
+        self.assertEqual(splitter.assignments, self.splitter.assignments)
+
+    def test_rebuildFrom(self):
+        """rebuildFrom() should refill only the named subrings, and share
+        all of the others with the previous splitter.
+        """
+        self.splitter.insertMany(self.bridges)
+        self.splitter.freeze()
+        Storage.clearGlobalDB()
+
+        splitter = self.makeSplitter()
+        rebuilt = splitter.ringsByName['https']
+        placed = splitter.rebuildFrom(self.splitter, self.bridges, ['https'])
+
+        self.assertEqual(placed, len(self.splitter.ringsByName['https']))
+        self.assertIs(splitter.ringsByName['https'], rebuilt)
+        self.assertIsNot(rebuilt, self.splitter.ringsByName['https'])
+        self.assertIs(splitter.ringsByName['email'],
+                      self.splitter.ringsByName['email'])
+        self.assertEqual(self.getAssignments(splitter),
+                         self.getAssignments(self.splitter))
+        self.assertEqual(splitter.assignments, self.splitter.assignments)
+
+    def test_updateFrom(self):
+        """updateFrom() should take over the previous splitter's assignments,
+        except for those of the removed bridges, and only place the added
+        bridges.
+        """
+        self.splitter.insertMany(self.bridges)
+        self.splitter.freeze()
+        assignments = self.splitter.assignments
+        gone = self.bridges[0]
+        old = [b for b in self.bridges[1:]
+               if assignments.get(b.fingerprint) == 'https'][0]
+        changed = copy.deepcopy(old)
+        changed.orPort += 1
+
+        splitter = self.makeSplitter()
+        placed = splitter.updateFrom(self.splitter, [gone, old], [changed])
+
+        assignments.pop(gone.fingerprint, None)
+        self.assertEqual(placed, 1)
+        self.assertEqual(splitter.assignments, assignments)
+        self.assertEqual(self.getAssignments(splitter), assignments)
+        https = splitter.ringsByName['https']
+        handle = https.bridgesByFingerprint[old.fingerprint]
+        self.assertIs(https.bridges[handle], changed)
+        self.assertEqual(self.getAssignments(self.splitter),
+                         self.splitter.assignments)
+
+    def test_freeze(self):
+        """Once frozen, the splitter and its subrings shouldn't let any
+        bridges be inserted.
+        """
+        self.splitter.insertMany(self.bridges[:10])
+        self.splitter.freeze()
+
+        self.assertTrue(self.splitter.ringsByName['https'].frozen)
+        self.assertRaises(Bridges.FrozenHashringError,
+                          self.splitter.insertMany, self.bridges[10:])
+        self.assertRaises(Bridges.FrozenHashringError, self.splitter.clear)
+        self.assertEqual(self.splitter.assignments,
+                         self.getAssignments(self.splitter))
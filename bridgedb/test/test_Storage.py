@@ -113,3 +113,79 @@ class DatabaseTest(unittest.TestCase):
         with Storage.getDB() as db:
             ringname = db.getBridgeDistributor(bridge, self.validRings)
             self.assertEqual(ringname, "unallocated")
+
+    def test_getBridgeDistributors(self):
+        Storage.initializeDBLock()
+        with Storage.getDB() as db:
+            db.insertBridgeAndGetRing(self.fakeBridges[0], 'moat',
+                                      time.time(), self.validRings)
+            db.insertBridgeAndGetRing(self.fakeBridges[1], 'email',
+                                      time.time(), self.validRings)
+            db.commit()
+
+        with Storage.getDB() as db:
+            distributors = db.getBridgeDistributors()
+
+        self.assertEqual(distributors,
+                         {self.fakeBridges[0].fingerprint: 'moat',
+                          self.fakeBridges[1].fingerprint: 'email'})
+
+    def test_insertBridgesAndGetRings(self):
+        bridges = self.fakeBridges[:3]
+        Storage.initializeDBLock()
+        with Storage.getDB() as db:
+            db.insertBridgeAndGetRing(bridges[0], 'moat',
+                                      time.time(), self.validRings)
+            ringnames = db.insertBridgesAndGetRings(
+                [(bridges[0], 'https'), (bridges[1], 'email'),
+                 (bridges[2], 'godzilla')],
+                time.time(), self.validRings)
+            db.commit()
+
+        self.assertEqual(ringnames, ['moat', 'email', 'unallocated'])
+
+        with Storage.getDB() as db:
+            for bridge, ringname in zip(bridges, ringnames):
+                self.assertEqual(
+                    db.getBridgeDistributor(bridge, self.validRings), ringname)
+
+    def test_insertBridgesAndGetRings_duplicates(self):
+        bridge = self.fakeBridges[0]
+        Storage.initializeDBLock()
+        with Storage.getDB() as db:
+            ringnames = db.insertBridgesAndGetRings(
+                [(bridge, 'moat'), (bridge, 'https')],
+                time.time(), self.validRings)
+            db.commit()
+
+        self.assertEqual(ringnames, ['moat', 'moat'])
+
+    def test_insertBridgesAndGetRings_invalidated_ring(self):
+        bridge = self.fakeBridges[0]
+        Storage.initializeDBLock()
+        with Storage.getDB() as db:
+            db.insertBridgeAndGetRing(bridge, 'moat', time.time(),
+                                      self.validRings)
+            ringnames = db.insertBridgesAndGetRings(
+                [(bridge, 'https')], time.time(), ['https', 'unallocated'])
+            db.commit()
+
+        self.assertEqual(ringnames, ['unallocated'])
+
+    def test_markBridgesSeen(self):
+        bridges = self.fakeBridges[:2]
+        Storage.initializeDBLock()
+        with Storage.getDB() as db:
+            db.insertBridgesAndGetRings(
+                [(bridge, 'moat') for bridge in bridges], 0, self.validRings)
+            db.markBridgesSeen([bridges[0].fingerprint], 1000)
+            db.commit()
+
+        with Storage.getDB() as db:
+            db._cur.execute("SELECT hex_key, last_seen FROM Bridges")
+            lastSeen = dict(db._cur.fetchall())
+
+        self.assertEqual(lastSeen[bridges[0].fingerprint],
+                         Storage.timeToStr(1000))
+        self.assertEqual(lastSeen[bridges[1].fingerprint],
+                         Storage.timeToStr(0))
@@ -36,6 +36,37 @@ class BridgeRequestBaseTests(unittest.TestCase):
         self.request.withoutBlockInCountry('US')
         self.assertIn('us', self.request.notBlockedIn)
 
+    def test_BridgeRequestBase_generateFilters_canonical(self):
+        """BridgeRequestBase.generateFilters() should give requests for the
+        same countries, in any order, case, or with duplicates, the very same
+        filterKey.
+        """
+        for cc in ['IR', 'cn', 'ir']:
+            self.request.withoutBlockInCountry(cc)
+        self.request.generateFilters()
+
+        other = BridgeRequestBase()
+        for cc in ['cn', 'ir']:
+            other.withoutBlockInCountry(cc)
+        other.generateFilters()
+
+        self.assertEqual(self.request.notBlockedIn, ['cn', 'ir'])
+        self.assertEqual(len(self.request.filters), 2)
+        self.assertIs(self.request.filterKey, other.filterKey)
+
+    def test_BridgeRequestBase_generateFilters_capped(self):
+        """BridgeRequestBase.generateFilters() should ignore countries past
+        MAX_UNBLOCKED_COUNTRIES.
+        """
+        countries = ['cn', 'ir', 'sy', 'kz', 'tm']
+        for cc in countries:
+            self.request.withoutBlockInCountry(cc)
+        self.request.generateFilters()
+
+        allowed = countries[:bridgerequest.MAX_UNBLOCKED_COUNTRIES]
+        self.assertEqual(self.request.notBlockedIn, sorted(allowed))
+        self.assertEqual(len(self.request.filters), len(allowed))
+
     def test_BridgeRequestBase_withPluggableTransportType(self):
         """BridgeRequestBase.withPluggableTransportType() should add the
         pluggable transport type to the ``transport`` attribute.
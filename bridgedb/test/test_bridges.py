@@ -12,6 +12,7 @@
 
 from binascii import a2b_hex
 
+import copy
 import datetime
 import ipaddr
 import io
@@ -1237,6 +1238,25 @@ class BridgeTests(unittest.TestCase):
         self.assertEqual(self.bridge.bandwidthObserved, 1623207134)
         self.assertEqual(len(self.bridge.transports), 4)
 
+    def test_Bridge_updateFromDescriptorRecords(self):
+        """A Bridge should be updated from DescriptorRecords, copied from
+        its descriptors, just as from the descriptors themselves.
+        """
+        DescriptorRecord = descriptors.DescriptorRecord
+        self.bridge.updateFromNetworkStatus(
+            DescriptorRecord('networkstatus', self.networkstatus))
+        self.bridge.updateFromServerDescriptor(
+            DescriptorRecord('server', self.serverdescriptor))
+        self.bridge.updateFromExtraInfoDescriptor(
+            DescriptorRecord('extrainfo', self.extrainfo))
+
+        self.assertEqual(self.bridge.fingerprint,
+                         '2C3225C4805331025E211F4B6E5BF45C333FDD2C')
+        self.assertEqual(self.bridge.bandwidthObserved, 1623207134)
+        self.assertEqual(len(self.bridge.transports), 4)
+        self.assertEqual(self.bridge.getDescriptorLastPublished(),
+                         self.serverdescriptor.published)
+
     def test_Bridge_updateFromExtraInfoDescriptor_bad_signature_changed(self):
         """Calling updateFromExtraInfoDescriptor() with a descriptor which
         has a bad signature should not continue to process the descriptor.
@@ -1703,6 +1723,31 @@ class BridgeTests(unittest.TestCase):
         self.assertIsInstance(published, datetime.datetime)
         self.assertEqual(str(published), '2014-12-22 21:51:27')
 
+    def test_Bridge_getDistributionState_copy(self):
+        """A copy of a bridge should have an equal distribution state."""
+        self.bridge.updateFromNetworkStatus(self.networkstatus)
+
+        self.assertEqual(self.bridge.getDistributionState(),
+                         copy.deepcopy(self.bridge).getDistributionState())
+
+    def test_Bridge_getDistributionState_blocked(self):
+        """Blocking a bridge should change its distribution state."""
+        self.bridge.updateFromNetworkStatus(self.networkstatus)
+        state = self.bridge.getDistributionState()
+
+        self.bridge.setBlockedIn('CN')
+        self.assertNotEqual(self.bridge.getDistributionState(), state)
+
+    def test_Bridge_getDistributionState_not_running(self):
+        """A bridge losing its Running flag should change its distribution
+        state.
+        """
+        self.bridge.updateFromNetworkStatus(self.networkstatus)
+        state = self.bridge.getDistributionState()
+
+        self.bridge.flags.running = not self.bridge.flags.running
+        self.assertNotEqual(self.bridge.getDistributionState(), state)
+
     def test_Bridge_isBlockedIn_IS(self):
         """Calling isBlockedIn('IS') should return False when the bridge isn't
         blocked in Iceland.
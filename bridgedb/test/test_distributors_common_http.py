@@ -13,6 +13,7 @@
 
 from __future__ import print_function
 
+import json
 import logging
 import os
 
@@ -116,3 +117,65 @@ class GetClientIPTests(unittest.TestCase):
         request = self.createRequestWithIPs()
         clientIP = server.getClientIP(request)
         self.assertEqual(clientIP, '3.3.3.3')
+
+
+class StatusResourcesTests(unittest.TestCase):
+    """Tests for :class:`bridgedb.distributors.common.http.ReadyResource`
+    and :class:`bridgedb.distributors.common.http.HealthResource`.
+    """
+
+    def setUp(self):
+        self.status = {'ready': False, 'generation': 0, 'bridges': {}}
+        self.root = server.resource.Resource()
+        server.addStatusResources(self.root, lambda: self.status)
+
+    def render(self, path):
+        request = DummyRequest([path])
+        request.method = b'GET'
+        page = self.root.getChildWithDefault(path, request).render(request)
+        return request, page
+
+    def test_ready_before_first_generation(self):
+        """/ready should respond with a 503 until there is a generation."""
+        request, page = self.render('ready')
+        self.assertEqual(request.responseCode, 503)
+        self.assertEqual(page, b"not ready\n")
+
+    def test_ready(self):
+        """/ready should respond with a 200 once there is a generation."""
+        self.status.update(ready=True, generation=1)
+        request, page = self.render('ready')
+        self.assertNotEqual(request.responseCode, 503)
+        self.assertEqual(page, b"ready\n")
+
+    def test_health(self):
+        """/health should describe the status as JSON."""
+        self.status.update(ready=True, generation=3, bridges={'https': 10})
+        request, page = self.render('health')
+        self.assertEqual(json.loads(page), self.status)
+        self.assertEqual(request.outgoingHeaders['content-type'],
+                         'application/json')
+
+    def test_health_detailed(self):
+        """/health should only ask for the detailed status if it was added
+        with ``detailed=True``.
+        """
+        calls = []
+        def getStatus(detailed=False):
+            calls.append(detailed)
+            return self.status
+
+        root = server.resource.Resource()
+        server.addStatusResources(root, getStatus)
+        self.root = root
+        self.render('health')
+        server.addStatusResources(root, getStatus, detailed=True)
+        self.render('health')
+
+        self.assertEqual(calls, [False, True])
+
+    def test_addStatusResources_without_status(self):
+        """Without a status, no resources should be added."""
+        root = server.resource.Resource()
+        server.addStatusResources(root, None)
+        self.assertEqual(root.children, {})
@@ -133,6 +133,33 @@ class EmailDistributorTests(unittest.TestCase):
         # The fourth from 'ghi' is ignored.
         self.assertRaises(IgnoreEmail,  dist.getBridges, bridgeRequest3, 1)
 
+    def test_EmailDistributor_getBridgesBatch(self):
+        """getBridgesBatch() should give each client the same bridges as
+        getBridges() would, and put the exceptions which getBridges() would
+        raise in place of their bridges.
+        """
+        dist = EmailDistributor(self.key, self.domainmap, self.domainrules)
+        [dist.hashring.insert(bridge) for bridge in self.bridges]
+        clients = ['abc@example.com', 'default', 'def@example.com',
+                   'abc@example.com', 'abc@example.com']
+
+        answers = dist.getBridgesBatch(
+            [self.makeClientRequest(client) for client in clients], 1)
+
+        self.assertEqual(len(answers), 5)
+        self.assertIsInstance(answers[1], BadEmail)
+        self.assertIsInstance(answers[3], TooSoonEmail)
+        self.assertIsInstance(answers[4], IgnoreEmail)
+
+        # The same bridges should be given out again, once the clients may
+        # ask again:
+        dist.emailRateMax = -1
+        self.assertEqual(len(answers[0]), 3)
+        self.assertEqual(answers[0], dist.getBridges(
+            self.makeClientRequest('abc@example.com'), 1))
+        self.assertEqual(answers[2], dist.getBridges(
+            self.makeClientRequest('def@example.com'), 1))
+
     def test_EmailDistributor_getBridges_rate_limit(self):
         """A client's first email should return bridges.  The second should
         return a warning, and the third should receive no response.
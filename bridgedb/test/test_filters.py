@@ -17,6 +17,7 @@ import ipaddr
 from twisted.trial import unittest
 
 from bridgedb import filters
+from bridgedb.Bridges import PlacementTable
 from bridgedb.bridges import Bridge
 from bridgedb.bridges import PluggableTransport
 from bridgedb.crypto import getHMACFunc
@@ -65,6 +66,39 @@ class FiltersTests(unittest.TestCase):
         filtre = filters.bySubring(self.hmac, 2, 2)
         self.assertFalse(filtre(self.bridge))
 
+    def test_bySubring_placements(self):
+        """filters.bySubring(HMAC, 1, 2) with some placements should remember
+        the Bridge's subring in them, and should be cached in them.
+        """
+        placements = PlacementTable()
+        filtre = filters.bySubring(self.hmac, 1, 2, placements)
+
+        self.assertIsNot(filtre, filters.bySubring(self.hmac, 1, 2))
+        self.assertIs(filters.bySubring(self.hmac, 1, 2, placements), filtre)
+        self.assertTrue(filtre(self.bridge))
+        self.assertEqual(placements.placements[self.bridge.identity][1][1], 0)
+
+    def test_bySubring_placements_per_generation(self):
+        """Asking for filters.bySubring(HMAC, 1, 2) with the placements of a
+        new generation shouldn't change the filter of an old generation, nor
+        any filters made from it with filters.byFilters().
+        """
+        old, new = PlacementTable(), PlacementTable()
+        oldFiltre = filters.bySubring(self.hmac, 1, 2, old)
+        oldFilters = filters.internFilters([oldFiltre, filters.byIPv4])
+        oldCombined = filters.byFilters(oldFilters)
+
+        newFiltre = filters.bySubring(self.hmac, 1, 2, new)
+        newFilters = filters.internFilters([newFiltre, filters.byIPv4])
+        newCombined = filters.byFilters(newFilters)
+        self.assertIsNot(newFiltre, oldFiltre)
+        self.assertIsNot(newCombined, oldCombined)
+        self.assertIs(filters.byFilters(oldFilters), oldCombined)
+
+        self.assertTrue(oldCombined(self.bridge))
+        self.assertIn(self.bridge.identity, old.placements)
+        self.assertNotIn(self.bridge.identity, new.placements)
+
     def test_byFilters_bySubring_byTransport_correct_subhashring_with_transport(self):
         """Filtering byTransport('voltron') and bySubring(HMAC, 1, 2) when the
         Bridge has a voltron transport and is assigned to sub-hashring 1-of-2
@@ -108,6 +142,37 @@ class FiltersTests(unittest.TestCase):
         filtre = filters.byFilters([])
         self.assertTrue(filtre(self.bridge))
 
+    def test_byFilters_order(self):
+        """byFilters() should return the same filter for the same filters,
+        in any order and with duplicates.
+        """
+        cn = filters.byNotBlockedIn('cn')
+        ir = filters.byNotBlockedIn('ir')
+        self.assertIs(filters.byFilters([cn, ir]),
+                      filters.byFilters([ir, cn, ir]))
+
+    def test_byFilters_distinct(self):
+        """byFilters() should return different filters for different filters,
+        even when the filters' names share all of the same words.
+        """
+        first = filters.byFilters([filters.byNotBlockedIn('cn', 'voltron'),
+                                   filters.byNotBlockedIn('ir')])
+        second = filters.byFilters([filters.byNotBlockedIn('cn'),
+                                    filters.byNotBlockedIn('ir', 'voltron')])
+        self.assertIsNot(first, second)
+
+    def test_internFilters(self):
+        """internFilters() should return the very same frozenset for the same
+        filters, in any order and with duplicates.
+        """
+        cn = filters.byNotBlockedIn('cn')
+        ir = filters.byNotBlockedIn('ir')
+        key = filters.internFilters([cn, ir])
+
+        self.assertEqual(key, frozenset([cn, ir]))
+        self.assertIs(filters.internFilters([ir, cn, cn]), key)
+        self.assertIs(filters.internFilters(frozenset([cn, ir])), key)
+
     def test_byIPv_ipv5(self):
         """Calling byIPv(ipVersion=5) should default to filterint by IPv4."""
         filtre = filters.byIPv(5)
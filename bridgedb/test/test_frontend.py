@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of BridgeDB, a Tor bridge distribution system.
+#
+# :authors: please see the AUTHORS file for attributions
+# :copyright: (c) 2007-2017, The Tor Project, Inc.
+#             (c) 2007-2017, all entities within the AUTHORS file
+# :license: see LICENSE for licensing information
+
+"""Tests for :mod:`bridgedb.frontend`."""
+
+from __future__ import print_function
+
+import base64
+import os
+
+from twisted.trial import unittest
+
+from bridgedb import frontend
+from bridgedb import main
+from bridgedb import proxy
+from bridgedb import snapshot
+from bridgedb import Storage
+from bridgedb.test.util import generateFakeBridges
+
+
+HERE = os.getcwd()
+TOPDIR = HERE.rstrip('_trial_temp')
+
+
+class FrontendTests(unittest.TestCase):
+    """Unittests for :mod:`bridgedb.frontend`."""
+
+    def setUp(self):
+        self.config = main.loadConfig(os.path.join(TOPDIR, 'bridgedb.conf'))
+        self.key = base64.b64decode('TvPS1y36BFguBmSOvhChgtXB2Lt+BOw0mGfz9SZe12Y=')
+        self.filename = self.mktemp()
+        self.proxies = proxy.ProxySet()
+        self.bridges = [b for b in generateFakeBridges() if b.flags.running]
+
+        Storage.setDBFilename('test-frontend.sqlite')
+        Storage.initializeDBLock()
+        self.addCleanup(Storage.clearGlobalDB)
+
+        (self.hashring, _, self.ipDistributor, self.moatDistributor) = \
+            main.createBridgeRings(self.config, self.proxies, self.key)
+        self.hashring.insertMany(self.bridges)
+
+    def export(self):
+        main.saveSnapshot(self.filename, main.getRingSettings(self.config),
+                          self.key, self.bridges, self.hashring.assignments,
+                          self.proxies)
+
+    def test_loadRings(self):
+        """loadRings() should give the HTTPS and moat distributors the same
+        bridges as the ones which wrote the snapshot, without the database.
+        """
+        self.export()
+        Storage.clearGlobalDB()
+
+        ipDistributor, moatDistributor = frontend.loadRings(
+            self.config, self.key, self.filename)
+
+        self.assertItemsEqual(
+            ipDistributor.hashring.bridgesByFingerprint.keys(),
+            self.ipDistributor.hashring.bridgesByFingerprint.keys())
+        self.assertItemsEqual(
+            moatDistributor.hashring.bridgesByFingerprint.keys(),
+            self.moatDistributor.hashring.bridgesByFingerprint.keys())
+        self.assertGreater(len(ipDistributor.hashring.filterRings), 0)
+
+    def test_loadRings_other_settings(self):
+        """loadRings() should raise a SnapshotError if the snapshot was
+        written with different settings.
+        """
+        self.export()
+        self.config.N_IP_CLUSTERS += 1
+
+        self.assertRaises(snapshot.SnapshotError, frontend.loadRings,
+                          self.config, self.key, self.filename)
+
+    def test_loadRings_proxies(self):
+        """loadRings() should use the open proxies which the snapshot was
+        written with, so that a frontend without any proxies of its own
+        creates the same hashrings as a BridgeDB with Tor exit relays.
+        """
+        self.proxies.addExitRelays(['1.2.3.4', '5.6.7.8'])
+        (self.hashring, _, self.ipDistributor, _) = main.createBridgeRings(
+            self.config, self.proxies, self.key)
+        self.hashring.insertMany(self.bridges)
+        self.export()
+
+        ipDistributor, _ = frontend.loadRings(self.config, self.key,
+                                              self.filename)
+
+        self.assertEqual(ipDistributor.totalSubrings,
+                         self.ipDistributor.totalSubrings)
+        self.assertEqual(ipDistributor.proxySubring,
+                         self.ipDistributor.proxySubring)
+        self.assertTrue(ipDistributor.proxies.isExitRelay('1.2.3.4'))
+
+    def test_getSnapshotID(self):
+        """getSnapshotID() should change when the snapshot is replaced."""
+        self.export()
+        first = frontend.getSnapshotID(self.filename)
+        self.assertEqual(frontend.getSnapshotID(self.filename), first)
+
+        self.export()
+        self.assertNotEqual(frontend.getSnapshotID(self.filename), first)
+
+    def test_run_without_snapshot(self):
+        """run() should return a non-zero exit status, without starting the
+        reactor, when there's no snapshot to serve from.
+        """
+        self.config.SNAPSHOT_FILE = None
+        self.assertEqual(frontend.run(self.config), 1)
+
+        self.config.MASTER_KEY_FILE = self.mktemp()
+        self.assertEqual(frontend.run(self.config, self.filename), 1)
+        self.assertFalse(os.path.exists(self.config.MASTER_KEY_FILE))
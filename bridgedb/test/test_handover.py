@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of BridgeDB, a Tor bridge distribution system.
+#
+# :authors: please see the AUTHORS file for attributions
+# :copyright: (c) 2007-2017, The Tor Project, Inc.
+#             (c) 2007-2017, all entities within the AUTHORS file
+# :license: see LICENSE for licensing information
+
+"""Tests for :mod:`bridgedb.handover`."""
+
+from __future__ import print_function
+
+import os
+import socket
+import stat
+
+from twisted.internet import defer
+from twisted.internet import protocol
+from twisted.internet import reactor
+from twisted.internet import task
+from twisted.internet import threads
+from twisted.test import proto_helpers
+from twisted.trial import unittest
+
+from bridgedb import handover
+from bridgedb import prefork
+
+
+class DummyReactor(task.Clock):
+    """A reactor which only pretends to stop."""
+
+    stopped = False
+
+    def stop(self):
+        self.stopped = True
+
+
+class DummyWorkers(object):
+    """A :class:`bridgedb.prefork.WorkerPool` which only remembers whether
+    it was told to drain.
+    """
+
+    drained = False
+
+    def drain(self):
+        self.drained = True
+
+
+class DummyPort(object):
+    """A listening port which stops listening straight away."""
+
+    listening = True
+
+    def stopListening(self):
+        self.listening = False
+
+
+class HandoverTests(unittest.TestCase):
+    """Unittests for :mod:`bridgedb.handover`."""
+
+    def setUp(self):
+        self.addCleanup(prefork._inherited.clear)
+        self.addCleanup(prefork._listening.clear)
+        self.path = self.mktemp()
+
+    def test_formatAddresses_parseAddresses(self):
+        """parseAddresses() should parse what formatAddresses() writes."""
+        addresses = [('', 6725), ('127.0.0.1', 6789), ('::1', 6791)]
+        description = handover.formatAddresses(addresses)
+
+        self.assertEqual(description, ":6725,127.0.0.1:6789,::1:6791")
+        self.assertEqual(handover.parseAddresses(description), addresses)
+
+    def test_parseAddresses_malformed(self):
+        """parseAddresses() should raise a ValueError for a malformed
+        description.
+        """
+        self.assertRaises(ValueError, handover.parseAddresses, "6789")
+
+    def test_listen_private(self):
+        """listen() should create a socket which only we can connect to."""
+        factory = handover.listen(self.path, 10)
+        self.addCleanup(factory.port.stopListening)
+
+        self.assertEqual(stat.S_IMODE(os.stat(self.path).st_mode), 0o600)
+
+    def test_drain_workers(self):
+        """Upon draining, our workers should be told to stop accepting
+        connections straight away, and the reactor should only be stopped
+        after the drain timeout.
+        """
+        clock = DummyReactor()
+        workers = DummyWorkers()
+        factory = handover.HandoverFactory(10, clock, workers)
+        factory.port = DummyPort()
+        proto = factory.buildProtocol(None)
+        transport = proto_helpers.StringTransport()
+        proto.makeConnection(transport)
+
+        proto.lineReceived("STARTED")
+
+        self.assertTrue(workers.drained)
+        self.assertFalse(factory.port.listening)
+        self.assertEqual(transport.value(), "DRAINING\n")
+        self.assertFalse(clock.stopped)
+        clock.advance(10)
+        self.assertTrue(clock.stopped)
+
+    def test_requestSockets_nobody(self):
+        """requestSockets() should return None if no BridgeDB is listening
+        for handovers.
+        """
+        self.assertIsNone(handover.requestSockets(self.path))
+        self.assertEqual(prefork._inherited, {})
+
+    @defer.inlineCallbacks
+    def test_handover(self):
+        """A new BridgeDB should receive our listening socket, and we should
+        stop accepting on it, and stop listening for handovers, once it has
+        started.
+        """
+        factory = protocol.ServerFactory()
+        factory.protocol = protocol.Protocol
+        listener = prefork.listenTCP(0, factory, interface='127.0.0.1')
+        self.addCleanup(listener.stopListening)
+        port = listener.getHost().port
+
+        clock = DummyReactor()
+        old = handover.HandoverFactory(10, clock)
+        old.port = reactor.listenUNIX(self.path, old)
+        self.addCleanup(old.port.stopListening)
+
+        conn = yield threads.deferToThread(handover.requestSockets,
+                                           self.path)
+        self.assertIsNotNone(conn)
+        self.assertEqual(list(prefork._inherited), [('127.0.0.1', 0)])
+        fd = prefork._inherited[('127.0.0.1', 0)]
+        sock = socket.fromfd(fd, socket.AF_INET, socket.SOCK_STREAM)
+        self.addCleanup(sock.close)
+        self.assertEqual(sock.getsockname(), ('127.0.0.1', port))
+        self.assertFalse(old.draining)
+
+        yield threads.deferToThread(handover.finishHandover, conn)
+        self.assertTrue(old.draining)
+        self.assertEqual(prefork._inherited, {})
+        self.assertFalse(os.path.exists(self.path))
+        self.assertNotIn(listener, reactor.getReaders())
+        self.assertFalse(clock.stopped)
+        clock.advance(10)
+        self.assertTrue(clock.stopped)
+
+        # The handed over socket should still be listening:
+        client = socket.create_connection(('127.0.0.1', port))
+        client.close()
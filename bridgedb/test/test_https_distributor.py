@@ -134,6 +134,54 @@ class HTTPSDistributorTests(unittest.TestCase):
         subring = dist.mapSubnetToSubring(subnet, usingProxy=False)
         self.assertNotEqual(subring, dist.proxySubring)
 
+    def test_HTTPSDistributor_getClientPlacement(self):
+        """HTTPSDistributor.getClientPlacement() should give the same
+        subhashring and position as mapSubnetToSubring() and
+        mapClientToHashringPosition(), and cache them.
+        """
+        dist = distributor.HTTPSDistributor(3, self.key, ProxySet(['1.1.1.1', '2.2.2.2']))
+        subnet = '15.1.0.0/16'
+        expected = (dist.mapSubnetToSubring(subnet, usingProxy=False),
+                    dist.mapClientToHashringPosition(1, subnet))
+
+        self.assertEqual(dist.getClientPlacement(1, subnet), expected)
+        self.assertEqual(dist.getClientPlacement(1, subnet), expected)
+        self.assertEqual(len(dist._placements), 1)
+
+        subring, _ = dist.getClientPlacement(1, 'proxy-group-3', True)
+        self.assertEqual(subring, dist.proxySubring)
+        self.assertEqual(len(dist._placements), 2)
+
+    def test_HTTPSDistributor_getClientPlacement_new_interval(self):
+        """HTTPSDistributor.getClientPlacement() should flush its cache when
+        the interval changes, and give a new position.
+        """
+        dist = distributor.HTTPSDistributor(3, self.key)
+        subnet = '15.1.0.0/16'
+        dist.getClientPlacement(1, '16.1.0.0/16')
+        subring1, position1 = dist.getClientPlacement(1, subnet)
+        subring2, position2 = dist.getClientPlacement(2, subnet)
+
+        self.assertEqual(subring1, subring2)
+        self.assertNotEqual(position1, position2)
+        self.assertEqual(position2, dist.mapClientToHashringPosition(2, subnet))
+        self.assertEqual(len(dist._placements), 1)
+
+    def test_HTTPSDistributor_getClientPlacement_bounded(self):
+        """HTTPSDistributor.getClientPlacement() should keep at most
+        placementCacheSize subnets, evicting the least recently used.
+        """
+        dist = distributor.HTTPSDistributor(3, self.key)
+        dist.placementCacheSize = 2
+        dist.getClientPlacement(1, '15.1.0.0/16')
+        dist.getClientPlacement(1, '15.2.0.0/16')
+        dist.getClientPlacement(1, '15.1.0.0/16')
+        dist.getClientPlacement(1, '15.3.0.0/16')
+
+        self.assertEqual(len(dist._placements), 2)
+        self.assertIn(('15.1.0.0/16', False), dist._placements)
+        self.assertNotIn(('15.2.0.0/16', False), dist._placements)
+
     def test_HTTPSDistributor_prepopulateRings_with_proxies(self):
         """An HTTPSDistributor with proxies should prepopulate two extra
         subhashrings (one for each of HTTP-Proxy-IPv4 and HTTP-Proxy-IPv6).
@@ -163,6 +211,185 @@ class HTTPSDistributorTests(unittest.TestCase):
 
         self.assertEqual(len(ipv4subrings), len(ipv6subrings))
 
+    def test_HTTPSDistributor_getBridges_bounded_ring_cache(self):
+        """Requesting bridges with many different filters shouldn't grow the
+        number of cached subrings beyond ringCacheSize, and should never
+        evict the prepopulated subrings.
+        """
+        dist = distributor.HTTPSDistributor(3, self.key)
+        [dist.insert(bridge) for bridge in self.bridges]
+        dist.prepopulateRings()
+        prepopulated = set(dist.hashring.filterRings.keys())
+
+        for cc in ['cn', 'ir', 'sy', 'kz', 'tm', 'by', 'ru', 'eg', 'et',
+                   'pk', 'vn', 'ae', 'sa', 'tr', 'bd', 'cu', 'ug', 'ng']:
+            dist.getBridges(self.randomClientRequestForNotBlockedIn(cc), 1)
+
+        self.assertLessEqual(len(dist.hashring.filterRings),
+                             len(prepopulated) + dist.ringCacheSize)
+        self.assertTrue(prepopulated.issubset(dist.hashring.filterRings))
+        self.assertGreater(dist.hashring.cacheEvictions, 0)
+
+    def test_HTTPSDistributor_getBridges_records_ring_requests(self):
+        """getBridges() should count the requested filters, so that the most
+        popular subhashrings can be prebuilt into another distributor.
+        """
+        dist = distributor.HTTPSDistributor(3, self.key)
+        [dist.insert(bridge) for bridge in self.bridges]
+        dist.prepopulateRings()
+
+        for _ in range(3):
+            dist.getBridges(self.randomClientRequestForNotBlockedIn('cn'), 1)
+        dist.getBridges(self.randomClientRequestForNotBlockedIn('ir'), 1)
+
+        popular = dist.popularRingRequests(1)
+        self.assertEqual(len(popular), 1)
+        filters, subring = popular[0]
+        self.assertIn('cn', ' '.join([f.name for f in filters]))
+
+        other = distributor.HTTPSDistributor(3, self.key)
+        [other.insert(bridge) for bridge in self.bridges]
+        other.prepopulateRings()
+        other.prebuildRings(popular)
+
+        self.assertIsNotNone(other.hashring.getRing(filters))
+
+    def test_HTTPSDistributor_getBridges_in_background(self):
+        """With buildRingsInBackground, a cache miss should be answered from
+        the nearest cached subhashring, using only bridges which match the
+        client's filters, while the missing subhashring is built.
+        """
+        dist = distributor.HTTPSDistributor(1, self.key)
+        dist.buildRingsInBackground = True
+        for bridge in self.bridges[:len(self.bridges) // 2]:
+            bridge.setBlockedIn('cn')
+        [dist.insert(bridge) for bridge in self.bridges]
+        dist.prepopulateRings()
+        rings = len(dist.hashring.filterRings)
+
+        bridgeRequest = self.randomClientRequestForNotBlockedIn('cn')
+        bridges = dist.getBridges(bridgeRequest, 1)
+
+        for bridge in bridges:
+            self.assertFalse(bridge.isBlockedIn('cn'))
+        self.assertEqual(len(dist.hashring.filterRings), rings)
+        self.assertEqual(len(dist._ringsBuilding), 1)
+
+    def test_HTTPSDistributor_getBridges_in_background_full(self):
+        """With buildRingsInBackground, a cache miss answered from the nearest
+        cached subhashring should still get as many bridges as the client's
+        own subhashring would give.
+        """
+        dist = distributor.HTTPSDistributor(1, self.key)
+        dist.buildRingsInBackground = True
+        for bridge in self.bridges[:len(self.bridges) * 9 // 10]:
+            bridge.setBlockedIn('cn')
+        [dist.insert(bridge) for bridge in self.bridges]
+        dist.prepopulateRings()
+
+        bridgeRequest = self.randomClientRequestForNotBlockedIn('cn')
+        bridges = dist.getBridges(bridgeRequest, 1)
+        ring = dist._addRing(frozenset(bridgeRequest.filters), 1)
+
+        self.assertEqual(len(bridges), dist.bridgesPerResponse(ring))
+        for bridge in bridges:
+            self.assertFalse(bridge.isBlockedIn('cn'))
+
+    def test_HTTPSDistributor_getBridges_in_background_same_answer(self):
+        """With buildRingsInBackground, a client should get the same bridges
+        from the nearest cached subhashring as from their own subhashring
+        once it is built, including the ones forced into answers by the
+        ports and flags which answers need.
+        """
+        params = BridgeRingParameters(needPorts=[(443, 1)],
+                                      needFlags=[('stable', 1)])
+        dist = distributor.HTTPSDistributor(1, self.key,
+                                            answerParameters=params)
+        dist.buildRingsInBackground = True
+        for bridge in self.bridges[:len(self.bridges) // 2]:
+            bridge.setBlockedIn('cn')
+        for bridge in self.bridges[::7]:
+            self.addCleanup(setattr, bridge, 'orPort', bridge.orPort)
+            bridge.orPort = 443
+        [dist.insert(bridge) for bridge in self.bridges]
+        dist.prepopulateRings()
+
+        requests = [self.randomClientRequestForNotBlockedIn('cn')
+                    for _ in range(10)]
+        before = [dist.getBridges(request, 1) for request in requests]
+        self.assertEqual(len(dist._ringsBuilding), 1)
+
+        filters = frozenset(requests[0].filters)
+        dist._addRing(filters, 1)
+        after = [dist.getBridges(request, 1) for request in requests]
+
+        self.assertEqual(after, before)
+
+    def test_HTTPSDistributor_getBridges_in_background_too_few(self):
+        """With buildRingsInBackground, if too few bridges in the nearest
+        cached subhashring match a client's filters, the subhashring for
+        them should be built right away.
+        """
+        dist = distributor.HTTPSDistributor(1, self.key)
+        dist.buildRingsInBackground = True
+        for bridge in self.bridges[1:]:
+            bridge.setBlockedIn('cn')
+        [dist.insert(bridge) for bridge in self.bridges]
+        dist.prepopulateRings()
+        rings = len(dist.hashring.filterRings)
+
+        bridgeRequest = self.randomClientRequestForNotBlockedIn('cn')
+        bridges = dist.getBridges(bridgeRequest, 1)
+        filters = frozenset(bridgeRequest.filters)
+
+        for bridge in bridges:
+            self.assertFalse(bridge.isBlockedIn('cn'))
+        self.assertEqual(len(dist.hashring.filterRings), rings + 1)
+        self.assertIsNotNone(dist.hashring.getRing(filters))
+
+    def test_HTTPSDistributor_buildRingInBackground(self):
+        """buildRingInBackground() should add the subhashring once it has been
+        built.
+        """
+        dist = distributor.HTTPSDistributor(1, self.key)
+        [dist.insert(bridge) for bridge in self.bridges]
+        filters = frozenset(self.randomClientRequestForNotBlockedIn('cn').filters)
+
+        d = dist.buildRingInBackground(filters, 1)
+        self.assertIsNone(dist.buildRingInBackground(filters, 1))
+
+        def check(_):
+            self.assertIsNotNone(dist.hashring.getRing(filters))
+            self.assertEqual(len(dist._ringsBuilding), 0)
+
+        d.addCallback(check)
+        return d
+
+    def test_HTTPSDistributor_useGeneration(self):
+        """useGeneration() should switch to the replacement's frozen hashring
+        and settings, keeping only the counts of clients' requests.
+        """
+        dist = distributor.HTTPSDistributor(1, self.key)
+        [dist.insert(bridge) for bridge in self.bridges]
+        dist.prepopulateRings()
+        dist.getBridges(self.randomClientRequestForNotBlockedIn('cn'), 1)
+        ringRequests = dist.ringRequests
+
+        replacement = distributor.HTTPSDistributor(4, self.key)
+        [replacement.insert(bridge) for bridge in self.bridges[:50]]
+        replacement.hashring.freeze()
+        replacement.prepopulateRings()
+
+        dist.useGeneration(replacement)
+
+        self.assertIs(dist.hashring, replacement.hashring)
+        self.assertEqual(dist.totalSubrings, 4)
+        self.assertEqual(dist._placements, {})
+        self.assertIs(dist.ringRequests, ringRequests)
+        self.assertGreater(len(dist.getBridges(self.randomClientRequest(), 1)),
+                           0)
+        self.assertLessEqual(len(dist.hashring), 50)
+
     def test_HTTPSDistributor_getBridges_with_blocked_bridges(self):
         dist = distributor.HTTPSDistributor(1, self.key)
         bridges = self.bridges[:]
@@ -293,6 +520,40 @@ class HTTPSDistributorTests(unittest.TestCase):
         for i in range(4):
             self.assertItemsEqual(responses[i], responses[i+1])
 
+    def test_HTTPSDistributor_getBridgesBatch(self):
+        """getBridgesBatch() should give each client, in order, the same
+        bridges as getBridges() would.
+        """
+        dist = distributor.HTTPSDistributor(3, self.key)
+        [dist.insert(bridge) for bridge in self.bridges[:250]]
+
+        clients = [randomValidIPv4String() for _ in xrange(20)]
+        clients.append(clients[0])
+
+        def makeRequest(client):
+            bridgeRequest = HTTPSBridgeRequest(addClientCountryCode=False)
+            bridgeRequest.client = client
+            bridgeRequest.isValid(True)
+            bridgeRequest.generateFilters()
+            return bridgeRequest
+
+        answers = dist.getBridgesBatch([makeRequest(c) for c in clients], 1)
+
+        self.assertEqual(len(answers), len(clients))
+        self.assertEqual(answers[0], answers[-1])
+        for client, answer in zip(clients, answers):
+            self.assertGreater(len(answer), 0)
+            self.assertEqual(answer, dist.getBridges(makeRequest(client), 1))
+
+    def test_HTTPSDistributor_getBridgesBatch_empty(self):
+        """getBridgesBatch() should give each client no bridges if there are
+        none.
+        """
+        dist = distributor.HTTPSDistributor(3, self.key)
+        requests = [self.randomClientRequest() for _ in xrange(3)]
+
+        self.assertEqual(dist.getBridgesBatch(requests, 1), [[], [], []])
+
     def test_HTTPSDistributor_getBridges_with_BridgeRingParameters(self):
        param = BridgeRingParameters(needPorts=[(443, 1)])
        dist = distributor.HTTPSDistributor(3, self.key, answerParameters=param)
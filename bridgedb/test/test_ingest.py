@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of BridgeDB, a Tor bridge distribution system.
+#
+# :authors: please see the AUTHORS file for attributions
+# :copyright: (c) 2007-2017, The Tor Project, Inc.
+#             (c) 2007-2017, all entities within the AUTHORS file
+# :license: see LICENSE for licensing information
+
+"""Tests for :mod:`bridgedb.ingest`."""
+
+from __future__ import print_function
+
+import os
+
+from twisted.internet import task
+from twisted.python.filepath import FilePath
+from twisted.trial import unittest
+
+from bridgedb import ingest
+from bridgedb.test import test_parse_descriptors as fixtures
+
+
+EXTRAINFO = fixtures.BRIDGE_EXTRA_INFO_DESCRIPTOR
+EXTRAINFO_NEWER = fixtures.BRIDGE_EXTRA_INFO_DESCRIPTOR_NEWER_DUPLICATE
+EXTRAINFO_ED25519 = fixtures.BRIDGE_EXTRA_INFO_DESCRIPTOR_ED25519
+NETWORKSTATUS_0 = fixtures.BRIDGE_NETWORKSTATUS_0
+NETWORKSTATUS_1 = fixtures.BRIDGE_NETWORKSTATUS_1
+FINGERPRINT = 'E08B324D20AD0A13E114F027AB9AC3F32CA696A0'
+
+
+class DescriptorCacheTests(unittest.TestCase):
+    """Unittests for :class:`bridgedb.ingest.DescriptorCache`."""
+
+    def setUp(self):
+        self.cache = ingest.DescriptorCache()
+        self.extrainfo = self.mktemp()
+        self.networkstatus = self.mktemp()
+
+    def write(self, filename, contents, mode='w', mtime=None):
+        with open(filename, mode) as fh:
+            fh.write(contents)
+        if mtime is not None:
+            os.utime(filename, (mtime, mtime))
+
+    def getAllExtraInfos(self):
+        """Parse all of the extrainfo file into a new cache."""
+        return ingest.DescriptorCache().getExtraInfos([self.extrainfo])
+
+    def test_unchanged(self):
+        """A file which wasn't modified shouldn't be parsed again."""
+        self.write(self.networkstatus, NETWORKSTATUS_0)
+        records = self.cache.getNetworkStatuses(self.networkstatus)
+
+        self.assertEqual(len(records), 1)
+        self.assertIs(self.cache.getNetworkStatuses(self.networkstatus),
+                      records)
+
+    def test_rewritten(self):
+        """A file which was rewritten with the same contents shouldn't be
+        parsed again.
+        """
+        self.write(self.networkstatus, NETWORKSTATUS_0)
+        records = self.cache.getNetworkStatuses(self.networkstatus)
+        self.write(self.networkstatus, NETWORKSTATUS_0, mtime=1)
+
+        self.assertIs(self.cache.getNetworkStatuses(self.networkstatus),
+                      records)
+        self.assertEqual(self.cache.cursors[self.networkstatus].mtime, 1)
+
+    def test_replaced(self):
+        """A file whose contents changed should be parsed again."""
+        self.write(self.networkstatus, NETWORKSTATUS_0)
+        self.cache.getNetworkStatuses(self.networkstatus)
+        self.write(self.networkstatus,
+                   NETWORKSTATUS_0 + NETWORKSTATUS_1)
+
+        records = self.cache.getNetworkStatuses(self.networkstatus)
+        self.assertEqual(len(records), 2)
+
+    def test_appended(self):
+        """Only the extrainfo descriptors appended to a file should be
+        parsed, and the newest descriptor for each bridge should be kept.
+        """
+        self.write(self.extrainfo, EXTRAINFO)
+        records = self.cache.getExtraInfos([self.extrainfo])
+        cursor = self.cache.cursors[self.extrainfo]
+        self.assertEqual(cursor.offset, len(EXTRAINFO))
+        published = records[FINGERPRINT].published
+
+        self.write(self.extrainfo, EXTRAINFO_NEWER + EXTRAINFO_ED25519,
+                   mode='a')
+        records = self.cache.getExtraInfos([self.extrainfo])
+
+        self.assertIs(self.cache.cursors[self.extrainfo], cursor)
+        self.assertEqual(cursor.offset, os.path.getsize(self.extrainfo))
+        self.assertItemsEqual(records, self.getAllExtraInfos())
+        self.assertGreater(records[FINGERPRINT].published, published)
+
+    def test_appended_incomplete(self):
+        """An extrainfo descriptor which is still being written at the end of
+        a file should be parsed once it has been finished.
+        """
+        half = len(EXTRAINFO_ED25519) // 2
+        self.write(self.extrainfo, EXTRAINFO)
+        self.cache.getExtraInfos([self.extrainfo])
+
+        self.write(self.extrainfo, EXTRAINFO_ED25519[:half], mode='a')
+        records = self.cache.getExtraInfos([self.extrainfo])
+        self.assertEqual(list(records), [FINGERPRINT])
+        self.assertEqual(self.cache.cursors[self.extrainfo].offset,
+                         len(EXTRAINFO))
+
+        self.write(self.extrainfo, EXTRAINFO_ED25519[half:], mode='a')
+        records = self.cache.getExtraInfos([self.extrainfo])
+        self.assertGreater(len(records), 1)
+        self.assertItemsEqual(records, self.getAllExtraInfos())
+
+    def test_forget(self):
+        """Files which are no longer read from should be forgotten."""
+        self.write(self.networkstatus, NETWORKSTATUS_0)
+        self.cache.getNetworkStatuses(self.networkstatus)
+        self.cache.forget([self.extrainfo])
+
+        self.assertEqual(self.cache.cursors, {})
+        self.assertEqual(self.cache.records, {})
+
+
+class DescriptorWatcherTests(unittest.TestCase):
+    """Unittests for :class:`bridgedb.ingest.DescriptorWatcher`."""
+
+    def setUp(self):
+        self.clock = task.Clock()
+        self.requests = []
+        self.filename = os.path.abspath(self.mktemp())
+        self.watcher = ingest.DescriptorWatcher(
+            [self.filename], self.request, delay=10, reactor=self.clock)
+
+    def request(self):
+        self.requests.append(self.clock.seconds())
+
+    def test_changed_debounced(self):
+        """Only one reload should be requested for many writes, once none
+        have happened for the delay.
+        """
+        self.watcher.changed(None, FilePath(self.filename), 0)
+        self.clock.advance(5)
+        self.watcher.changed(None, FilePath(self.filename), 0)
+        self.clock.advance(9)
+        self.assertEqual(self.requests, [])
+
+        self.clock.advance(1)
+        self.assertEqual(self.requests, [15])
+        self.assertIsNone(self.watcher.pending)
+
+    def test_changed_other_file(self):
+        """Files other than the descriptor files should be ignored."""
+        self.watcher.changed(None, FilePath(self.filename + ".tmp"), 0)
+        self.clock.advance(10)
+
+        self.assertEqual(self.requests, [])
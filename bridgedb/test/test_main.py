@@ -14,7 +14,9 @@
 from __future__ import print_function
 
 import base64
+import copy
 import logging
+import multiprocessing
 import os
 import random
 import shutil
@@ -26,8 +28,12 @@ from time import sleep
 from twisted.internet.threads import deferToThread
 from twisted.trial import unittest
 
+from bridgedb import Bridges
+from bridgedb import ingest
 from bridgedb import main
+from bridgedb import Storage
 from bridgedb.parse.options import parseOptions
+from bridgedb.test.util import generateFakeBridges
 
 
 logging.getLogger().disabled = True
@@ -287,6 +293,191 @@ class BridgedbTests(unittest.TestCase):
         self._appendToFile(self.state.STATUS_FILE, NETWORKSTATUS_MALFORMED)
         self.assertRaises(ValueError, main.load, self.state, self.hashring)
 
+    def test_main_loadBridges(self):
+        """main.loadBridges() should return the parsed bridges without
+        inserting them anywhere.
+        """
+        bridges = main.loadBridges(self.state)
+        self.assertGreater(len(bridges), 0)
+        self.assertEqual(len(self.hashring), 0)
+
+    def test_main_loadBridges_parser(self):
+        """main.loadBridges() should return the same bridges when the
+        descriptors are parsed in a pool of processes.
+        """
+        parser = multiprocessing.Pool(2)
+        # Let the workers exit by themselves (cleanups run in reverse
+        # order), as terminating them can hang when the reactor has a
+        # SIGTERM handler:
+        self.addCleanup(parser.join)
+        self.addCleanup(parser.close)
+
+        parsed = main.loadBridges(self.state, parser)
+        bridges = main.loadBridges(self.state)
+        self.assertGreater(len(parsed), 0)
+        self.assertItemsEqual([b.fingerprint for b in parsed],
+                              [b.fingerprint for b in bridges])
+
+    def test_main_loadBridges_cache(self):
+        """main.loadBridges() should return the same bridges when the
+        descriptors are parsed into a cache, and when they are reloaded from
+        it.
+        """
+        cache = ingest.DescriptorCache()
+
+        parsed = main.loadBridges(self.state, cache=cache)
+        bridges = main.loadBridges(self.state)
+        self.assertGreater(len(parsed), 0)
+        self.assertItemsEqual([b.fingerprint for b in parsed],
+                              [b.fingerprint for b in bridges])
+
+        reloaded = main.loadBridges(self.state, cache=cache)
+        self.assertItemsEqual([b.fingerprint for b in reloaded],
+                              [b.fingerprint for b in bridges])
+
+    def test_main_getBridgeDelta(self):
+        """main.getBridgeDelta() should find the removed, added, and changed
+        bridges.
+        """
+        bridges = generateFakeBridges(10)
+        live = main.getLiveBridges(bridges[:-1])
+
+        current = copy.deepcopy(bridges[1:])
+        current[0].orPort += 1
+        removed, added = main.getBridgeDelta(live, current)
+
+        self.assertItemsEqual([b.fingerprint for b in removed],
+                              [bridges[0].fingerprint, bridges[1].fingerprint])
+        self.assertItemsEqual([b.fingerprint for b in added],
+                              [bridges[1].fingerprint, bridges[-1].fingerprint])
+
+    def test_main_getBridgeDelta_unchanged(self):
+        """Reloading the same bridges should produce an empty delta."""
+        bridges = generateFakeBridges(10)
+        live = main.getLiveBridges(bridges)
+        removed, added = main.getBridgeDelta(live, copy.deepcopy(bridges))
+        self.assertEqual(removed, [])
+        self.assertEqual(added, [])
+
+    def test_main_replaceAllBridgeRings(self):
+        """main.replaceAllBridgeRings() should switch every distributor which
+        has a replacement to its replacement's frozen hashrings.
+        """
+        Storage.setDBFilename('test-generation.sqlite')
+        Storage.initializeDBLock()
+        self.addCleanup(Storage.clearGlobalDB)
+
+        (hashring, emailDist, httpsDist, moatDist) = main.createBridgeRings(
+            self.config, None, self.key)
+        (newHashring, newEmailDist, newHttpsDist, newMoatDist) = \
+            main.createBridgeRings(self.config, None, self.key)
+        newHashring.insertMany(generateFakeBridges())
+        newHashring.freeze()
+        moatHashring = moatDist.hashring
+
+        main.replaceAllBridgeRings([(httpsDist, newHttpsDist),
+                                    (emailDist, newEmailDist),
+                                    (moatDist, None)])
+
+        self.assertIs(httpsDist.hashring, newHttpsDist.hashring)
+        self.assertIs(emailDist.hashring, newEmailDist.hashring)
+        self.assertIs(moatDist.hashring, moatHashring)
+        self.assertTrue(httpsDist.hashring.frozen)
+        self.assertRaises(Bridges.FrozenHashringError,
+                          httpsDist.hashring.insert, generateFakeBridges()[0])
+
+    def buildGeneration(self, bridges, live=None, delta=None):
+        """Build a frozen generation of the hashrings, from scratch with
+        :func:`main.load`, or from the **live** one plus the **delta**.
+        """
+        (hashring, emailDist, httpsDist, moatDist) = main.createBridgeRings(
+            self.config, None, self.key)
+        if live is None:
+            main.load(self.state, hashring, bridges=bridges)
+        else:
+            hashring.updateFrom(live, *delta)
+        hashring.freeze()
+        for dist in (emailDist, httpsDist, moatDist):
+            dist.prepopulateRings()
+        return hashring, httpsDist
+
+    def test_main_createBridgeRings_updateFrom(self):
+        """Building a generation of the hashrings from the live one, after
+        one bridge changed, should only insert that bridge, and should give
+        the same answers as building it from scratch.
+        """
+        Storage.setDBFilename('test-delta.sqlite')
+        Storage.initializeDBLock()
+        self.addCleanup(Storage.clearGlobalDB)
+
+        bridges = generateFakeBridges()
+        live, _ = self.buildGeneration(bridges)
+        current = copy.deepcopy(bridges)
+        changed = [b for b in current
+                   if live.assignments.get(b.fingerprint) == 'https'][0]
+        changed.orPort += 1
+        delta = main.getBridgeDelta(main.getLiveBridges(bridges), current)
+
+        inserted = []
+        def recordInserts(cls, name):
+            method = getattr(cls, name)
+            def record(ring, bridge, *args, **kwargs):
+                inserted.append(bridge.fingerprint)
+                return method(ring, bridge, *args, **kwargs)
+            self.patch(cls, name, record)
+        recordInserts(Bridges.BridgeRing, 'insert')
+        recordInserts(Bridges.CompactBridgeRing, 'insert')
+        recordInserts(Bridges.FilteredBridgeSplitter, '_addBridge')
+
+        hashring, httpsDist = self.buildGeneration(current, live, delta)
+        self.assertEqual(set(inserted), set([changed.fingerprint]))
+
+        expected, expectedDist = self.buildGeneration(current)
+        self.assertEqual(hashring.assignments, expected.assignments)
+
+        # Each generation has its own filters, with the same names:
+        def byFilterNames(rings):
+            return dict([(frozenset([f.name for f in ringname]), subring)
+                         for ringname, (_, subring) in rings.items()])
+        rings = byFilterNames(httpsDist.hashring.filterRings)
+        expectedRings = byFilterNames(expectedDist.hashring.filterRings)
+        self.assertItemsEqual(rings.keys(), expectedRings.keys())
+        positions = [chr(i) * 20 for i in range(0, 256, 51)]
+        for names, subring in rings.items():
+            expectedRing = expectedRings[names]
+            self.assertEqual(len(subring), len(expectedRing))
+            for pos in positions:
+                self.assertEqual(
+                    [b.fingerprint for b in subring.getBridges(pos, 3)],
+                    [b.fingerprint for b in expectedRing.getBridges(pos, 3)])
+
+    def test_main_load_bridges(self):
+        """main.load() should insert the given bridges, rather than parsing
+        the descriptors.
+        """
+        bridges = generateFakeBridges()[:10]
+        inserted = main.load(self.state, self.hashring, bridges=bridges)
+        self.assertIs(inserted, bridges)
+        self.assertEqual(len(self.hashring), 10)
+
+    def test_main_restoreSnapshot(self):
+        """main.restoreSnapshot() should return the bridges saved by
+        main.saveSnapshot() with the same settings, and None otherwise.
+        """
+        filename = self.mktemp()
+        settings = main.getRingSettings(self.config)
+        bridges = generateFakeBridges()[:10]
+
+        self.assertIsNone(main.restoreSnapshot(filename, settings, self.key))
+        main.saveSnapshot(filename, settings, self.key, bridges)
+
+        restored = main.restoreSnapshot(filename, settings, self.key)
+        self.assertEqual([b.fingerprint for b in restored],
+                         [b.fingerprint for b in bridges])
+        self.assertIsNone(main.restoreSnapshot(filename, settings[1:],
+                                               self.key))
+        self.assertIsNone(main.restoreSnapshot(None, settings, self.key))
+
     def test_main_reloadFn(self):
         """main._reloadFn() should return True."""
         self.assertTrue(main._reloadFn())
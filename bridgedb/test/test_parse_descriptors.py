@@ -15,7 +15,9 @@ import datetime
 import glob
 import hashlib
 import io
+import multiprocessing
 import os
+import pickle
 import textwrap
 
 from twisted.trial import unittest
@@ -358,6 +360,26 @@ class ParseDescriptorsTests(unittest.TestCase):
         self.assertEqual(bridge.address, self.expectedIPBridge0)
         self.assertEqual(bridge.fingerprint, self.expectedFprBridge0)
 
+    def test_parse_descriptors_iterNetworkStatusFile(self):
+        """``b.p.descriptors.iterNetworkStatusFile`` should parse the
+        entries one at a time, and close the file after the last one.
+        """
+        descFile = self.writeTestDescriptorsToFile('networkstatus-bridges',
+                                                   BRIDGE_NETWORKSTATUS_0,
+                                                   BRIDGE_NETWORKSTATUS_1)
+        routers = descriptors.iterNetworkStatusFile(descFile)
+
+        self.assertEqual(next(routers).address, self.expectedIPBridge0)
+        self.assertEqual(next(routers).address, self.expectedIPBridge1)
+        self.assertRaises(StopIteration, next, routers)
+
+    def test_parse_descriptors_iterDescriptorRecords_unknown(self):
+        """``b.p.descriptors.iterDescriptorRecords`` should raise a
+        ValueError for an unknown kind of descriptor.
+        """
+        records = descriptors.iterDescriptorRecords('consensus', 'nonexistent')
+        self.assertRaises(ValueError, list, records)
+
     def test_parse_descriptors_parseNetworkStatusFile_two_files(self):
         """Test ``b.p.descriptors.parseNetworkStatusFile`` with two bridge
         networkstatus descriptors.
@@ -497,6 +519,54 @@ class ParseDescriptorsTests(unittest.TestCase):
 
         self.assertEqual(bridge.fingerprint, self.expectedFprBridge0)
 
+    def test_parse_descriptors_parseDescriptorFile_networkstatus(self):
+        """``b.p.descriptors.parseDescriptorFile`` should return a
+        DescriptorRecord for each networkstatus entry.
+        """
+        descFile = self.writeTestDescriptorsToFile('networkstatus-bridges',
+                                                   BRIDGE_NETWORKSTATUS_0,
+                                                   BRIDGE_NETWORKSTATUS_1)
+        routers = descriptors.parseDescriptorFile(('networkstatus', descFile))
+        self.assertEqual(len(routers), 2)
+        self.assertIsInstance(routers[0], descriptors.DescriptorRecord)
+        self.assertEqual(routers[0].address, self.expectedIPBridge0)
+        self.assertEqual(routers[0].fingerprint, self.expectedFprBridge0)
+        self.assertEqual(routers[1].address, self.expectedIPBridge1)
+
+    def test_parse_descriptors_parseDescriptorFile_extrainfo(self):
+        """A DescriptorRecord for an extrainfo descriptor should keep its
+        transports and contents, and should survive being pickled.
+        """
+        descFile = self.writeTestDescriptorsToFile(
+            'cached-extrainfo', BRIDGE_EXTRA_INFO_DESCRIPTOR)
+        router = descriptors.parseExtraInfoFiles(descFile).values()[0]
+        record = descriptors.parseDescriptorFile(('extrainfo', descFile))[0]
+        record = pickle.loads(pickle.dumps(record, pickle.HIGHEST_PROTOCOL))
+
+        self.assertEqual(record.fingerprint, self.expectedFprBridge0)
+        self.assertEqual(record.published, router.published)
+        self.assertEqual(record.transport, router.transport)
+        self.assertEqual(record.get_bytes(), router.get_bytes())
+
+    def test_parse_descriptors_parseDescriptorFile_processes(self):
+        """``b.p.descriptors.parseDescriptorFile`` should give the same
+        records when called in a pool of processes.
+        """
+        descFile = self.writeTestDescriptorsToFile('networkstatus-bridges',
+                                                   BRIDGE_NETWORKSTATUS_0)
+        pool = multiprocessing.Pool(2)
+        # Let the workers exit by themselves (cleanups run in reverse
+        # order), as terminating them can hang when the reactor has a
+        # SIGTERM handler:
+        self.addCleanup(pool.join)
+        self.addCleanup(pool.close)
+
+        results = pool.map(descriptors.parseDescriptorFile,
+                           [('networkstatus', descFile)] * 2)
+        self.assertEqual([[r.digest for r in rs] for rs in results],
+                         [[r.digest for r in descriptors.parseDescriptorFile(
+                             ('networkstatus', descFile))]] * 2)
+
     def test_parse_descriptors_deduplicate_identical_timestamps(self):
         """Parsing two descriptors for the same bridge with identical
         timestamps should log a ``b.p.descriptors.DescriptorWarning``
@@ -508,6 +578,22 @@ class ParseDescriptorsTests(unittest.TestCase):
 
         self.assertEqual(len(routers), 1)
 
+    def test_parse_descriptors_deduplicate_generator(self):
+        """``b.p.descriptors.deduplicate`` should keep only the newest of
+        the descriptors from a generator, in a single pass.
+        """
+        descFileOne = io.BytesIO(BRIDGE_EXTRA_INFO_DESCRIPTOR_NEWER_DUPLICATE)
+        descFileTwo = io.BytesIO(BRIDGE_EXTRA_INFO_DESCRIPTOR)
+        descFileThree = io.BytesIO(BRIDGE_EXTRA_INFO_DESCRIPTOR_NEWEST_DUPLICATE)
+        routers = descriptors.iterExtraInfoFiles(descFileOne, descFileTwo,
+                                                 descFileThree)
+        newest = descriptors.deduplicate(routers, statistics=True)
+
+        self.assertEqual(len(newest), 1)
+        self.assertEqual(
+            newest.values()[0].published,
+            datetime.datetime.strptime("2014-12-04 03:10:25", "%Y-%m-%d %H:%M:%S"))
+
     def test_parse_descriptors_parseExtraInfoFiles_two_files(self):
         """Test for ``b.p.descriptors.parseExtraInfoFiles`` with two
         bridge extrainfo files, and check that only the newest extrainfo
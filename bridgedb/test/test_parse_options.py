@@ -67,6 +67,22 @@ class ParseOptionsTests(unittest.TestCase):
         opts = options.parseOptions()
         self.assertIsInstance(opts, options.MainOptions)
 
+    def test_parse_options_parseOptions_export_rings(self):
+        """The `export-rings` subcommand should take an `--output` file."""
+        fakeSysArgv = ['bridgedb', 'export-rings', '-o', 'rings.snapshot']
+        sys.argv = fakeSysArgv
+        opts = options.parseOptions()
+        self.assertEqual(opts.subCommand, 'export-rings')
+        self.assertEqual(opts.subOptions['output'], 'rings.snapshot')
+
+    def test_parse_options_parseOptions_frontend(self):
+        """The `frontend` subcommand should take a `--snapshot` file."""
+        fakeSysArgv = ['bridgedb', 'frontend', '--snapshot', 'rings.snapshot']
+        sys.argv = fakeSysArgv
+        opts = options.parseOptions()
+        self.assertEqual(opts.subCommand, 'frontend')
+        self.assertEqual(opts.subOptions['snapshot'], 'rings.snapshot')
+
     def test_parse_options_parseOptions_verbosity_quiet_quiet(self):
         """If we use `-q` twice on the commandline, ``opts['verbosity']``
         should equal ``10``.
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of BridgeDB, a Tor bridge distribution system.
+#
+# :authors: please see the AUTHORS file for attributions
+# :copyright: (c) 2007-2017, The Tor Project, Inc.
+#             (c) 2007-2017, all entities within the AUTHORS file
+# :license: see LICENSE for licensing information
+
+"""Tests for :mod:`bridgedb.planner`."""
+
+from __future__ import print_function
+
+import inspect
+import os
+import re
+
+from twisted.trial import unittest
+
+from bridgedb import main
+from bridgedb import planner
+from bridgedb.configure import Conf
+
+
+class PlannerTests(unittest.TestCase):
+    """Unittests for :func:`bridgedb.planner.planReload`."""
+
+    def setUp(self):
+        self.descriptors = self.mktemp()
+        self.proxies = self.mktemp()
+        self.write(self.descriptors, "router 1\n")
+        self.write(self.proxies, "1.2.3.4\n")
+        self.config = self.makeConfig()
+        self.previous = self.getInputs()
+
+    def write(self, filename, contents, mtime=None):
+        with open(filename, 'w') as fh:
+            fh.write(contents)
+        if mtime is not None:
+            os.utime(filename, (mtime, mtime))
+
+    def makeConfig(self, **changes):
+        settings = dict(LOGLEVEL="INFO", PROXY_LIST_FILES=[self.proxies],
+                        N_IP_CLUSTERS=5, HTTPS_SHARE=10, EMAIL_SHARE=2)
+        settings.update(changes)
+        return Conf(**settings)
+
+    def getInputs(self, config=None):
+        return planner.getInputs(config or self.config, [self.descriptors])
+
+    def test_planReload_unknown(self):
+        """Everything should be redone if nothing is known about the
+        hashrings being served.
+        """
+        plan = planner.planReload(None, self.previous)
+
+        self.assertTrue(plan.full)
+        self.assertTrue(plan.descriptors)
+        self.assertTrue(plan.needsNewGeneration())
+
+    def test_planReload_nothing(self):
+        """Nothing should be redone if nothing changed."""
+        plan = planner.planReload(self.previous, self.getInputs())
+
+        self.assertTrue(plan.isEmpty())
+        self.assertEqual(str(plan), "nothing to do (nothing changed)")
+
+    def test_planReload_rewritten(self):
+        """Nothing should be redone if a file was rewritten with the same
+        contents.
+        """
+        self.write(self.descriptors, "router 1\n", mtime=1)
+        plan = planner.planReload(self.previous, self.getInputs())
+
+        self.assertTrue(plan.isEmpty())
+
+    def test_planReload_logLevel(self):
+        """Only the log level should be updated if only LOGLEVEL changed."""
+        inputs = self.getInputs(self.makeConfig(LOGLEVEL="DEBUG"))
+        plan = planner.planReload(self.previous, inputs)
+
+        self.assertTrue(plan.logLevel)
+        self.assertFalse(plan.proxies)
+        self.assertFalse(plan.needsNewGeneration())
+        self.assertEqual(str(plan),
+                         "update the log level (LOGLEVEL changed)")
+
+    def test_planReload_proxies(self):
+        """Only the proxies should be reloaded if only a proxy list
+        changed.
+        """
+        self.write(self.proxies, "1.2.3.4\n5.6.7.8\n")
+        plan = planner.planReload(self.previous, self.getInputs())
+
+        self.assertTrue(plan.proxies)
+        self.assertFalse(plan.logLevel)
+        self.assertFalse(plan.needsNewGeneration())
+
+    def test_planReload_distributor(self):
+        """Only the HTTPS distributor should be rebuilt if only
+        N_IP_CLUSTERS changed.
+        """
+        inputs = self.getInputs(self.makeConfig(N_IP_CLUSTERS=6))
+        plan = planner.planReload(self.previous, inputs)
+
+        self.assertEqual(plan.distributors, set(['https']))
+        self.assertFalse(plan.full)
+        self.assertFalse(plan.descriptors)
+        self.assertTrue(plan.needsNewGeneration())
+
+    def test_planReload_descriptors(self):
+        """The descriptors should be reparsed if one of them changed."""
+        self.write(self.descriptors, "router 2\n")
+        plan = planner.planReload(self.previous, self.getInputs())
+
+        self.assertTrue(plan.descriptors)
+        self.assertFalse(plan.full)
+        self.assertEqual(str(plan), "reparse descriptors "
+                                    "(1 descriptor files changed)")
+
+    def test_planReload_full(self):
+        """All hashrings should be rebuilt if a distributor's share
+        changed.
+        """
+        inputs = self.getInputs(self.makeConfig(HTTPS_SHARE=5))
+        plan = planner.planReload(self.previous, inputs)
+
+        self.assertTrue(plan.full)
+        self.assertTrue(plan.proxies)
+        self.assertIn("HTTPS_SHARE changed", str(plan))
+
+    def test_planReload_unclassified(self):
+        """All hashrings should be rebuilt if a setting which the planner
+        doesn't know about changed.
+        """
+        previous = self.getInputs(self.makeConfig(NEW_SETTING=1))
+        inputs = self.getInputs(self.makeConfig(NEW_SETTING=2))
+        plan = planner.planReload(previous, inputs)
+
+        self.assertTrue(plan.full)
+        self.assertIn("NEW_SETTING changed", str(plan))
+
+    def test_planReload_reload_settings(self):
+        """Nothing should be redone if only SKIP_UNCHANGED_RELOADS changed."""
+        previous = self.getInputs(
+            self.makeConfig(SKIP_UNCHANGED_RELOADS=False))
+        inputs = self.getInputs(self.makeConfig(SKIP_UNCHANGED_RELOADS=True))
+        plan = planner.planReload(previous, inputs)
+
+        self.assertTrue(plan.isEmpty())
+
+    def test_reload_settings_classified(self):
+        """Every setting which reloads read should be classified by the
+        planner, so that changing it redoes only what depends on it.
+        """
+        classified = set(planner.LOGGING_SETTINGS + planner.PROXY_SETTINGS +
+                         planner.DESCRIPTOR_SETTINGS +
+                         planner.HASHRING_SETTINGS + planner.RELOAD_SETTINGS)
+        for settings in planner.DISTRIBUTOR_SETTINGS.values():
+            classified.update(settings)
+
+        # exportRings() is run by a subcommand, rather than by reloads:
+        source = inspect.getsource(main).replace(
+            inspect.getsource(main.exportRings), '')
+        used = set(re.findall(r"\b(?:cfg|state)\.([A-Z][A-Z0-9_]+)", source))
+        used.update(re.findall(r"getattr\((?:cfg|state), '([A-Z][A-Z0-9_]+)'",
+                               source))
+        # This is where the settings are loaded from, not a setting:
+        used.discard('CONFIG_FILE')
+
+        self.assertTrue(used)
+        self.assertEqual(used - classified, set())
+
+    def test_getFileState_reused(self):
+        """A file's digest should be reused if its modification time and
+        size didn't change.
+        """
+        previous = (os.stat(self.descriptors).st_mtime, 9, "digest")
+
+        self.assertEqual(planner.getFileState(self.descriptors, previous),
+                         previous)
+        self.assertIsNone(planner.getFileState(self.mktemp()))
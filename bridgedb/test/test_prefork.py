@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of BridgeDB, a Tor bridge distribution system.
+#
+# :authors: please see the AUTHORS file for attributions
+# :copyright: (c) 2007-2017, The Tor Project, Inc.
+#             (c) 2007-2017, all entities within the AUTHORS file
+# :license: see LICENSE for licensing information
+
+"""Tests for :mod:`bridgedb.prefork`."""
+
+from __future__ import print_function
+
+import socket
+
+from twisted.internet import defer
+from twisted.internet import protocol
+from twisted.internet import reactor
+from twisted.internet import task
+from twisted.internet.error import ProcessExitedAlready
+from twisted.internet.error import ProcessTerminated
+from twisted.python.failure import Failure
+from twisted.trial import unittest
+
+from bridgedb import prefork
+from bridgedb.configure import Conf
+
+
+class DummyTransport(object):
+    def __init__(self, pid):
+        self.pid = pid
+        self.signals = []
+        self.exited = False
+
+    def signalProcess(self, signalName):
+        if self.exited:
+            raise ProcessExitedAlready()
+        self.signals.append(signalName)
+
+
+class DummyReactor(task.Clock):
+    """A reactor which only pretends to spawn processes."""
+
+    def __init__(self):
+        task.Clock.__init__(self)
+        self.spawned = []
+
+    def spawnProcess(self, processProtocol, executable, args, env, childFDs):
+        processProtocol.makeConnection(DummyTransport(len(self.spawned)))
+        self.spawned.append((processProtocol, executable, args, childFDs))
+
+
+class PreforkTests(unittest.TestCase):
+    """Unittests for the functions in :mod:`bridgedb.prefork`."""
+
+    def setUp(self):
+        self.addCleanup(prefork._inherited.clear)
+        self.addCleanup(prefork._listening.clear)
+
+    def test_getWebAddresses(self):
+        """getWebAddresses() should get the addresses of the enabled HTTPS
+        and moat servers.
+        """
+        cfg = Conf(HTTPS_DIST=True, HTTPS_SHARE=10,
+                   HTTP_UNENCRYPTED_PORT=6788, HTTP_UNENCRYPTED_BIND_IP=None,
+                   HTTPS_PORT=6789, HTTPS_BIND_IP='127.0.0.1',
+                   MOAT_DIST=False, MOAT_SHARE=10,
+                   MOAT_HTTP_PORT=6790, MOAT_HTTP_IP=None,
+                   MOAT_HTTPS_PORT=None, MOAT_HTTPS_IP=None)
+
+        self.assertEqual(prefork.getWebAddresses(cfg),
+                         [("", 6788), ("127.0.0.1", 6789)])
+
+        cfg.MOAT_DIST = True
+        self.assertEqual(prefork.getWebAddresses(cfg),
+                         [("", 6788), ("127.0.0.1", 6789), ("", 6790)])
+
+    def test_formatSockets_parseSockets(self):
+        """parseSockets() should parse the output of formatSockets()."""
+        sock = prefork.bindSocket('127.0.0.1', 0)
+        self.addCleanup(sock.close)
+        port = sock.getsockname()[1]
+
+        description = prefork.formatSockets({('127.0.0.1', port): sock})
+        self.assertEqual(prefork.parseSockets(description),
+                         {('127.0.0.1', port): sock.fileno()})
+
+    def test_parseSockets_ipv6(self):
+        """parseSockets() should parse IPv6 interfaces and empty ones."""
+        self.assertEqual(prefork.parseSockets("7=::1:443,8=:80"),
+                         {('::1', 443): 7, ('', 80): 8})
+
+    def test_parseSockets_malformed(self):
+        """parseSockets() should raise a ValueError for a malformed
+        description.
+        """
+        self.assertRaises(ValueError, prefork.parseSockets, "7:443")
+
+    @defer.inlineCallbacks
+    def test_listenTCP_inherited(self):
+        """listenTCP() should accept connections on an inherited socket."""
+        sock = prefork.bindSocket('127.0.0.1', 0)
+        self.addCleanup(sock.close)
+        port = sock.getsockname()[1]
+        prefork.inheritSockets(
+            prefork.formatSockets({('127.0.0.1', port): sock}))
+
+        connected = defer.Deferred()
+        factory = protocol.ServerFactory()
+        factory.protocol = protocol.Protocol
+        factory.buildProtocol = lambda addr: connected.callback(addr)
+
+        listening = prefork.listenTCP(port, factory, interface='127.0.0.1')
+        self.addCleanup(listening.stopListening)
+        self.assertEqual(listening.getHost().port, port)
+
+        client = socket.create_connection(('127.0.0.1', port))
+        self.addCleanup(client.close)
+        yield connected
+
+    @defer.inlineCallbacks
+    def test_stopListening(self):
+        """stopListening() should stop our servers listening, but not close
+        the sockets which our workers accept connections on.
+        """
+        factory = protocol.ServerFactory()
+        factory.protocol = protocol.Protocol
+        listening = prefork.listenTCP(0, factory, interface='127.0.0.1')
+        sock = prefork.bindSocket('127.0.0.1', 0)
+        self.addCleanup(sock.close)
+        prefork._listening[('127.0.0.1', 1)] = sock
+
+        yield prefork.stopListening()
+
+        self.assertEqual(prefork.getListening(), {('127.0.0.1', 1): sock})
+        self.assertFalse(listening.connected)
+
+
+class WorkerPoolTests(unittest.TestCase):
+    """Unittests for :class:`bridgedb.prefork.WorkerPool`."""
+
+    def setUp(self):
+        self.reactor = DummyReactor()
+        self.sock = prefork.bindSocket('127.0.0.1', 0)
+        self.addCleanup(self.sock.close)
+        self.pool = prefork.WorkerPool(
+            ['python', 'bridgedb', 'frontend'],
+            {('127.0.0.1', self.sock.getsockname()[1]): self.sock}, 3,
+            self.reactor)
+
+    def test_start(self):
+        """start() should spawn the workers, which should inherit the
+        listening sockets.
+        """
+        self.pool.start()
+
+        self.assertEqual(len(self.reactor.spawned), 3)
+        self.assertEqual(len(self.pool.workers), 3)
+        for _, executable, args, childFDs in self.reactor.spawned:
+            self.assertEqual(executable, 'python')
+            self.assertEqual(childFDs[self.sock.fileno()], self.sock.fileno())
+
+    def test_signal(self):
+        """signal() should signal every running worker."""
+        self.pool.start()
+        worker = list(self.pool.workers)[0]
+        worker.transport.exited = True
+
+        self.pool.signal('HUP')
+
+        for other in self.pool.workers:
+            if other is not worker:
+                self.assertEqual(other.transport.signals, ['HUP'])
+
+    def test_respawn(self):
+        """A worker which exits should be respawned after a delay."""
+        self.pool.start()
+        worker = list(self.pool.workers)[0]
+        worker.processEnded(Failure(ProcessTerminated(1)))
+
+        self.assertEqual(len(self.pool.workers), 2)
+        self.reactor.advance(self.pool.respawnDelay)
+        self.assertEqual(len(self.pool.workers), 3)
+        self.assertEqual(len(self.reactor.spawned), 4)
+
+    def test_respawn_backoff(self):
+        """Workers which keep exiting right after being spawned should be
+        respawned after longer and longer delays, up to a limit.
+        """
+        self.pool.start()
+        delays = []
+        for _ in range(12):
+            worker = self.reactor.spawned[-1][0]
+            worker.processEnded(Failure(ProcessTerminated(1)))
+            delays.append(self.pool.getRespawnDelay())
+            self.reactor.advance(delays[-1])
+
+        self.assertEqual(delays[:4], [1, 2, 4, 8])
+        self.assertEqual(delays[-1], self.pool.maxRespawnDelay)
+        self.assertEqual(len(self.reactor.spawned), 3 + 12)
+
+    def test_respawn_backoff_reset(self):
+        """A worker which ran for long enough before exiting should be
+        respawned without backing off.
+        """
+        self.pool.start()
+        self.pool.failures = 5
+        self.reactor.advance(self.pool.minUptime)
+        worker = list(self.pool.workers)[0]
+        worker.processEnded(Failure(ProcessTerminated(1)))
+
+        self.assertEqual(self.pool.failures, 0)
+        self.assertEqual(self.pool.getRespawnDelay(), self.pool.respawnDelay)
+
+    def test_drain(self):
+        """drain() should tell the workers to stop accepting connections,
+        and they should only be terminated, and not respawned, afterwards.
+        """
+        self.pool.start()
+        self.pool.drain()
+        self.pool.stop()
+
+        for worker in list(self.pool.workers):
+            self.assertEqual(worker.transport.signals, ['USR2', 'TERM'])
+            worker.processEnded(Failure(ProcessTerminated(signal=15)))
+
+        self.reactor.advance(self.pool.respawnDelay)
+        self.assertEqual(len(self.reactor.spawned), 3)
+
+    def test_stop(self):
+        """stop() should terminate the workers, and they shouldn't be
+        respawned.
+        """
+        self.pool.start()
+        self.pool.stop()
+
+        for worker in list(self.pool.workers):
+            self.assertEqual(worker.transport.signals, ['TERM'])
+            worker.processEnded(Failure(ProcessTerminated(signal=15)))
+
+        self.reactor.advance(self.pool.respawnDelay)
+        self.assertEqual(len(self.pool.workers), 0)
+        self.assertEqual(len(self.reactor.spawned), 3)
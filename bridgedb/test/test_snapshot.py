@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of BridgeDB, a Tor bridge distribution system.
+#
+# :authors: please see the AUTHORS file for attributions
+# :copyright: (c) 2007-2017, The Tor Project, Inc.
+#             (c) 2007-2017, all entities within the AUTHORS file
+# :license: see LICENSE for licensing information
+
+"""Tests for :mod:`bridgedb.snapshot`."""
+
+from __future__ import print_function
+
+import os
+import stat
+
+from twisted.trial import unittest
+
+from bridgedb import proxy
+from bridgedb import snapshot
+from bridgedb.test.util import generateFakeBridges
+
+
+class SnapshotTests(unittest.TestCase):
+    """Unittests for :func:`bridgedb.snapshot.dump` and
+    :func:`bridgedb.snapshot.load`.
+    """
+
+    def setUp(self):
+        self.filename = self.mktemp()
+        self.settings = (3, 1, True, ['https', 'email'])
+        self.key = 'x' * 32
+        self.bridges = generateFakeBridges(20)
+
+    def test_dump_load(self):
+        """Bridges loaded from a snapshot should have the same fingerprints
+        and distribution states as the ones which were dumped.
+        """
+        snapshot.dump(self.filename, self.settings, self.key, self.bridges)
+        bridges, assignments = snapshot.load(self.filename, self.settings,
+                                             self.key)
+
+        self.assertEqual(
+            [(b.fingerprint, b.getDistributionState()) for b in bridges],
+            [(b.fingerprint, b.getDistributionState()) for b in self.bridges])
+        self.assertEqual(assignments, {})
+
+    def test_dump_load_assignments(self):
+        """The assignments of bridges to rings should be loaded from a
+        snapshot.
+        """
+        assignments = dict([(b.fingerprint, 'https') for b in self.bridges])
+        snapshot.dump(self.filename, self.settings, self.key, self.bridges,
+                      assignments)
+        _, loaded = snapshot.load(self.filename, self.settings, self.key)
+        self.assertEqual(loaded, assignments)
+
+    def test_dump_load_proxies(self):
+        """The open proxies, and their tags, should be loaded from a
+        snapshot.
+        """
+        proxies = proxy.ProxySet()
+        proxies.addExitRelays(['1.2.3.4'])
+        proxies.add('5.6.7.8', 'socks')
+        snapshot.dump(self.filename, self.settings, self.key, self.bridges,
+                      proxies=proxies)
+
+        loaded = proxy.ProxySet()
+        snapshot.load(self.filename, self.settings, self.key, loaded)
+        self.assertItemsEqual(loaded, ['1.2.3.4', '5.6.7.8'])
+        self.assertTrue(loaded.isExitRelay('1.2.3.4'))
+        self.assertEqual(loaded.getTag('5.6.7.8'), 'socks')
+
+    def test_dump_strips_descriptors(self):
+        """Dumping a snapshot shouldn't store, nor remove from the original
+        bridges, their parsed descriptors.
+        """
+        self.bridges[0].descriptors['server'] = 'a descriptor'
+        snapshot.dump(self.filename, self.settings, self.key, self.bridges)
+        bridges, _ = snapshot.load(self.filename, self.settings, self.key)
+
+        self.assertIsNone(bridges[0].descriptors['server'])
+        self.assertEqual(self.bridges[0].descriptors['server'], 'a descriptor')
+
+    def test_dump_private(self):
+        """Only we should be able to read a snapshot."""
+        snapshot.dump(self.filename, self.settings, self.key, self.bridges)
+        mode = stat.S_IMODE(os.stat(self.filename).st_mode)
+        self.assertEqual(mode, 0o600)
+        self.assertFalse(os.path.exists(self.filename + ".new"))
+
+    def test_load_missing(self):
+        """Loading a missing snapshot should raise a SnapshotError."""
+        self.assertRaises(snapshot.SnapshotError, snapshot.load,
+                          self.filename, self.settings, self.key)
+
+    def test_load_other_settings(self):
+        """Loading a snapshot written with different settings should raise a
+        SnapshotError.
+        """
+        snapshot.dump(self.filename, self.settings, self.key, self.bridges)
+        self.assertRaises(snapshot.SnapshotError, snapshot.load,
+                          self.filename, self.settings[:-1], self.key)
+
+    def test_load_other_key(self):
+        """Loading a snapshot written with a different master key should
+        raise a SnapshotError.
+        """
+        snapshot.dump(self.filename, self.settings, self.key, self.bridges)
+        self.assertRaises(snapshot.SnapshotError, snapshot.load,
+                          self.filename, self.settings, 'y' * 32)
+
+    def test_load_other_version(self):
+        """Loading a snapshot with a different version should raise a
+        SnapshotError.
+        """
+        snapshot.dump(self.filename, self.settings, self.key, self.bridges)
+        with open(self.filename, 'rb') as fh:
+            header, payload = fh.read().split(b"\n", 1)
+        with open(self.filename, 'wb') as fh:
+            fh.write(b"%s %d %s\n" % (snapshot.SNAPSHOT_MAGIC,
+                                      snapshot.SNAPSHOT_VERSION + 1,
+                                      header.split()[2]))
+            fh.write(payload)
+
+        self.assertRaises(snapshot.SnapshotError, snapshot.load,
+                          self.filename, self.settings, self.key)
+
+    def test_load_changed(self):
+        """Loading a snapshot which was changed after it was written should
+        raise a SnapshotError.
+        """
+        snapshot.dump(self.filename, self.settings, self.key, self.bridges)
+        with open(self.filename, 'rb') as fh:
+            contents = bytearray(fh.read())
+        contents[-10] ^= 1
+        with open(self.filename, 'wb') as fh:
+            fh.write(contents)
+
+        self.assertRaises(snapshot.SnapshotError, snapshot.load,
+                          self.filename, self.settings, self.key)
+
+    def test_load_truncated(self):
+        """Loading a truncated snapshot should raise a SnapshotError."""
+        snapshot.dump(self.filename, self.settings, self.key, self.bridges)
+        with open(self.filename, 'rb') as fh:
+            contents = fh.read()
+        with open(self.filename, 'wb') as fh:
+            fh.write(contents[:len(contents) // 2])
+
+        self.assertRaises(snapshot.SnapshotError, snapshot.load,
+                          self.filename, self.settings, self.key)
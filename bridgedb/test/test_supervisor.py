@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of BridgeDB, a Tor bridge distribution system.
+#
+# :authors: please see the AUTHORS file for attributions
+# :copyright: (c) 2007-2017, The Tor Project, Inc.
+#             (c) 2007-2017, all entities within the AUTHORS file
+# :license: see LICENSE for licensing information
+
+"""Tests for :mod:`bridgedb.supervisor`."""
+
+from __future__ import print_function
+
+import threading
+
+from twisted.internet import defer
+from twisted.internet import reactor
+from twisted.internet import task
+from twisted.internet import threads
+from twisted.trial import unittest
+
+from bridgedb.supervisor import ReloadSupervisor
+
+
+class ReloadSupervisorTests(unittest.TestCase):
+    """Tests for :class:`bridgedb.supervisor.ReloadSupervisor`."""
+
+    def setUp(self):
+        self.calls = []
+        self.release = threading.Event()
+        self.release.set()
+        self.supervisor = ReloadSupervisor(self.reload, reactor)
+
+    def reload(self):
+        self.calls.append(threading.current_thread())
+        self.supervisor.stage("parsing descriptors")
+        self.release.wait(10)
+        self.supervisor.stage("building hashrings")
+        threads.blockingCallFromThread(reactor, self.supervisor.published,
+                                       len(self.calls), {'https': 10})
+
+    def waitUntilIdle(self):
+        if not self.supervisor.running:
+            return defer.succeed(None)
+        return task.deferLater(reactor, 0.01, self.waitUntilIdle)
+
+    def test_request(self):
+        """A requested reload should run in a thread, and its stages and
+        the new generation should be recorded.
+        """
+        d = self.supervisor.request()
+
+        def check(_):
+            status = self.supervisor.getStatus(detailed=True)
+            self.assertEqual(len(self.calls), 1)
+            self.assertIsNot(self.calls[0], threading.current_thread())
+            self.assertTrue(status['ready'])
+            self.assertFalse(status['reloading'])
+            self.assertEqual(status['generation'], 1)
+            self.assertEqual(status['bridges'], {'https': 10})
+            self.assertEqual([name for name, _ in status['stages']],
+                             ["parsing descriptors", "building hashrings"])
+            self.assertIsNone(status['lastError'])
+
+        d.addCallback(check)
+        return d
+
+    def test_request_coalesces(self):
+        """Reloads requested while one is running should be merged into a
+        single reload afterwards.
+        """
+        self.release.clear()
+        first = self.supervisor.request()
+        self.assertIsNone(self.supervisor.request())
+        self.assertIsNone(self.supervisor.request())
+        self.assertTrue(self.supervisor.getStatus(detailed=True)['pending'])
+        self.assertEqual(self.supervisor.coalesced, 1)
+
+        def check(_):
+            # The pending reload was started as soon as the first finished:
+            self.assertEqual(self.supervisor.reloads, 2)
+            self.assertFalse(self.supervisor.pending)
+            return self.waitUntilIdle()
+
+        def checkSecond(_):
+            self.assertEqual(len(self.calls), 2)
+            self.assertEqual(self.supervisor.generation, 2)
+
+        first.addCallback(check)
+        first.addCallback(checkSecond)
+        reactor.callLater(0, self.release.set)
+        return first
+
+    def test_getStatus_public(self):
+        """Unless asked for the details, getStatus() should only say whether
+        we're ready, the generation, and whether a reload is running.
+        """
+        self.supervisor.published(4, {'https': 10})
+        self.supervisor.planned("rebuild everything")
+
+        self.assertEqual(self.supervisor.getStatus(),
+                         {'ready': True, 'generation': 4, 'reloading': False})
+
+    def test_request_failure(self):
+        """If a stage fails, the failure should be recorded, and the previous
+        generation should still be current.
+        """
+        def reload():
+            self.supervisor.stage("building hashrings")
+            raise ValueError("Bad bridge")
+
+        self.supervisor.published(4, {'https': 10})
+        self.supervisor.reloadFn = reload
+        d = self.supervisor.request()
+
+        def check(_):
+            status = self.supervisor.getStatus(detailed=True)
+            self.assertEqual(status['generation'], 4)
+            self.assertEqual(status['failures'], 1)
+            self.assertEqual(status['lastError'], "building hashrings")
+            self.assertNotIn("Bad bridge", repr(status))
+            self.assertFalse(status['reloading'])
+
+        d.addCallback(check)
+        return d
+
+    def test_runNow(self):
+        """runNow() should run the reload in this thread and return its
+        result, raising any error.
+        """
+        self.supervisor.reloadFn = lambda inThread: inThread
+        self.assertIs(self.supervisor.runNow(False), False)
+        self.assertFalse(self.supervisor.running)
+
+        def reload():
+            self.supervisor.stage("loading settings")
+            raise ValueError("Bad config")
+
+        self.supervisor.reloadFn = reload
+        self.assertRaises(ValueError, self.supervisor.runNow)
+        self.assertEqual([name for name, _ in self.supervisor.stages],
+                         ["loading settings"])